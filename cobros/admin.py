@@ -3,7 +3,11 @@ from .models import *
 
 admin.site.register(CategoriaCobro)
 admin.site.register(EstadoCuentaCobro)
+admin.site.register(AntiguedadCartera)
 admin.site.register(MovimientoCobro)
 admin.site.register(PromesaPago)
 admin.site.register(PrestamoCobro)
-admin.site.register(MovimientoPrestamoCobro)
\ No newline at end of file
+admin.site.register(MovimientoPrestamoCobro)
+admin.site.register(CuotaCobro)
+admin.site.register(RutaCobro)
+admin.site.register(ReciboCobro)
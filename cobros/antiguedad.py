@@ -0,0 +1,148 @@
+# Ubicación: cobros/antiguedad.py
+"""
+Antigüedad de la cartera: saldos abiertos de los estados de cuenta repartidos
+en tramos por días de vencimiento a una fecha de corte (corriente, 1-30,
+31-60, 61-90 y más de 90).
+
+Los tramos se calculan con Sum(filter=...) sobre rangos de fecha_vencimiento
+(sin aritmética de fechas en SQL), así cualquier resumen sale de un solo
+GROUP BY.
+
+- resumen: totales de la empresa (cacheado en el espacio "cobros").
+- por_cliente: una página de deudores ordenada por (nombre, id) y paginada
+  por clave (?despues=<cliente_id>), sin OFFSET.
+- materializar: guarda la foto del día en AntiguedadCartera para todas las
+  empresas con una consulta (TAREA 12 de core/tasks.py). Los saldos son los
+  vigentes, por eso la foto solo se toma del día en curso. Las empresas que
+  se quedan sin saldos abiertos siguen con una foto en cero.
+- tendencia: fotos guardadas de un período, para el gráfico.
+"""
+import datetime
+
+from django.db.models import Count, Q, Sum
+from django.utils import timezone
+
+from core import cache as cache_erp
+from core.models import Cliente
+
+from .models import AntiguedadCartera, EstadoCuentaCobro
+
+TRAMOS = (
+    ("corriente", "Corriente"),
+    ("vencido_1_30", "1-30 días"),
+    ("vencido_31_60", "31-60 días"),
+    ("vencido_61_90", "61-90 días"),
+    ("vencido_mas_90", "Más de 90 días"),
+)
+
+def abiertas():
+    """Estados de cuenta con saldo pendiente."""
+    return EstadoCuentaCobro.objects.filter(saldo__gt=0).exclude(estado__in=("PAGADO", "ANULADO"))
+
+def _filtros(corte):
+    """{tramo: Q} por fecha_vencimiento; sin vencimiento cuenta como corriente."""
+    dias = lambda n: corte - datetime.timedelta(days=n)
+    return {
+        "corriente": Q(fecha_vencimiento__isnull=True) | Q(fecha_vencimiento__gte=corte),
+        "vencido_1_30": Q(fecha_vencimiento__lt=corte, fecha_vencimiento__gte=dias(30)),
+        "vencido_31_60": Q(fecha_vencimiento__lt=dias(30), fecha_vencimiento__gte=dias(60)),
+        "vencido_61_90": Q(fecha_vencimiento__lt=dias(60), fecha_vencimiento__gte=dias(90)),
+        "vencido_mas_90": Q(fecha_vencimiento__lt=dias(90)),
+    }
+
+def _tramos(corte):
+    expresiones = {tramo: Sum("saldo", filter=q) for tramo, q in _filtros(corte).items()}
+    expresiones["total"] = Sum("saldo")
+    return expresiones
+
+def _sin_nulos(fila):
+    return {k: (v if v is not None else 0) for k, v in fila.items()}
+
+# ==========================================
+# CONSULTAS EN LÍNEA
+# ==========================================
+
+def _resumen(empresa, corte):
+    return _sin_nulos(abiertas().filter(empresa=empresa).aggregate(
+        **_tramos(corte),
+        clientes=Count("cliente_id", distinct=True),
+        documentos=Count("id"),
+    ))
+
+def resumen(empresa, corte):
+    """Totales por tramo, clientes y documentos de la empresa a la fecha de corte."""
+    return cache_erp.obtener(
+        empresa.id, ("cobros",), "antiguedad_resumen", lambda: _resumen(empresa, corte), partes=(corte,),
+    )
+
+def por_cliente(empresa, corte, despues=None, tramo=None, limite=50):
+    """
+    Página de deudores con sus saldos por tramo, ordenada por nombre.
+    `despues` es el id del último cliente de la página anterior; `tramo`
+    deja solo los que tienen saldo en ese tramo.
+
+    Devuelve (filas, id para la página siguiente o None).
+    """
+    documentos = abiertas().filter(empresa=empresa)
+    if despues is not None:
+        ultimo = Cliente.objects.filter(empresa=empresa, pk=despues).values_list("nombre", flat=True).first()
+        if ultimo is not None:
+            # La condición va antes de agrupar: solo se agregan los deudores que siguen
+            documentos = documentos.filter(
+                Q(cliente__nombre__gt=ultimo) | Q(cliente__nombre=ultimo, cliente_id__gt=despues)
+            )
+    if tramo in dict(TRAMOS):
+        documentos = documentos.filter(_filtros(corte)[tramo])
+
+    filas = list(
+        documentos.values("cliente_id", "cliente__nombre", "cliente__ruc")
+        .annotate(**_tramos(corte), documentos=Count("id"))
+        .order_by("cliente__nombre", "cliente_id")[:limite + 1]
+    )
+    siguiente = filas[limite - 1]["cliente_id"] if len(filas) > limite else None
+    return [_sin_nulos(f) for f in filas[:limite]], siguiente
+
+# ==========================================
+# FOTO DIARIA
+# ==========================================
+
+def materializar(corte=None, empresa_ids=None):
+    """Guarda (o reemplaza) la foto de `corte` (hoy) de todas las empresas. Devuelve las filas."""
+    corte = corte or timezone.localdate()
+    documentos = abiertas()
+    if empresa_ids is not None:
+        documentos = documentos.filter(empresa_id__in=empresa_ids)
+
+    fotos = [
+        AntiguedadCartera(empresa_id=fila.pop("empresa_id"), fecha=corte, **_sin_nulos(fila))
+        for fila in documentos.values("empresa_id").annotate(
+            **_tramos(corte),
+            clientes=Count("cliente_id", distinct=True),
+            documentos=Count("id"),
+        ).order_by()
+    ]
+    # Una empresa que ayer tenía foto y hoy ya no tiene saldos abiertos queda en
+    # cero (no un hueco en la tendencia); igual si hoy ya se había tomado una
+    anteriores = AntiguedadCartera.objects.filter(fecha__in=(corte - datetime.timedelta(days=1), corte))
+    if empresa_ids is not None:
+        anteriores = anteriores.filter(empresa_id__in=empresa_ids)
+    con_saldo = {foto.empresa_id for foto in fotos}
+    fotos.extend(
+        AntiguedadCartera(empresa_id=empresa_id, fecha=corte)
+        for empresa_id in set(anteriores.values_list("empresa_id", flat=True)) - con_saldo
+    )
+    AntiguedadCartera.objects.bulk_create(
+        fotos,
+        update_conflicts=True,
+        unique_fields=["empresa", "fecha"],
+        update_fields=[t for t, _ in TRAMOS] + ["total", "clientes", "documentos", "generado_en"],
+    )
+    return len(fotos)
+
+def tendencia(empresa, desde, hasta):
+    """Fotos guardadas del período, por fecha."""
+    return list(
+        AntiguedadCartera.objects.filter(empresa=empresa, fecha__range=(desde, hasta))
+        .order_by("fecha")
+        .values("fecha", *(t for t, _ in TRAMOS), "total")
+    )
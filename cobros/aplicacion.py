@@ -0,0 +1,194 @@
+# Ubicación: cobros/aplicacion.py
+"""
+Aplicación de un pago a varias facturas: un ReciboCobro repartido entre los
+estados de cuenta abiertos del cliente.
+
+- FIFO: primero las facturas más antiguas (fecha de emisión).
+- VENCIMIENTO: primero las de vencimiento más antiguo; las que no vencen, al final.
+- MANUAL: el reparto {estado_cuenta_id: monto} lo indica el usuario y debe
+  sumar el monto del recibo.
+
+aplicar() bloquea los estados de cuenta abiertos del cliente y, en una sola
+transacción: crea el recibo, inserta todos los abonos con un bulk_create
+(saldos anterior y nuevo calculados en memoria), actualiza todos los saldos
+con un UPDATE y, si hay cuenta, registra un solo ingreso en ella. Un pago a
+veinte facturas cuesta lo mismo que a una.
+
+anular() deshace el recibo completo de la misma forma: devuelve cada parte a
+su estado de cuenta con un UPDATE, marca anulados sus abonos y, si hubo
+cuenta, registra un egreso por el monto del recibo. Los abonos de un recibo
+no se editan ni se borran uno por uno (MovimientoCobro lo impide).
+"""
+import datetime
+from decimal import Decimal
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import OuterRef, Subquery
+
+from core import cache as cache_erp
+from core import tesoreria
+
+from . import antiguedad, ruta
+from .models import EstadoCuentaCobro, MovimientoCobro, MovimientoCuentaCobro, ReciboCobro
+
+CENTAVO = Decimal("0.01")
+
+ORDENES = {
+    "FIFO": lambda d: (d["fecha_emision"], d["id"]),
+    "VENCIMIENTO": lambda d: (
+        d["fecha_vencimiento"] is None, d["fecha_vencimiento"] or datetime.date.max, d["fecha_emision"], d["id"],
+    ),
+}
+
+def repartir(documentos, monto, criterio="FIFO", asignacion=None):
+    """
+    [(estado_cuenta_id, parte)] del `monto` entre `documentos` (dicts con id,
+    saldo, fecha_emision y fecha_vencimiento). Lanza ValidationError si el
+    monto supera lo adeudado o si el reparto manual no cuadra.
+    """
+    saldos = {d["id"]: d["saldo"] for d in documentos}
+    adeudado = sum(saldos.values(), Decimal("0.00"))
+    if monto > adeudado:
+        raise ValidationError(f"El pago (${monto}) supera el saldo pendiente del cliente (${adeudado}).")
+
+    if criterio == "MANUAL":
+        partes = []
+        for pk, parte in (asignacion or {}).items():
+            if not parte:
+                continue
+            if pk not in saldos:
+                raise ValidationError(f"El estado de cuenta {pk} no está abierto para este cliente.")
+            if parte < 0 or parte > saldos[pk]:
+                raise ValidationError(f"El abono al estado de cuenta {pk} debe estar entre 0 y ${saldos[pk]}.")
+            partes.append((pk, parte))
+        asignado = sum((p for _, p in partes), Decimal("0.00"))
+        if asignado != monto:
+            raise ValidationError(f"El reparto (${asignado}) no coincide con el monto del recibo (${monto}).")
+        return partes
+
+    if criterio not in ORDENES:
+        raise ValidationError(f"Criterio de reparto desconocido: {criterio}")
+    partes, restante = [], monto
+    for documento in sorted(documentos, key=ORDENES[criterio]):
+        if restante <= 0:
+            break
+        parte = min(restante, documento["saldo"])
+        partes.append((documento["id"], parte))
+        restante -= parte
+    return partes
+
+def aplicar(empresa, cliente, monto, usuario, criterio="FIFO", asignacion=None,
+            cuenta=None, metodo_pago=None, referencia=None, observacion=None):
+    """Registra el recibo y sus abonos. Devuelve el ReciboCobro."""
+    monto = Decimal(monto).quantize(CENTAVO)
+    if monto <= 0:
+        raise ValidationError("El monto del recibo debe ser mayor a cero.")
+    asignacion = {int(pk): Decimal(parte).quantize(CENTAVO) for pk, parte in (asignacion or {}).items()}
+
+    with transaction.atomic():
+        # Los saldos leídos aquí son los que quedan en saldo_anterior de cada abono
+        abiertos = list(
+            antiguedad.abiertas().filter(empresa=empresa, cliente=cliente)
+            .select_for_update().order_by("id")
+            .values("id", "factura_id", "saldo", "fecha_emision", "fecha_vencimiento")
+        )
+        partes = repartir(abiertos, monto, criterio, asignacion)
+        por_id = {d["id"]: d for d in abiertos}
+
+        recibo = ReciboCobro.objects.create(
+            empresa=empresa,
+            cliente=cliente,
+            monto=monto,
+            criterio=criterio,
+            facturas=len(partes),
+            cuenta=cuenta,
+            metodo_pago=metodo_pago,
+            referencia=referencia,
+            observacion=observacion,
+            usuario=usuario,
+        )
+
+        # bulk_create no pasa por MovimientoConSaldo.save: los saldos se mueven abajo, en un UPDATE
+        MovimientoCobro.objects.bulk_create([
+            MovimientoCobro(
+                empresa=empresa,
+                estado_cuenta_id=pk,
+                cliente=cliente,
+                factura_id=por_id[pk]["factura_id"],
+                tipo="ABONO",
+                monto=parte,
+                saldo_anterior=por_id[pk]["saldo"],
+                saldo_nuevo=por_id[pk]["saldo"] - parte,
+                metodo_pago=metodo_pago,
+                referencia=referencia,
+                observacion=observacion or f"Recibo {recibo.pk}",
+                usuario=usuario,
+                recibo=recibo,
+            )
+            for pk, parte in partes
+        ])
+        parte_del_recibo = Subquery(
+            MovimientoCobro.objects.filter(recibo=recibo, estado_cuenta=OuterRef("pk")).values("monto")[:1]
+        )
+        EstadoCuentaCobro.postear_varios([pk for pk, _ in partes], -parte_del_recibo, parte_del_recibo)
+
+        if cuenta:
+            MovimientoCuentaCobro.objects.create(
+                empresa=empresa,
+                cuenta=cuenta,
+                tipo="INGRESO",
+                origen="COBRO",
+                monto=monto,
+                referencia=f"Recibo {recibo.pk}",
+                observacion=f"Cobro de {len(partes)} facturas de {cliente.nombre}",
+                usuario=usuario,
+            )
+
+        tesoreria.auditar(
+            usuario, empresa, f"Recibo de cobro {recibo.pk}: ${monto} de {cliente.nombre} en {len(partes)} facturas.",
+        )
+        # Sin señales por bulk_create / update: se avisa a mano
+        cache_erp.invalidar_al_confirmar("cobros", empresa.id)
+        ruta.marcar(empresa.id, cliente.id)
+    return recibo
+
+def anular(recibo, usuario):
+    """Anula el recibo con todos sus abonos y, si entró a una cuenta, su ingreso. Devuelve el recibo."""
+    with transaction.atomic():
+        recibo = ReciboCobro.objects.select_for_update(of=("self",)).select_related("cliente").get(pk=recibo.pk)
+        if recibo.anulado:
+            raise ValidationError(f"El recibo {recibo.pk} ya está anulado.")
+
+        abonos = MovimientoCobro.objects.filter(recibo=recibo, anulado=False)
+        pks = list(
+            EstadoCuentaCobro.objects.select_for_update().order_by("id")
+            .filter(pk__in=abonos.values("estado_cuenta_id")).values_list("id", flat=True)
+        )
+        parte_del_recibo = Subquery(
+            abonos.filter(estado_cuenta=OuterRef("pk")).values("monto")[:1]
+        )
+        # update() no pasa por MovimientoCobro.save: los saldos se devuelven aquí, antes de marcarlos
+        EstadoCuentaCobro.postear_varios(pks, parte_del_recibo, -parte_del_recibo)
+        abonos.update(anulado=True)
+
+        if recibo.cuenta_id:
+            MovimientoCuentaCobro.objects.create(
+                empresa=recibo.empresa,
+                cuenta=recibo.cuenta,
+                tipo="EGRESO",
+                origen="COBRO",
+                monto=recibo.monto,
+                referencia=f"Recibo {recibo.pk}",
+                observacion=f"Anulación del recibo {recibo.pk} de {recibo.cliente.nombre}",
+                usuario=usuario,
+            )
+
+        recibo.anulado = True
+        recibo.save(update_fields=["anulado"])
+        tesoreria.auditar(
+            usuario, recibo.empresa, f"Recibo de cobro {recibo.pk} anulado: ${recibo.monto} de {recibo.cliente.nombre}.",
+        )
+        cache_erp.invalidar_al_confirmar("cobros", recibo.empresa_id)
+        ruta.marcar(recibo.empresa_id, recibo.cliente_id)
+    return recibo
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class CobrosConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'cobros'
+
+    def ready(self):
+        from . import signals  # noqa: F401
@@ -0,0 +1,207 @@
+# Ubicación: cobros/conciliacion.py
+"""
+Conciliación de los saldos guardados contra sus tablas de movimientos.
+
+Los saldos de estados de cuenta, préstamos, compras financiadas, cuentas
+financieras, cuentas bancarias y cajas chicas se mantienen sumando cada
+movimiento. Este módulo recalcula el saldo esperado de todas las empresas con
+una consulta por tabla (JOIN + GROUP BY + HAVING): solo vuelven las filas que
+no cuadran.
+
+- conciliar(reparar=False, completo=False): informa los descuadres y, con
+  reparar=True, los corrige.
+- Cada corrida registra en PuntoControl el último id de movimiento revisado;
+  la siguiente solo revisa los documentos con movimientos posteriores, más
+  los de los últimos VENTANA_IDS ids anteriores (completo=True revisa todo).
+  Los ids se asignan al insertar y no al confirmar: un movimiento con id
+  menor que el tope de una corrida puede confirmarse después de ella, y la
+  ventana lo alcanza en la siguiente.
+- Los cambios que no crean movimientos (editar un movimiento viejo, tocar el
+  saldo a mano) solo los ve una corrida completa. Lo ejecuta cada noche la
+  TAREA 10 de core/tasks.py y a mano el comando conciliar_saldos.
+"""
+import logging
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import DecimalField, F, Max, Q, Sum, Value
+from django.db.models.functions import Coalesce
+
+from core import cache as cache_erp
+from core.models import CajaChica, CuentaBancaria, MovimientoCaja, PuntoControl, TransaccionBancaria
+
+from .models import (
+    CompraFinanciada, CuentaFinancieraCobro, EstadoCuentaCobro, MovimientoCobro,
+    MovimientoCompraFinanciada, MovimientoCuentaCobro, MovimientoPrestamoCobro, PrestamoCobro,
+)
+
+logger = logging.getLogger(__name__)
+
+CERO = Decimal("0.00")
+# Ids anteriores al punto de control que se vuelven a revisar: cubre los
+# movimientos que ya tenían id al tomar el tope pero aún no se habían confirmado
+VENTANA_IDS = 50000
+
+def _suma(relacion, tipos, anulado=True):
+    """Suma de los montos de los movimientos de la relación con esos tipos (0 si no hay)."""
+    filtro = Q(**{f"{relacion}__tipo__in": tipos})
+    if anulado:
+        filtro &= Q(**{f"{relacion}__anulado": False})
+    return Coalesce(
+        Sum(f"{relacion}__monto", filter=filtro),
+        Value(CERO),
+        output_field=DecimalField(max_digits=14, decimal_places=2),
+    )
+
+# ==========================================
+# TABLAS CONCILIADAS
+# ==========================================
+# esperado: saldo calculado desde los movimientos; abonado: idem para total_abonado.
+# Los documentos de cobranza se reparan con su recalcular_saldo() (también corrige el estado).
+
+TABLAS = [
+    {
+        "nombre": "estados_cuenta",
+        "modelo": EstadoCuentaCobro,
+        "movimiento": MovimientoCobro,
+        "fk": "estado_cuenta",
+        "campo": "saldo",
+        "esperado": F("total_documento")
+        + _suma("movimientos", MovimientoCobro.TIPOS_CARGO)
+        - _suma("movimientos", MovimientoCobro.TIPOS_RESTA),
+        "abonado": _suma("movimientos", MovimientoCobro.TIPOS_ABONADO),
+    },
+    {
+        "nombre": "prestamos",
+        "modelo": PrestamoCobro,
+        "movimiento": MovimientoPrestamoCobro,
+        "fk": "prestamo",
+        "campo": "saldo",
+        "esperado": _suma("movimientos", MovimientoPrestamoCobro.TIPOS_CARGO)
+        - _suma("movimientos", MovimientoPrestamoCobro.TIPOS_ABONO),
+    },
+    {
+        "nombre": "compras_financiadas",
+        "modelo": CompraFinanciada,
+        "movimiento": MovimientoCompraFinanciada,
+        "fk": "compra",
+        "campo": "saldo",
+        "esperado": _suma("movimientos", MovimientoCompraFinanciada.TIPOS_CARGO)
+        - _suma("movimientos", MovimientoCompraFinanciada.TIPOS_ABONO),
+        "abonado": _suma("movimientos", MovimientoCompraFinanciada.TIPOS_ABONO),
+    },
+    {
+        "nombre": "cuentas_financieras",
+        "modelo": CuentaFinancieraCobro,
+        "movimiento": MovimientoCuentaCobro,
+        "fk": "cuenta",
+        "campo": "saldo_actual",
+        "esperado": F("saldo_inicial")
+        + _suma("movimientos", MovimientoCuentaCobro.TIPOS_INGRESO)
+        - _suma("movimientos", MovimientoCuentaCobro.TIPOS_EGRESO),
+    },
+    {
+        "nombre": "cuentas_bancarias",
+        "modelo": CuentaBancaria,
+        "movimiento": TransaccionBancaria,
+        "fk": "cuenta",
+        "campo": "saldo",
+        "esperado": F("saldo_inicial")
+        + _suma("transacciones", TransaccionBancaria.TIPOS_INGRESO, anulado=False)
+        - _suma("transacciones", TransaccionBancaria.TIPOS_EGRESO, anulado=False),
+    },
+    {
+        "nombre": "cajas_chicas",
+        "modelo": CajaChica,
+        "movimiento": MovimientoCaja,
+        "fk": "caja",
+        "campo": "saldo_actual",
+        "esperado": F("saldo_inicial")
+        + _suma("movimientos", ("ING",), anulado=False)
+        - _suma("movimientos", ("EGR",), anulado=False),
+    },
+]
+
+def _clave(tabla):
+    return f"conciliacion:{tabla['nombre']}"
+
+# ==========================================
+# CONCILIACIÓN
+# ==========================================
+
+def _descuadres(tabla, desde_id, empresa_ids):
+    """Filas de la tabla cuyo saldo (o total abonado) no coincide con sus movimientos."""
+    documentos = tabla["modelo"].objects.all()
+    if empresa_ids is not None:
+        documentos = documentos.filter(empresa_id__in=empresa_ids)
+    if desde_id is not None:
+        tocados = tabla["movimiento"].objects.filter(id__gt=desde_id).values(tabla["fk"])
+        documentos = documentos.filter(pk__in=tocados)
+
+    campo = tabla["campo"]
+    anotaciones = {"esperado": tabla["esperado"]}
+    distinto = ~Q(**{campo: F("esperado")})
+    columnas = ["pk", "empresa_id", campo, "esperado"]
+    if "abonado" in tabla:
+        anotaciones["abonado_esperado"] = tabla["abonado"]
+        distinto |= ~Q(total_abonado=F("abonado_esperado"))
+        columnas += ["total_abonado", "abonado_esperado"]
+
+    return [
+        {
+            "tabla": tabla["nombre"],
+            "id": fila["pk"],
+            "empresa_id": fila["empresa_id"],
+            "saldo": fila[campo],
+            "esperado": fila["esperado"],
+            **({"total_abonado": fila["total_abonado"], "abonado_esperado": fila["abonado_esperado"]}
+               if "abonado" in tabla else {}),
+        }
+        for fila in documentos.annotate(**anotaciones).filter(distinto).values(*columnas).order_by("pk")
+    ]
+
+def _reparar(tabla, filas):
+    modelo = tabla["modelo"]
+    if hasattr(modelo, "recalcular_saldo"):
+        # post_save de cobros invalida la caché de la empresa
+        for documento in modelo.objects.filter(pk__in=[f["id"] for f in filas]):
+            documento.recalcular_saldo()
+        return
+    for fila in filas:
+        modelo.objects.filter(pk=fila["id"]).update(**{tabla["campo"]: fila["esperado"]})
+        if fila["empresa_id"] is not None:
+            cache_erp.invalidar_al_confirmar("cobros", fila["empresa_id"])
+
+def conciliar(reparar=False, completo=False, empresa_ids=None):
+    """
+    Concilia todas las tablas. Devuelve la lista de descuadres encontrados
+    (dicts con tabla, id, empresa_id, saldo, esperado y, si aplica,
+    total_abonado y abonado_esperado).
+
+    El punto de control solo avanza en corridas de todas las empresas, y en
+    cada tabla solo si quedó cuadrada.
+    """
+    descuadres = []
+    for tabla in TABLAS:
+        with transaction.atomic():
+            # El tope se toma antes de leer: lo que entre durante la corrida se revisa en la próxima
+            tope = tabla["movimiento"].objects.aggregate(tope=Max("id"))["tope"]
+            punto = None
+            desde_id = None
+            if empresa_ids is None:
+                punto, _ = PuntoControl.objects.select_for_update().get_or_create(clave=_clave(tabla))
+                if not completo and punto.ultimo_id is not None:
+                    desde_id = max(punto.ultimo_id - VENTANA_IDS, 0)
+
+            filas = _descuadres(tabla, desde_id, empresa_ids)
+            for fila in filas:
+                logger.warning("Descuadre en %s #%s: saldo %s, esperado %s", fila["tabla"], fila["id"], fila["saldo"], fila["esperado"])
+            if reparar and filas:
+                _reparar(tabla, filas)
+
+            # Si quedan descuadres sin reparar, el punto no avanza y se vuelven a informar
+            if punto is not None and tope is not None and (reparar or not filas):
+                punto.ultimo_id = max(tope, punto.ultimo_id or 0)
+                punto.save(update_fields=["ultimo_id", "actualizado_en"])
+        descuadres.extend(filas)
+    return descuadres
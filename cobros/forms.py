@@ -205,4 +205,42 @@ class MovimientoCompraFinanciadaForm(forms.ModelForm):
                 'class': 'form-control form-control-sm',
                 'rows': 2
             }),
-        }
\ No newline at end of file
+        }
+
+class ReciboCobroForm(forms.ModelForm):
+    class Meta:
+        model = ReciboCobro
+        fields = [
+            'cliente',
+            'monto',
+            'criterio',
+            'cuenta',
+            'metodo_pago',
+            'referencia',
+            'observacion',
+        ]
+        widgets = {
+            'cliente': forms.Select(attrs={
+                'class': 'form-select form-select-sm'
+            }),
+            'monto': forms.NumberInput(attrs={
+                'class': 'form-control form-control-sm',
+                'step': '0.01'
+            }),
+            'criterio': forms.Select(attrs={
+                'class': 'form-select form-select-sm'
+            }),
+            'cuenta': forms.Select(attrs={
+                'class': 'form-select form-select-sm'
+            }),
+            'metodo_pago': forms.Select(attrs={
+                'class': 'form-select form-select-sm'
+            }),
+            'referencia': forms.TextInput(attrs={
+                'class': 'form-control form-control-sm'
+            }),
+            'observacion': forms.Textarea(attrs={
+                'class': 'form-control form-control-sm',
+                'rows': 2
+            }),
+        }
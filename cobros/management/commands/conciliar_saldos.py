@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+
+from cobros import conciliacion
+
+
+class Command(BaseCommand):
+    help = (
+        "Compara los saldos de cobranza y tesorería con sus movimientos e informa "
+        "(o corrige, con --reparar) los descuadres"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--reparar", action="store_true", help="Corrige los saldos descuadrados.")
+        parser.add_argument(
+            "--completo", action="store_true",
+            help="Revisa todos los documentos, no solo los con movimientos desde la última corrida.",
+        )
+        parser.add_argument("--empresa", type=int, help="ID de la empresa. Por defecto, todas.")
+
+    def handle(self, *args, **options):
+        descuadres = conciliacion.conciliar(
+            reparar=options["reparar"],
+            completo=options["completo"],
+            empresa_ids=[options["empresa"]] if options["empresa"] else None,
+        )
+        for d in descuadres:
+            linea = f"{d['tabla']} #{d['id']} (empresa {d['empresa_id']}): saldo {d['saldo']}, esperado {d['esperado']}"
+            if "abonado_esperado" in d:
+                linea += f"; abonado {d['total_abonado']}, esperado {d['abonado_esperado']}"
+            self.stdout.write(linea)
+
+        accion = "reparados" if options["reparar"] else "encontrados"
+        estilo = self.style.SUCCESS if not descuadres or options["reparar"] else self.style.WARNING
+        self.stdout.write(estilo(f"{len(descuadres)} descuadres {accion}"))
@@ -0,0 +1,39 @@
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from cobros import mora
+
+
+class Command(BaseCommand):
+    help = "Carga la mora diaria de préstamos y compras financiadas para uno o varios días (los ya devengados se omiten)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--desde", help="Primer día (YYYY-MM-DD). Por defecto, ayer.")
+        parser.add_argument("--hasta", help="Último día (YYYY-MM-DD). Por defecto, igual a --desde.")
+        parser.add_argument("--empresa", type=int, help="ID de la empresa. Por defecto, todas.")
+
+    def _dia(self, valor):
+        try:
+            return datetime.date.fromisoformat(valor)
+        except ValueError:
+            raise CommandError(f"Fecha inválida: {valor} (use YYYY-MM-DD)")
+
+    def handle(self, *args, **options):
+        desde = self._dia(options["desde"]) if options["desde"] else timezone.localdate() - datetime.timedelta(days=1)
+        hasta = self._dia(options["hasta"]) if options["hasta"] else desde
+        if hasta < desde:
+            raise CommandError("--hasta no puede ser anterior a --desde")
+        if hasta >= timezone.localdate():
+            raise CommandError("Solo se devengan días ya terminados")
+
+        empresa_ids = [options["empresa"]] if options["empresa"] else None
+        # En orden: cada día ve el saldo con la mora de los anteriores
+        dia = desde
+        while dia <= hasta:
+            cargos = mora.devengar(dia, empresa_ids)
+            self.stdout.write(f"{dia}: {cargos['prestamos']} préstamos, {cargos['compras_financiadas']} compras financiadas")
+            dia += datetime.timedelta(days=1)
+
+        self.stdout.write(self.style.SUCCESS("Devengo de mora completado"))
@@ -0,0 +1,40 @@
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Q, Sum
+from django.core.management.base import BaseCommand
+
+from cobros.models import (
+    CompraFinanciada, CuotaCobro, MovimientoCompraFinanciada, MovimientoPrestamoCobro, PrestamoCobro,
+    registrar_en_cuotas,
+)
+
+
+class Command(BaseCommand):
+    help = "Genera el plan de cuotas de los préstamos y compras financiadas que no lo tienen y reparte sus pagos ya registrados"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--empresa", type=int, help="ID de la empresa. Por defecto, todas.")
+
+    def handle(self, *args, **options):
+        for modelo, campo, movimiento in (
+            (PrestamoCobro, "prestamo", MovimientoPrestamoCobro),
+            (CompraFinanciada, "compra", MovimientoCompraFinanciada),
+        ):
+            documentos = modelo.objects.exclude(
+                Exists(CuotaCobro.objects.filter(**{campo: OuterRef("pk")}))
+            ).annotate(
+                pagado=Sum("movimientos__monto", filter=Q(
+                    movimientos__tipo__in=movimiento.TIPOS_PAGO, movimientos__anulado=False,
+                ))
+            )
+            if options["empresa"]:
+                documentos = documentos.filter(empresa_id=options["empresa"])
+
+            total = 0
+            for documento in documentos.iterator():
+                with transaction.atomic():
+                    if CuotaCobro.generar(documento):
+                        registrar_en_cuotas(modelo, campo, documento.pk, documento.pagado or 0)
+                        total += 1
+            self.stdout.write(f"{modelo._meta.verbose_name_plural}: {total} planes generados")
+
+        self.stdout.write(self.style.SUCCESS("Planes de cuotas generados"))
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from cobros.models import CompraFinanciada, EstadoCuentaCobro, PrestamoCobro
+
+
+class Command(BaseCommand):
+    help = (
+        "Recalcula desde sus movimientos los saldos de estados de cuenta, préstamos y "
+        "compras financiadas (reparación de los saldos incrementales)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--empresa", type=int, help="ID de la empresa. Por defecto, todas.")
+
+    def handle(self, *args, **options):
+        for modelo in (EstadoCuentaCobro, PrestamoCobro, CompraFinanciada):
+            documentos = modelo.objects.order_by("pk")
+            if options["empresa"]:
+                documentos = documentos.filter(empresa_id=options["empresa"])
+
+            revisados = corregidos = 0
+            for documento in documentos.iterator():
+                with transaction.atomic():
+                    antes = documento.saldo
+                    documento.recalcular_saldo()
+                revisados += 1
+                if documento.saldo != antes:
+                    corregidos += 1
+                    self.stdout.write(f"{modelo._meta.verbose_name} {documento.pk}: {antes} -> {documento.saldo}")
+
+            self.stdout.write(self.style.SUCCESS(
+                f"{modelo._meta.verbose_name_plural}: {revisados} revisados, {corregidos} corregidos"
+            ))
@@ -0,0 +1,48 @@
+# Generated by Django 5.2.5 on 2026-10-19 19:06
+
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import DecimalField, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+TIPOS_INGRESO = ('INGRESO', 'TRANSFERENCIA_ENTRADA', 'AJUSTE_MAS')
+TIPOS_EGRESO = ('EGRESO', 'TRANSFERENCIA_SALIDA', 'AJUSTE_MENOS')
+
+
+def calcular_saldos_iniciales(apps, schema_editor):
+    """El saldo inicial de las cuentas existentes es el que cuadra con su saldo actual."""
+    CuentaFinancieraCobro = apps.get_model('cobros', 'CuentaFinancieraCobro')
+    MovimientoCuentaCobro = apps.get_model('cobros', 'MovimientoCuentaCobro')
+
+    cero = Value(Decimal('0'))
+    neto = (
+        MovimientoCuentaCobro.objects.filter(cuenta=OuterRef('pk'), anulado=False)
+        .values('cuenta')
+        .annotate(neto=(
+            Coalesce(Sum('monto', filter=Q(tipo__in=TIPOS_INGRESO)), cero)
+            - Coalesce(Sum('monto', filter=Q(tipo__in=TIPOS_EGRESO)), cero)
+        ))
+        .values('neto')
+    )
+    CuentaFinancieraCobro.objects.update(
+        saldo_inicial=models.F('saldo_actual') - Coalesce(
+            Subquery(neto), cero, output_field=DecimalField(max_digits=14, decimal_places=2)
+        )
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cobros', '0005_alter_prestamocobro_tipo_interes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cuentafinancieracobro',
+            name='saldo_inicial',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=14),
+        ),
+        migrations.RunPython(calcular_saldos_iniciales, migrations.RunPython.noop),
+    ]
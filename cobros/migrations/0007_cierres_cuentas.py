@@ -0,0 +1,48 @@
+# Generated by Django 5.2.5 on 2026-10-19 19:10
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cobros', '0006_saldo_inicial_cuentas'),
+        ('core', '0017_cierres_cuentas'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CierreCuentaCobro',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('periodo', models.DateField(help_text='Primer día del mes cerrado')),
+                ('saldo_inicial', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('ingresos', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('egresos', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('saldo_final', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('movimientos', models.PositiveIntegerField(default=0)),
+                ('generado_en', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Cierre mensual de cuenta',
+                'verbose_name_plural': 'Cierres mensuales de cuentas',
+                'ordering': ['periodo'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='movimientocuentacobro',
+            index=models.Index(fields=['cuenta', 'fecha', 'id'], name='cobros_movi_cuenta__1a356d_idx'),
+        ),
+        migrations.AddField(
+            model_name='cierrecuentacobro',
+            name='cuenta',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='cierres', to='cobros.cuentafinancieracobro'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='cierrecuentacobro',
+            unique_together={('cuenta', 'periodo')},
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.5 on 2026-10-19 19:13
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cobros', '0007_cierres_cuentas'),
+        ('core', '0017_cierres_cuentas'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AntiguedadCartera',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateField()),
+                ('corriente', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('vencido_1_30', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('vencido_31_60', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('vencido_61_90', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('vencido_mas_90', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('total', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('clientes', models.PositiveIntegerField(default=0)),
+                ('documentos', models.PositiveIntegerField(default=0)),
+                ('generado_en', models.DateTimeField(auto_now=True)),
+                ('empresa', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='antiguedad_cartera', to='core.empresa')),
+            ],
+            options={
+                'verbose_name': 'Antigüedad de cartera',
+                'verbose_name_plural': 'Antigüedad de cartera',
+                'ordering': ['fecha'],
+                'unique_together': {('empresa', 'fecha')},
+            },
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.5 on 2026-10-19 19:16
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cobros', '0008_antiguedad_cartera'),
+        ('core', '0018_mora_diaria'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='movimientocomprafinanciada',
+            name='fecha_devengo',
+            field=models.DateField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='movimientoprestamocobro',
+            name='fecha_devengo',
+            field=models.DateField(blank=True, null=True),
+        ),
+        migrations.AddConstraint(
+            model_name='movimientocomprafinanciada',
+            constraint=models.UniqueConstraint(condition=models.Q(('fecha_devengo__isnull', False)), fields=('compra', 'tipo', 'fecha_devengo'), name='mov_compra_devengo_unico'),
+        ),
+        migrations.AddConstraint(
+            model_name='movimientoprestamocobro',
+            constraint=models.UniqueConstraint(condition=models.Q(('fecha_devengo__isnull', False)), fields=('prestamo', 'tipo', 'fecha_devengo'), name='mov_prestamo_devengo_unico'),
+        ),
+    ]
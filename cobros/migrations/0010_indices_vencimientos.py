@@ -0,0 +1,20 @@
+# Generated by Django 5.2.5 on 2026-10-19 19:17
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cobros', '0009_mora_diaria'),
+        ('core', '0019_indices_vencimientos'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='prestamocobro',
+            index=models.Index(fields=['empresa', 'estado', 'fecha_vencimiento'], name='cobros_pres_empresa_5475b9_idx'),
+        ),
+    ]
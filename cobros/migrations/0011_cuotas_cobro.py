@@ -0,0 +1,38 @@
+# Generated by Django 5.2.5 on 2026-10-19 19:20
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cobros', '0010_indices_vencimientos'),
+        ('core', '0019_indices_vencimientos'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CuotaCobro',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('numero', models.PositiveIntegerField()),
+                ('fecha_vencimiento', models.DateField()),
+                ('monto', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('abonado', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('estado', models.CharField(choices=[('PENDIENTE', 'Pendiente'), ('ABONADA', 'Abonada'), ('PAGADA', 'Pagada'), ('VENCIDA', 'Vencida')], default='PENDIENTE', max_length=10)),
+                ('fecha_pago', models.DateField(blank=True, null=True)),
+                ('cliente', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='cuotas_cobro', to='core.cliente')),
+                ('compra', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='plan_cuotas', to='cobros.comprafinanciada')),
+                ('empresa', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='cuotas_cobro', to='core.empresa')),
+                ('prestamo', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='plan_cuotas', to='cobros.prestamocobro')),
+            ],
+            options={
+                'verbose_name': 'Cuota de cobranza',
+                'verbose_name_plural': 'Cuotas de cobranza',
+                'ordering': ['fecha_vencimiento', 'numero'],
+                'indexes': [models.Index(fields=['empresa', 'fecha_vencimiento', 'estado'], name='cobros_cuot_empresa_414355_idx')],
+                'constraints': [models.CheckConstraint(condition=models.Q(models.Q(('compra__isnull', True), ('prestamo__isnull', False)), models.Q(('compra__isnull', False), ('prestamo__isnull', True)), _connector='OR'), name='cuota_cobro_un_documento'), models.UniqueConstraint(condition=models.Q(('prestamo__isnull', False)), fields=('prestamo', 'numero'), name='cuota_prestamo_numero_unico'), models.UniqueConstraint(condition=models.Q(('compra__isnull', False)), fields=('compra', 'numero'), name='cuota_compra_numero_unico')],
+            },
+        ),
+    ]
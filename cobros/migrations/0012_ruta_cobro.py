@@ -0,0 +1,85 @@
+# Generated by Django 5.2.5 on 2026-10-19 19:25
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cobros', '0011_cuotas_cobro'),
+        ('core', '0020_prestamo_sistema_amortizacion'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RutaCobro',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateField()),
+                ('monto_vencido', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('monto_del_dia', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('cuotas_vencidas', models.PositiveIntegerField(default=0)),
+                ('vencimiento_mas_antiguo', models.DateField(blank=True, null=True)),
+                ('saldo_total', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('promesa_fecha', models.DateField(blank=True, null=True)),
+                ('promesa_monto', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('cobrado_hoy', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('documentos', models.JSONField(default=list)),
+                ('estado', models.CharField(choices=[('PENDIENTE', 'Pendiente'), ('ATENDIDA', 'Atendida')], default='PENDIENTE', max_length=10)),
+                ('actualizado_en', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Hoja de ruta de cobro',
+                'verbose_name_plural': 'Hojas de ruta de cobro',
+                'ordering': ['fecha', 'cliente__nombre'],
+            },
+        ),
+        migrations.AddField(
+            model_name='movimientocobro',
+            name='id_movil',
+            field=models.CharField(blank=True, max_length=40, null=True),
+        ),
+        migrations.AddField(
+            model_name='movimientocomprafinanciada',
+            name='id_movil',
+            field=models.CharField(blank=True, max_length=40, null=True),
+        ),
+        migrations.AddField(
+            model_name='movimientoprestamocobro',
+            name='id_movil',
+            field=models.CharField(blank=True, max_length=40, null=True),
+        ),
+        migrations.AddConstraint(
+            model_name='movimientocobro',
+            constraint=models.UniqueConstraint(condition=models.Q(('id_movil__isnull', False)), fields=('empresa', 'id_movil'), name='mov_cobro_id_movil_unico'),
+        ),
+        migrations.AddConstraint(
+            model_name='movimientocomprafinanciada',
+            constraint=models.UniqueConstraint(condition=models.Q(('id_movil__isnull', False)), fields=('empresa', 'id_movil'), name='mov_compra_id_movil_unico'),
+        ),
+        migrations.AddConstraint(
+            model_name='movimientoprestamocobro',
+            constraint=models.UniqueConstraint(condition=models.Q(('id_movil__isnull', False)), fields=('empresa', 'id_movil'), name='mov_prestamo_id_movil_unico'),
+        ),
+        migrations.AddField(
+            model_name='rutacobro',
+            name='cliente',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rutas_cobro', to='core.cliente'),
+        ),
+        migrations.AddField(
+            model_name='rutacobro',
+            name='empresa',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rutas_cobro', to='core.empresa'),
+        ),
+        migrations.AddIndex(
+            model_name='rutacobro',
+            index=models.Index(fields=['empresa', 'fecha', 'actualizado_en'], name='cobros_ruta_empresa_3e2984_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='rutacobro',
+            unique_together={('empresa', 'fecha', 'cliente')},
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 5.2.5 on 2026-10-19 19:27
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cobros', '0012_ruta_cobro'),
+        ('core', '0020_prestamo_sistema_amortizacion'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReciboCobro',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateTimeField(auto_now_add=True)),
+                ('monto', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('criterio', models.CharField(choices=[('FIFO', 'Facturas más antiguas primero'), ('VENCIMIENTO', 'Vencimiento más antiguo primero'), ('MANUAL', 'Reparto indicado')], default='FIFO', max_length=12)),
+                ('facturas', models.PositiveIntegerField(default=0)),
+                ('referencia', models.CharField(blank=True, max_length=100, null=True)),
+                ('observacion', models.TextField(blank=True, null=True)),
+                ('cliente', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='recibos_cobro', to='core.cliente')),
+                ('cuenta', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='recibos', to='cobros.cuentafinancieracobro')),
+                ('empresa', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='recibos_cobro', to='core.empresa')),
+                ('metodo_pago', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, to='core.metodopago')),
+                ('usuario', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Recibo de cobro',
+                'verbose_name_plural': 'Recibos de cobro',
+                'ordering': ['-fecha', '-id'],
+            },
+        ),
+        migrations.AddField(
+            model_name='movimientocobro',
+            name='recibo',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='movimientos', to='cobros.recibocobro'),
+        ),
+        migrations.AddIndex(
+            model_name='recibocobro',
+            index=models.Index(fields=['empresa', 'cliente', 'fecha'], name='cobros_reci_empresa_485a92_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-19 19:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cobros', '0013_recibo_cobro'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recibocobro',
+            name='anulado',
+            field=models.BooleanField(default=False),
+        ),
+    ]
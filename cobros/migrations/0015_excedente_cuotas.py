@@ -0,0 +1,60 @@
+# Generated by Django 5.2.5 on 2026-10-19 20:14
+
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import DecimalField, Exists, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, Greatest
+
+PAGOS = {
+    'PrestamoCobro': ('prestamo', 'MovimientoPrestamoCobro', ('CUOTA', 'ABONO_CAPITAL', 'AJUSTE_ABONO')),
+    'CompraFinanciada': ('compra', 'MovimientoCompraFinanciada', ('CUOTA', 'ABONO_EXTRA', 'AJUSTE_ABONO')),
+}
+
+
+def calcular_excedentes(apps, schema_editor):
+    """El excedente de los documentos con plan es lo pagado que sus cuotas no recibieron."""
+    CuotaCobro = apps.get_model('cobros', 'CuotaCobro')
+    cero = Value(Decimal('0'))
+    decimal = DecimalField(max_digits=12, decimal_places=2)
+
+    for nombre, (campo, movimiento, tipos) in PAGOS.items():
+        Documento = apps.get_model('cobros', nombre)
+        Movimiento = apps.get_model('cobros', movimiento)
+        pagado = (
+            Movimiento.objects.filter(**{campo: OuterRef('pk')}, anulado=False, tipo__in=tipos)
+            .values(campo).annotate(total=Sum('monto')).values('total')
+        )
+        abonado = (
+            CuotaCobro.objects.filter(**{campo: OuterRef('pk')})
+            .values(campo).annotate(total=Sum('abonado')).values('total')
+        )
+        Documento.objects.filter(Exists(CuotaCobro.objects.filter(**{campo: OuterRef('pk')}))).update(
+            excedente_cuotas=Greatest(
+                Coalesce(Subquery(pagado), cero, output_field=decimal)
+                - Coalesce(Subquery(abonado), cero, output_field=decimal),
+                cero,
+                output_field=decimal,
+            )
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cobros', '0014_recibo_cobro_anulado'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='comprafinanciada',
+            name='excedente_cuotas',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=12),
+        ),
+        migrations.AddField(
+            model_name='prestamocobro',
+            name='excedente_cuotas',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=12),
+        ),
+        migrations.RunPython(calcular_excedentes, migrations.RunPython.noop),
+    ]
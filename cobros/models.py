@@ -1,9 +1,111 @@
-from django.db import models
+from django.db import connection, models, transaction
+from django.db.models import Case, F, Value, When
+from django.db.models.lookups import GreaterThan, LessThanOrEqual
 from django.conf import settings
+from datetime import timedelta
 from decimal import Decimal
 from core.models import *
+from core import tesoreria
 from django.core.exceptions import ValidationError
 from django.utils import timezone
+
+# ==============================
+# SALDOS INCREMENTALES
+# ==============================
+def _postear(modelo, pk, campos, devolver):
+    """
+    Aplica al documento un UPDATE atómico con expresiones F() (el motor bloquea
+    la fila hasta el fin de la transacción) y devuelve los valores resultantes.
+    Cuesta dos consultas sin importar cuántos movimientos tenga el documento.
+    """
+    modelo.objects.filter(pk=pk).update(**campos)
+    return modelo.objects.filter(pk=pk).values(*devolver).get()
+
+class MovimientoConSaldo:
+    """
+    Movimiento que mueve el saldo de su documento (estado de cuenta, préstamo o
+    compra financiada). Al guardarse o borrarse suma al documento solo la
+    diferencia que produce, sin volver a recorrer su historial; el
+    recalcular_saldo() del documento queda como reparación (comando
+    recalcular_saldos_cobros).
+
+    Cada clase define el campo del documento, los tipos que restan del saldo,
+    los que cuentan como abonado (si el documento lleva total_abonado) y los
+    pagos que se reparten entre las cuotas del plan (CuotaCobro).
+    """
+    CAMPO_DOCUMENTO = None
+    TIPOS_RESTA = ()
+    TIPOS_ABONADO = ()
+    TIPOS_PAGO = ()
+
+    def _efecto(self, tipo, monto, anulado):
+        """(cambio en el saldo, cambio en el total abonado) de un movimiento."""
+        if anulado or not monto:
+            return Decimal('0.00'), Decimal('0.00')
+        saldo = -monto if tipo in self.TIPOS_RESTA else monto
+        abonado = monto if tipo in self.TIPOS_ABONADO else Decimal('0.00')
+        return saldo, abonado
+
+    def _pago(self, tipo, monto, anulado):
+        """Parte del movimiento que paga cuotas del plan."""
+        if anulado or not monto or tipo not in self.TIPOS_PAGO:
+            return Decimal('0.00')
+        return monto
+
+    def _aplicar_a_cuotas(self, delta_pago):
+        if delta_pago:
+            campo = self._meta.get_field(self.CAMPO_DOCUMENTO)
+            registrar_en_cuotas(campo.related_model, self.CAMPO_DOCUMENTO, getattr(self, campo.attname), delta_pago)
+
+    def _postear_documento(self, delta_saldo, delta_abonado):
+        campo = self._meta.get_field(self.CAMPO_DOCUMENTO)
+        valores = campo.related_model.postear(
+            getattr(self, campo.attname), delta_saldo, delta_abonado
+        )
+        # El documento ya cargado en memoria queda al día
+        if campo.is_cached(self):
+            documento = getattr(self, self.CAMPO_DOCUMENTO)
+            for nombre, valor in valores.items():
+                setattr(documento, nombre, valor)
+        return valores['saldo']
+
+    def save(self, *args, **kwargs):
+        if getattr(self, f"{self.CAMPO_DOCUMENTO}_id") is None:
+            return super().save(*args, **kwargs)
+
+        with transaction.atomic():
+            delta_saldo, delta_abonado = self._efecto(self.tipo, self.monto, self.anulado)
+            delta_pago = self._pago(self.tipo, self.monto, self.anulado)
+
+            if self.pk is None:
+                saldo = self._postear_documento(delta_saldo, delta_abonado)
+                self._aplicar_a_cuotas(delta_pago)
+                self.saldo_anterior = saldo - delta_saldo
+                self.saldo_nuevo = saldo
+                return super().save(*args, **kwargs)
+
+            previo = type(self).objects.filter(pk=self.pk).values_list('tipo', 'monto', 'anulado').first()
+            if previo:
+                saldo_previo, abonado_previo = self._efecto(*previo)
+                delta_saldo -= saldo_previo
+                delta_abonado -= abonado_previo
+                delta_pago -= self._pago(*previo)
+            super().save(*args, **kwargs)
+            if delta_saldo or delta_abonado:
+                self._postear_documento(delta_saldo, delta_abonado)
+            self._aplicar_a_cuotas(delta_pago)
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            previo = type(self).objects.filter(pk=self.pk).values_list('tipo', 'monto', 'anulado').first()
+            resultado = super().delete(*args, **kwargs)
+            if previo and getattr(self, f"{self.CAMPO_DOCUMENTO}_id") is not None:
+                delta_saldo, delta_abonado = self._efecto(*previo)
+                if delta_saldo or delta_abonado:
+                    self._postear_documento(-delta_saldo, -delta_abonado)
+                self._aplicar_a_cuotas(-self._pago(*previo))
+            return resultado
+
 # ==============================
 # CATEGORÍAS DE COBRANZA
 # ==============================
@@ -68,7 +170,41 @@ class EstadoCuentaCobro(models.Model):
     def __str__(self):
         return f"{self.factura} - Saldo: {self.saldo}"
 
+    def save(self, *args, **kwargs):
+        # Sin movimientos el saldo es el total del documento; desde ahí lo mueve cada movimiento
+        if self.pk is None and not self.saldo and not self.total_abonado:
+            self.saldo = self.total_documento
+        super().save(*args, **kwargs)
+
+    @staticmethod
+    def _valores_postear(delta_saldo, delta_abonado):
+        saldo = F('saldo') + delta_saldo
+        abonado = F('total_abonado') + delta_abonado
+        return {
+            'saldo': saldo,
+            'total_abonado': abonado,
+            'estado': Case(
+                When(estado='ANULADO', then=F('estado')),
+                When(LessThanOrEqual(saldo, 0), then=Value('PAGADO')),
+                # El barrido de vencimientos lo marcó vencido: sigue así hasta pagarse
+                When(estado='VENCIDO', then=F('estado')),
+                When(GreaterThan(abonado, 0), then=Value('ABONADO')),
+                default=Value('PENDIENTE'),
+            ),
+            'fecha_actualizacion': timezone.now(),
+        }
+
+    @classmethod
+    def postear(cls, pk, delta_saldo, delta_abonado):
+        return _postear(cls, pk, cls._valores_postear(delta_saldo, delta_abonado), ('saldo', 'total_abonado', 'estado'))
+
+    @classmethod
+    def postear_varios(cls, pks, delta_saldo, delta_abonado):
+        """Como postear, para varios documentos en un solo UPDATE; los deltas pueden ser expresiones por fila."""
+        return cls.objects.filter(pk__in=pks).update(**cls._valores_postear(delta_saldo, delta_abonado))
+
     def recalcular_saldo(self):
+        """Reparación: recalcula el saldo sumando todos los movimientos."""
         total_abonos = self.movimientos.filter(
             tipo='ABONO',
             anulado=False
@@ -91,6 +227,8 @@ class EstadoCuentaCobro(models.Model):
             pass
         elif self.saldo <= 0:
             self.estado = 'PAGADO'
+        elif self.estado == 'VENCIDO':
+            pass
         elif self.total_abonado > 0:
             self.estado = 'ABONADO'
         else:
@@ -98,10 +236,40 @@ class EstadoCuentaCobro(models.Model):
 
         self.save(update_fields=['total_abonado', 'saldo', 'estado', 'fecha_actualizacion'])
 
+class AntiguedadCartera(models.Model):
+    """
+    Foto diaria de la antigüedad de la cartera (saldos abiertos de estados de
+    cuenta) por empresa: corriente y vencido a 1-30, 31-60, 61-90 y más de 90
+    días. La genera cada noche cobros/antiguedad.py para los gráficos de
+    tendencia; el detalle por cliente se consulta en línea.
+    """
+    empresa = models.ForeignKey(Empresa, on_delete=models.CASCADE, related_name='antiguedad_cartera')
+    fecha = models.DateField()
+
+    corriente = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    vencido_1_30 = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    vencido_31_60 = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    vencido_61_90 = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    vencido_mas_90 = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    total = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    clientes = models.PositiveIntegerField(default=0)
+    documentos = models.PositiveIntegerField(default=0)
+
+    generado_en = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Antigüedad de cartera"
+        verbose_name_plural = "Antigüedad de cartera"
+        unique_together = ('empresa', 'fecha')
+        ordering = ['fecha']
+
+    def __str__(self):
+        return f"{self.empresa} - {self.fecha}: {self.total}"
+
 # ==============================
 # KARDEX / MOVIMIENTOS DE COBRANZA
 # ==============================
-class MovimientoCobro(models.Model):
+class MovimientoCobro(MovimientoConSaldo, models.Model):
     TIPO_CHOICES = [
         ('CARGO', 'Cargo inicial'),
         ('ABONO', 'Abono'),
@@ -111,6 +279,10 @@ class MovimientoCobro(models.Model):
         ('AJUSTE_CARGO', 'Ajuste cargo'),
         ('AJUSTE_ABONO', 'Ajuste abono'),
     ]
+    TIPOS_CARGO = ('CARGO', 'INTERES', 'MORA', 'AJUSTE_CARGO')
+    TIPOS_RESTA = ('ABONO', 'DESCUENTO', 'AJUSTE_ABONO')
+    TIPOS_ABONADO = ('ABONO',)
+    CAMPO_DOCUMENTO = 'estado_cuenta'
 
     empresa = models.ForeignKey(Empresa, on_delete=models.CASCADE, related_name='movimientos_cobro')
     estado_cuenta = models.ForeignKey(
@@ -134,6 +306,10 @@ class MovimientoCobro(models.Model):
 
     usuario = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.PROTECT)
     anulado = models.BooleanField(default=False)
+    # Identificador que genera el teléfono del cobrador: reenviar el mismo pago no lo duplica
+    id_movil = models.CharField(max_length=40, null=True, blank=True)
+    # Recibo del que sale el abono cuando un pago se repartió entre varias facturas
+    recibo = models.ForeignKey('ReciboCobro', on_delete=models.PROTECT, related_name='movimientos', null=True, blank=True)
 
     class Meta:
         verbose_name = "Movimiento de cobro"
@@ -143,26 +319,75 @@ class MovimientoCobro(models.Model):
             models.Index(fields=['empresa', 'cliente', 'fecha']),
             models.Index(fields=['empresa', 'factura', 'tipo']),
         ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['empresa', 'id_movil'], condition=models.Q(id_movil__isnull=False), name='mov_cobro_id_movil_unico',
+            ),
+        ]
 
     def __str__(self):
         return f"{self.get_tipo_display()} - {self.monto}"
 
+    def _validar_recibo(self):
+        # Los abonos de un recibo se anulan juntos con él (cobros/aplicacion.py), nunca uno por uno
+        if self.pk is not None and self.recibo_id is not None:
+            raise ValidationError(f"El abono es parte del recibo {self.recibo_id}: anule el recibo completo.")
+
+    def clean(self):
+        super().clean()
+        self._validar_recibo()
+
     def save(self, *args, **kwargs):
-        es_nuevo = self.pk is None
+        self._validar_recibo()
+        return super().save(*args, **kwargs)
 
-        if es_nuevo and self.estado_cuenta_id:
-            saldo_actual = self.estado_cuenta.saldo or Decimal('0.00')
-            self.saldo_anterior = saldo_actual
+    def delete(self, *args, **kwargs):
+        self._validar_recibo()
+        return super().delete(*args, **kwargs)
 
-            if self.tipo in ['ABONO', 'DESCUENTO', 'AJUSTE_ABONO']:
-                self.saldo_nuevo = saldo_actual - self.monto
-            else:
-                self.saldo_nuevo = saldo_actual + self.monto
+# ==============================
+# RECIBOS DE COBRO (UN PAGO, VARIAS FACTURAS)
+# ==============================
+class ReciboCobro(models.Model):
+    """
+    Pago de un cliente repartido entre sus estados de cuenta abiertos: cada
+    parte es un MovimientoCobro ABONO con este recibo. Lo registra y lo anula
+    (con todos sus abonos y su ingreso en la cuenta) cobros/aplicacion.py.
+    """
+    CRITERIO_CHOICES = [
+        ('FIFO', 'Facturas más antiguas primero'),
+        ('VENCIMIENTO', 'Vencimiento más antiguo primero'),
+        ('MANUAL', 'Reparto indicado'),
+    ]
 
-        super().save(*args, **kwargs)
+    empresa = models.ForeignKey(Empresa, on_delete=models.CASCADE, related_name='recibos_cobro')
+    cliente = models.ForeignKey(Cliente, on_delete=models.PROTECT, related_name='recibos_cobro')
+
+    fecha = models.DateTimeField(auto_now_add=True)
+    monto = models.DecimalField(max_digits=12, decimal_places=2)
+    criterio = models.CharField(max_length=12, choices=CRITERIO_CHOICES, default='FIFO')
+    facturas = models.PositiveIntegerField(default=0)
+
+    cuenta = models.ForeignKey(
+        'CuentaFinancieraCobro', on_delete=models.PROTECT, related_name='recibos', null=True, blank=True
+    )
+    metodo_pago = models.ForeignKey(MetodoPago, on_delete=models.PROTECT, null=True, blank=True)
+    referencia = models.CharField(max_length=100, blank=True, null=True)
+    observacion = models.TextField(blank=True, null=True)
+
+    usuario = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.PROTECT)
+    anulado = models.BooleanField(default=False)
+
+    class Meta:
+        verbose_name = "Recibo de cobro"
+        verbose_name_plural = "Recibos de cobro"
+        ordering = ['-fecha', '-id']
+        indexes = [
+            models.Index(fields=['empresa', 'cliente', 'fecha']),
+        ]
 
-        if self.estado_cuenta_id:
-            self.estado_cuenta.recalcular_saldo()
+    def __str__(self):
+        return f"Recibo {self.pk} - {self.cliente} - {self.monto}"
 
 # ==============================
 # PROMESAS DE PAGO
@@ -216,11 +441,17 @@ class CuentaFinancieraCobro(models.Model):
     numero_cuenta = models.CharField(max_length=50, blank=True, null=True)
     titular = models.CharField(max_length=150, blank=True, null=True)
     saldo_actual = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    # Saldo sin movimientos: saldo_actual = saldo_inicial + ingresos - egresos (ver cobros/conciliacion.py)
+    saldo_inicial = models.DecimalField(max_digits=14, decimal_places=2, default=0)
     activo = models.BooleanField(default=True)
     observacion = models.TextField(blank=True, null=True)
 
     fecha_creacion = models.DateTimeField(auto_now_add=True)
 
+    # Libro de la cuenta para saldos a una fecha y estados de cuenta (ver core/tesoreria.py)
+    RELACION_MOVIMIENTOS = 'movimientos'
+    CAMPO_SALDO = 'saldo_actual'
+
     class Meta:
         verbose_name = "Cuenta financiera"
         verbose_name_plural = "Cuentas financieras"
@@ -232,6 +463,11 @@ class CuentaFinancieraCobro(models.Model):
     def __str__(self):
         return f"{self.nombre} ({self.get_tipo_display()})"
 
+    def save(self, *args, **kwargs):
+        if self._state.adding and not self.saldo_inicial:
+            self.saldo_inicial = self.saldo_actual
+        super().save(*args, **kwargs)
+
 class MovimientoCuentaCobro(models.Model):
     TIPO_CHOICES = [
         ('INGRESO', 'Ingreso'),
@@ -241,6 +477,8 @@ class MovimientoCuentaCobro(models.Model):
         ('AJUSTE_MAS', 'Ajuste más'),
         ('AJUSTE_MENOS', 'Ajuste menos'),
     ]
+    TIPOS_INGRESO = ('INGRESO', 'TRANSFERENCIA_ENTRADA', 'AJUSTE_MAS')
+    TIPOS_EGRESO = ('EGRESO', 'TRANSFERENCIA_SALIDA', 'AJUSTE_MENOS')
 
     ORIGEN_CHOICES = [
         ('PRESTAMO', 'Préstamo'),
@@ -273,33 +511,53 @@ class MovimientoCuentaCobro(models.Model):
         ordering = ['fecha', 'id']
         indexes = [
             models.Index(fields=['empresa', 'cuenta', 'fecha']),
+            models.Index(fields=['cuenta', 'fecha', 'id']),
         ]
 
     def __str__(self):
         return f"{self.cuenta.nombre} - {self.get_tipo_display()} - {self.monto}"
 
     def save(self, *args, **kwargs):
-        es_nuevo = self.pk is None
-
-        if es_nuevo and self.cuenta_id:
-            saldo_actual = self.cuenta.saldo_actual or Decimal('0.00')
-            self.saldo_anterior = saldo_actual
-
-            if self.tipo in ['INGRESO', 'TRANSFERENCIA_ENTRADA', 'AJUSTE_MAS']:
-                self.saldo_nuevo = saldo_actual + self.monto
-            else:
-                if saldo_actual < self.monto:
-                    raise ValidationError(
-                        f"No hay saldo suficiente en la cuenta '{self.cuenta.nombre}'. "
-                        f"Disponible: {saldo_actual}, requerido: {self.monto}"
-                    )
-                self.saldo_nuevo = saldo_actual - self.monto
+        if self.pk is not None or not self.cuenta_id:
+            return super().save(*args, **kwargs)
+
+        with transaction.atomic():
+            delta = self.monto if self.tipo in self.TIPOS_INGRESO else -self.monto
+            self.saldo_anterior, self.saldo_nuevo = tesoreria.postear(
+                CuentaFinancieraCobro, self.cuenta_id, 'saldo_actual', delta, nombre=self.cuenta.nombre
+            )
+            super().save(*args, **kwargs)
+            tesoreria.auditar(
+                self.usuario,
+                self.empresa,
+                f"Movimiento cuenta {self.cuenta.nombre}: {self.get_tipo_display()} de ${self.monto}. Ref: {self.referencia or ''}",
+            )
+        self.cuenta.saldo_actual = self.saldo_nuevo
+
+class CierreCuentaCobro(models.Model):
+    """
+    Saldo de la cuenta financiera al cierre de cada mes y totales del mes
+    (core/tesoreria.py). El saldo a una fecha parte del último cierre.
+    """
+    cuenta = models.ForeignKey(CuentaFinancieraCobro, on_delete=models.CASCADE, related_name='cierres')
+    periodo = models.DateField(help_text="Primer día del mes cerrado")
+
+    saldo_inicial = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    ingresos = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    egresos = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    saldo_final = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    movimientos = models.PositiveIntegerField(default=0)
+
+    generado_en = models.DateTimeField(auto_now=True)
 
-        super().save(*args, **kwargs)
+    class Meta:
+        verbose_name = "Cierre mensual de cuenta"
+        verbose_name_plural = "Cierres mensuales de cuentas"
+        unique_together = ('cuenta', 'periodo')
+        ordering = ['periodo']
 
-        if es_nuevo and self.cuenta_id:
-            self.cuenta.saldo_actual = self.saldo_nuevo
-            self.cuenta.save(update_fields=['saldo_actual'])
+    def __str__(self):
+        return f"{self.cuenta} - {self.periodo:%Y-%m}: {self.saldo_final}"
 
 class PrestamoCobro(models.Model):
     ESTADO_CHOICES = [
@@ -341,6 +599,9 @@ class PrestamoCobro(models.Model):
     total = models.DecimalField(max_digits=12, decimal_places=2, default=0)
     cuota_estimada = models.DecimalField(max_digits=12, decimal_places=2, default=0)
     saldo = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    # Pagos que ya no caben en el plan de cuotas (mora, intereses, sobrepago);
+    # una reversión sale primero de aquí (ver MovimientoConSaldo._aplicar_a_cuotas)
+    excedente_cuotas = models.DecimalField(max_digits=12, decimal_places=2, default=0)
 
     estado = models.CharField(max_length=10, choices=ESTADO_CHOICES, default='ACTIVO')
     observacion = models.TextField(blank=True, null=True)
@@ -354,6 +615,7 @@ class PrestamoCobro(models.Model):
         unique_together = ('empresa', 'numero')
         indexes = [
             models.Index(fields=['empresa', 'cliente', 'estado']),
+            models.Index(fields=['empresa', 'estado', 'fecha_vencimiento']),
         ]
 
     def __str__(self):
@@ -372,8 +634,36 @@ class PrestamoCobro(models.Model):
         if cuotas <= 0:
             cuotas = 1
         return (total / Decimal(cuotas)).quantize(Decimal('0.01'))
-    
-class MovimientoPrestamoCobro(models.Model):
+
+    @classmethod
+    def postear(cls, pk, delta_saldo, delta_abonado):
+        saldo = F('saldo') + delta_saldo
+        return _postear(cls, pk, {
+            'saldo': saldo,
+            'estado': Case(
+                When(estado='ANULADO', then=F('estado')),
+                When(LessThanOrEqual(saldo, 0), then=Value('PAGADO')),
+                When(estado='VENCIDO', then=F('estado')),
+                default=Value('ACTIVO'),
+            ),
+        }, ('saldo', 'estado'))
+
+    def recalcular_saldo(self):
+        """Reparación: recalcula el saldo sumando todos los movimientos."""
+        totales = self.movimientos.filter(anulado=False).aggregate(
+            abonos=models.Sum('monto', filter=models.Q(tipo__in=MovimientoPrestamoCobro.TIPOS_ABONO)),
+            cargos=models.Sum('monto', filter=models.Q(tipo__in=MovimientoPrestamoCobro.TIPOS_CARGO)),
+        )
+        self.saldo = (totales['cargos'] or Decimal('0.00')) - (totales['abonos'] or Decimal('0.00'))
+
+        if self.saldo <= 0 and self.estado != 'ANULADO':
+            self.estado = 'PAGADO'
+        elif self.estado not in ('ANULADO', 'VENCIDO'):
+            self.estado = 'ACTIVO'
+
+        self.save(update_fields=['saldo', 'estado'])
+
+class MovimientoPrestamoCobro(MovimientoConSaldo, models.Model):
     TIPO_CHOICES = [
         ('DESEMBOLSO', 'Desembolso'),
         ('CUOTA', 'Cuota'),
@@ -383,6 +673,11 @@ class MovimientoPrestamoCobro(models.Model):
         ('AJUSTE_CARGO', 'Ajuste cargo'),
         ('AJUSTE_ABONO', 'Ajuste abono'),
     ]
+    TIPOS_ABONO = ('CUOTA', 'ABONO_CAPITAL', 'AJUSTE_ABONO')
+    TIPOS_CARGO = ('DESEMBOLSO', 'INTERES', 'MORA', 'AJUSTE_CARGO')
+    TIPOS_RESTA = TIPOS_ABONO
+    TIPOS_PAGO = TIPOS_ABONO
+    CAMPO_DOCUMENTO = 'prestamo'
 
     empresa = models.ForeignKey(Empresa, on_delete=models.CASCADE, related_name='movimientos_prestamo_cobro')
     prestamo = models.ForeignKey(PrestamoCobro, on_delete=models.CASCADE, related_name='movimientos')
@@ -408,6 +703,10 @@ class MovimientoPrestamoCobro(models.Model):
 
     usuario = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.PROTECT)
     anulado = models.BooleanField(default=False)
+    # Identificador que genera el teléfono del cobrador: reenviar el mismo pago no lo duplica
+    id_movil = models.CharField(max_length=40, null=True, blank=True)
+    # Día al que corresponde un cargo devengado automáticamente (mora); uno por préstamo y día
+    fecha_devengo = models.DateField(null=True, blank=True)
 
     class Meta:
         verbose_name = "Movimiento de préstamo"
@@ -416,42 +715,20 @@ class MovimientoPrestamoCobro(models.Model):
         indexes = [
             models.Index(fields=['empresa', 'cliente', 'fecha']),
         ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['prestamo', 'tipo', 'fecha_devengo'],
+                condition=models.Q(fecha_devengo__isnull=False),
+                name='mov_prestamo_devengo_unico',
+            ),
+            models.UniqueConstraint(
+                fields=['empresa', 'id_movil'], condition=models.Q(id_movil__isnull=False), name='mov_prestamo_id_movil_unico',
+            ),
+        ]
 
     def __str__(self):
         return f"{self.prestamo.numero} - {self.get_tipo_display()}"
 
-    def save(self, *args, **kwargs):
-        es_nuevo = self.pk is None
-
-        if es_nuevo and self.prestamo_id:
-            saldo_actual = self.prestamo.saldo or Decimal('0.00')
-            self.saldo_anterior = saldo_actual
-
-            if self.tipo in ['CUOTA', 'ABONO_CAPITAL', 'AJUSTE_ABONO']:
-                self.saldo_nuevo = saldo_actual - self.monto
-            else:
-                self.saldo_nuevo = saldo_actual + self.monto
-
-        super().save(*args, **kwargs)
-
-        if self.prestamo_id:
-            total_abonos = self.prestamo.movimientos.filter(
-                tipo__in=['CUOTA', 'ABONO_CAPITAL', 'AJUSTE_ABONO'],
-                anulado=False
-            ).aggregate(total=models.Sum('monto'))['total'] or Decimal('0.00')
-
-            total_cargos = self.prestamo.movimientos.filter(
-                tipo__in=['DESEMBOLSO', 'INTERES', 'MORA', 'AJUSTE_CARGO'],
-                anulado=False
-            ).aggregate(total=models.Sum('monto'))['total'] or Decimal('0.00')
-
-            self.prestamo.saldo = total_cargos - total_abonos
-
-            if self.prestamo.estado != 'ANULADO':
-                self.prestamo.estado = 'PAGADO' if self.prestamo.saldo <= 0 else 'ACTIVO'
-
-            self.prestamo.save(update_fields=['saldo', 'estado'])
-            
 # ==============================
 # COMPRAS FINANCIADAS
 # ==============================
@@ -477,6 +754,9 @@ class CompraFinanciada(models.Model):
     total = models.DecimalField(max_digits=12, decimal_places=2, default=0)
     total_abonado = models.DecimalField(max_digits=12, decimal_places=2, default=0)
     saldo = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    # Pagos que ya no caben en el plan de cuotas (mora, intereses, sobrepago);
+    # una reversión sale primero de aquí (ver MovimientoConSaldo._aplicar_a_cuotas)
+    excedente_cuotas = models.DecimalField(max_digits=12, decimal_places=2, default=0)
 
     cuotas = models.PositiveIntegerField(default=1)
     frecuencia_dias = models.PositiveIntegerField(default=30)
@@ -499,7 +779,22 @@ class CompraFinanciada(models.Model):
     def __str__(self):
         return f"{self.numero} - {self.cliente}"
 
+    @classmethod
+    def postear(cls, pk, delta_saldo, delta_abonado):
+        saldo = F('saldo') + delta_saldo
+        return _postear(cls, pk, {
+            'saldo': saldo,
+            'total_abonado': F('total_abonado') + delta_abonado,
+            'estado': Case(
+                When(estado='ANULADA', then=F('estado')),
+                When(LessThanOrEqual(saldo, 0), then=Value('PAGADA')),
+                When(estado='VENCIDA', then=F('estado')),
+                default=Value('ACTIVA'),
+            ),
+        }, ('saldo', 'total_abonado', 'estado'))
+
     def recalcular_saldo(self):
+        """Reparación: recalcula el saldo sumando todos los movimientos."""
         total_abonos = self.movimientos.filter(
             tipo__in=['CUOTA', 'ABONO_EXTRA', 'AJUSTE_ABONO'],
             anulado=False
@@ -513,12 +808,14 @@ class CompraFinanciada(models.Model):
         self.total_abonado = total_abonos
         self.saldo = total_cargos - total_abonos
 
-        if self.estado != 'ANULADA':
-            self.estado = 'PAGADA' if self.saldo <= 0 else 'ACTIVA'
+        if self.saldo <= 0 and self.estado != 'ANULADA':
+            self.estado = 'PAGADA'
+        elif self.estado not in ('ANULADA', 'VENCIDA'):
+            self.estado = 'ACTIVA'
 
         self.save(update_fields=['total_abonado', 'saldo', 'estado'])
 
-class MovimientoCompraFinanciada(models.Model):
+class MovimientoCompraFinanciada(MovimientoConSaldo, models.Model):
     TIPO_CHOICES = [
         ('CARGO_INICIAL', 'Cargo inicial'),
         ('CUOTA', 'Cuota'),
@@ -528,6 +825,12 @@ class MovimientoCompraFinanciada(models.Model):
         ('AJUSTE_CARGO', 'Ajuste cargo'),
         ('AJUSTE_ABONO', 'Ajuste abono'),
     ]
+    TIPOS_ABONO = ('CUOTA', 'ABONO_EXTRA', 'AJUSTE_ABONO')
+    TIPOS_CARGO = ('CARGO_INICIAL', 'INTERES', 'MORA', 'AJUSTE_CARGO')
+    TIPOS_RESTA = TIPOS_ABONO
+    TIPOS_ABONADO = TIPOS_ABONO
+    TIPOS_PAGO = TIPOS_ABONO
+    CAMPO_DOCUMENTO = 'compra'
 
     empresa = models.ForeignKey(Empresa, on_delete=models.CASCADE, related_name='movimientos_compra_financiada')
     compra = models.ForeignKey(CompraFinanciada, on_delete=models.CASCADE, related_name='movimientos')
@@ -546,6 +849,10 @@ class MovimientoCompraFinanciada(models.Model):
 
     usuario = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.PROTECT)
     anulado = models.BooleanField(default=False)
+    # Identificador que genera el teléfono del cobrador: reenviar el mismo pago no lo duplica
+    id_movil = models.CharField(max_length=40, null=True, blank=True)
+    # Día al que corresponde un cargo devengado automáticamente (mora); uno por compra y día
+    fecha_devengo = models.DateField(null=True, blank=True)
 
     class Meta:
         verbose_name = "Movimiento de compra financiada"
@@ -554,26 +861,250 @@ class MovimientoCompraFinanciada(models.Model):
         indexes = [
             models.Index(fields=['empresa', 'cliente', 'fecha']),
         ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['compra', 'tipo', 'fecha_devengo'],
+                condition=models.Q(fecha_devengo__isnull=False),
+                name='mov_compra_devengo_unico',
+            ),
+            models.UniqueConstraint(
+                fields=['empresa', 'id_movil'], condition=models.Q(id_movil__isnull=False), name='mov_compra_id_movil_unico',
+            ),
+        ]
 
     def __str__(self):
         return f"{self.compra.numero} - {self.get_tipo_display()}"
 
-    def save(self, *args, **kwargs):
-        es_nuevo = self.pk is None
+# ==============================
+# CUOTAS DE PRÉSTAMOS Y COMPRAS FINANCIADAS
+# ==============================
+# Los pagos se reparten entre las cuotas en orden (FIFO) con una sola sentencia:
+# la suma acumulada (ventana) de lo que falta en cada cuota dice cuánto le toca.
+# Una reversión (anular, editar o borrar un pago) descuenta desde la última cuota
+# abonada hacia atrás. El documento ya quedó bloqueado por su postear(), así que
+# dos pagos al mismo documento no se reparten a la vez. Lo que no cabe en el plan
+# (mora, intereses, sobrepago) queda en el excedente_cuotas del documento.
+
+_SQL_APLICAR_PAGO = """
+WITH pendientes AS (
+    SELECT id, LEAST(monto - abonado, %(monto)s - (SUM(monto - abonado) OVER (ORDER BY numero) - (monto - abonado))) AS aplica
+    FROM {tabla} WHERE {fk} = %(documento)s AND abonado < monto
+)
+UPDATE {tabla} AS c SET
+    abonado = c.abonado + p.aplica,
+    estado = CASE
+        WHEN c.abonado + p.aplica >= c.monto THEN 'PAGADA'
+        WHEN c.fecha_vencimiento < %(hoy)s THEN 'VENCIDA'
+        ELSE 'ABONADA' END,
+    fecha_pago = CASE WHEN c.abonado + p.aplica >= c.monto THEN %(hoy)s ELSE NULL END
+FROM pendientes p
+WHERE c.id = p.id AND p.aplica > 0
+RETURNING p.aplica
+"""
+
+_SQL_REVERTIR_PAGO = """
+WITH abonadas AS (
+    SELECT id, LEAST(abonado, %(monto)s - (SUM(abonado) OVER (ORDER BY numero DESC) - abonado)) AS quita
+    FROM {tabla} WHERE {fk} = %(documento)s AND abonado > 0
+)
+UPDATE {tabla} AS c SET
+    abonado = c.abonado - p.quita,
+    estado = CASE
+        WHEN c.fecha_vencimiento < %(hoy)s THEN 'VENCIDA'
+        WHEN c.abonado - p.quita > 0 THEN 'ABONADA'
+        ELSE 'PENDIENTE' END,
+    fecha_pago = NULL
+FROM abonadas p
+WHERE c.id = p.id AND p.quita > 0
+RETURNING p.quita
+"""
+
+class CuotaCobro(models.Model):
+    """
+    Cuota del plan de pagos de un préstamo o de una compra financiada (uno de
+    los dos). El índice (empresa, fecha_vencimiento, estado) responde "qué
+    vence hoy" o "qué está vencido" sin recalcular planes.
+    """
+    ESTADO_CHOICES = [
+        ('PENDIENTE', 'Pendiente'),
+        ('ABONADA', 'Abonada'),
+        ('PAGADA', 'Pagada'),
+        ('VENCIDA', 'Vencida'),
+    ]
 
-        if es_nuevo and self.compra_id:
-            saldo_actual = self.compra.saldo or Decimal('0.00')
-            self.saldo_anterior = saldo_actual
+    empresa = models.ForeignKey(Empresa, on_delete=models.CASCADE, related_name='cuotas_cobro')
+    cliente = models.ForeignKey(Cliente, on_delete=models.PROTECT, related_name='cuotas_cobro')
+    prestamo = models.ForeignKey(
+        PrestamoCobro, on_delete=models.CASCADE, related_name='plan_cuotas', null=True, blank=True
+    )
+    compra = models.ForeignKey(
+        CompraFinanciada, on_delete=models.CASCADE, related_name='plan_cuotas', null=True, blank=True
+    )
 
-            if self.tipo in ['CUOTA', 'ABONO_EXTRA', 'AJUSTE_ABONO']:
-                self.saldo_nuevo = saldo_actual - self.monto
-            else:
-                self.saldo_nuevo = saldo_actual + self.monto
+    numero = models.PositiveIntegerField()
+    fecha_vencimiento = models.DateField()
+    monto = models.DecimalField(max_digits=12, decimal_places=2)
+    abonado = models.DecimalField(max_digits=12, decimal_places=2, default=0)
 
-        super().save(*args, **kwargs)
+    estado = models.CharField(max_length=10, choices=ESTADO_CHOICES, default='PENDIENTE')
+    fecha_pago = models.DateField(null=True, blank=True)
 
-        if self.compra_id:
-            self.compra.recalcular_saldo()
+    class Meta:
+        verbose_name = "Cuota de cobranza"
+        verbose_name_plural = "Cuotas de cobranza"
+        ordering = ['fecha_vencimiento', 'numero']
+        indexes = [
+            models.Index(fields=['empresa', 'fecha_vencimiento', 'estado']),
+        ]
+        constraints = [
+            models.CheckConstraint(
+                condition=(
+                    models.Q(prestamo__isnull=False, compra__isnull=True)
+                    | models.Q(prestamo__isnull=True, compra__isnull=False)
+                ),
+                name='cuota_cobro_un_documento',
+            ),
+            models.UniqueConstraint(
+                fields=['prestamo', 'numero'], condition=models.Q(prestamo__isnull=False), name='cuota_prestamo_numero_unico',
+            ),
+            models.UniqueConstraint(
+                fields=['compra', 'numero'], condition=models.Q(compra__isnull=False), name='cuota_compra_numero_unico',
+            ),
+        ]
+
+    def __str__(self):
+        documento = self.prestamo or self.compra
+        return f"{documento.numero} - Cuota {self.numero}"
+
+    @property
+    def pendiente(self):
+        return self.monto - self.abonado
+
+    @staticmethod
+    def _campo(documento):
+        return 'prestamo' if isinstance(documento, PrestamoCobro) else 'compra'
+
+    @classmethod
+    def plan(cls, documento):
+        """[(fecha_vencimiento, monto)]: el total en partes iguales, el redondeo en la última cuota."""
+        cuotas = max(documento.cuotas or 1, 1)
+        frecuencia = documento.frecuencia_dias or 30
+        total = documento.total or Decimal('0.00')
+        monto = (total / cuotas).quantize(Decimal('0.01'))
+        return [
+            (
+                documento.fecha + timedelta(days=frecuencia * numero),
+                monto if numero < cuotas else total - monto * (cuotas - 1),
+            )
+            for numero in range(1, cuotas + 1)
+        ]
+
+    @classmethod
+    def generar(cls, documento):
+        """Crea el plan de cuotas del documento (un solo INSERT). No hace nada si ya tiene."""
+        campo = cls._campo(documento)
+        if documento.plan_cuotas.exists():
+            return 0
+        hoy = timezone.localdate()
+        cuotas = [
+            cls(
+                empresa_id=documento.empresa_id,
+                cliente_id=documento.cliente_id,
+                numero=numero,
+                fecha_vencimiento=fecha,
+                monto=monto,
+                estado='VENCIDA' if fecha < hoy else 'PENDIENTE',
+                **{campo: documento},
+            )
+            for numero, (fecha, monto) in enumerate(cls.plan(documento), start=1)
+        ]
+        cls.objects.bulk_create(cuotas)
+        return len(cuotas)
+
+    @classmethod
+    def aplicar_pago(cls, campo, documento_id, monto):
+        """
+        Reparte `monto` entre las cuotas impagas del documento (o lo revierte si
+        es negativo). Devuelve, con el mismo signo, la parte que no cupo: lo que
+        excede a lo pendiente del plan o, en una reversión, lo que las cuotas no
+        tenían abonado. El que llama decide qué hacer con ella.
+        """
+        monto = Decimal(monto)
+        if not monto:
+            return Decimal('0.00')
+        sql = _SQL_APLICAR_PAGO if monto > 0 else _SQL_REVERTIR_PAGO
+        sql = sql.format(tabla=cls._meta.db_table, fk=cls._meta.get_field(campo).column)
+        with connection.cursor() as cursor:
+            cursor.execute(sql, {'monto': abs(monto), 'documento': documento_id, 'hoy': timezone.localdate()})
+            repartido = sum((fila[0] for fila in cursor.fetchall()), Decimal('0.00'))
+        return monto - repartido if monto > 0 else monto + repartido
+
+def registrar_en_cuotas(modelo, campo, documento_id, monto):
+    """
+    Aplica (o revierte) un pago en el plan de cuotas del documento y lleva lo
+    que no cabe en documento.excedente_cuotas. Una reversión sale primero del
+    excedente: así anular un pago de mora no deja impaga una cuota que otro
+    pago había cubierto.
+    """
+    monto = Decimal(monto)
+    if monto < 0:
+        excedente = modelo.objects.filter(pk=documento_id).values_list('excedente_cuotas', flat=True).get()
+        toma = min(excedente, -monto)
+        if toma:
+            modelo.objects.filter(pk=documento_id).update(excedente_cuotas=F('excedente_cuotas') - toma)
+            monto += toma
+    resto = CuotaCobro.aplicar_pago(campo, documento_id, monto)
+    if resto > 0:
+        modelo.objects.filter(pk=documento_id).update(excedente_cuotas=F('excedente_cuotas') + resto)
+    return resto
+
+# ==============================
+# HOJA DE RUTA DE COBRADORES
+# ==============================
+class RutaCobro(models.Model):
+    """
+    Cliente por visitar en la hoja de ruta de un día: lo vencido y lo que vence
+    ese día (cuotas y estados de cuenta), su promesa de pago y sus saldos. La
+    genera cobros/ruta.py de madrugada y la refresca por cliente cuando se
+    registra un pago o una promesa; actualizado_en es el cursor con el que los
+    teléfonos bajan solo lo que cambió.
+    """
+    ESTADO_CHOICES = [
+        ('PENDIENTE', 'Pendiente'),
+        ('ATENDIDA', 'Atendida'),
+    ]
+
+    empresa = models.ForeignKey(Empresa, on_delete=models.CASCADE, related_name='rutas_cobro')
+    fecha = models.DateField()
+    cliente = models.ForeignKey(Cliente, on_delete=models.CASCADE, related_name='rutas_cobro')
+
+    monto_vencido = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    monto_del_dia = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    cuotas_vencidas = models.PositiveIntegerField(default=0)
+    vencimiento_mas_antiguo = models.DateField(null=True, blank=True)
+    saldo_total = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    promesa_fecha = models.DateField(null=True, blank=True)
+    promesa_monto = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+
+    cobrado_hoy = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    # [{"tipo": "prestamo" | "compra" | "estado_cuenta", "id", "numero", "exigible", "saldo"}]
+    documentos = models.JSONField(default=list)
+
+    estado = models.CharField(max_length=10, choices=ESTADO_CHOICES, default='PENDIENTE')
+    actualizado_en = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Hoja de ruta de cobro"
+        verbose_name_plural = "Hojas de ruta de cobro"
+        ordering = ['fecha', 'cliente__nombre']
+        unique_together = ('empresa', 'fecha', 'cliente')
+        indexes = [
+            models.Index(fields=['empresa', 'fecha', 'actualizado_en']),
+        ]
+
+    def __str__(self):
+        return f"{self.fecha} - {self.cliente}"
 
 # ==============================
 # CUENTAS FINANCIERAS / BANCOS
@@ -0,0 +1,168 @@
+# Ubicación: cobros/mora.py
+"""
+Devengo diario de mora de préstamos y compras financiadas.
+
+La mora del día es el porcentaje diario de la empresa
+(Empresa.mora_porcentaje_diario) sobre lo vencido y no pagado del plan de
+cuotas del documento (CuotaCobro: monto - abonado de las cuotas que vencieron
+antes del día; los préstamos, además, vencen por completo en
+fecha_vencimiento), siempre que la cuota impaga más antigua supere los días
+de gracia. Se calcula sobre las cuotas, no sobre la mora ya cargada. Los
+documentos sin plan no devengan: se les genera con el comando
+generar_cuotas_cobros.
+
+Por tabla, devengar() hace:
+- una consulta con todos los documentos candidatos de todas las empresas
+  (con lo vencido de sus cuotas en subconsultas), bloqueándolos;
+- el cálculo en memoria, sin consultas por documento;
+- un bulk_create de los movimientos MORA con fecha_devengo;
+- un único UPDATE que suma a cada saldo su cargo del día.
+
+La restricción única (documento, tipo, fecha_devengo) y el filtro de los ya
+devengados hacen que correrlo dos veces el mismo día no cargue dos veces. Lo
+ejecuta la TAREA 13 de core/tasks.py y, para recuperar días, el comando
+devengar_mora (lo abonado es el de las cuotas al correrlo: al recuperar días
+pasados, los pagos posteriores ya cuentan).
+
+El interés ordinario no se devenga aquí: ya va incluido en el total del
+documento (DESEMBOLSO / CARGO_INICIAL) al crearlo.
+"""
+import datetime
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.db import transaction
+from django.db.models import DecimalField, Exists, F, Min, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from core import cache as cache_erp
+
+from .models import (
+    CompraFinanciada, CuotaCobro, MovimientoCompraFinanciada, MovimientoPrestamoCobro, PrestamoCobro,
+)
+
+CERO = Decimal("0.00")
+CENTAVO = Decimal("0.01")
+
+TABLAS = [
+    {
+        "nombre": "prestamos",
+        "modelo": PrestamoCobro,
+        "movimiento": MovimientoPrestamoCobro,
+        "fk": "prestamo",
+        "estados": ("ACTIVO", "VENCIDO"),
+        "vencimiento": "fecha_vencimiento",
+    },
+    {
+        "nombre": "compras_financiadas",
+        "modelo": CompraFinanciada,
+        "movimiento": MovimientoCompraFinanciada,
+        "fk": "compra",
+        "estados": ("ACTIVA", "VENCIDA"),
+        "vencimiento": None,
+    },
+]
+
+def calcular_mora(dia, fila):
+    """
+    Mora del `dia` de un documento (dict con saldo, tasa, gracia y, de sus
+    cuotas impagas, vencido, pendiente y primera_impaga; opcionalmente
+    vencimiento).
+    """
+    vencido = fila["vencido"]
+    primera = fila["primera_impaga"]
+    if fila.get("vencimiento") and dia > fila["vencimiento"]:
+        # Préstamo vencido por completo: todo lo pendiente es exigible
+        vencido = fila["pendiente"]
+        if primera is None or fila["vencimiento"] < primera:
+            primera = fila["vencimiento"]
+    vencido = min(vencido, fila["saldo"])
+    if vencido <= 0 or primera is None:
+        return CERO
+    if (dia - primera).days <= fila["gracia"]:
+        return CERO
+
+    return (vencido * fila["tasa"] / Decimal("100")).quantize(CENTAVO, rounding=ROUND_HALF_UP)
+
+def _candidatos(tabla, dia, empresa_ids):
+    modelo, movimiento, fk = tabla["modelo"], tabla["movimiento"], tabla["fk"]
+    impagas = (
+        CuotaCobro.objects.filter(**{fk: OuterRef("pk")}, abonado__lt=F("monto"))
+        .exclude(estado="PAGADA").order_by().values(fk)
+    )
+    pendiente = Sum(F("monto") - F("abonado"))
+    devengado = movimiento.objects.filter(**{fk: OuterRef("pk")}, tipo="MORA", fecha_devengo=dia)
+
+    documentos = modelo.objects.filter(
+        estado__in=tabla["estados"],
+        saldo__gt=0,
+        fecha__lt=dia,
+        empresa__mora_porcentaje_diario__gt=0,
+    ).exclude(Exists(devengado))
+    if empresa_ids is not None:
+        documentos = documentos.filter(empresa_id__in=empresa_ids)
+
+    monto = DecimalField(max_digits=12, decimal_places=2)
+    columnas = {
+        "tasa": F("empresa__mora_porcentaje_diario"),
+        "gracia": F("empresa__dias_gracia_mora"),
+        "vencido": Coalesce(
+            Subquery(impagas.filter(fecha_vencimiento__lt=dia).annotate(t=pendiente).values("t")),
+            Value(CERO), output_field=monto,
+        ),
+        "pendiente": Coalesce(Subquery(impagas.annotate(t=pendiente).values("t")), Value(CERO), output_field=monto),
+        "primera_impaga": Subquery(impagas.annotate(p=Min("fecha_vencimiento")).values("p")),
+    }
+    if tabla["vencimiento"]:
+        columnas["vencimiento"] = F(tabla["vencimiento"])
+    # Bloquea los documentos (no la empresa) hasta el UPDATE del saldo
+    return (
+        documentos.select_for_update(of=("self",))
+        .annotate(**columnas)
+        .values("id", "empresa_id", "cliente_id", "usuario_id", "saldo", *columnas)
+        .order_by("id")
+    )
+
+def _devengar_tabla(tabla, dia, empresa_ids):
+    movimiento, fk = tabla["movimiento"], tabla["fk"]
+    cargos = []
+    with transaction.atomic():
+        for fila in _candidatos(tabla, dia, empresa_ids):
+            mora = calcular_mora(dia, fila)
+            if mora <= 0:
+                continue
+            cargos.append(movimiento(
+                empresa_id=fila["empresa_id"],
+                cliente_id=fila["cliente_id"],
+                usuario_id=fila["usuario_id"],
+                tipo="MORA",
+                monto=mora,
+                saldo_anterior=fila["saldo"],
+                saldo_nuevo=fila["saldo"] + mora,
+                fecha_devengo=dia,
+                observacion=f"Mora del {dia:%d/%m/%Y}",
+                **{f"{fk}_id": fila["id"]},
+            ))
+        if not cargos:
+            return 0
+
+        # bulk_create no pasa por MovimientoConSaldo.save: el saldo se suma aquí, en un solo UPDATE
+        movimiento.objects.bulk_create(cargos)
+        cargo_del_dia = movimiento.objects.filter(
+            **{fk: OuterRef("pk")}, tipo="MORA", fecha_devengo=dia,
+        ).values("monto")[:1]
+        tabla["modelo"].objects.filter(pk__in=[getattr(c, f"{fk}_id") for c in cargos]).update(
+            saldo=F("saldo") + Subquery(cargo_del_dia)
+        )
+        for empresa_id in {c.empresa_id for c in cargos}:
+            cache_erp.invalidar_al_confirmar("cobros", empresa_id)
+    return len(cargos)
+
+def devengar(dia=None, empresa_ids=None):
+    """
+    Carga la mora de `dia` (por defecto ayer, el último día completo) de todas
+    las empresas con mora configurada. Devuelve {tabla: cargos creados}.
+    """
+    if dia is None:
+        dia = timezone.localdate() - datetime.timedelta(days=1)
+    return {tabla["nombre"]: _devengar_tabla(tabla, dia, empresa_ids) for tabla in TABLAS}
@@ -0,0 +1,90 @@
+# Ubicación: cobros/reportes.py
+"""
+Indicadores de cobranza para el dashboard y los reportes de cobros.
+
+Cada tabla se recorre una sola vez: los totales y conteos por estado o por
+tipo de movimiento salen de un único aggregate con Sum/Count(filter=Q(...)).
+El resultado se cachea por empresa y rango de fechas en el espacio "cobros"
+de core/cache.py, que se invalida con cada movimiento de cobranza (ver
+cobros/signals.py).
+"""
+from django.db.models import Count, Q, Sum
+
+from core import cache as cache_erp
+from core.fechas import rango_dias
+
+from .models import (
+    CompraFinanciada, MovimientoCompraFinanciada, MovimientoCuentaCobro,
+    MovimientoPrestamoCobro, PrestamoCobro,
+)
+
+def _totales(queryset, **expresiones):
+    """aggregate() con los None (sin filas) convertidos en 0."""
+    return {campo: valor or 0 for campo, valor in queryset.aggregate(**expresiones).items()}
+
+# ==========================================
+# UNA CONSULTA POR TABLA
+# ==========================================
+
+def resumen_prestamos(empresa):
+    return _totales(
+        PrestamoCobro.objects.filter(empresa=empresa),
+        total_prestado=Sum("monto"),
+        saldo=Sum("saldo"),
+        activos=Count("id", filter=Q(estado="ACTIVO")),
+        pagados=Count("id", filter=Q(estado="PAGADO")),
+        vencidos=Count("id", filter=Q(estado="VENCIDO")),
+    )
+
+def resumen_compras_financiadas(empresa):
+    return _totales(
+        CompraFinanciada.objects.filter(empresa=empresa),
+        total_financiado=Sum("monto_producto"),
+        saldo=Sum("saldo"),
+        activas=Count("id", filter=Q(estado="ACTIVA")),
+        pagadas=Count("id", filter=Q(estado="PAGADA")),
+        vencidas=Count("id", filter=Q(estado="VENCIDA")),
+    )
+
+def flujo_cuentas(empresa, desde, hasta):
+    return _totales(
+        MovimientoCuentaCobro.objects.filter(empresa=empresa, anulado=False, **rango_dias(desde, hasta)),
+        ingresos=Sum("monto", filter=Q(tipo__in=MovimientoCuentaCobro.TIPOS_INGRESO)),
+        egresos=Sum("monto", filter=Q(tipo__in=MovimientoCuentaCobro.TIPOS_EGRESO)),
+    )
+
+def _cobrado(modelo, empresa, desde, hasta):
+    return _totales(
+        modelo.objects.filter(empresa=empresa, anulado=False, tipo__in=modelo.TIPOS_ABONO, **rango_dias(desde, hasta)),
+        total=Sum("monto"),
+        movimientos=Count("id"),
+    )
+
+# ==========================================
+# INDICADORES (CACHEADOS)
+# ==========================================
+
+def _calcular(empresa, desde, hasta):
+    prestamos = resumen_prestamos(empresa)
+    compras = resumen_compras_financiadas(empresa)
+    cuentas = flujo_cuentas(empresa, desde, hasta)
+    cobrado_prestamos = _cobrado(MovimientoPrestamoCobro, empresa, desde, hasta)
+    cobrado_compras = _cobrado(MovimientoCompraFinanciada, empresa, desde, hasta)
+    return {
+        "desde": desde,
+        "hasta": hasta,
+        "prestamos": prestamos,
+        "compras": compras,
+        "cuentas": cuentas,
+        "cobrado_prestamos": cobrado_prestamos["total"],
+        "cobrado_compras": cobrado_compras["total"],
+        "total_cobrado": cobrado_prestamos["total"] + cobrado_compras["total"],
+        "movimientos_cobro": cobrado_prestamos["movimientos"] + cobrado_compras["movimientos"],
+    }
+
+def indicadores(empresa, desde, hasta):
+    """Todos los KPI de cobranza de la empresa; los flujos y cobros, del rango [desde, hasta]."""
+    return cache_erp.obtener(
+        empresa.id, ("cobros",), "cobros_indicadores",
+        lambda: _calcular(empresa, desde, hasta), partes=(desde, hasta),
+    )
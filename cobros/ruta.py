@@ -0,0 +1,212 @@
+# Ubicación: cobros/ruta.py
+"""
+Hoja de ruta diaria de los cobradores: clientes con cuotas (CuotaCobro) o
+estados de cuenta vencidos o que vencen en el día, o con una promesa de pago
+para ese día, con lo exigible por documento, sus saldos y lo ya cobrado.
+
+- generar: arma las filas de RutaCobro de una empresa con unas pocas
+  consultas agrupadas (rangos sobre fecha_vencimiento y fecha, usables por
+  índice) y las guarda con un solo upsert. Con `clientes` recalcula solo esos.
+  Lo ejecuta de madrugada la TAREA 15 de core/tasks.py.
+- marcar: lo llaman las señales de pagos y promesas; junta los clientes
+  tocados en la transacción y los refresca una sola vez al confirmarla.
+- cambios: filas del día modificadas desde el cursor de un teléfono.
+
+Las filas no se borran durante el día: un cliente que ya no debe nada queda
+ATENDIDA con sus montos en cero, así la sincronización por cursor también
+trae esos cambios.
+"""
+import datetime
+from decimal import Decimal
+
+from django.db.models import Count, F, Min, Q, Sum
+from django.utils import timezone
+
+from core import transacciones
+from core.fechas import rango_dias
+from core.models import Empresa
+
+from . import antiguedad
+from .models import (
+    CompraFinanciada, CuotaCobro, MovimientoCobro, MovimientoCompraFinanciada,
+    MovimientoPrestamoCobro, PrestamoCobro, PromesaPago, RutaCobro,
+)
+
+CERO = Decimal("0.00")
+# Margen del cursor: una transacción que escribió antes del cursor pero confirmó después
+# no se pierde; el teléfono recibe otra vez esas filas y las reemplaza por id
+MARGEN_SINCRONIZACION = datetime.timedelta(seconds=30)
+
+# (modelo, tipos que cuentan como cobro) para lo cobrado en el día
+COBROS = (
+    (MovimientoPrestamoCobro, MovimientoPrestamoCobro.TIPOS_ABONO),
+    (MovimientoCompraFinanciada, MovimientoCompraFinanciada.TIPOS_ABONO),
+    (MovimientoCobro, MovimientoCobro.TIPOS_ABONADO),
+)
+
+CAMPOS = [
+    "monto_vencido", "monto_del_dia", "cuotas_vencidas", "vencimiento_mas_antiguo", "saldo_total",
+    "promesa_fecha", "promesa_monto", "cobrado_hoy", "documentos", "estado", "actualizado_en",
+]
+
+def _fila_vacia():
+    return {
+        "monto_vencido": CERO, "monto_del_dia": CERO, "cuotas_vencidas": 0, "vencimiento_mas_antiguo": None,
+        "saldo_total": CERO, "promesa_fecha": None, "promesa_monto": CERO, "cobrado_hoy": CERO, "documentos": [],
+    }
+
+def _acumular(fila, vencido, del_dia, vencidas, vence):
+    fila["monto_vencido"] += vencido or CERO
+    fila["monto_del_dia"] += del_dia or CERO
+    fila["cuotas_vencidas"] += vencidas
+    if vence and (fila["vencimiento_mas_antiguo"] is None or vence < fila["vencimiento_mas_antiguo"]):
+        fila["vencimiento_mas_antiguo"] = vence
+
+# ==========================================
+# CÁLCULO
+# ==========================================
+
+def _calcular(empresa_id, fecha, clientes=None):
+    """{cliente_id: valores de RutaCobro} de los clientes con algo por cobrar en `fecha`."""
+    acotar = (lambda qs: qs.filter(cliente_id__in=clientes)) if clientes is not None else (lambda qs: qs)
+    filas = {}
+
+    pendiente = F("monto") - F("abonado")
+    cuotas = acotar(CuotaCobro.objects.filter(empresa_id=empresa_id, fecha_vencimiento__lte=fecha)).exclude(estado="PAGADA")
+    for c in cuotas.values("cliente_id", "prestamo_id", "prestamo__numero", "compra_id", "compra__numero").annotate(
+        vencido=Sum(pendiente, filter=Q(fecha_vencimiento__lt=fecha)),
+        del_dia=Sum(pendiente, filter=Q(fecha_vencimiento=fecha)),
+        vencidas=Count("id", filter=Q(fecha_vencimiento__lt=fecha)),
+        vence=Min("fecha_vencimiento"),
+    ).order_by():
+        fila = filas.setdefault(c["cliente_id"], _fila_vacia())
+        _acumular(fila, c["vencido"], c["del_dia"], c["vencidas"], c["vence"])
+        tipo = "prestamo" if c["prestamo_id"] else "compra"
+        fila["documentos"].append({
+            "tipo": tipo,
+            "id": c[f"{tipo}_id"],
+            "numero": c[f"{tipo}__numero"],
+            "exigible": (c["vencido"] or CERO) + (c["del_dia"] or CERO),
+        })
+
+    facturas = acotar(antiguedad.abiertas().filter(empresa_id=empresa_id, fecha_vencimiento__lte=fecha))
+    for e in facturas.values("id", "cliente_id", "factura__secuencial", "saldo", "fecha_vencimiento"):
+        fila = filas.setdefault(e["cliente_id"], _fila_vacia())
+        vencida = e["fecha_vencimiento"] < fecha
+        _acumular(fila, e["saldo"] if vencida else CERO, CERO if vencida else e["saldo"], int(vencida), e["fecha_vencimiento"])
+        fila["documentos"].append({
+            "tipo": "estado_cuenta", "id": e["id"], "numero": e["factura__secuencial"], "exigible": e["saldo"],
+        })
+
+    # Las promesas de días siguientes se informan, pero solo traen a la ruta las que vencen hoy
+    promesas = acotar(PromesaPago.objects.filter(empresa_id=empresa_id, estado="PENDIENTE", fecha_promesa__gte=fecha))
+    for p in promesas.values("cliente_id").annotate(
+        primera=Min("fecha_promesa"), monto=Sum("monto_prometido", filter=Q(fecha_promesa=fecha)),
+    ).order_by():
+        if p["primera"] == fecha:
+            fila = filas.setdefault(p["cliente_id"], _fila_vacia())
+        elif p["cliente_id"] in filas:
+            fila = filas[p["cliente_id"]]
+        else:
+            continue
+        fila["promesa_fecha"] = p["primera"]
+        fila["promesa_monto"] = p["monto"] or CERO
+    return filas
+
+def _completar(empresa_id, fecha, filas):
+    """Saldos totales y lo cobrado en `fecha` de los clientes de la ruta."""
+    ids = list(filas)
+    if not ids:
+        return
+    for modelo, estados in ((PrestamoCobro, ("ACTIVO", "VENCIDO")), (CompraFinanciada, ("ACTIVA", "VENCIDA"))):
+        for cliente_id, saldo in modelo.objects.filter(
+            empresa_id=empresa_id, cliente_id__in=ids, estado__in=estados, saldo__gt=0,
+        ).values("cliente_id").annotate(s=Sum("saldo")).order_by().values_list("cliente_id", "s"):
+            filas[cliente_id]["saldo_total"] += saldo
+    for cliente_id, saldo in antiguedad.abiertas().filter(
+        empresa_id=empresa_id, cliente_id__in=ids,
+    ).values("cliente_id").annotate(s=Sum("saldo")).order_by().values_list("cliente_id", "s"):
+        filas[cliente_id]["saldo_total"] += saldo
+
+    for modelo, tipos in COBROS:
+        for cliente_id, cobrado in modelo.objects.filter(
+            empresa_id=empresa_id, cliente_id__in=ids, tipo__in=tipos, anulado=False, **rango_dias(fecha, fecha),
+        ).values("cliente_id").annotate(s=Sum("monto")).order_by().values_list("cliente_id", "s"):
+            filas[cliente_id]["cobrado_hoy"] += cobrado
+
+# ==========================================
+# GENERACIÓN Y REFRESCO
+# ==========================================
+
+def generar(empresa_id, fecha=None, clientes=None):
+    """
+    Guarda (o reemplaza) la ruta de `fecha` (hoy) de la empresa, o solo la de
+    `clientes`. Los que ya estaban en la ruta y no deben nada quedan en cero y
+    ATENDIDA. Devuelve las filas escritas.
+    """
+    fecha = fecha or timezone.localdate()
+    filas = _calcular(empresa_id, fecha, clientes)
+    previas = RutaCobro.objects.filter(empresa_id=empresa_id, fecha=fecha)
+    if clientes is not None:
+        previas = previas.filter(cliente_id__in=clientes)
+    for cliente_id in previas.values_list("cliente_id", flat=True):
+        filas.setdefault(cliente_id, _fila_vacia())
+    _completar(empresa_id, fecha, filas)
+
+    rutas = []
+    for cliente_id, valores in filas.items():
+        exigible = valores["monto_vencido"] + valores["monto_del_dia"]
+        valores["estado"] = "ATENDIDA" if valores["cobrado_hoy"] > 0 or (exigible <= 0 and not valores["promesa_monto"]) else "PENDIENTE"
+        valores["documentos"] = [dict(d, exigible=str(d["exigible"])) for d in valores["documentos"]]
+        rutas.append(RutaCobro(empresa_id=empresa_id, fecha=fecha, cliente_id=cliente_id, **valores))
+    RutaCobro.objects.bulk_create(
+        rutas, update_conflicts=True, unique_fields=["empresa", "fecha", "cliente"], update_fields=CAMPOS,
+    )
+    return len(rutas)
+
+def generar_todas(fecha=None, empresa_ids=None):
+    """Genera la ruta de `fecha` de todas las empresas (o las indicadas). Devuelve {empresa_id: filas}."""
+    empresas = Empresa.objects.all()
+    if empresa_ids is not None:
+        empresas = empresas.filter(pk__in=empresa_ids)
+    return {empresa_id: generar(empresa_id, fecha) for empresa_id in empresas.order_by("pk").values_list("pk", flat=True)}
+
+def refrescar(pendientes):
+    """Recalcula los clientes {empresa_id: {cliente_id}} en la ruta de hoy de las empresas que ya la tienen."""
+    hoy = timezone.localdate()
+    con_ruta = set(
+        RutaCobro.objects.filter(empresa_id__in=pendientes, fecha=hoy).values_list("empresa_id", flat=True).distinct()
+    )
+    for empresa_id, clientes in pendientes.items():
+        if empresa_id in con_ruta:
+            generar(empresa_id, hoy, clientes)
+
+def marcar(empresa_id, cliente_id):
+    """Pide refrescar al cliente en la ruta de hoy cuando se confirme la transacción (una vez por transacción)."""
+    if empresa_id is None or cliente_id is None:
+        return
+    pendientes = transacciones.lote_al_confirmar("ruta_cobro", refrescar, dict)
+    if pendientes is None:
+        refrescar({empresa_id: {cliente_id}})
+        return
+    pendientes.setdefault(empresa_id, set()).add(cliente_id)
+
+# ==========================================
+# SINCRONIZACIÓN
+# ==========================================
+
+def cambios(empresa, desde=None):
+    """
+    Filas de la ruta de hoy cambiadas desde `desde` (todas si es None), y el
+    cursor para la próxima sincronización. El cursor se toma antes de leer.
+    """
+    cursor = timezone.now()
+    filas = RutaCobro.objects.filter(empresa=empresa, fecha=timezone.localdate())
+    if desde is not None:
+        filas = filas.filter(actualizado_en__gt=desde - MARGEN_SINCRONIZACION)
+    return list(
+        filas.order_by("cliente__nombre", "cliente_id").values(
+            "id", "cliente_id", "cliente__nombre", "cliente__ruc", "cliente__direccion", "cliente__telefono",
+            *(c for c in CAMPOS if c != "actualizado_en"), "actualizado_en",
+        )
+    ), cursor
@@ -0,0 +1,28 @@
+# Ubicación: cobros/signals.py
+from django.db.models.signals import post_delete, post_save
+
+from core.signals import conectar_invalidacion
+
+from . import ruta
+from .models import (
+    CompraFinanciada, CuentaFinancieraCobro, EstadoCuentaCobro, MovimientoCobro,
+    MovimientoCompraFinanciada, MovimientoCuentaCobro, MovimientoPrestamoCobro,
+    PrestamoCobro, PromesaPago,
+)
+
+# Cualquier cambio de cobranza invalida lo cacheado del espacio "cobros" de la empresa
+conectar_invalidacion(
+    "cobros",
+    EstadoCuentaCobro, MovimientoCobro, PromesaPago, CuentaFinancieraCobro,
+    MovimientoCuentaCobro, PrestamoCobro, MovimientoPrestamoCobro,
+    CompraFinanciada, MovimientoCompraFinanciada,
+)
+
+# Un pago o una promesa cambia lo que el cliente tiene por cobrar en la ruta de hoy
+def _marcar_en_ruta(sender, instance, **kwargs):
+    ruta.marcar(instance.empresa_id, instance.cliente_id)
+
+for modelo in (MovimientoCobro, MovimientoPrestamoCobro, MovimientoCompraFinanciada, PromesaPago):
+    uid = f"ruta:{modelo._meta.label}"
+    post_save.connect(_marcar_en_ruta, sender=modelo, dispatch_uid=uid)
+    post_delete.connect(_marcar_en_ruta, sender=modelo, dispatch_uid=uid)
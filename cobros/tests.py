@@ -1,3 +1,577 @@
+import datetime
+import io
+import json
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.management import call_command
+from django.db import IntegrityError, connection, transaction
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from core.fechas import inicio_dia
+from core.models import Bitacora, Cliente, Empresa, Factura, Perfil, PuntoControl, PuntoVenta
+
+from . import antiguedad, aplicacion, conciliacion, mora, reportes, vencimientos
+from .models import (
+    AntiguedadCartera, CuentaFinancieraCobro, CuotaCobro, EstadoCuentaCobro, MovimientoCobro,
+    MovimientoCuentaCobro, MovimientoPrestamoCobro, PrestamoCobro, PromesaPago, ReciboCobro,
+)
+
+class CobrosTestCase(TestCase):
+    def setUp(self):
+        self.empresa = Empresa.objects.create(nombre="Empresa de prueba", ruc="0990000000001", direccion="Guayaquil")
+        self.usuario = get_user_model().objects.create_user(username="cobrador", password="x")
+        self.cliente = Cliente.objects.create(
+            empresa=self.empresa, ruc="0900000001", nombre="Cliente", email="c@x.com", direccion="Guayaquil",
+        )
+        self.hoy = timezone.localdate()
+
+    def crear_prestamo(self, total="100.00", cuotas=3, fecha=None):
+        prestamo = PrestamoCobro.objects.create(
+            empresa=self.empresa, cliente=self.cliente, numero=f"P-{PrestamoCobro.objects.count() + 1}",
+            fecha=fecha or self.hoy, monto=Decimal(total), total=Decimal(total), cuotas=cuotas, usuario=self.usuario,
+        )
+        CuotaCobro.generar(prestamo)
+        self.mover_prestamo(prestamo, "DESEMBOLSO", total)
+        return prestamo
+
+    def crear_estado_cuenta(self, emitida=0, vence=None, total="10.00"):
+        """Factura con su estado de cuenta; `emitida` y `vence` son días antes de hoy."""
+        punto, _ = PuntoVenta.objects.get_or_create(
+            empresa=self.empresa, codigo_establecimiento="001", codigo_punto_emision="001",
+            defaults={"nombre": "Matriz"},
+        )
+        numero = Factura.objects.count() + 1
+        factura = Factura.objects.create(
+            empresa=self.empresa, cliente=self.cliente, punto_venta=punto, usuario=self.usuario, ambiente="1",
+            secuencial=f"{numero:09d}", clave_acceso=f"{numero:049d}",
+            fecha_emision=self.hoy, total_sin_impuestos=Decimal(total), importe_total=Decimal(total),
+        )
+        return EstadoCuentaCobro.objects.create(
+            empresa=self.empresa, cliente=self.cliente, factura=factura, total_documento=Decimal(total),
+            fecha_emision=self.hoy - datetime.timedelta(days=emitida),
+            fecha_vencimiento=self.hoy - datetime.timedelta(days=vence) if vence is not None else None,
+        )
+
+    def mover_prestamo(self, prestamo, tipo, monto, **extra):
+        return MovimientoPrestamoCobro.objects.create(
+            empresa=self.empresa, prestamo=prestamo, cliente=self.cliente, tipo=tipo,
+            monto=Decimal(monto), usuario=self.usuario, **extra,
+        )
+
+# ==========================================
+# SALDOS INCREMENTALES
+# ==========================================
+
+class SaldosIncrementalesTests(CobrosTestCase):
+    def mover(self, estado, tipo, monto):
+        return MovimientoCobro.objects.create(
+            empresa=self.empresa, estado_cuenta=estado, cliente=self.cliente, factura=estado.factura,
+            tipo=tipo, monto=Decimal(monto), usuario=self.usuario,
+        )
+
+    def comprobar(self, estado, saldo, abonado, situacion):
+        """El saldo posteado coincide con lo esperado y con recalcularlo desde cero."""
+        esperado = (Decimal(saldo), Decimal(abonado), situacion)
+        estado.refresh_from_db()
+        self.assertEqual((estado.saldo, estado.total_abonado, estado.estado), esperado)
+        estado.recalcular_saldo()
+        estado.refresh_from_db()
+        self.assertEqual((estado.saldo, estado.total_abonado, estado.estado), esperado)
+
+    def test_estado_de_cuenta_sigue_altas_ediciones_anulaciones_y_bajas(self):
+        estado = self.crear_estado_cuenta()
+        abono = self.mover(estado, "ABONO", "3.00")
+        self.assertEqual((abono.saldo_anterior, abono.saldo_nuevo), (Decimal("10.00"), Decimal("7.00")))
+        self.comprobar(estado, "7.00", "3.00", "ABONADO")
+
+        mora = self.mover(estado, "MORA", "2.00")
+        self.comprobar(estado, "9.00", "3.00", "ABONADO")
+
+        abono.monto = Decimal("5.00")
+        abono.save()
+        self.comprobar(estado, "7.00", "5.00", "ABONADO")
+
+        abono.anulado = True
+        abono.save()
+        self.comprobar(estado, "12.00", "0.00", "PENDIENTE")
+
+        mora.delete()
+        self.comprobar(estado, "10.00", "0.00", "PENDIENTE")
+
+        self.mover(estado, "ABONO", "10.00")
+        self.comprobar(estado, "0.00", "10.00", "PAGADO")
+
+    def test_costo_de_un_movimiento_no_depende_del_historial(self):
+        estado = self.crear_estado_cuenta(total="100.00")
+
+        def consultas():
+            with CaptureQueriesContext(connection) as contexto:
+                self.mover(estado, "ABONO", "1.00")
+            return len(contexto)
+
+        primero = consultas()
+        for _ in range(20):
+            self.mover(estado, "MORA", "1.00")
+        self.assertEqual(consultas(), primero)
+
+    def test_prestamo_y_comando_de_reparacion(self):
+        prestamo = self.crear_prestamo()
+        cuota = self.mover_prestamo(prestamo, "CUOTA", "40.00")
+        self.assertEqual((cuota.saldo_anterior, cuota.saldo_nuevo), (Decimal("100.00"), Decimal("60.00")))
+
+        PrestamoCobro.objects.filter(pk=prestamo.pk).update(saldo=Decimal("999.00"))
+        salida = io.StringIO()
+        call_command("recalcular_saldos_cobros", empresa=self.empresa.pk, stdout=salida)
+        self.assertIn(f"{prestamo.pk}: 999.00 -> 60.00", salida.getvalue())
+        prestamo.refresh_from_db()
+        self.assertEqual((prestamo.saldo, prestamo.estado), (Decimal("60.00"), "ACTIVO"))
+
+        self.mover_prestamo(prestamo, "CUOTA", "60.00")
+        prestamo.refresh_from_db()
+        self.assertEqual((prestamo.saldo, prestamo.estado), (Decimal("0.00"), "PAGADO"))
+
+# ==========================================
+# INDICADORES DE COBRANZA
+# ==========================================
+
+class IndicadoresTests(CobrosTestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.primero = self.crear_prestamo()
+        self.segundo = self.crear_prestamo(total="50.00")
+        self.mover_prestamo(self.primero, "CUOTA", "30.00")
+        self.mover_prestamo(self.primero, "CUOTA", "5.00", anulado=True)
+        anterior = self.mover_prestamo(self.segundo, "CUOTA", "10.00")
+        MovimientoPrestamoCobro.objects.filter(pk=anterior.pk).update(
+            fecha=inicio_dia(self.hoy - datetime.timedelta(days=2)) + datetime.timedelta(hours=10)
+        )
+
+    def test_totales_y_cobrado_por_rango(self):
+        hoy = reportes.indicadores(self.empresa, self.hoy, self.hoy)
+        self.assertEqual(
+            (hoy["prestamos"]["total_prestado"], hoy["prestamos"]["saldo"], hoy["prestamos"]["activos"]),
+            (Decimal("150.00"), Decimal("110.00"), 2),
+        )
+        self.assertEqual((hoy["total_cobrado"], hoy["movimientos_cobro"]), (Decimal("30.00"), 1))
+        self.assertEqual(hoy["compras"]["saldo"], 0)
+
+        semana = reportes.indicadores(self.empresa, self.hoy - datetime.timedelta(days=2), self.hoy)
+        self.assertEqual((semana["total_cobrado"], semana["movimientos_cobro"]), (Decimal("40.00"), 2))
+
+    def test_una_consulta_por_tabla_y_cache_hasta_el_siguiente_movimiento(self):
+        with self.assertNumQueries(5):
+            reportes.indicadores(self.empresa, self.hoy, self.hoy)
+        with self.assertNumQueries(0):
+            reportes.indicadores(self.empresa, self.hoy, self.hoy)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.mover_prestamo(self.segundo, "CUOTA", "15.00")
+        self.assertEqual(reportes.indicadores(self.empresa, self.hoy, self.hoy)["total_cobrado"], Decimal("45.00"))
+
+# ==========================================
+# PLAN DE CUOTAS
+# ==========================================
+
+class PlanCuotasTests(CobrosTestCase):
+    def plan(self, prestamo):
+        return list(prestamo.plan_cuotas.order_by("numero").values_list("abonado", "estado"))
+
+    def test_plan_con_redondeo_en_la_ultima_cuota(self):
+        prestamo = self.crear_prestamo()
+        self.assertEqual(
+            list(prestamo.plan_cuotas.order_by("numero").values_list("monto", flat=True)),
+            [Decimal("33.33"), Decimal("33.33"), Decimal("33.34")],
+        )
+        self.assertEqual(CuotaCobro.generar(prestamo), 0)
+
+    def test_pagos_se_aplican_a_la_cuota_mas_antigua(self):
+        prestamo = self.crear_prestamo()
+        self.mover_prestamo(prestamo, "CUOTA", "50.00")
+        self.assertEqual(self.plan(prestamo), [
+            (Decimal("33.33"), "PAGADA"), (Decimal("16.67"), "ABONADA"), (Decimal("0.00"), "PENDIENTE"),
+        ])
+        self.mover_prestamo(prestamo, "CUOTA", "20.00")
+        self.assertEqual(self.plan(prestamo), [
+            (Decimal("33.33"), "PAGADA"), (Decimal("33.33"), "PAGADA"), (Decimal("3.34"), "ABONADA"),
+        ])
+
+    def test_anular_editar_y_borrar_pagos_revierte_el_plan(self):
+        prestamo = self.crear_prestamo()
+        primero = self.mover_prestamo(prestamo, "CUOTA", "50.00")
+        segundo = self.mover_prestamo(prestamo, "CUOTA", "20.00")
+
+        primero.anulado = True
+        primero.save()
+        self.assertEqual(self.plan(prestamo), [
+            (Decimal("20.00"), "ABONADA"), (Decimal("0.00"), "PENDIENTE"), (Decimal("0.00"), "PENDIENTE"),
+        ])
+
+        primero.anulado = False
+        primero.monto = Decimal("40.00")
+        primero.save()
+        self.assertEqual(self.plan(prestamo), [
+            (Decimal("33.33"), "PAGADA"), (Decimal("26.67"), "ABONADA"), (Decimal("0.00"), "PENDIENTE"),
+        ])
+
+        segundo.delete()
+        self.assertEqual(self.plan(prestamo), [
+            (Decimal("33.33"), "PAGADA"), (Decimal("6.67"), "ABONADA"), (Decimal("0.00"), "PENDIENTE"),
+        ])
+
+    def test_pago_total_cierra_plan_y_prestamo(self):
+        prestamo = self.crear_prestamo()
+        self.mover_prestamo(prestamo, "CUOTA", "100.00")
+        prestamo.refresh_from_db()
+        self.assertEqual((prestamo.saldo, prestamo.estado), (Decimal("0.00"), "PAGADO"))
+        self.assertFalse(prestamo.plan_cuotas.exclude(estado="PAGADA").exists())
+
+    def test_aplicar_pago_devuelve_lo_que_no_cupo(self):
+        prestamo = self.crear_prestamo()
+        self.assertEqual(CuotaCobro.aplicar_pago("prestamo", prestamo.pk, "30.00"), Decimal("0.00"))
+        self.assertEqual(CuotaCobro.aplicar_pago("prestamo", prestamo.pk, "80.00"), Decimal("10.00"))
+        self.assertEqual(CuotaCobro.aplicar_pago("prestamo", prestamo.pk, "-120.00"), Decimal("-20.00"))
+
+    def test_pago_de_mora_va_al_excedente_y_su_anulacion_no_toca_el_plan(self):
+        prestamo = self.crear_prestamo()
+        self.mover_prestamo(prestamo, "MORA", "10.00")
+        self.mover_prestamo(prestamo, "CUOTA", "100.00")
+        mora = self.mover_prestamo(prestamo, "CUOTA", "10.00")
+        prestamo.refresh_from_db()
+        self.assertEqual((prestamo.saldo, prestamo.excedente_cuotas), (Decimal("0.00"), Decimal("10.00")))
+
+        mora.anulado = True
+        mora.save()
+        prestamo.refresh_from_db()
+        self.assertEqual(prestamo.excedente_cuotas, Decimal("0.00"))
+        self.assertFalse(prestamo.plan_cuotas.exclude(estado="PAGADA").exists())
+
+        # Lo que el excedente no cubre sale de las cuotas
+        mora.anulado = False
+        mora.monto = Decimal("5.00")
+        mora.save()
+        mora.delete()
+        primero = prestamo.movimientos.filter(tipo="CUOTA").first()
+        primero.monto = Decimal("90.00")
+        primero.save()
+        prestamo.refresh_from_db()
+        self.assertEqual(prestamo.excedente_cuotas, Decimal("0.00"))
+        self.assertEqual(self.plan(prestamo)[-1], (Decimal("23.34"), "ABONADA"))
+
+# ==========================================
+# PAGOS DESDE EL TELÉFONO DEL COBRADOR
+# ==========================================
+
+class PagosMovilesTests(CobrosTestCase):
+    def setUp(self):
+        super().setUp()
+        Perfil.objects.create(user=self.usuario, empresa=self.empresa)
+        self.client.force_login(self.usuario)
+        self.prestamo = self.crear_prestamo()
+        self.cuenta = CuentaFinancieraCobro.objects.create(empresa=self.empresa, nombre="Caja ruta", tipo="CAJA")
+
+    def enviar(self, pagos):
+        with self.captureOnCommitCallbacks(execute=True):
+            respuesta = self.client.post(
+                reverse("cobros:api_ruta_pagos"), json.dumps({"pagos": pagos}), content_type="application/json",
+            )
+        self.assertEqual(respuesta.status_code, 200)
+        return [r["estado"] for r in respuesta.json()["resultados"]]
+
+    def test_reenviar_el_lote_no_duplica_pagos(self):
+        lote = [
+            {"id_movil": "a1", "tipo": "prestamo", "documento": self.prestamo.pk, "monto": "30", "cuenta": self.cuenta.pk},
+            {"id_movil": "a2", "tipo": "prestamo", "documento": self.prestamo.pk, "monto": 10.5},
+        ]
+        self.assertEqual(self.enviar(lote), ["registrado", "registrado"])
+        self.assertEqual(self.enviar(lote), ["duplicado", "duplicado"])
+
+        self.prestamo.refresh_from_db()
+        self.assertEqual(self.prestamo.saldo, Decimal("59.50"))
+        self.assertEqual(MovimientoPrestamoCobro.objects.filter(prestamo=self.prestamo, tipo="CUOTA").count(), 2)
+        self.cuenta.refresh_from_db()
+        self.assertEqual(self.cuenta.saldo_actual, Decimal("30.00"))
+
+    def test_mismo_id_movil_dentro_del_lote(self):
+        pago = {"id_movil": "b1", "tipo": "prestamo", "documento": self.prestamo.pk, "monto": "5"}
+        self.assertEqual(self.enviar([pago, dict(pago)]), ["registrado", "duplicado"])
+
+    def test_pagos_invalidos_no_frenan_el_lote(self):
+        estados = self.enviar([
+            {"id_movil": "c1", "tipo": "prestamo", "documento": self.prestamo.pk, "monto": "-1"},
+            {"id_movil": "c2", "tipo": "prestamo", "documento": self.prestamo.pk, "monto": "NaN"},
+            {"id_movil": "c3", "tipo": "prestamo", "documento": self.prestamo.pk, "monto": "1E30"},
+            {"id_movil": "c4", "tipo": "prestamo", "documento": self.prestamo.pk, "monto": "100.01"},
+            {"id_movil": "c5", "tipo": "prestamo", "documento": True, "monto": "1"},
+            {"id_movil": "c6", "tipo": "prestamo", "documento": self.prestamo.pk, "monto": "1", "referencia": 7},
+            {"id_movil": "c7", "tipo": ["prestamo"], "documento": self.prestamo.pk, "monto": "1"},
+            {"id_movil": "c8", "tipo": "prestamo", "documento": self.prestamo.pk, "monto": "100"},
+        ])
+        self.assertEqual(estados, ["error"] * 7 + ["registrado"])
+        self.prestamo.refresh_from_db()
+        self.assertEqual((self.prestamo.saldo, self.prestamo.estado), (Decimal("0.00"), "PAGADO"))
+
+    def test_lote_invalido(self):
+        url = reverse("cobros:api_ruta_pagos")
+        self.assertEqual(self.client.post(url, "{", content_type="application/json").status_code, 400)
+        self.assertEqual(self.client.post(url, json.dumps({"pagos": "x"}), content_type="application/json").status_code, 400)
+
+# ==========================================
+# RECIBOS DE COBRO
+# ==========================================
+
+class ReciboCobroTests(CobrosTestCase):
+    def setUp(self):
+        super().setUp()
+        # Emitidas hace 30, 20 y 10 días; la más nueva vence primero
+        self.estados = [
+            self.crear_estado_cuenta(emitida=dias, vence=vence)
+            for dias, vence in [(30, None), (20, 15), (10, 5)]
+        ]
+        self.cuenta = CuentaFinancieraCobro.objects.create(empresa=self.empresa, nombre="Caja", tipo="CAJA")
+
+    def saldos(self):
+        return [e.saldo for e in EstadoCuentaCobro.objects.filter(pk__in=[e.pk for e in self.estados]).order_by("id")]
+
+    def aplicar(self, monto, **kwargs):
+        with self.captureOnCommitCallbacks(execute=True):
+            return aplicacion.aplicar(self.empresa, self.cliente, Decimal(monto), self.usuario, **kwargs)
+
+    def test_fifo_paga_primero_las_facturas_mas_antiguas(self):
+        recibo = self.aplicar("15.50", cuenta=self.cuenta)
+        self.assertEqual(self.saldos(), [Decimal("0.00"), Decimal("4.50"), Decimal("10.00")])
+        self.assertEqual((recibo.facturas, recibo.monto), (2, Decimal("15.50")))
+        self.assertEqual(
+            list(MovimientoCobro.objects.filter(recibo=recibo).order_by("estado_cuenta_id")
+                 .values_list("saldo_anterior", "monto", "saldo_nuevo")),
+            [(Decimal("10.00"), Decimal("10.00"), Decimal("0.00")), (Decimal("10.00"), Decimal("5.50"), Decimal("4.50"))],
+        )
+        self.cuenta.refresh_from_db()
+        self.assertEqual(self.cuenta.saldo_actual, Decimal("15.50"))
+
+    def test_vencimiento_paga_primero_lo_mas_vencido(self):
+        self.aplicar("15", criterio="VENCIMIENTO")
+        self.assertEqual(self.saldos(), [Decimal("10.00"), Decimal("0.00"), Decimal("5.00")])
+
+    def test_reparto_manual(self):
+        primero, _, tercero = self.estados
+        self.aplicar("7", criterio="MANUAL", asignacion={primero.pk: "3", tercero.pk: "4"})
+        self.assertEqual(self.saldos(), [Decimal("7.00"), Decimal("10.00"), Decimal("6.00")])
+        with self.assertRaises(ValidationError):
+            self.aplicar("7", criterio="MANUAL", asignacion={primero.pk: "3"})
+
+    def test_monto_mayor_a_lo_adeudado(self):
+        with self.assertRaises(ValidationError):
+            self.aplicar("30.01")
+        self.assertFalse(ReciboCobro.objects.exists())
+
+    def test_anular_devuelve_saldos_y_el_ingreso(self):
+        recibo = self.aplicar("25", cuenta=self.cuenta)
+        with self.captureOnCommitCallbacks(execute=True):
+            aplicacion.anular(recibo, self.usuario)
+
+        self.assertEqual(self.saldos(), [Decimal("10.00")] * 3)
+        self.assertFalse(EstadoCuentaCobro.objects.exclude(estado="PENDIENTE").exists())
+        self.assertFalse(MovimientoCobro.objects.filter(recibo=recibo, anulado=False).exists())
+        recibo.refresh_from_db()
+        self.assertTrue(recibo.anulado)
+        self.cuenta.refresh_from_db()
+        self.assertEqual(self.cuenta.saldo_actual, Decimal("0.00"))
+        self.assertEqual(
+            list(MovimientoCuentaCobro.objects.filter(cuenta=self.cuenta).order_by("id").values_list("tipo", "monto")),
+            [("INGRESO", Decimal("25.00")), ("EGRESO", Decimal("25.00"))],
+        )
+        with self.assertRaises(ValidationError):
+            aplicacion.anular(recibo, self.usuario)
+
+    def test_abonos_del_recibo_no_se_tocan_por_separado(self):
+        recibo = self.aplicar("15")
+        abono = MovimientoCobro.objects.filter(recibo=recibo).first()
+        abono.anulado = True
+        with self.assertRaises(ValidationError):
+            abono.save()
+        with self.assertRaises(ValidationError):
+            abono.delete()
+        self.assertEqual(self.saldos(), [Decimal("0.00"), Decimal("5.00"), Decimal("10.00")])
+
+    def test_vista_anular_recibo(self):
+        Perfil.objects.create(user=self.usuario, empresa=self.empresa)
+        self.client.force_login(self.usuario)
+        recibo = self.aplicar("10")
+        with self.captureOnCommitCallbacks(execute=True):
+            respuesta = self.client.post(reverse("cobros:anular_recibo_cobro", args=[recibo.pk]))
+        self.assertRedirects(
+            respuesta, f"{reverse('cobros:recibo_cobro')}?cliente={self.cliente.pk}", fetch_redirect_response=False,
+        )
+        self.assertEqual(self.saldos(), [Decimal("10.00")] * 3)
+
+# ==========================================
+# CONCILIACIÓN
+# ==========================================
+
+class ConciliacionTests(CobrosTestCase):
+    def test_incremental_revisa_movimientos_confirmados_tras_la_corrida(self):
+        prestamo = self.crear_prestamo()
+        self.assertEqual(conciliacion.conciliar(), [])
+
+        # Un movimiento con id menor que el tope de la corrida anterior (se confirmó después)
+        tarde = self.mover_prestamo(prestamo, "CUOTA", "10.00")
+        PuntoControl.objects.filter(clave="conciliacion:prestamos").update(ultimo_id=tarde.pk)
+        PrestamoCobro.objects.filter(pk=prestamo.pk).update(saldo=Decimal("100.00"))
+
+        descuadres = conciliacion.conciliar(reparar=True)
+        self.assertEqual(
+            [(d["tabla"], d["id"], d["saldo"], d["esperado"]) for d in descuadres],
+            [("prestamos", prestamo.pk, Decimal("100.00"), Decimal("90.00"))],
+        )
+        prestamo.refresh_from_db()
+        self.assertEqual(prestamo.saldo, Decimal("90.00"))
+        self.assertEqual(conciliacion.conciliar(), [])
+
+# ==========================================
+# BARRIDO DE VENCIMIENTOS
+# ==========================================
+
+class VencimientosTests(CobrosTestCase):
+    def dia(self, dias, hora=12, minuto=0):
+        """Instante local de hace `dias` días."""
+        return inicio_dia(self.hoy - datetime.timedelta(days=dias)) + datetime.timedelta(hours=hora, minutes=minuto)
+
+    def prometer(self, estado, dias, monto):
+        promesa = PromesaPago.objects.create(
+            empresa=self.empresa, estado_cuenta=estado, cliente=self.cliente, usuario=self.usuario,
+            fecha_promesa=self.hoy - datetime.timedelta(days=dias), monto_prometido=Decimal(monto),
+        )
+        PromesaPago.objects.filter(pk=promesa.pk).update(fecha_creacion=self.dia(5))
+        return promesa
+
+    def abonar(self, estado, monto, fecha):
+        movimiento = MovimientoCobro.objects.create(
+            empresa=self.empresa, estado_cuenta=estado, cliente=self.cliente, factura=estado.factura,
+            tipo="ABONO", monto=Decimal(monto), usuario=self.usuario,
+        )
+        MovimientoCobro.objects.filter(pk=movimiento.pk).update(fecha=fecha)
+
+    def barrer(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            return vencimientos.barrer(hoy=self.hoy, empresa_ids=[self.empresa.pk])
+
+    def test_transiciones_y_segundo_barrido_sin_cambios(self):
+        estado = self.crear_estado_cuenta(emitida=30, vence=1)
+        prestamo = self.crear_prestamo()
+        PrestamoCobro.objects.filter(pk=prestamo.pk).update(fecha_vencimiento=self.hoy - datetime.timedelta(days=1))
+        CuotaCobro.objects.filter(prestamo=prestamo, numero=1).update(fecha_vencimiento=self.hoy - datetime.timedelta(days=1))
+        # Vence hoy: todavía no
+        self.crear_estado_cuenta(emitida=30, vence=0)
+
+        self.assertEqual(self.barrer(), {self.empresa.pk: {
+            "préstamos vencidos": 1, "estados de cuenta vencidos": 1, "cuotas de cobranza vencidas": 1,
+        }})
+        estado.refresh_from_db()
+        prestamo.refresh_from_db()
+        self.assertEqual((estado.estado, prestamo.estado), ("VENCIDO", "VENCIDO"))
+        self.assertEqual(Bitacora.objects.filter(empresa=self.empresa).count(), 1)
+        self.assertEqual(self.barrer(), {})
+
+    def test_promesa_cuenta_abonos_hasta_el_fin_del_dia_prometido(self):
+        estado = self.crear_estado_cuenta(emitida=30)
+        ayer = self.prometer(estado, 1, "4.00")
+        anteayer = self.prometer(estado, 2, "4.00")
+        # Último minuto local de ayer: cumple la de ayer, llega tarde para la de anteayer
+        self.abonar(estado, "4.00", self.dia(1, hora=23, minuto=59))
+
+        self.assertEqual(self.barrer(), {self.empresa.pk: {"promesas cumplidas": 1, "promesas incumplidas": 1}})
+        ayer.refresh_from_db()
+        anteayer.refresh_from_db()
+        self.assertEqual((ayer.estado, anteayer.estado), ("CUMPLIDA", "INCUMPLIDA"))
+
+    def test_abono_anterior_a_la_promesa_no_la_cumple(self):
+        estado = self.crear_estado_cuenta(emitida=30)
+        self.abonar(estado, "4.00", self.dia(6))
+        promesa = self.prometer(estado, 0, "4.00")
+
+        self.assertEqual(self.barrer(), {})
+        promesa.refresh_from_db()
+        self.assertEqual(promesa.estado, "PENDIENTE")
+
+# ==========================================
+# ANTIGÜEDAD DE CARTERA
+# ==========================================
+
+class AntiguedadTests(CobrosTestCase):
+    def test_tramos_en_los_limites(self):
+        # (días vencido, saldo): el saldo identifica el documento en cada tramo
+        for dias, total in [(0, "1"), (1, "2"), (30, "4"), (31, "8"), (60, "16"), (61, "32"), (90, "64"), (91, "128")]:
+            self.crear_estado_cuenta(emitida=120, vence=dias, total=total)
+        self.crear_estado_cuenta(emitida=120, total="256")
+
+        resumen = antiguedad._resumen(self.empresa, self.hoy)
+        self.assertEqual(
+            {tramo: resumen[tramo] for tramo, _ in antiguedad.TRAMOS},
+            {
+                "corriente": Decimal("257.00"), "vencido_1_30": Decimal("6.00"), "vencido_31_60": Decimal("24.00"),
+                "vencido_61_90": Decimal("96.00"), "vencido_mas_90": Decimal("128.00"),
+            },
+        )
+        self.assertEqual((resumen["total"], resumen["documentos"], resumen["clientes"]), (Decimal("511.00"), 9, 1))
+
+    def test_materializar_deja_en_cero_a_quien_ya_no_debe(self):
+        estado = self.crear_estado_cuenta(vence=10)
+        ayer = self.hoy - datetime.timedelta(days=1)
+        self.assertEqual(antiguedad.materializar(ayer), 1)
+
+        EstadoCuentaCobro.objects.filter(pk=estado.pk).update(saldo=0, estado="PAGADO")
+        self.assertEqual(antiguedad.materializar(self.hoy), 1)
+        self.assertEqual(
+            [(f["fecha"], f["total"]) for f in antiguedad.tendencia(self.empresa, ayer, self.hoy)],
+            [(ayer, Decimal("10.00")), (self.hoy, Decimal("0.00"))],
+        )
+
+        # Sin foto ayer ni hoy, una empresa sin saldos no aparece
+        otra = Empresa.objects.create(nombre="Otra", ruc="0990000000002", direccion="Quito")
+        antiguedad.materializar(self.hoy)
+        self.assertFalse(AntiguedadCartera.objects.filter(empresa=otra).exists())
+
+# ==========================================
+# MORA
+# ==========================================
+
+class MoraTests(CobrosTestCase):
+    def setUp(self):
+        super().setUp()
+        Empresa.objects.filter(pk=self.empresa.pk).update(mora_porcentaje_diario=Decimal("1"), dias_gracia_mora=5)
+        self.ayer = self.hoy - datetime.timedelta(days=1)
+
+    def test_calcular_mora_respeta_la_gracia_y_el_vencimiento_total(self):
+        dia = datetime.date(2026, 3, 20)
+        fila = {
+            "saldo": Decimal("100"), "tasa": Decimal("1"), "gracia": 5, "vencido": Decimal("30"),
+            "pendiente": Decimal("90"), "primera_impaga": datetime.date(2026, 3, 15),
+        }
+        self.assertEqual(mora.calcular_mora(dia, fila), Decimal("0.00"))
+        self.assertEqual(mora.calcular_mora(dia + datetime.timedelta(days=1), fila), Decimal("0.30"))
+        vencido = {**fila, "vencimiento": datetime.date(2026, 3, 1), "primera_impaga": None}
+        self.assertEqual(mora.calcular_mora(dia, vencido), Decimal("0.90"))
+        self.assertEqual(mora.calcular_mora(dia, {**fila, "saldo": Decimal("10"), "gracia": 0}), Decimal("0.10"))
+
+    def test_devengar_dos_veces_el_mismo_dia_carga_una_sola_vez(self):
+        # La primera cuota venció hace 10 días (fuera de la gracia de 5)
+        prestamo = self.crear_prestamo(fecha=self.hoy - datetime.timedelta(days=40))
+        self.crear_prestamo()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(mora.devengar(self.ayer), {"prestamos": 1, "compras_financiadas": 0})
+            self.assertEqual(mora.devengar(self.ayer), {"prestamos": 0, "compras_financiadas": 0})
+        prestamo.refresh_from_db()
+        self.assertEqual(prestamo.saldo, Decimal("100.33"))
+        cargo = prestamo.movimientos.get(tipo="MORA")
+        self.assertEqual((cargo.monto, cargo.fecha_devengo, cargo.saldo_nuevo), (Decimal("0.33"), self.ayer, Decimal("100.33")))
 
-# Create your tests here.
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            self.mover_prestamo(prestamo, "MORA", "0.33", fecha_devengo=self.ayer)
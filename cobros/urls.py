@@ -10,14 +10,20 @@ urlpatterns = [
     path('compras-financiadas/', views.compras_financiadas, name='compras_financiadas'),
     path('cobros-del-dia/', views.cobros_del_dia, name='cobros_del_dia'),
     path('cuentas-por-cobrar/', views.cuentas_por_cobrar, name='cuentas_por_cobrar'),
+    path('cuentas-por-cobrar/recibo/', views.recibo_cobro, name='recibo_cobro'),
+    path('cuentas-por-cobrar/recibo/<int:pk>/anular/', views.anular_recibo_cobro, name='anular_recibo_cobro'),
     path('reportes/', views.reportes_cobros, name='reportes_cobros'),
 
     path('cuentas/', views.cuentas_financieras_cobro, name='cuentas_financieras'),
+    path('cuentas/<int:pk>/movimientos/', views.cuenta_financiera_movimientos, name='cuenta_movimientos'),
 
     path('ajax/clientes/crear/', views.ajax_cliente_crear, name='ajax_cliente_crear'),
     path('ajax/cuentas/crear/', views.ajax_cuenta_crear, name='ajax_cuenta_crear'),
     path('ajax/categorias/crear/', views.ajax_categoria_crear, name='ajax_categoria_crear'),
     path('ajax/metodos-pago/crear/', views.ajax_metodo_pago_crear, name='ajax_metodo_pago_crear'),
 
+    path('api/ruta/', views.api_ruta_cobro, name='api_ruta_cobro'),
+    path('api/ruta/pagos/', views.api_ruta_pagos, name='api_ruta_pagos'),
+
     path('compras-financiadas/pago/<int:pk>/', views.registrar_pago_compra, name='pago_compra')
 ]
\ No newline at end of file
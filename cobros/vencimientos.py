@@ -0,0 +1,141 @@
+# Ubicación: cobros/vencimientos.py
+"""
+Barrido nocturno de estados que dependen de la fecha.
+
+Nada cambia de estado solo por pasar el día: un préstamo con
+fecha_vencimiento ya pasada sigue ACTIVO, una cuota sigue 'PEN', una
+cotización sigue enviada y una promesa de pago sigue PENDIENTE. barrer()
+aplica esas transiciones empresa por empresa, en una transacción por
+empresa, con un UPDATE condicional por transición (sin cargar filas), y deja
+en Bitacora un solo registro con los conteos.
+
+Así los indicadores por estado (préstamos vencidos del dashboard, etc.) son
+conteos sobre la columna estado. Un abono parcial no saca a un documento de
+VENCIDO (ver los postear() de cobros/models.py); solo pagarlo del todo.
+Lo ejecuta la TAREA 14 de core/tasks.py.
+"""
+from django.db import transaction
+from django.db.models import DateField, DecimalField, Exists, ExpressionWrapper, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from core import cache as cache_erp
+from core import tesoreria
+from core.fechas import FinDia
+from core.models import Cotizacion, CuotaPrestamo, Empresa, Prestamo
+
+from .models import CompraFinanciada, CuotaCobro, EstadoCuentaCobro, MovimientoCobro, PrestamoCobro, PromesaPago
+
+CERO = Value(0, output_field=DecimalField(max_digits=12, decimal_places=2))
+
+def _abonado_para_promesa():
+    """Abonos al estado de cuenta desde que se hizo la promesa hasta el fin del día prometido."""
+    return Coalesce(
+        Subquery(
+            MovimientoCobro.objects.filter(
+                estado_cuenta=OuterRef("estado_cuenta"),
+                tipo__in=MovimientoCobro.TIPOS_ABONADO,
+                anulado=False,
+                fecha__gte=OuterRef("fecha_creacion"),
+                fecha__lt=FinDia(OuterRef("fecha_promesa")),
+            ).order_by().values("estado_cuenta").annotate(total=Sum("monto")).values("total")
+        ),
+        CERO,
+    )
+
+# ==========================================
+# TRANSICIONES
+# ==========================================
+# (etiqueta del resumen, modelo, camino a la empresa, filtro(hoy) -> queryset, valores del UPDATE, espacio de caché)
+# Van en orden: las promesas incumplidas y los préstamos en mora dependen de la fila anterior.
+
+TRANSICIONES = [
+    (
+        "préstamos vencidos", PrestamoCobro, "empresa",
+        lambda qs, hoy: qs.filter(estado="ACTIVO", saldo__gt=0, fecha_vencimiento__lt=hoy),
+        {"estado": "VENCIDO"}, "cobros",
+    ),
+    (
+        "compras financiadas vencidas", CompraFinanciada, "empresa",
+        # La última cuota vence `cuotas` períodos después de la fecha de compra
+        lambda qs, hoy: qs.alias(
+            vence=ExpressionWrapper(F("fecha") + F("cuotas") * F("frecuencia_dias"), output_field=DateField())
+        ).filter(estado="ACTIVA", saldo__gt=0, vence__lt=hoy),
+        {"estado": "VENCIDA"}, "cobros",
+    ),
+    (
+        "estados de cuenta vencidos", EstadoCuentaCobro, "empresa",
+        lambda qs, hoy: qs.filter(estado__in=("PENDIENTE", "ABONADO"), saldo__gt=0, fecha_vencimiento__lt=hoy),
+        {"estado": "VENCIDO"}, "cobros",
+    ),
+    (
+        "cuotas de cobranza vencidas", CuotaCobro, "empresa",
+        lambda qs, hoy: qs.filter(estado__in=("PENDIENTE", "ABONADA"), fecha_vencimiento__lt=hoy),
+        {"estado": "VENCIDA"}, "cobros",
+    ),
+    (
+        # Se cumple en cuanto lo abonado alcanza, aunque no haya llegado el día
+        "promesas cumplidas", PromesaPago, "empresa",
+        lambda qs, hoy: qs.alias(abonado=_abonado_para_promesa()).filter(
+            estado="PENDIENTE", abonado__gte=F("monto_prometido"),
+        ),
+        {"estado": "CUMPLIDA"}, "cobros",
+    ),
+    (
+        "promesas incumplidas", PromesaPago, "empresa",
+        lambda qs, hoy: qs.filter(estado="PENDIENTE", fecha_promesa__lt=hoy),
+        {"estado": "INCUMPLIDA"}, "cobros",
+    ),
+    (
+        "cuotas vencidas", CuotaPrestamo, "prestamo__empresa",
+        lambda qs, hoy: qs.filter(estado="PEN", fecha_vencimiento__lt=hoy),
+        {"estado": "VEN"}, None,
+    ),
+    (
+        "préstamos en mora", Prestamo, "empresa",
+        lambda qs, hoy: qs.filter(
+            Exists(CuotaPrestamo.objects.filter(prestamo=OuterRef("pk"), estado="VEN")), estado="A",
+        ),
+        {"estado": "M"}, None,
+    ),
+    (
+        "cotizaciones vencidas", Cotizacion, "empresa",
+        lambda qs, hoy: qs.filter(estado__in=("B", "E"), fecha_vencimiento__lt=hoy),
+        {"estado": "V"}, None,
+    ),
+]
+
+# ==========================================
+# BARRIDO
+# ==========================================
+
+def barrer_empresa(empresa, hoy):
+    """Aplica todas las transiciones a una empresa. Devuelve {etiqueta: filas cambiadas} (solo las no vacías)."""
+    cambios = {}
+    with transaction.atomic():
+        for etiqueta, modelo, camino, filtro, valores, espacio in TRANSICIONES:
+            filas = filtro(modelo.objects.filter(**{camino: empresa}), hoy).update(**valores)
+            if not filas:
+                continue
+            cambios[etiqueta] = filas
+            if espacio:
+                cache_erp.invalidar_al_confirmar(espacio, empresa.id)
+
+        if cambios:
+            detalle = ", ".join(f"{n} {etiqueta}" for etiqueta, n in cambios.items())
+            tesoreria.auditar(None, empresa, f"Barrido de estados del {hoy:%d/%m/%Y}: {detalle}.")
+    return cambios
+
+def barrer(hoy=None, empresa_ids=None):
+    """Barre todas las empresas (o las indicadas). Devuelve {empresa_id: cambios} de las que cambiaron algo."""
+    hoy = hoy or timezone.localdate()
+    empresas = Empresa.objects.all()
+    if empresa_ids is not None:
+        empresas = empresas.filter(pk__in=empresa_ids)
+
+    resultado = {}
+    for empresa in empresas.order_by("pk"):
+        cambios = barrer_empresa(empresa, hoy)
+        if cambios:
+            resultado[empresa.pk] = cambios
+    return resultado
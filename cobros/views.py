@@ -1,12 +1,19 @@
 from django.contrib.auth.decorators import login_required
-from django.db import transaction
+from django.core.exceptions import ValidationError
+from django.db import DatabaseError, IntegrityError, transaction
+from django.db.models import Count, Sum
+from django.utils.dateparse import parse_datetime
 from django.utils import timezone
-from datetime import timedelta
+from datetime import datetime, timedelta
 from decimal import Decimal
 from django.contrib import messages
 from django.shortcuts import get_object_or_404, render, redirect
+from django.urls import reverse
 from .forms import *
 from .models import *
+from . import antiguedad, aplicacion, reportes, ruta
+from core import tesoreria
+from core.fechas import rango_dias
 import json
 from django.http import JsonResponse
 from django.views.decorators.http import require_POST
@@ -19,26 +26,8 @@ def dashboard_cobros(request):
         empresa=empresa
     ).order_by('-id')[:10]
 
-    total_prestado = PrestamoCobro.objects.filter(
-        empresa=empresa
-    ).aggregate(total=models.Sum('monto'))['total'] or 0
-
-    total_saldo = PrestamoCobro.objects.filter(
-        empresa=empresa
-    ).aggregate(total=models.Sum('saldo'))['total'] or 0
-
-    hoy = timezone.now().date()
-
-    cobrado_hoy = MovimientoPrestamoCobro.objects.filter(
-        empresa=empresa,
-        fecha__date=hoy,
-        tipo='CUOTA'
-    ).aggregate(total=models.Sum('monto'))['total'] or 0
-
-    prestamos_vencidos = PrestamoCobro.objects.filter(
-        empresa=empresa,
-        estado='VENCIDO'
-    ).count()
+    hoy = timezone.localdate()
+    kpi = reportes.indicadores(empresa, hoy, hoy)
 
     cuentas = CuentaFinancieraCobro.objects.filter(
         empresa=empresa
@@ -46,16 +35,102 @@ def dashboard_cobros(request):
 
     return render(request, 'cobros/dashboard.html', {
         'prestamos': prestamos,
-        'total_prestado': total_prestado,
-        'total_saldo': total_saldo,
-        'cobrado_hoy': cobrado_hoy,
-        'prestamos_vencidos': prestamos_vencidos,
+        'total_prestado': kpi['prestamos']['total_prestado'],
+        'total_saldo': kpi['prestamos']['saldo'],
+        # Abonos de préstamos del día (MovimientoPrestamoCobro.TIPOS_ABONO, sin anulados)
+        'cobrado_hoy': kpi['cobrado_prestamos'],
+        'prestamos_vencidos': kpi['prestamos']['vencidos'],
         'cuentas': cuentas,
     })
 
 @login_required
 def cuentas_por_cobrar(request):
-    return render(request, 'cobros/cuentas_por_cobrar.html')
+    """ Antigüedad de la cartera: resumen por tramo, tendencia y deudores paginados por clave (?despues=<cliente_id>) """
+    empresa = request.user.perfil.empresa
+    hoy = timezone.localdate()
+
+    tramo = request.GET.get('tramo') or None
+    despues = request.GET.get('despues', '')
+    deudores, siguiente = antiguedad.por_cliente(
+        empresa, hoy, despues=int(despues) if despues.isdigit() else None, tramo=tramo
+    )
+    resumen = antiguedad.resumen(empresa, hoy)
+
+    return render(request, 'cobros/cuentas_por_cobrar.html', {
+        'hoy': hoy,
+        'resumen': resumen,
+        'tramos': [(clave, nombre, resumen[clave]) for clave, nombre in antiguedad.TRAMOS],
+        'tramo': tramo,
+        'deudores': deudores,
+        'siguiente': siguiente,
+        'tendencia': antiguedad.tendencia(empresa, hoy - timedelta(days=90), hoy),
+    })
+
+@login_required
+def recibo_cobro(request):
+    """ Un pago del cliente repartido entre sus facturas abiertas (FIFO, por vencimiento o a mano con asignar_<estado_cuenta_id>) """
+    empresa = request.user.perfil.empresa
+
+    def preparar(form):
+        form.fields['cliente'].queryset = Cliente.objects.filter(empresa=empresa).order_by('nombre')
+        form.fields['cuenta'].queryset = CuentaFinancieraCobro.objects.filter(empresa=empresa, activo=True)
+        form.fields['metodo_pago'].queryset = MetodoPago.objects.filter(empresa=empresa)
+        return form
+
+    if request.method == 'POST':
+        form = preparar(ReciboCobroForm(request.POST))
+        if form.is_valid():
+            datos = form.cleaned_data
+            asignacion = {
+                int(clave[len('asignar_'):]): valor
+                for clave, valor in request.POST.items()
+                if clave.startswith('asignar_') and clave[len('asignar_'):].isdigit() and valor.strip()
+            }
+            try:
+                recibo = aplicacion.aplicar(
+                    empresa, datos['cliente'], datos['monto'], request.user,
+                    criterio=datos['criterio'],
+                    asignacion=asignacion,
+                    cuenta=datos['cuenta'],
+                    metodo_pago=datos['metodo_pago'],
+                    referencia=datos['referencia'],
+                    observacion=datos['observacion'],
+                )
+                messages.success(request, f'Recibo {recibo.pk} registrado: ${recibo.monto} en {recibo.facturas} facturas.')
+                return redirect('cobros:cuentas_por_cobrar')
+            except (ValidationError, ArithmeticError, ValueError) as e:
+                messages.error(request, f'Error al registrar el recibo: {e}')
+        else:
+            messages.error(request, f'Formulario inválido: {form.errors}')
+        cliente_id = request.POST.get('cliente', '')
+    else:
+        cliente_id = request.GET.get('cliente', '')
+        form = preparar(ReciboCobroForm(initial={'cliente': cliente_id or None}))
+
+    abiertos = recibos = []
+    if cliente_id.isdigit():
+        abiertos = antiguedad.abiertas().filter(
+            empresa=empresa, cliente_id=cliente_id
+        ).select_related('factura').order_by('fecha_emision', 'id')
+        recibos = ReciboCobro.objects.filter(empresa=empresa, cliente_id=cliente_id).select_related('cuenta')[:10]
+
+    return render(request, 'cobros/recibo_cobro.html', {
+        'form': form,
+        'abiertos': abiertos,
+        'recibos': recibos,
+    })
+
+@login_required
+@require_POST
+def anular_recibo_cobro(request, pk):
+    """ Anula el recibo completo: sus abonos en cada factura y su ingreso en la cuenta """
+    recibo = get_object_or_404(ReciboCobro, pk=pk, empresa=request.user.perfil.empresa)
+    try:
+        aplicacion.anular(recibo, request.user)
+        messages.success(request, f'Recibo {recibo.pk} anulado: ${recibo.monto} devueltos a {recibo.facturas} facturas.')
+    except ValidationError as e:
+        messages.error(request, f'No se pudo anular el recibo: {e.message}')
+    return redirect(f"{reverse('cobros:recibo_cobro')}?cliente={recibo.cliente_id}")
 
 @login_required
 def prestamos_cobros(request):
@@ -77,7 +152,8 @@ def prestamos_cobros(request):
 
                     prestamo.total = prestamo.calcular_total()
                     prestamo.cuota_estimada = prestamo.calcular_cuota_estimada()
-                    prestamo.saldo = prestamo.total
+                    # El movimiento de desembolso lleva el saldo al total
+                    prestamo.saldo = Decimal('0.00')
 
                     if not prestamo.fecha_vencimiento:
                         prestamo.fecha_vencimiento = prestamo.fecha + timedelta(
@@ -95,6 +171,8 @@ def prestamos_cobros(request):
                         return redirect('cobros:prestamos')
 
                     prestamo.save()
+                    # Plan de cuotas (un INSERT); los pagos se reparten entre ellas al registrarse
+                    CuotaCobro.generar(prestamo)
 
                     MovimientoPrestamoCobro.objects.create(
                         empresa=empresa_actual,
@@ -257,38 +335,42 @@ def compras_financiadas(request):
                 base_financiada = Decimal('0.00')
 
             compra.total = base_financiada + (base_financiada * interes / Decimal('100'))
-            compra.total_abonado = cuota_inicial
-            compra.saldo = compra.total
-
-            compra.save()
-
-            # Registrar cargo inicial
-            MovimientoCompraFinanciada.objects.create(
-                empresa=empresa_actual,
-                compra=compra,
-                cliente=compra.cliente,
-                tipo='CARGO_INICIAL',
-                monto=compra.total,
-                metodo_pago=None,
-                referencia='',
-                observacion='Registro inicial de compra financiada',
-                usuario=request.user,
-            )
+            # El cargo inicial y la cuota inicial mueven el saldo y el total abonado
+            compra.total_abonado = Decimal('0.00')
+            compra.saldo = Decimal('0.00')
+
+            with transaction.atomic():
+                compra.save()
+                # Antes de la cuota inicial, que se reparte entre las cuotas como cualquier pago
+                CuotaCobro.generar(compra)
 
-            # Registrar cuota inicial si aplica
-            if cuota_inicial > 0:
+                # Registrar cargo inicial
                 MovimientoCompraFinanciada.objects.create(
                     empresa=empresa_actual,
                     compra=compra,
                     cliente=compra.cliente,
-                    tipo='ABONO_EXTRA',
-                    monto=cuota_inicial,
+                    tipo='CARGO_INICIAL',
+                    monto=compra.total,
                     metodo_pago=None,
                     referencia='',
-                    observacion='Cuota inicial',
+                    observacion='Registro inicial de compra financiada',
                     usuario=request.user,
                 )
 
+                # Registrar cuota inicial si aplica
+                if cuota_inicial > 0:
+                    MovimientoCompraFinanciada.objects.create(
+                        empresa=empresa_actual,
+                        compra=compra,
+                        cliente=compra.cliente,
+                        tipo='ABONO_EXTRA',
+                        monto=cuota_inicial,
+                        metodo_pago=None,
+                        referencia='',
+                        observacion='Cuota inicial',
+                        usuario=request.user,
+                    )
+
             messages.success(request, 'Compra financiada registrada correctamente.')
             return redirect('cobros:compras_financiadas')
     else:
@@ -303,36 +385,37 @@ def compras_financiadas(request):
 def cobros_del_dia(request):
     empresa = request.user.perfil.empresa
     hoy = timezone.localdate()
+    # Rango con zona horaria en lugar de fecha__date: usa el índice (empresa, cliente, fecha)
+    del_dia = rango_dias(hoy, hoy)
 
     cobros_prestamos = MovimientoPrestamoCobro.objects.filter(
         empresa=empresa,
-        fecha__date=hoy,
         anulado=False,
-        tipo__in=['CUOTA', 'ABONO_CAPITAL', 'AJUSTE_ABONO']
+        tipo__in=MovimientoPrestamoCobro.TIPOS_ABONO,
+        **del_dia
     ).select_related(
         'prestamo', 'cliente', 'cuenta', 'metodo_pago', 'usuario'
     ).order_by('-fecha')
 
     cobros_compras = MovimientoCompraFinanciada.objects.filter(
         empresa=empresa,
-        fecha__date=hoy,
         anulado=False,
-        tipo__in=['CUOTA', 'ABONO_EXTRA', 'AJUSTE_ABONO']
+        tipo__in=MovimientoCompraFinanciada.TIPOS_ABONO,
+        **del_dia
     ).select_related(
         'compra', 'cliente', 'metodo_pago', 'usuario'
     ).order_by('-fecha')
 
-    total_prestamos = cobros_prestamos.aggregate(
-        total=Sum('monto')
-    )['total'] or 0
+    # Total y cantidad en una sola consulta por tabla
+    prestamos = cobros_prestamos.aggregate(total=Sum('monto'), cantidad=Count('id'))
+    compras = cobros_compras.aggregate(total=Sum('monto'), cantidad=Count('id'))
 
-    total_compras = cobros_compras.aggregate(
-        total=Sum('monto')
-    )['total'] or 0
+    total_prestamos = prestamos['total'] or 0
+    total_compras = compras['total'] or 0
 
     total_cobrado_hoy = total_prestamos + total_compras
 
-    total_movimientos = cobros_prestamos.count() + cobros_compras.count()
+    total_movimientos = prestamos['cantidad'] + compras['cantidad']
 
     return render(request, 'cobros/cobros_del_dia.html', {
         'fecha_hoy': hoy,
@@ -344,83 +427,25 @@ def cobros_del_dia(request):
         'total_movimientos': total_movimientos,
     })
 
+def _rango_fechas(request, desde_defecto, hasta_defecto):
+    """ Lee ?desde=YYYY-MM-DD&hasta=YYYY-MM-DD; los valores ausentes o inválidos toman el defecto """
+    def leer(nombre, defecto):
+        try:
+            return datetime.strptime(request.GET.get(nombre, ''), '%Y-%m-%d').date()
+        except ValueError:
+            return defecto
+    desde = leer('desde', desde_defecto)
+    hasta = leer('hasta', hasta_defecto)
+    if hasta < desde:
+        desde, hasta = hasta, desde
+    return desde, hasta
+
 @login_required
 def reportes_cobros(request):
     empresa = request.user.perfil.empresa
     hoy = timezone.localdate()
-    inicio_mes = hoy.replace(day=1)
-    ultimos_30_dias = hoy - timedelta(days=30)
-
-    total_prestado = PrestamoCobro.objects.filter(
-        empresa=empresa
-    ).aggregate(total=Sum('monto'))['total'] or 0
-
-    total_saldo_prestamos = PrestamoCobro.objects.filter(
-        empresa=empresa
-    ).aggregate(total=Sum('saldo'))['total'] or 0
-
-    prestamos_activos = PrestamoCobro.objects.filter(
-        empresa=empresa,
-        estado='ACTIVO'
-    ).count()
-
-    prestamos_pagados = PrestamoCobro.objects.filter(
-        empresa=empresa,
-        estado='PAGADO'
-    ).count()
-
-    prestamos_vencidos = PrestamoCobro.objects.filter(
-        empresa=empresa,
-        estado='VENCIDO'
-    ).count()
-
-    total_compras_financiadas = CompraFinanciada.objects.filter(
-        empresa=empresa
-    ).aggregate(total=Sum('monto_producto'))['total'] or 0
-
-    saldo_compras_financiadas = CompraFinanciada.objects.filter(
-        empresa=empresa
-    ).aggregate(total=Sum('saldo'))['total'] or 0
-
-    compras_activas = CompraFinanciada.objects.filter(
-        empresa=empresa,
-        estado='ACTIVA'
-    ).count()
-
-    compras_pagadas = CompraFinanciada.objects.filter(
-        empresa=empresa,
-        estado='PAGADA'
-    ).count()
-
-    ingresos_cuentas_mes = MovimientoCuentaCobro.objects.filter(
-        empresa=empresa,
-        fecha__date__gte=inicio_mes,
-        anulado=False,
-        tipo__in=['INGRESO', 'TRANSFERENCIA_ENTRADA', 'AJUSTE_MAS']
-    ).aggregate(total=Sum('monto'))['total'] or 0
-
-    egresos_cuentas_mes = MovimientoCuentaCobro.objects.filter(
-        empresa=empresa,
-        fecha__date__gte=inicio_mes,
-        anulado=False,
-        tipo__in=['EGRESO', 'TRANSFERENCIA_SALIDA', 'AJUSTE_MENOS']
-    ).aggregate(total=Sum('monto'))['total'] or 0
-
-    cobrado_30_dias_prestamos = MovimientoPrestamoCobro.objects.filter(
-        empresa=empresa,
-        fecha__date__gte=ultimos_30_dias,
-        anulado=False,
-        tipo__in=['CUOTA', 'ABONO_CAPITAL', 'AJUSTE_ABONO']
-    ).aggregate(total=Sum('monto'))['total'] or 0
-
-    cobrado_30_dias_compras = MovimientoCompraFinanciada.objects.filter(
-        empresa=empresa,
-        fecha__date__gte=ultimos_30_dias,
-        anulado=False,
-        tipo__in=['CUOTA', 'ABONO_EXTRA', 'AJUSTE_ABONO']
-    ).aggregate(total=Sum('monto'))['total'] or 0
-
-    total_cobrado_30_dias = cobrado_30_dias_prestamos + cobrado_30_dias_compras
+    desde, hasta = _rango_fechas(request, hoy - timedelta(days=30), hoy)
+    kpi = reportes.indicadores(empresa, desde, hasta)
 
     cuentas = CuentaFinancieraCobro.objects.filter(
         empresa=empresa
@@ -438,22 +463,9 @@ def reportes_cobros(request):
 
     return render(request, 'cobros/reportes.html', {
         'hoy': hoy,
-        'inicio_mes': inicio_mes,
-        'ultimos_30_dias': ultimos_30_dias,
-        'total_prestado': total_prestado,
-        'total_saldo_prestamos': total_saldo_prestamos,
-        'prestamos_activos': prestamos_activos,
-        'prestamos_pagados': prestamos_pagados,
-        'prestamos_vencidos': prestamos_vencidos,
-        'total_compras_financiadas': total_compras_financiadas,
-        'saldo_compras_financiadas': saldo_compras_financiadas,
-        'compras_activas': compras_activas,
-        'compras_pagadas': compras_pagadas,
-        'ingresos_cuentas_mes': ingresos_cuentas_mes,
-        'egresos_cuentas_mes': egresos_cuentas_mes,
-        'cobrado_30_dias_prestamos': cobrado_30_dias_prestamos,
-        'cobrado_30_dias_compras': cobrado_30_dias_compras,
-        'total_cobrado_30_dias': total_cobrado_30_dias,
+        'desde': desde,
+        'hasta': hasta,
+        'kpi': kpi,
         'cuentas': cuentas,
         'movimientos_recientes_prestamos': movimientos_recientes_prestamos,
         'movimientos_recientes_compras': movimientos_recientes_compras,
@@ -479,7 +491,8 @@ def prestamos_cobros(request):
 
                     prestamo.total = prestamo.calcular_total()
                     prestamo.cuota_estimada = prestamo.calcular_cuota_estimada()
-                    prestamo.saldo = prestamo.total
+                    # El movimiento de desembolso lleva el saldo al total
+                    prestamo.saldo = Decimal('0.00')
 
                     if not prestamo.fecha_vencimiento:
                         prestamo.fecha_vencimiento = prestamo.fecha + timedelta(
@@ -497,6 +510,8 @@ def prestamos_cobros(request):
                         return redirect('cobros:prestamos')
 
                     prestamo.save()
+                    # Plan de cuotas (un INSERT); los pagos se reparten entre ellas al registrarse
+                    CuotaCobro.generar(prestamo)
 
                     MovimientoPrestamoCobro.objects.create(
                         empresa=empresa_actual,
@@ -560,6 +575,27 @@ def cuentas_financieras_cobro(request):
         'cuentas': cuentas,
     })
 
+@login_required
+def cuenta_financiera_movimientos(request, pk):
+    """ Estado de cuenta: una página hacia atrás desde ?hasta=YYYY-MM-DD o ?antes=<id>, con saldo corrido """
+    empresa_actual = request.user.perfil.empresa
+    cuenta = get_object_or_404(CuentaFinancieraCobro, pk=pk, empresa=empresa_actual)
+
+    try:
+        hasta = datetime.strptime(request.GET.get('hasta', ''), '%Y-%m-%d').date()
+    except ValueError:
+        hasta = None
+    antes = request.GET.get('antes', '')
+    estado = tesoreria.estado_de_cuenta(
+        cuenta, hasta=hasta, antes=int(antes) if antes.isdigit() else None
+    )
+
+    return render(request, 'cobros/cuenta_movimientos.html', {
+        'cuenta': cuenta,
+        'estado': estado,
+        'hasta': hasta,
+    })
+
 @login_required
 def registrar_pago_prestamo(request, pk):
     empresa_actual = request.user.perfil.empresa
@@ -624,7 +660,8 @@ def registrar_pago_prestamo(request, pk):
 
     return render(request, 'cobros/movimiento_prestamo.html', {
         'form': form,
-        'prestamo': prestamo
+        'prestamo': prestamo,
+        'cuotas': prestamo.plan_cuotas.order_by('numero'),
     })
 
 @login_required
@@ -674,6 +711,7 @@ def registrar_pago_compra(request, pk):
     return render(request, 'cobros/movimiento_compra.html', {
         'form': form,
         'compra': compra,
+        'cuotas': compra.plan_cuotas.order_by('numero'),
     })
 
 @login_required
@@ -715,3 +753,192 @@ def ajax_cuenta_crear(request):
 
     except Exception as e:
         return JsonResponse({"detail": str(e)}, status=400)
+
+# ==========================================
+# API DE LA HOJA DE RUTA (TELÉFONOS DE LOS COBRADORES)
+# ==========================================
+
+@login_required
+def api_ruta_cobro(request):
+    """
+    Ruta de hoy de la empresa. Con ?desde=<cursor> (el de la respuesta
+    anterior) devuelve solo las filas que cambiaron; el teléfono las
+    reemplaza por id.
+    """
+    empresa = request.user.perfil.empresa
+
+    desde = None
+    if request.GET.get('desde'):
+        desde = parse_datetime(request.GET['desde'])
+        if desde is None:
+            return JsonResponse({"detail": "Cursor inválido."}, status=400)
+        if timezone.is_naive(desde):
+            desde = timezone.make_aware(desde)
+
+    filas, cursor = ruta.cambios(empresa, desde)
+    return JsonResponse({
+        "fecha": timezone.localdate(),
+        "cursor": cursor,
+        "completa": desde is None,
+        "clientes": filas,
+    })
+
+# tipo -> (documento, movimiento, campo del documento, tipo de movimiento, número del documento)
+PAGOS_MOVILES = {
+    'prestamo': (PrestamoCobro, MovimientoPrestamoCobro, 'prestamo', 'CUOTA', lambda d: d.numero),
+    'compra': (CompraFinanciada, MovimientoCompraFinanciada, 'compra', 'CUOTA', lambda d: d.numero),
+    'estado_cuenta': (EstadoCuentaCobro, MovimientoCobro, 'estado_cuenta', 'ABONO', lambda d: d.factura.secuencial),
+}
+LOTE_PAGOS_MAXIMO = 200
+# Los montos son DecimalField(max_digits=12, decimal_places=2)
+MONTO_MAXIMO = Decimal('9999999999.99')
+
+def _id_opcional(pago, campo):
+    valor = pago.get(campo)
+    if valor in (None, ''):
+        return None
+    if isinstance(valor, bool) or not isinstance(valor, int):
+        raise ValueError(f"{campo} inválido.")
+    return valor
+
+def _texto_opcional(pago, campo, largo=None):
+    valor = pago.get(campo)
+    if valor is None:
+        return ''
+    if not isinstance(valor, str):
+        raise ValueError(f"{campo} debe ser texto.")
+    return valor[:largo] if largo else valor
+
+def _registrar_pago_movil(request, empresa, pago, documentos, cuentas, metodos):
+    """Registra un pago del lote. Devuelve el id del movimiento o lanza ValueError con el motivo."""
+    documento_modelo, movimiento_modelo, campo, tipo, numero = PAGOS_MOVILES[pago['tipo']]
+    documento = documentos[pago['tipo']].get(_id_opcional(pago, 'documento'))
+    if documento is None:
+        raise ValueError("Documento no encontrado.")
+    valor = pago.get('monto')
+    if isinstance(valor, bool) or not isinstance(valor, (int, float, str)):
+        raise ValueError("Monto inválido.")
+    try:
+        monto = Decimal(str(valor))
+    except ArithmeticError:
+        raise ValueError("Monto inválido.")
+    if not monto.is_finite() or monto <= 0:
+        raise ValueError("El monto debe ser mayor a cero.")
+    if monto > MONTO_MAXIMO:
+        raise ValueError("El monto excede el máximo permitido.")
+    monto = monto.quantize(Decimal('0.01'))
+    if monto <= 0:
+        raise ValueError("El monto debe ser mayor a cero.")
+
+    cuenta_id = _id_opcional(pago, 'cuenta')
+    cuenta = cuentas.get(cuenta_id) if cuenta_id else None
+    if cuenta_id and cuenta is None:
+        raise ValueError("Cuenta no encontrada.")
+    metodo_id = _id_opcional(pago, 'metodo_pago')
+    referencia = _texto_opcional(pago, 'referencia', 100)
+    observacion = _texto_opcional(pago, 'observacion') or 'Cobro en ruta'
+
+    with transaction.atomic():
+        # Saldo bloqueado: dos pagos del lote (o de dos teléfonos) al mismo documento no lo sobrepasan
+        saldo = documento_modelo.objects.select_for_update().filter(pk=documento.pk).values_list('saldo', flat=True).get()
+        if monto > saldo:
+            raise ValueError(f"El monto (${monto}) supera el saldo del documento (${saldo}).")
+
+        movimiento = movimiento_modelo(
+            empresa=empresa,
+            cliente_id=documento.cliente_id,
+            usuario=request.user,
+            tipo=tipo,
+            monto=monto,
+            metodo_pago=metodos.get(metodo_id),
+            referencia=referencia,
+            observacion=observacion,
+            id_movil=pago['id_movil'],
+            **{campo: documento},
+        )
+        if campo == 'estado_cuenta':
+            movimiento.factura_id = documento.factura_id
+        if cuenta and campo == 'prestamo':
+            movimiento.cuenta = cuenta
+        movimiento.save()
+
+        if cuenta:
+            MovimientoCuentaCobro.objects.create(
+                empresa=empresa,
+                cuenta=cuenta,
+                tipo='INGRESO',
+                origen='COBRO',
+                monto=movimiento.monto,
+                referencia=numero(documento),
+                observacion=f'Cobro en ruta {numero(documento)}',
+                usuario=request.user,
+            )
+    return movimiento.pk
+
+@login_required
+@require_POST
+def api_ruta_pagos(request):
+    """
+    Lote de pagos cobrados en ruta:
+    {"pagos": [{"id_movil", "tipo": "prestamo" | "compra" | "estado_cuenta",
+    "documento", "monto", "cuenta"?, "metodo_pago"?, "referencia"?, "observacion"?}]}.
+
+    Cada pago va en su propio punto de guardado: uno inválido (tipos o montos
+    fuera de rango, o mayor que el saldo del documento) no frena al resto.
+    id_movil hace que reenviar el lote (sin conexión, reintentos) no duplique
+    pagos: los ya recibidos vuelven como "duplicado".
+    """
+    empresa = request.user.perfil.empresa
+    try:
+        pagos = json.loads(request.body).get('pagos')
+    except (ValueError, AttributeError):
+        return JsonResponse({"detail": "JSON inválido."}, status=400)
+    if not isinstance(pagos, list) or not all(isinstance(p, dict) for p in pagos):
+        return JsonResponse({"detail": "Se esperaba una lista de pagos."}, status=400)
+    if len(pagos) > LOTE_PAGOS_MAXIMO:
+        return JsonResponse({"detail": f"Máximo {LOTE_PAGOS_MAXIMO} pagos por lote."}, status=400)
+
+    # Documentos, cuentas, métodos y pagos ya recibidos: una consulta por tabla, no por pago
+    documentos, recibidos = {}, {}
+    for tipo, (documento_modelo, movimiento_modelo, campo, _, _) in PAGOS_MOVILES.items():
+        del_tipo = [p for p in pagos if p.get('tipo') == tipo]
+        documentos[tipo] = documento_modelo.objects.select_related(
+            *(['factura'] if campo == 'estado_cuenta' else [])
+        ).filter(empresa=empresa).in_bulk([p.get('documento') for p in del_tipo if isinstance(p.get('documento'), int)])
+        recibidos.update(movimiento_modelo.objects.filter(
+            empresa=empresa, id_movil__in=[str(p.get('id_movil') or '')[:40] for p in del_tipo],
+        ).values_list('id_movil', 'id'))
+    cuentas = CuentaFinancieraCobro.objects.filter(empresa=empresa, activo=True).in_bulk(
+        [p['cuenta'] for p in pagos if isinstance(p.get('cuenta'), int)]
+    )
+    metodos = MetodoPago.objects.filter(empresa=empresa).in_bulk(
+        [p['metodo_pago'] for p in pagos if isinstance(p.get('metodo_pago'), int)]
+    )
+
+    resultados = []
+    # Una transacción para el lote: la ruta se refresca una sola vez al confirmar
+    with transaction.atomic():
+        for pago in pagos:
+            id_movil = str(pago.get('id_movil') or '')[:40]
+            resultado = {"id_movil": id_movil}
+            if not id_movil or not isinstance(pago.get('tipo'), str) or pago['tipo'] not in PAGOS_MOVILES:
+                resultado.update(estado="error", detalle="Falta id_movil o el tipo no es válido.")
+            elif id_movil in recibidos:
+                resultado.update(estado="duplicado", movimiento=recibidos[id_movil])
+            else:
+                try:
+                    pago['id_movil'] = id_movil
+                    movimiento = _registrar_pago_movil(request, empresa, pago, documentos, cuentas, metodos)
+                    recibidos[id_movil] = movimiento
+                    resultado.update(estado="registrado", movimiento=movimiento)
+                except IntegrityError:
+                    # Otro envío del mismo pago se registró mientras tanto
+                    resultado.update(estado="duplicado")
+                except (ValueError, ValidationError) as e:
+                    resultado.update(estado="error", detalle=str(e))
+                except (DatabaseError, ArithmeticError, TypeError) as e:
+                    # El punto de guardado del pago ya se revirtió: el resto del lote sigue
+                    resultado.update(estado="error", detalle=f"Pago rechazado: {e}")
+            resultados.append(resultado)
+
+    return JsonResponse({"resultados": resultados})
@@ -55,6 +55,20 @@ class PuntoVentaAdmin(admin.ModelAdmin):
     )
 
 
+@admin.register(ProductoProveedor)
+class ProductoProveedorAdmin(admin.ModelAdmin):
+    list_display = ('proveedor', 'codigo_proveedor', 'producto', 'empresa')
+    list_filter = ('empresa',)
+    search_fields = ('codigo_proveedor', 'producto__codigo', 'producto__nombre', 'proveedor__ruc')
+
+
+@admin.register(Bodega)
+class BodegaAdmin(admin.ModelAdmin):
+    list_display = ('nombre', 'empresa', 'es_principal', 'activa')
+    list_filter = ('empresa', 'activa')
+    search_fields = ('nombre',)
+
+
 # ==============================================================================
 # 2. ADMINS DE DATOS MAESTROS
 # ==============================================================================
@@ -0,0 +1,85 @@
+# Ubicación: core/amortizacion.py
+"""
+Tablas de amortización en Decimal exacto (sin floats).
+
+- FRANCES: cuota fija, R = P * i / (1 - (1 + i)^-n), redondeada al centavo.
+- ALEMAN: capital constante P / n más el interés del saldo.
+
+El interés de cada período se redondea al centavo sobre el saldo vigente; la
+última cuota amortiza exactamente el saldo que queda, así la suma del capital
+es el monto prestado al centavo y el saldo final es 0.00.
+
+tabla() es Python puro: sirve para la vista previa del formulario (ver
+prestamo_simular_ajax) y para Prestamo.generar_tabla_amortizacion(), que la
+guarda con un solo bulk_create.
+"""
+from decimal import ROUND_HALF_UP, Decimal, localcontext
+
+from dateutil.relativedelta import relativedelta
+
+CENTAVO = Decimal("0.01")
+CERO = Decimal("0.00")
+
+SISTEMAS = [
+    ("FRANCES", "Francés (cuota fija)"),
+    ("ALEMAN", "Alemán (capital constante)"),
+]
+
+def _centavos(valor):
+    return valor.quantize(CENTAVO, rounding=ROUND_HALF_UP)
+
+def cuota_francesa(capital, tasa, plazo):
+    """Cuota fija (sin redondear) para una tasa por período `tasa` (0.015 = 1.5 %)."""
+    if not tasa:
+        return capital / plazo
+    # Precisión extra: con plazos de 360 períodos (1 + i)^-n pierde dígitos
+    with localcontext() as ctx:
+        ctx.prec = 40
+        return capital * tasa / (1 - (1 + tasa) ** -plazo)
+
+def tabla(capital, tasa_mensual, plazo, fecha_inicio, sistema="FRANCES"):
+    """
+    Filas de la tabla de amortización, con las claves de CuotaPrestamo:
+    numero_cuota, fecha_vencimiento, valor_cuota, interes, capital y
+    saldo_pendiente. `tasa_mensual` es el porcentaje por mes (1.5 = 1.5 %).
+    """
+    capital = _centavos(Decimal(capital))
+    tasa = Decimal(tasa_mensual) / 100
+    plazo = int(plazo)
+    if plazo <= 0 or capital <= 0:
+        return []
+    if sistema not in dict(SISTEMAS):
+        raise ValueError(f"Sistema de amortización desconocido: {sistema}")
+
+    cuota_fija = _centavos(cuota_francesa(capital, tasa, plazo))
+    capital_fijo = _centavos(capital / plazo)
+
+    filas = []
+    saldo = capital
+    for numero in range(1, plazo + 1):
+        interes = _centavos(saldo * tasa)
+        if numero == plazo:
+            amortizado = saldo
+        elif sistema == "FRANCES":
+            amortizado = min(cuota_fija - interes, saldo)
+        else:
+            amortizado = min(capital_fijo, saldo)
+        saldo -= amortizado
+        filas.append({
+            "numero_cuota": numero,
+            # Desde la fecha de inicio (no acumulado): un 31 vuelve a caer en 31 cuando el mes lo tiene
+            "fecha_vencimiento": fecha_inicio + relativedelta(months=numero),
+            "valor_cuota": amortizado + interes,
+            "interes": interes,
+            "capital": amortizado,
+            "saldo_pendiente": saldo,
+        })
+    return filas
+
+def resumen(filas):
+    """Totales de una tabla: pagado, interés y capital."""
+    return {
+        "total_pagado": sum((f["valor_cuota"] for f in filas), CERO),
+        "total_interes": sum((f["interes"] for f in filas), CERO),
+        "total_capital": sum((f["capital"] for f in filas), CERO),
+    }
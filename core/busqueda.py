@@ -0,0 +1,165 @@
+# Ubicación: core/busqueda.py
+"""
+Índice de prefijos en memoria para el autocompletado (Select2) de clientes
+y proveedores.
+
+Cada proceso mantiene un índice por (fuente, empresa). La vigencia del índice
+se controla con una clave de versión guardada en la caché compartida: las
+señales post_save/post_delete incrementan la versión y el siguiente proceso
+que consulte reconstruye su índice de forma perezosa. Así el cajero escribe
+sin golpear la base de datos en cada tecla.
+"""
+import threading
+import unicodedata
+from bisect import bisect_left
+
+from . import cache as cache_erp
+from .models import Cliente, Proveedor
+
+# ==========================================
+# NORMALIZACIÓN
+# ==========================================
+
+def normalizar(texto):
+    """Minúsculas, sin tildes y con espacios colapsados."""
+    if not texto:
+        return ""
+    texto = unicodedata.normalize("NFKD", str(texto))
+    texto = "".join(c for c in texto if not unicodedata.combining(c))
+    return " ".join(texto.lower().split())
+
+# ==========================================
+# ÍNDICE DE PREFIJOS
+# ==========================================
+
+class IndicePrefijos:
+    """
+    Índice ordenado de (término, posición) para búsquedas por prefijo con bisect.
+
+    Se indexa cada palabra del nombre y el RUC/cédula completo. Una consulta de
+    varias palabras exige que todas coincidan (por prefijo) con alguna palabra
+    del registro.
+    """
+
+    def __init__(self, registros, campos_texto, campo_documento):
+        self.registros = list(registros)
+        self._palabras = []
+        self._terminos = []
+        self._documentos = []
+
+        for pos, registro in enumerate(self.registros):
+            palabras = set()
+            for campo in campos_texto:
+                palabras.update(normalizar(registro.get(campo)).split())
+            self._palabras.append(palabras)
+            for palabra in palabras:
+                self._terminos.append((palabra, pos))
+
+            documento = normalizar(registro.get(campo_documento)).replace(" ", "")
+            if documento:
+                self._documentos.append((documento, pos))
+
+        self._terminos.sort()
+        self._documentos.sort()
+
+    @staticmethod
+    def _prefijo(lista, prefijo):
+        inicio = bisect_left(lista, (prefijo,))
+        for termino, pos in lista[inicio:]:
+            if not termino.startswith(prefijo):
+                break
+            yield pos
+
+    def buscar(self, consulta, limite=20):
+        tokens = normalizar(consulta).split()
+        if not tokens:
+            return []
+
+        encontrados = []
+        vistos = set()
+
+        # 1. Coincidencias por RUC/cédula primero (el cajero suele digitarlo)
+        documento = "".join(tokens)
+        for pos in self._prefijo(self._documentos, documento):
+            if pos not in vistos:
+                vistos.add(pos)
+                encontrados.append(pos)
+
+        # 2. Coincidencias por nombre: candidatos por el token más largo y
+        #    filtro del resto de tokens contra las palabras del registro.
+        tokens = sorted(tokens, key=len, reverse=True)
+        principal, resto = tokens[0], tokens[1:]
+        candidatos = sorted(set(self._prefijo(self._terminos, principal)))
+        for pos in candidatos:
+            if pos in vistos:
+                continue
+            palabras = self._palabras[pos]
+            if all(any(p.startswith(t) for p in palabras) for t in resto):
+                vistos.add(pos)
+                encontrados.append(pos)
+
+        return [self.registros[pos] for pos in encontrados[:limite]]
+
+# ==========================================
+# FUENTES INDEXADAS
+# ==========================================
+
+FUENTES = {
+    "cliente": {
+        "modelo": Cliente,
+        "campos": ("id", "nombre", "ruc"),
+        "texto": ("nombre",),
+        "documento": "ruc",
+        "orden": ("nombre",),
+    },
+    "proveedor": {
+        "modelo": Proveedor,
+        "campos": ("id", "nombre", "razon_social", "ruc"),
+        "texto": ("nombre", "razon_social"),
+        "documento": "ruc",
+        "orden": ("nombre",),
+    },
+}
+
+_indices = {}
+_lock = threading.Lock()
+
+def version_indice(fuente, empresa_id):
+    """Versión vigente del índice (contador por empresa en core/cache.py)."""
+    return cache_erp.version(f"busqueda:{fuente}", empresa_id)
+
+def invalidar_indice(fuente, empresa_id):
+    """Incrementa la versión para que todos los procesos reconstruyan el índice."""
+    cache_erp.invalidar(f"busqueda:{fuente}", empresa_id)
+
+def obtener_indice(fuente, empresa_id):
+    """Devuelve el índice vigente de la empresa, reconstruyéndolo si cambió la versión."""
+    version = version_indice(fuente, empresa_id)
+    actual = _indices.get((fuente, empresa_id))
+    if actual and actual[0] == version:
+        return actual[1]
+
+    with _lock:
+        actual = _indices.get((fuente, empresa_id))
+        if actual and actual[0] == version:
+            return actual[1]
+
+        config = FUENTES[fuente]
+        registros = (
+            config["modelo"].objects
+            .filter(empresa_id=empresa_id)
+            .order_by(*config["orden"])
+            .values(*config["campos"])
+        )
+        indice = IndicePrefijos(registros, config["texto"], config["documento"])
+        _indices[(fuente, empresa_id)] = (version, indice)
+        return indice
+
+def buscar(fuente, empresa_id, consulta, limite=20):
+    return obtener_indice(fuente, empresa_id).buscar(consulta, limite=limite)
+
+def buscar_clientes(empresa_id, consulta, limite=20):
+    return buscar("cliente", empresa_id, consulta, limite)
+
+def buscar_proveedores(empresa_id, consulta, limite=10):
+    return buscar("proveedor", empresa_id, consulta, limite)
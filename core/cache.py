@@ -0,0 +1,178 @@
+# Ubicación: core/cache.py
+"""
+Caché por empresa con versiones (sobre la caché compartida de Redis).
+
+Cada empresa tiene un contador de versión por espacio ("ventas", "compras",
+"inventario", "clientes", "cobros", además de los índices de búsqueda,
+precios y promociones). Toda clave cacheada lleva las versiones de los
+espacios de los que depende; invalidar es solo incrementar un contador (ver
+core/signals.py y cobros/signals.py), y las claves viejas expiran solas.
+
+Helpers:
+- obtener: valor calculado bajo demanda (cualquier objeto serializable).
+- obtener_lista: resultado de un queryset, ya evaluado.
+- obtener_fragmento: HTML renderizado.
+- obtener_json / respuesta_json: payload JSON ya serializado.
+
+Cada acierto o fallo se cuenta por nombre de helper (ver estadisticas).
+etag y ultimo_cambio sirven para responder 304 sin calcular nada (ver
+django.views.decorators.http.condition).
+"""
+import datetime
+import json
+import time
+
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.http import HttpResponse
+
+TTL = 60 * 15
+TTL_ESTADISTICAS = 60 * 60 * 24 * 7
+
+# Espacios de datos de negocio (los de índices y precios los define cada módulo)
+ESPACIOS = ("ventas", "compras", "inventario", "clientes", "cobros")
+
+_FALTA = object()
+
+# ==========================================
+# VERSIONES
+# ==========================================
+
+def _clave_version(espacio, empresa_id):
+    return f"v:{espacio}:{empresa_id}"
+
+def _clave_cambio(espacio, empresa_id):
+    return f"t:{espacio}:{empresa_id}"
+
+def version(espacio, empresa_id):
+    """
+    Versión vigente del espacio. Si la clave no existe (caché reiniciada o
+    expulsada) se inicializa con una marca de tiempo para que nunca coincida
+    con una versión antigua.
+    """
+    return versiones((espacio,), empresa_id)[0]
+
+def versiones(espacios, empresa_id):
+    """Versiones de varios espacios en una sola lectura a la caché."""
+    claves = [_clave_version(e, empresa_id) for e in espacios]
+    vigentes = cache.get_many(claves)
+    for clave in claves:
+        if clave not in vigentes:
+            cache.add(clave, time.time_ns(), timeout=None)
+            vigentes[clave] = cache.get(clave)
+    return [vigentes[clave] for clave in claves]
+
+def invalidar(espacio, empresa_id):
+    """Incrementa la versión: todas las claves que dependen del espacio quedan obsoletas."""
+    clave = _clave_version(espacio, empresa_id)
+    try:
+        cache.incr(clave)
+    except ValueError:
+        cache.add(clave, time.time_ns(), timeout=None)
+    cache.set(_clave_cambio(espacio, empresa_id), time.time(), timeout=None)
+
+def ultimo_cambio(espacios, empresa_id):
+    """Fecha (UTC) de la última invalidación de cualquiera de los espacios, o None si no se conoce."""
+    marcas = cache.get_many([_clave_cambio(e, empresa_id) for e in espacios]).values()
+    if not marcas:
+        return None
+    return datetime.datetime.fromtimestamp(max(marcas), tz=datetime.timezone.utc)
+
+def etag(empresa_id, espacios, *partes):
+    """ETag que cambia con cualquier invalidación de los espacios (o con las partes variables)."""
+    return "-".join([str(empresa_id), *(str(p) for p in partes), *(str(v) for v in versiones(espacios, empresa_id))])
+
+def invalidar_al_confirmar(espacio, empresa_id):
+    """
+    Invalida cuando se confirma la transacción en curso: si se hiciera antes,
+    otro proceso podría volver a cachear los datos sin ver todavía el cambio.
+    """
+    transaction.on_commit(lambda: invalidar(espacio, empresa_id))
+
+# ==========================================
+# VALORES CACHEADOS
+# ==========================================
+
+def clave(empresa_id, espacios, nombre, *partes):
+    """Clave de un valor: empresa, nombre, partes variables y versiones de sus espacios."""
+    vigentes = ".".join(str(v) for v in versiones(espacios, empresa_id))
+    return ":".join(["datos", str(empresa_id), nombre, *(str(p) for p in partes), vigentes])
+
+def obtener(empresa_id, espacios, nombre, calcular, partes=(), timeout=TTL):
+    """
+    Devuelve el valor cacheado de `nombre` o lo calcula con `calcular()` y lo
+    guarda. `espacios` son los datos de los que depende: un cambio en
+    cualquiera de ellos genera una clave nueva.
+    """
+    k = clave(empresa_id, espacios, nombre, *partes)
+    valor = cache.get(k, _FALTA)
+    if valor is _FALTA:
+        _contar(nombre, "fallos")
+        valor = calcular()
+        cache.set(k, valor, timeout)
+    else:
+        _contar(nombre, "aciertos")
+    return valor
+
+def obtener_lista(empresa_id, espacios, nombre, queryset, partes=(), timeout=TTL):
+    """Resultado del queryset como lista (conviene usar .values()/.values_list())."""
+    return obtener(empresa_id, espacios, nombre, lambda: list(queryset), partes, timeout)
+
+def obtener_fragmento(empresa_id, espacios, nombre, renderizar, partes=(), timeout=TTL):
+    """HTML de un fragmento; `renderizar()` devuelve el texto."""
+    return obtener(empresa_id, espacios, nombre, renderizar, partes, timeout)
+
+def obtener_json(empresa_id, espacios, nombre, calcular, partes=(), timeout=TTL):
+    """Payload ya serializado (texto JSON): un acierto no vuelve a serializar."""
+    return obtener(
+        empresa_id, espacios, nombre,
+        lambda: json.dumps(calcular(), cls=DjangoJSONEncoder),
+        partes, timeout,
+    )
+
+def respuesta_json(empresa_id, espacios, nombre, calcular, partes=(), timeout=TTL):
+    return HttpResponse(
+        obtener_json(empresa_id, espacios, nombre, calcular, partes, timeout),
+        content_type="application/json",
+    )
+
+# ==========================================
+# ESTADÍSTICAS
+# ==========================================
+
+_CLAVE_NOMBRES = "stats:nombres"
+_nombres_vistos = set()
+
+def _contar(nombre, tipo):
+    clave_contador = f"stats:{nombre}:{tipo}"
+    try:
+        cache.incr(clave_contador)
+    except ValueError:
+        if not cache.add(clave_contador, 1, TTL_ESTADISTICAS):
+            cache.incr(clave_contador)
+    if nombre not in _nombres_vistos:
+        _nombres_vistos.add(nombre)
+        nombres = cache.get(_CLAVE_NOMBRES) or set()
+        if nombre not in nombres:
+            cache.set(_CLAVE_NOMBRES, nombres | {nombre}, TTL_ESTADISTICAS)
+
+def estadisticas():
+    """{nombre: {"aciertos", "fallos", "tasa_aciertos"}} de todos los helpers usados."""
+    nombres = sorted(cache.get(_CLAVE_NOMBRES) or ())
+    contadores = cache.get_many([f"stats:{n}:{t}" for n in nombres for t in ("aciertos", "fallos")])
+    resultado = {}
+    for n in nombres:
+        aciertos = contadores.get(f"stats:{n}:aciertos", 0)
+        fallos = contadores.get(f"stats:{n}:fallos", 0)
+        total = aciertos + fallos
+        resultado[n] = {
+            "aciertos": aciertos,
+            "fallos": fallos,
+            "tasa_aciertos": round(aciertos / total, 4) if total else None,
+        }
+    return resultado
+
+def reiniciar_estadisticas():
+    nombres = cache.get(_CLAVE_NOMBRES) or ()
+    cache.delete_many([f"stats:{n}:{t}" for n in nombres for t in ("aciertos", "fallos")])
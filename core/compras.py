@@ -0,0 +1,146 @@
+# Ubicación: core/compras.py
+"""
+Contabilización de compras en el kardex como asientos reversibles.
+
+- registrar_compra guarda la cabecera, los detalles con un bulk_create y las
+  entradas 'E' con una sola llamada al kardex.
+- anular_compra / restaurar_compra cambian el estado con un UPDATE
+  condicional (una segunda anulación simultánea no hace nada) y escriben en
+  bloque los movimientos compensatorios, al mismo costo con que entró cada
+  línea según el kardex.
+- corregir_compra es "reversa + nuevo registro" en una sola transacción y una
+  sola llamada al kardex, de modo que cada producto se bloquea una sola vez.
+"""
+from decimal import Decimal
+
+from django.db import transaction
+
+from . import kardex, resumenes
+from .models import Compra, CompraDetalle, MovimientoInventario
+
+# ==========================================
+# LÍNEAS DE LA COMPRA
+# ==========================================
+
+def _lineas(compra):
+    """[(detalle_id, producto_id, cantidad, costo_unitario)] en una consulta."""
+    return list(
+        CompraDetalle.objects
+        .filter(compra=compra)
+        .order_by("id")
+        .values_list("id", "producto_id", "cantidad", "costo_unitario")
+    )
+
+def _costos_de_entrada(detalle_ids):
+    """{detalle_compra_id: costo_unitario} del último ingreso de cada línea."""
+    return dict(
+        MovimientoInventario.objects
+        .filter(detalle_compra_id__in=detalle_ids, tipo="E")
+        .order_by("detalle_compra_id", "-fecha", "-id")
+        .distinct("detalle_compra_id")
+        .values_list("detalle_compra_id", "costo_unitario")
+    )
+
+def entradas(compra, lineas, documento):
+    """Movimientos 'E' de las líneas [(detalle_id, producto_id, cantidad, costo)] de una compra."""
+    return [
+        {
+            "producto_id": producto_id,
+            "tipo": "E",
+            "cantidad": cantidad,
+            "costo_unitario": costo,
+            "detalle_compra_id": detalle_id,
+            "bodega": compra.bodega,
+            "documento": documento,
+        }
+        for detalle_id, producto_id, cantidad, costo in lineas
+    ]
+
+def _reversas(compra, lineas, documento):
+    costos = _costos_de_entrada([l[0] for l in lineas])
+    return [
+        {
+            "producto_id": producto_id,
+            "tipo": "AN_C",
+            "cantidad": cantidad,
+            "costo_unitario": costos.get(detalle_id, costo),
+            "detalle_compra_id": detalle_id,
+            "bodega": compra.bodega,
+            "documento": documento,
+        }
+        for detalle_id, producto_id, cantidad, costo in lineas
+    ]
+
+def _guardar(compra, detalles):
+    """Guarda cabecera y detalles (instancias sin guardar) con sus totales."""
+    total = sum((d.cantidad * d.costo_unitario for d in detalles), Decimal("0"))
+    compra.total = total
+    compra.subtotal = total  # Asumiendo que no hay IVA por ahora
+    compra.save()
+    for d in detalles:
+        d.compra = compra
+    CompraDetalle.objects.bulk_create(detalles)
+    return [(d.id, d.producto_id, d.cantidad, d.costo_unitario) for d in detalles]
+
+def _cambiar_estado(compra, actual, nuevo):
+    if not Compra.objects.filter(pk=compra.pk, estado=actual).update(estado=nuevo):
+        return False
+    compra.estado = nuevo
+    return True
+
+# ==========================================
+# OPERACIONES
+# ==========================================
+
+@transaction.atomic
+def registrar_compra(compra, detalles, usuario=None):
+    """`compra` y `detalles` son instancias aún sin guardar (compra con empresa)."""
+    lineas = _guardar(compra, detalles)
+    kardex.registrar_movimientos(
+        compra.empresa, entradas(compra, lineas, f"COMPRA-{compra.id}"), usuario=usuario
+    )
+    resumenes.registrar_compras([compra])
+    return compra
+
+@transaction.atomic
+def anular_compra(compra, usuario=None):
+    """Revierte el stock al costo de ingreso. Devuelve False si ya estaba anulada."""
+    if not _cambiar_estado(compra, "A", "N"):
+        return False
+    kardex.registrar_movimientos(
+        compra.empresa, _reversas(compra, _lineas(compra), f"ANULA-COMPRA-{compra.id}"), usuario=usuario
+    )
+    resumenes.registrar_compras([compra], signo=-1)
+    return True
+
+@transaction.atomic
+def restaurar_compra(compra, usuario=None):
+    """Vuelve a ingresar el stock de una compra anulada. False si no estaba anulada."""
+    if not _cambiar_estado(compra, "N", "A"):
+        return False
+    kardex.registrar_movimientos(
+        compra.empresa, entradas(compra, _lineas(compra), f"RESTAURA-COMPRA-{compra.id}"), usuario=usuario
+    )
+    resumenes.registrar_compras([compra])
+    return True
+
+@transaction.atomic
+def corregir_compra(original, nueva, detalles, usuario=None):
+    """
+    Anula `original` y registra `nueva` (con sus detalles sin guardar) como su
+    corrección. Reversa y nuevo ingreso van en una sola llamada al kardex.
+    """
+    if not _cambiar_estado(original, "A", "N"):
+        raise ValueError("Solo se pueden corregir compras activas.")
+
+    nueva.corrige_a = original
+    lineas = _guardar(nueva, detalles)
+    kardex.registrar_movimientos(
+        original.empresa,
+        _reversas(original, _lineas(original), f"ANULA-COMPRA-{original.id}")
+        + entradas(nueva, lineas, f"COMPRA-{nueva.id}"),
+        usuario=usuario,
+    )
+    resumenes.registrar_compras([original], signo=-1)
+    resumenes.registrar_compras([nueva])
+    return nueva
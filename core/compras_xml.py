@@ -0,0 +1,382 @@
+# Ubicación: core/compras_xml.py
+"""
+Carga de facturas de proveedores desde los XML autorizados del SRI, ejecutada
+por Celery (ver ImportacionCompras y core.tasks.importar_compras_xml_task).
+
+- Se acepta un XML suelto o un ZIP con cientos de ellos. Cada archivo se lee
+  con lxml.etree.iterparse y cada comprobante se libera apenas se procesa,
+  así que la memoria no crece con el tamaño del ZIP.
+- El XML puede ser la respuesta de autorización (<autorizacion> con el
+  comprobante en CDATA) o la <factura> sola.
+- Los proveedores se buscan por RUC y se crean si no existen. Cada línea se
+  asocia a un producto por el código aprendido del proveedor
+  (ProductoProveedor), luego por el código del producto y, si se pidió, se
+  crea el producto.
+- Las compras se guardan por lotes: un bulk_create de Compra, uno de
+  CompraDetalle y una llamada al kardex por lote. Si un lote falla se
+  reintenta comprobante por comprobante para reportar cuál tiene el error.
+"""
+import datetime
+import logging
+import os
+import zipfile
+from decimal import Decimal, InvalidOperation
+
+from django.db import transaction
+from django.utils import timezone
+from lxml import etree
+
+from . import busqueda, cache as cache_erp, kardex, procesos, resumenes
+from .compras import entradas
+from .models import (
+    Compra, CompraDetalle, ImportacionCompras, Producto,
+    ProductoProveedor, Proveedor,
+)
+
+logger = logging.getLogger(__name__)
+
+TAMANO_LOTE = 200
+CUATRO_DECIMALES = Decimal("0.0001")
+
+# Sin entidades externas ni red: los XML vienen de terceros
+_OPCIONES_XML = {"resolve_entities": False, "no_network": True, "huge_tree": True}
+
+# ==========================================
+# LECTURA DE COMPROBANTES
+# ==========================================
+
+def _texto(elem, ruta, obligatorio=True):
+    valor = (elem.findtext(ruta) or "").strip()
+    if obligatorio and not valor:
+        raise ValueError(f"Falta el campo {ruta}.")
+    return valor
+
+def _decimal(valor, campo):
+    try:
+        return Decimal(valor)
+    except (InvalidOperation, TypeError):
+        raise ValueError(f"Valor inválido en {campo}: {valor}")
+
+def leer_factura(factura):
+    """Diccionario con los datos de un elemento <factura> del SRI."""
+    tributaria = factura.find("infoTributaria")
+    info = factura.find("infoFactura")
+    if tributaria is None or info is None:
+        raise ValueError("El comprobante no tiene infoTributaria / infoFactura.")
+
+    try:
+        fecha = datetime.datetime.strptime(_texto(info, "fechaEmision"), "%d/%m/%Y").date()
+    except ValueError:
+        raise ValueError(f"Fecha de emisión inválida: {info.findtext('fechaEmision')}")
+
+    lineas = []
+    for detalle in factura.iterfind("detalles/detalle"):
+        codigo = _texto(detalle, "codigoPrincipal", False) or _texto(detalle, "codigoAuxiliar", False)
+        descripcion = _texto(detalle, "descripcion", False)
+        if not codigo:
+            raise ValueError(f"Línea sin código: {descripcion}")
+        cantidad = _decimal(_texto(detalle, "cantidad"), "cantidad")
+        if cantidad <= 0:
+            raise ValueError(f"Cantidad inválida en la línea {codigo}.")
+        total = _decimal(_texto(detalle, "precioTotalSinImpuesto"), "precioTotalSinImpuesto")
+        lineas.append({
+            "codigo": codigo[:50],
+            "descripcion": (descripcion or codigo)[:200],
+            "cantidad": cantidad,
+            # Costo neto de descuentos
+            "costo_unitario": (total / cantidad).quantize(CUATRO_DECIMALES),
+            "grava_iva": any(
+                i.findtext("codigo") == "2" and _decimal(i.findtext("valor") or "0", "valor") > 0
+                for i in detalle.iterfind("impuestos/impuesto")
+            ),
+        })
+    if not lineas:
+        raise ValueError("El comprobante no tiene detalles.")
+
+    return {
+        "clave_acceso": _texto(tributaria, "claveAcceso"),
+        "ruc": _texto(tributaria, "ruc"),
+        "razon_social": _texto(tributaria, "razonSocial"),
+        "nombre_comercial": _texto(tributaria, "nombreComercial", False),
+        "direccion": _texto(tributaria, "dirMatriz", False),
+        "numero": "-".join(_texto(tributaria, campo) for campo in ("estab", "ptoEmi", "secuencial")),
+        "fecha": fecha,
+        "comprador": _texto(info, "identificacionComprador", False),
+        "subtotal": _decimal(_texto(info, "totalSinImpuestos"), "totalSinImpuestos"),
+        "iva": sum(
+            (_decimal(v.text, "totalImpuesto/valor") for v in info.iterfind("totalConImpuestos/totalImpuesto/valor")),
+            Decimal("0"),
+        ),
+        "total": _decimal(_texto(info, "importeTotal"), "importeTotal"),
+        "lineas": lineas,
+    }
+
+def _desde_autorizacion(autorizacion):
+    """(factura, error) de un elemento <autorizacion>."""
+    estado = _texto(autorizacion, "estado", False).upper()
+    if estado and estado != "AUTORIZADO":
+        return None, f"Comprobante no autorizado (estado {estado})."
+
+    nodo = autorizacion.find("comprobante")
+    if nodo is None:
+        return None, "Autorización sin comprobante."
+
+    factura = nodo.find("factura")
+    if factura is None and (nodo.text or "").strip():
+        # Lo normal: el comprobante viene como texto (CDATA) dentro de la autorización
+        try:
+            factura = etree.fromstring(nodo.text.strip().encode("utf-8"), etree.XMLParser(**_OPCIONES_XML))
+        except etree.XMLSyntaxError as e:
+            return None, f"Comprobante ilegible: {e}"
+
+    if factura is None or factura.tag != "factura":
+        return None, "El comprobante no es una factura."
+    return factura, None
+
+def _liberar(elem):
+    """Libera el elemento y sus hermanos anteriores ya procesados."""
+    elem.clear()
+    padre = elem.getparent()
+    if padre is not None:
+        while elem.getprevious() is not None:
+            del padre[0]
+
+def comprobantes(flujo):
+    """Genera (factura, error) por cada comprobante de un archivo XML, en streaming."""
+    for _, elem in etree.iterparse(flujo, events=("end",), tag=("autorizacion", "factura"), **_OPCIONES_XML):
+        if elem.tag == "factura":
+            if any(a.tag == "autorizacion" for a in elem.iterancestors()):
+                continue  # se procesa junto con su autorización
+            yield elem, None
+        else:
+            yield _desde_autorizacion(elem)
+        _liberar(elem)
+
+# ==========================================
+# GUARDADO POR LOTES
+# ==========================================
+
+def _proveedores(empresa, lote):
+    """{ruc: proveedor_id}; crea en bloque los proveedores que no existen."""
+    rucs = {datos["ruc"] for _, datos in lote}
+    proveedores = {}
+    # Si hay RUC repetidos en la empresa se usa el proveedor más antiguo
+    for proveedor_id, ruc in Proveedor.objects.filter(empresa=empresa, ruc__in=rucs).order_by("-id").values_list("id", "ruc"):
+        proveedores[ruc] = proveedor_id
+
+    nuevos = {}
+    for _, datos in lote:
+        if datos["ruc"] not in proveedores and datos["ruc"] not in nuevos:
+            nuevos[datos["ruc"]] = Proveedor(
+                empresa=empresa,
+                ruc=datos["ruc"],
+                razon_social=datos["razon_social"][:200],
+                nombre=(datos["nombre_comercial"] or datos["razon_social"])[:200],
+                direccion=datos["direccion"][:300] or None,
+            )
+    if nuevos:
+        Proveedor.objects.bulk_create(nuevos.values())
+        proveedores.update((ruc, p.id) for ruc, p in nuevos.items())
+        # bulk_create no dispara señales: refrescar el autocompletado a mano
+        transaction.on_commit(lambda: busqueda.invalidar_indice("proveedor", empresa.id))
+    return proveedores
+
+@transaction.atomic
+def guardar_lote(importacion, lote):
+    """
+    Guarda un lote de (archivo, datos) ya depurado de duplicados.
+    Devuelve (compras creadas, productos creados).
+    """
+    empresa = importacion.empresa
+    proveedores = _proveedores(empresa, lote)
+
+    # Productos: primero el código aprendido del proveedor, después el código propio
+    pares = {(proveedores[datos["ruc"]], l["codigo"]) for _, datos in lote for l in datos["lineas"]}
+    codigos = {codigo for _, codigo in pares}
+    aprendidos = {
+        (proveedor_id, codigo): producto_id
+        for proveedor_id, codigo, producto_id in ProductoProveedor.objects.filter(
+            proveedor_id__in={p for p, _ in pares}, codigo_proveedor__in=codigos
+        ).values_list("proveedor_id", "codigo_proveedor", "producto_id")
+    }
+    por_codigo = dict(Producto.objects.filter(empresa=empresa, codigo__in=codigos).values_list("codigo", "id"))
+
+    sin_producto = {}
+    for _, datos in lote:
+        for l in datos["lineas"]:
+            if (proveedores[datos["ruc"]], l["codigo"]) not in aprendidos and l["codigo"] not in por_codigo:
+                sin_producto.setdefault(l["codigo"], l)
+
+    if sin_producto and not importacion.crear_productos:
+        raise ValueError(f"Productos sin asociar: {', '.join(sorted(sin_producto)[:20])}")
+    if sin_producto:
+        Producto.objects.bulk_create(
+            [
+                Producto(
+                    empresa=empresa,
+                    codigo=codigo,
+                    nombre=l["descripcion"],
+                    costo=l["costo_unitario"],
+                    precio=0,  # El precio de venta se define después en inventario
+                    maneja_iva=l["grava_iva"],
+                )
+                for codigo, l in sin_producto.items()
+            ],
+            ignore_conflicts=True,
+        )
+        por_codigo.update(
+            Producto.objects.filter(empresa=empresa, codigo__in=list(sin_producto)).values_list("codigo", "id")
+        )
+
+    # Se aprende el código de cada proveedor para las próximas cargas
+    ProductoProveedor.objects.bulk_create(
+        [
+            ProductoProveedor(empresa=empresa, proveedor_id=proveedor_id, codigo_proveedor=codigo, producto_id=por_codigo[codigo])
+            for proveedor_id, codigo in pares
+            if (proveedor_id, codigo) not in aprendidos
+        ],
+        ignore_conflicts=True,
+    )
+
+    compras = [
+        Compra(
+            empresa=empresa,
+            proveedor_id=proveedores[datos["ruc"]],
+            fecha=datos["fecha"],
+            subtotal=datos["subtotal"],
+            iva=datos["iva"],
+            total=datos["total"],
+            clave_acceso=datos["clave_acceso"],
+            numero_comprobante=datos["numero"],
+        )
+        for _, datos in lote
+    ]
+    Compra.objects.bulk_create(compras)
+
+    por_compra = []
+    for compra, (_, datos) in zip(compras, lote):
+        por_compra.append((compra, [
+            CompraDetalle(
+                compra=compra,
+                producto_id=aprendidos.get((compra.proveedor_id, l["codigo"])) or por_codigo[l["codigo"]],
+                cantidad=l["cantidad"],
+                costo_unitario=l["costo_unitario"],
+            )
+            for l in datos["lineas"]
+        ]))
+    CompraDetalle.objects.bulk_create([d for _, detalles in por_compra for d in detalles])
+
+    movimientos = []
+    for compra, detalles in por_compra:
+        movimientos += entradas(
+            compra,
+            [(d.id, d.producto_id, d.cantidad, d.costo_unitario) for d in detalles],
+            f"COMPRA-{compra.id}",
+        )
+    kardex.registrar_movimientos(empresa, movimientos, usuario=importacion.usuario)
+    resumenes.registrar_compras(compras)
+    cache_erp.invalidar_al_confirmar("compras", empresa.id)
+    return len(compras), len(sin_producto)
+
+# ==========================================
+# PROCESO COMPLETO
+# ==========================================
+
+class _Progreso(procesos.Progreso):
+    CONTADORES = ("archivos_leidos", "comprobantes", "creadas", "duplicadas", "productos_creados")
+
+    def __init__(self, importacion):
+        super().__init__(importacion)
+        self.lote = []
+
+def _procesar_lote(importacion, progreso):
+    lote, progreso.lote = progreso.lote, []
+
+    # Duplicados: ya cargados antes o repetidos dentro del mismo lote
+    claves = [datos["clave_acceso"] for _, datos in lote]
+    existentes = set(
+        Compra.objects.filter(empresa=importacion.empresa, clave_acceso__in=claves)
+        .values_list("clave_acceso", flat=True)
+    )
+    unicos = {}
+    for archivo, datos in lote:
+        if datos["clave_acceso"] in existentes or datos["clave_acceso"] in unicos:
+            progreso.duplicadas += 1
+        elif datos["comprador"] and datos["comprador"] != importacion.empresa.ruc:
+            progreso.error(f"Emitida a otro comprador ({datos['comprador']}).", archivo=archivo, comprobante=datos["numero"])
+        else:
+            unicos[datos["clave_acceso"]] = (archivo, datos)
+    lote = list(unicos.values())
+    if not lote:
+        return
+
+    try:
+        creadas, productos = guardar_lote(importacion, lote)
+    except Exception:
+        # Comprobante por comprobante para identificar cuáles fallan
+        creadas = productos = 0
+        for item in lote:
+            try:
+                c, p = guardar_lote(importacion, [item])
+                creadas += c
+                productos += p
+            except Exception as e:
+                progreso.error(e, archivo=item[0], comprobante=item[1]["numero"])
+
+    progreso.creadas += creadas
+    progreso.productos_creados += productos
+    progreso.guardar()
+
+def _leer_archivo(importacion, nombre, flujo, progreso):
+    try:
+        for factura, error in comprobantes(flujo):
+            progreso.comprobantes += 1
+            if error:
+                progreso.error(error, archivo=nombre, comprobante="")
+                continue
+            try:
+                progreso.lote.append((nombre, leer_factura(factura)))
+            except ValueError as e:
+                progreso.error(e, archivo=nombre, comprobante="")
+                continue
+            if len(progreso.lote) >= TAMANO_LOTE:
+                _procesar_lote(importacion, progreso)
+    except etree.XMLSyntaxError as e:
+        progreso.error(f"XML inválido: {e}", archivo=nombre, comprobante="")
+    progreso.archivos_leidos += 1
+
+def procesar_importacion_compras(importacion_id):
+    importacion = ImportacionCompras.objects.select_related("empresa", "usuario").get(pk=importacion_id)
+    if importacion.estado != "P":
+        return importacion  # Ya procesada (reintento de Celery)
+
+    ImportacionCompras.objects.filter(pk=importacion.pk).update(estado="E")
+    progreso = _Progreso(importacion)
+
+    try:
+        with importacion.archivo.open("rb") as archivo:
+            if zipfile.is_zipfile(archivo):
+                with zipfile.ZipFile(archivo) as zf:
+                    miembros = [
+                        m for m in zf.infolist()
+                        if not m.is_dir() and m.filename.lower().endswith(".xml")
+                    ]
+                    progreso.guardar(total_archivos=len(miembros))
+                    for miembro in miembros:
+                        with zf.open(miembro) as flujo:
+                            _leer_archivo(importacion, miembro.filename, flujo, progreso)
+            else:
+                archivo.seek(0)
+                progreso.guardar(total_archivos=1)
+                _leer_archivo(importacion, os.path.basename(importacion.archivo.name), archivo, progreso)
+
+        if progreso.lote:
+            _procesar_lote(importacion, progreso)
+        progreso.guardar(estado="C", finalizado_en=timezone.now())
+
+    except Exception as e:
+        logger.exception(f"Error en la importación de compras #{importacion.id}")
+        progreso.guardar(estado="F", mensaje=str(e), finalizado_en=timezone.now())
+
+    importacion.refresh_from_db()
+    return importacion
@@ -0,0 +1,42 @@
+# Ubicación: core/fechas.py
+"""
+Límites de días y meses locales como datetimes con zona horaria.
+
+Los filtros por fecha sobre un DateTimeField se hacen con un rango
+[inicio, fin) en lugar de __date, así usan el índice de la columna. Los
+límites se calculan en la zona horaria actual (settings.TIME_ZONE).
+"""
+import datetime
+
+from dateutil.relativedelta import relativedelta
+from django.db.models import DateTimeField, Func
+from django.utils import timezone
+
+def inicio_dia(fecha):
+    """Medianoche local de `fecha`."""
+    return timezone.make_aware(datetime.datetime.combine(fecha, datetime.time.min))
+
+def fin_dia(fecha):
+    """Inicio del día siguiente a `fecha` (límite exclusivo)."""
+    return inicio_dia(fecha + datetime.timedelta(days=1))
+
+class FinDia(Func):
+    """
+    fin_dia() sobre una columna DateField (F, OuterRef): el inicio del día
+    local siguiente como timestamptz, para comparar con __lt (PostgreSQL).
+    """
+    arity = 1
+    output_field = DateTimeField()
+
+    def as_sql(self, compiler, connection, **extra_context):
+        sql, params = compiler.compile(self.source_expressions[0])
+        return f"(({sql} + 1)::timestamp AT TIME ZONE %s)", (*params, timezone.get_current_timezone_name())
+
+def rango_dias(desde, hasta, campo="fecha"):
+    """Filtro por los días locales [desde, hasta] sobre el DateTimeField `campo`."""
+    return {f"{campo}__gte": inicio_dia(desde), f"{campo}__lt": fin_dia(hasta)}
+
+def rango_periodo(periodo):
+    """(inicio, fin) del mes como datetimes con zona horaria; fin es exclusivo."""
+    inicio = periodo.replace(day=1)
+    return inicio_dia(inicio), inicio_dia(inicio + relativedelta(months=1))
@@ -12,9 +12,11 @@ from .models import *
 class EmpresaConfigForm(forms.ModelForm):
     class Meta:
         model = Empresa
-        fields = ['iva_porcentaje', 'firma_electronica', 'clave_firma']
+        fields = ['iva_porcentaje', 'mora_porcentaje_diario', 'dias_gracia_mora', 'firma_electronica', 'clave_firma']
         widgets = {
             'iva_porcentaje': forms.NumberInput(attrs={'class': 'form-control', 'step': '0.01'}),
+            'mora_porcentaje_diario': forms.NumberInput(attrs={'class': 'form-control', 'step': '0.0001'}),
+            'dias_gracia_mora': forms.NumberInput(attrs={'class': 'form-control'}),
             'firma_electronica': forms.FileInput(attrs={'class': 'form-control'}),
             'clave_firma': forms.PasswordInput(attrs={'class': 'form-control', 'placeholder': 'Ingrese la clave solo si desea cambiarla'}),
         }
@@ -25,14 +27,48 @@ class EmpresaConfigForm(forms.ModelForm):
 class PuntoVentaForm(forms.ModelForm):
     class Meta:
         model = PuntoVenta
-        fields = ['nombre', 'codigo_establecimiento', 'codigo_punto_emision', 'activo']
+        fields = ['nombre', 'codigo_establecimiento', 'codigo_punto_emision', 'bodega', 'activo']
         widgets = {
             'nombre': forms.TextInput(attrs={'class': 'form-control'}),
             'codigo_establecimiento': forms.TextInput(attrs={'class': 'form-control'}),
             'codigo_punto_emision': forms.TextInput(attrs={'class': 'form-control'}),
+            'bodega': forms.Select(attrs={'class': 'form-select'}),
             'activo': forms.CheckboxInput(attrs={'class': 'form-check-input'}),
         }
 
+    def __init__(self, *args, **kwargs):
+        empresa = kwargs.pop('empresa', None)
+        super().__init__(*args, **kwargs)
+        if empresa:
+            self.fields['bodega'].queryset = Bodega.objects.filter(empresa=empresa, activa=True)
+
+class BodegaForm(forms.ModelForm):
+    class Meta:
+        model = Bodega
+        fields = ['nombre', 'direccion', 'es_principal', 'activa']
+        widgets = {
+            'nombre': forms.TextInput(attrs={'class': 'form-control'}),
+            'direccion': forms.TextInput(attrs={'class': 'form-control'}),
+            'es_principal': forms.CheckboxInput(attrs={'class': 'form-check-input'}),
+            'activa': forms.CheckboxInput(attrs={'class': 'form-check-input'}),
+        }
+
+    def __init__(self, *args, **kwargs):
+        self.empresa = kwargs.pop('empresa', None)
+        super().__init__(*args, **kwargs)
+
+    def clean_nombre(self):
+        nombre = (self.cleaned_data.get('nombre') or '').strip()
+        # (empresa, nombre) es único: la empresa no está en el formulario, así que
+        # Django no lo valida por sí solo.
+        if self.empresa and nombre:
+            existentes = Bodega.objects.filter(empresa=self.empresa, nombre__iexact=nombre)
+            if self.instance.pk:
+                existentes = existentes.exclude(pk=self.instance.pk)
+            if existentes.exists():
+                raise ValidationError("Ya existe una bodega con este nombre.")
+        return nombre
+
 class MetodoPagoForm(forms.ModelForm):
     class Meta:
         model = MetodoPago
@@ -41,6 +77,12 @@ class MetodoPagoForm(forms.ModelForm):
             'nombre': forms.TextInput(attrs={'class': 'form-control'}),
         }
 
+def cliente_duplicado(empresa, ruc, instance=None):
+    qs = Cliente.objects.filter(empresa=empresa, ruc=ruc)
+    if instance is not None and instance.pk:
+        qs = qs.exclude(pk=instance.pk)
+    return qs.exists()
+
 class ClienteForm(forms.ModelForm):
     class Meta:
         model = Cliente
@@ -53,11 +95,20 @@ class ClienteForm(forms.ModelForm):
             'direccion': forms.Textarea(attrs={'class': 'form-control form-control-sm', 'rows': 1, 'placeholder': 'Dirección'}),
         }
 
+    def __init__(self, *args, **kwargs):
+        self.empresa = kwargs.pop('empresa', None)
+        super().__init__(*args, **kwargs)
+
     # CORRECCIÓN: Renombrado de clean_dni a clean_ruc para que coincida con el campo
     def clean_ruc(self):
-        dni = self.cleaned_data.get('ruc') # Obtenemos el campo ruc
+        dni = (self.cleaned_data.get('ruc') or '').strip() # Obtenemos el campo ruc
         if not dni:
             return dni
+
+        # (empresa, ruc) es único: la empresa no está en el formulario, así que
+        # Django no lo valida por sí solo.
+        if self.empresa and cliente_duplicado(self.empresa, dni, self.instance):
+            raise ValidationError("Ya existe un cliente con este RUC/Cédula.")
             
         # Si longitud es 10 y es numérico, validar algoritmo Cédula
         if len(dni) == 10 and dni.isdigit():
@@ -168,10 +219,11 @@ class ProductoForm(forms.ModelForm):
 class CompraForm(forms.ModelForm):
     class Meta:
         model = Compra
-        fields = ['proveedor', 'fecha']
+        fields = ['proveedor', 'fecha', 'bodega']
         widgets = {
             'fecha': forms.DateInput(attrs={'class': 'form-control', 'type': 'date'}),
             'proveedor': forms.Select(attrs={'class': 'form-select'}),
+            'bodega': forms.Select(attrs={'class': 'form-select form-select-sm'}),
         }
     
     def __init__(self, *args, **kwargs):
@@ -179,6 +231,7 @@ class CompraForm(forms.ModelForm):
         super(CompraForm, self).__init__(*args, **kwargs)
         if empresa:
             self.fields['proveedor'].queryset = Proveedor.objects.filter(empresa=empresa)
+            self.fields['bodega'].queryset = Bodega.objects.filter(empresa=empresa, activa=True)
 
 class CompraDetalleForm(forms.ModelForm):
     class Meta:
@@ -291,6 +344,16 @@ class ClienteAjaxForm(forms.ModelForm):
         model = Cliente
         fields = ['nombre', 'ruc', 'email', 'telefono', 'direccion']
 
+    def __init__(self, *args, **kwargs):
+        self.empresa = kwargs.pop('empresa', None)
+        super().__init__(*args, **kwargs)
+
+    def clean_ruc(self):
+        ruc = (self.cleaned_data.get('ruc') or '').strip()
+        if ruc and self.empresa and cliente_duplicado(self.empresa, ruc, self.instance):
+            raise ValidationError("Ya existe un cliente con este RUC/Cédula.")
+        return ruc
+
 class MetodoPagoAjaxForm(forms.ModelForm):
     class Meta:
         model = MetodoPago
@@ -0,0 +1,383 @@
+# Ubicación: core/importaciones.py
+"""
+Importación masiva de inventario desde Excel, ejecutada por Celery
+(ver ImportacionInventario y core.tasks.importar_inventario_task).
+
+- El libro se lee en modo read_only con iter_rows(values_only=True): no se
+  carga la hoja completa en memoria.
+- Categorías, marcas y modelos se resuelven desde diccionarios en memoria;
+  los que faltan se crean en bloque por lote.
+- Productos y precios se guardan por lotes con bulk_create(update_conflicts=True).
+  Cada lote es su propia transacción; si un lote falla se reintenta fila por
+  fila para reportar exactamente qué filas tienen error.
+- La columna STOCK no se escribe en Producto: la diferencia con la existencia
+  actual se registra como ajuste (AJ_E/AJ_S) en el kardex.
+"""
+import logging
+from decimal import Decimal, InvalidOperation
+
+import openpyxl
+from django.db import transaction
+from django.utils import timezone
+
+from . import cache as cache_erp, kardex, precios, procesos
+from .models import (
+    Categoria, ImportacionInventario, Marca, Modelo,
+    MovimientoInventario, Producto, ProductoPrecio, StockBodega,
+)
+
+logger = logging.getLogger(__name__)
+
+TAMANO_LOTE = 1000
+FILAS_BUSQUEDA_ENCABEZADO = 50
+
+ALIAS = {
+    "codigo": ["CÓDIGO", "CODIGO", "COD", "SKU"],
+    "nombre": ["PRODUCTO", "NOMBRE", "DESCRIPCION", "DESCRIPCIÓN"],
+    "categoria": ["CATEGORÍA", "CATEGORIA"],
+    "marca": ["PROVEEDOR", "MARCA"],
+    "stock": ["STOCK", "EXISTENCIA"],
+    "costo": ["COSTO", "COSTE", "COSTO UNITARIO"],
+    "precio1": ["PRECIO 1", "PRECIO1", "PRECIO"],
+    "precio2": ["PRECIO 2", "PRECIO2", "P2"],
+    "precio3": ["PRECIO 3", "PRECIO3", "P3"],
+    "maneja_iva": ["IVA", "MANEJA IVA", "GRAVA IVA"],
+    "activo": ["ACTIVO", "ESTADO"],
+}
+
+CAMPOS_PRODUCTO = [
+    "nombre", "categoria", "marca", "modelo",
+    "costo", "precio", "maneja_iva", "activo",
+]
+
+# ==========================================
+# LECTURA DE FILAS
+# ==========================================
+
+def _norm(valor):
+    if valor is None:
+        return ""
+    return str(valor).strip().upper()
+
+def _texto(valor):
+    if valor is None:
+        return ""
+    if isinstance(valor, float) and valor.is_integer():
+        valor = int(valor)  # 1001.0 -> "1001"
+    return str(valor).strip()
+
+def _decimal(valor, campo):
+    if valor in (None, ""):
+        return Decimal("0")
+    if isinstance(valor, (int, float, Decimal)):
+        return Decimal(str(valor))
+    texto = str(valor).strip().replace(" ", "")
+    # Soporta 1.234,56 / 1234,56 / 1234.56
+    if texto.count(",") == 1 and texto.count(".") >= 1:
+        texto = texto.replace(".", "").replace(",", ".")
+    else:
+        texto = texto.replace(",", ".")
+    try:
+        return Decimal(texto)
+    except InvalidOperation:
+        raise ValueError(f"{campo} inválido: {valor!r}")
+
+def _bool(valor, defecto=True):
+    if valor in (None, ""):
+        return defecto
+    return str(valor).strip().lower() in ("1", "true", "si", "sí", "yes", "x", "ok", "activo")
+
+def buscar_encabezado(filas):
+    """
+    Consume el iterador hasta encontrar la fila de encabezados (la primera que
+    tenga código y producto/nombre). Devuelve (número de fila, {campo: índice}).
+    """
+    for numero, valores in enumerate(filas, start=1):
+        if numero > FILAS_BUSQUEDA_ENCABEZADO:
+            break
+        encabezados = [_norm(v) for v in valores]
+        columnas = {}
+        for campo, nombres in ALIAS.items():
+            for nombre in nombres:
+                if nombre in encabezados:
+                    columnas[campo] = encabezados.index(nombre)
+                    break
+        if "codigo" in columnas and "nombre" in columnas:
+            if "precio1" not in columnas:
+                raise ValueError(
+                    "El archivo debe incluir al menos estas columnas válidas: CÓDIGO, PRODUCTO y PRECIO 1."
+                )
+            return numero, columnas
+
+    raise ValueError(
+        "No se encontró la fila de encabezados del Excel. El archivo debe contener columnas como: "
+        "CÓDIGO, PRODUCTO, STOCK, COSTO, PRECIO 1, PRECIO 2, PRECIO 3."
+    )
+
+def leer_fila(valores, columnas):
+    """Dict con los datos de la fila, o None si no trae código o nombre."""
+    def celda(campo):
+        indice = columnas.get(campo)
+        if indice is None or indice >= len(valores):
+            return None
+        return valores[indice]
+
+    codigo = _texto(celda("codigo"))
+    nombre = _texto(celda("nombre"))
+    if not codigo or not nombre:
+        return None
+    if len(codigo) > 50:
+        raise ValueError("El código supera los 50 caracteres")
+    if len(nombre) > 200:
+        raise ValueError("El nombre supera los 200 caracteres")
+
+    return {
+        "codigo": codigo,
+        "nombre": nombre,
+        "categoria": _texto(celda("categoria"))[:100] or "NA",
+        "marca": _texto(celda("marca"))[:100] or "NA",
+        "stock": _decimal(celda("stock"), "STOCK"),
+        "costo": _decimal(celda("costo"), "COSTO"),
+        "precio1": _decimal(celda("precio1"), "PRECIO 1"),
+        "precio2": _decimal(celda("precio2"), "PRECIO 2"),
+        "precio3": _decimal(celda("precio3"), "PRECIO 3"),
+        "maneja_iva": _bool(celda("maneja_iva"), True),
+        "activo": _bool(celda("activo"), True),
+    }
+
+# ==========================================
+# CATÁLOGOS EN MEMORIA
+# ==========================================
+
+class Catalogos:
+    """Ids de categorías, marcas y modelos "NA" de la empresa, por nombre."""
+
+    def __init__(self, empresa):
+        self.empresa = empresa
+        self.categorias = dict(Categoria.objects.filter(empresa=empresa).values_list("nombre", "id"))
+        self.marcas = dict(Marca.objects.filter(empresa=empresa).values_list("nombre", "id"))
+        self.modelos = dict(
+            Modelo.objects.filter(empresa=empresa, nombre="NA").values_list("marca_id", "id")
+        )
+
+    def _completar(self, modelo, mapa, nombres):
+        faltantes = set(nombres) - mapa.keys()
+        if faltantes:
+            modelo.objects.bulk_create(
+                [modelo(empresa=self.empresa, nombre=n) for n in faltantes],
+                ignore_conflicts=True,
+            )
+            mapa.update(
+                modelo.objects.filter(empresa=self.empresa, nombre__in=faltantes).values_list("nombre", "id")
+            )
+
+    def resolver(self, filas):
+        """Crea en bloque lo que falte para estas filas."""
+        self._completar(Categoria, self.categorias, {f["categoria"] for f in filas})
+        self._completar(Marca, self.marcas, {f["marca"] for f in filas})
+
+        marcas = {self.marcas[f["marca"]] for f in filas} - self.modelos.keys()
+        if marcas:
+            Modelo.objects.bulk_create(
+                [Modelo(empresa=self.empresa, marca_id=m, nombre="NA") for m in marcas],
+                ignore_conflicts=True,
+            )
+            self.modelos.update(
+                Modelo.objects.filter(empresa=self.empresa, nombre="NA", marca_id__in=marcas)
+                .values_list("marca_id", "id")
+            )
+
+# ==========================================
+# GUARDADO POR LOTES
+# ==========================================
+
+@transaction.atomic
+def guardar_lote(importacion, lote, catalogos, tipos_precio):
+    """
+    Guarda un lote de (fila, datos) con un bulk_create por tabla. Los
+    catálogos ya deben estar resueltos. Devuelve (creados, actualizados).
+    """
+    empresa = importacion.empresa
+    filas = [datos for _, datos in lote]
+
+    ids = dict(
+        Producto.objects.filter(empresa=empresa, codigo__in=[f["codigo"] for f in filas])
+        .values_list("codigo", "id")
+    )
+    # Las filas de stock de estos productos quedan bloqueadas hasta el commit:
+    # una venta concurrente no cambia la existencia entre leerla y ajustarla
+    existentes = dict.fromkeys(ids, Decimal("0"))
+    codigos = {pid: codigo for codigo, pid in ids.items()}
+    for pid, cantidad in (
+        StockBodega.objects.select_for_update()
+        .filter(producto_id__in=codigos)
+        .order_by("producto_id", "bodega_id", "franja")
+        .values_list("producto_id", "cantidad")
+    ):
+        existentes[codigos[pid]] += cantidad
+
+    productos = [
+        Producto(
+            empresa=empresa,
+            codigo=f["codigo"],
+            nombre=f["nombre"],
+            categoria_id=catalogos.categorias[f["categoria"]],
+            marca_id=catalogos.marcas[f["marca"]],
+            modelo_id=catalogos.modelos[catalogos.marcas[f["marca"]]],
+            costo=f["costo"],
+            precio=f["precio1"],
+            maneja_iva=f["maneja_iva"],
+            activo=f["activo"],
+        )
+        for f in filas
+    ]
+    # En PostgreSQL los objetos vuelven con su pk también en los actualizados.
+    # El stock no se escribe aquí: lo mueve el kardex con los ajustes.
+    Producto.objects.bulk_create(
+        productos,
+        update_conflicts=True,
+        unique_fields=["empresa", "codigo"],
+        update_fields=CAMPOS_PRODUCTO,
+    )
+
+    valores = []
+    ajustes = []
+    for (numero, f), producto in zip(lote, productos):
+        valores.append(ProductoPrecio(producto_id=producto.pk, tipo_id=tipos_precio[2], valor=f["precio2"]))
+        valores.append(ProductoPrecio(producto_id=producto.pk, tipo_id=tipos_precio[3], valor=f["precio3"]))
+
+        diferencia = f["stock"] - existentes.get(f["codigo"], Decimal("0"))
+        if diferencia > 0:
+            ajustes.append({
+                "producto_id": producto.pk, "tipo": "AJ_E", "cantidad": diferencia,
+                "costo_unitario": f["costo"],
+                "observacion": f"Importación de inventario #{importacion.id} fila {numero}",
+            })
+        elif diferencia < 0:
+            # Los faltantes salen al costo promedio vigente
+            ajustes.append({
+                "producto_id": producto.pk, "tipo": "AJ_S", "cantidad": -diferencia,
+                "observacion": f"Importación de inventario #{importacion.id} fila {numero}",
+            })
+
+    ProductoPrecio.objects.bulk_create(
+        valores,
+        update_conflicts=True,
+        unique_fields=["producto", "tipo"],
+        update_fields=["valor"],
+    )
+    # La diferencia se ajusta en la bodega principal
+    kardex.registrar_movimientos(
+        empresa, ajustes, usuario=importacion.usuario,
+        documento="IMPORTACION_EXCEL", bodega=kardex.bodega_principal(empresa),
+    )
+
+    creados = sum(1 for f in filas if f["codigo"] not in existentes)
+    return creados, len(filas) - creados
+
+# ==========================================
+# PROCESO COMPLETO
+# ==========================================
+
+class _Progreso(procesos.Progreso):
+    CONTADORES = ("procesadas", "creados", "actualizados", "omitidos")
+
+def _procesar_lote(importacion, lote, catalogos, tipos_precio, progreso):
+    # Un mismo código repetido en el lote: prevalece la última fila
+    unicos = {}
+    for numero, datos in lote:
+        if datos["codigo"] in unicos:
+            progreso.omitidos += 1
+        unicos[datos["codigo"]] = (numero, datos)
+    lote = list(unicos.values())
+
+    # Fuera de la transacción del lote: si éste falla, los ids en memoria siguen siendo válidos
+    catalogos.resolver([datos for _, datos in lote])
+
+    try:
+        creados, actualizados = guardar_lote(importacion, lote, catalogos, tipos_precio)
+    except Exception:
+        # Fila por fila para identificar cuáles fallan
+        creados = actualizados = 0
+        for item in lote:
+            try:
+                c, a = guardar_lote(importacion, [item], catalogos, tipos_precio)
+                creados += c
+                actualizados += a
+            except Exception as e:
+                progreso.error(e, fila=item[0], codigo=item[1]["codigo"])
+
+    progreso.creados += creados
+    progreso.actualizados += actualizados
+
+def procesar_importacion_inventario(importacion_id):
+    importacion = ImportacionInventario.objects.select_related("empresa", "usuario").get(pk=importacion_id)
+    if importacion.estado != "P":
+        return importacion  # Ya procesada (reintento de Celery)
+
+    empresa = importacion.empresa
+    ImportacionInventario.objects.filter(pk=importacion.pk).update(estado="E")
+    progreso = _Progreso(importacion)
+
+    try:
+        with importacion.archivo.open("rb") as archivo:
+            libro = openpyxl.load_workbook(archivo, read_only=True, data_only=True)
+            try:
+                hoja = libro.active
+                filas = hoja.iter_rows(values_only=True)
+                fila_encabezado, columnas = buscar_encabezado(filas)
+
+                total = max((hoja.max_row or 0) - fila_encabezado, 0)
+                ImportacionInventario.objects.filter(pk=importacion.pk).update(total_filas=total)
+
+                if importacion.vaciar_antes:
+                    with transaction.atomic():
+                        ProductoPrecio.objects.filter(producto__empresa=empresa).delete()
+                        MovimientoInventario.objects.filter(empresa=empresa).delete()
+                        Producto.objects.filter(empresa=empresa).delete()
+
+                catalogos = Catalogos(empresa)
+                tipos_precio = {
+                    2: precios.tipo_precio_id(empresa.id, 2, crear=True),
+                    3: precios.tipo_precio_id(empresa.id, 3, crear=True),
+                }
+
+                lote = []
+                for numero, valores in enumerate(filas, start=fila_encabezado + 1):
+                    progreso.procesadas += 1
+                    if not any(v not in (None, "") for v in valores):
+                        continue  # fila vacía
+                    try:
+                        datos = leer_fila(valores, columnas)
+                    except ValueError as e:
+                        codigo = valores[columnas["codigo"]] if columnas["codigo"] < len(valores) else None
+                        progreso.error(e, fila=numero, codigo=_texto(codigo))
+                        continue
+                    if datos is None:
+                        progreso.omitidos += 1
+                        continue
+
+                    lote.append((numero, datos))
+                    if len(lote) >= TAMANO_LOTE:
+                        _procesar_lote(importacion, lote, catalogos, tipos_precio, progreso)
+                        lote = []
+                        progreso.guardar()
+
+                if lote:
+                    _procesar_lote(importacion, lote, catalogos, tipos_precio, progreso)
+            finally:
+                libro.close()
+
+        progreso.guardar(estado="C", total_filas=progreso.procesadas, finalizado_en=timezone.now())
+
+    except Exception as e:
+        logger.exception(f"Error en la importación de inventario #{importacion.id}")
+        progreso.guardar(estado="F", mensaje=str(e), finalizado_en=timezone.now())
+
+    finally:
+        # bulk_create no dispara señales: invalidar las cachés a mano
+        precios.invalidar_precios(empresa.id)
+        cache_erp.invalidar("inventario", empresa.id)
+
+    importacion.refresh_from_db()
+    return importacion
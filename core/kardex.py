@@ -0,0 +1,644 @@
+# Ubicación: core/kardex.py
+"""
+Kardex valorizado con costo promedio ponderado.
+
+Todo movimiento de inventario (compras, ventas, ajustes, anulaciones) pasa por
+registrar_movimientos: calcula en memoria la existencia y el costo promedio
+resultantes y guarda todo con un bulk_create de movimientos y un único UPSERT
+sobre StockBodega. Cada fila de MovimientoInventario queda con su costo, su
+saldo y el costo promedio después del movimiento.
+
+La existencia vive en StockBodega (producto, bodega, franja), no en una sola
+fila de Producto: las ventas de distintos locales descuentan de filas
+distintas y no se bloquean entre sí. Producto.stock es solo el total derivado
+(ver sincronizar_stock), que se refresca al confirmar cada movimiento; en
+productos con franjas_stock > 1 (y en los que estaban bloqueados en ese
+momento) lo refresca core.tasks.sincronizar_stock_task.
+
+Solo las entradas y las reversiones a costo bloquean la fila de Producto
+(cambian el costo promedio). Una venta espera únicamente a otra que descuente
+de la misma fila de StockBodega; su saldo es la existencia que ve al
+registrarse, que no incluye lo que otra caja está por confirmar en otra
+bodega o franja. Por eso los cierres, las existencias diarias y las
+existencias a una fecha no toman la cantidad del saldo del último movimiento:
+la calculan como la existencia actual menos el neto de los movimientos
+posteriores, en una sola consulta (ver _cantidades_al).
+
+CierreInventario guarda una foto mensual por producto y ExistenciaDiaria una
+fila por producto y día con movimientos (generada cada noche). El inventario
+valorizado a una fecha o el costo de ventas de un mes se calculan desde esas
+fotos más los movimientos aún no consolidados, no recorriendo todo el histórico.
+"""
+import datetime
+import random
+from decimal import Decimal, ROUND_HALF_UP
+
+from dateutil.relativedelta import relativedelta
+from django.db import connection, transaction
+from django.db.models import Case, DecimalField, F, Max, Min, OuterRef, Q, Subquery, Sum, When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from . import cache as cache_erp
+from .fechas import fin_dia, inicio_dia, rango_periodo
+from .models import (
+    Bodega, CierreInventario, ExistenciaDiaria, MovimientoInventario,
+    Producto, PuntoControl, StockBodega,
+)
+
+CUATRO_DECIMALES = Decimal("0.0001")
+CERO = Decimal("0")
+
+ENTRADAS = MovimientoInventario.TIPOS_ENTRADA
+SALIDAS = MovimientoInventario.TIPOS_SALIDA
+
+def _redondear(valor):
+    return Decimal(valor).quantize(CUATRO_DECIMALES, rounding=ROUND_HALF_UP)
+
+def _decimal(valor):
+    return valor if isinstance(valor, Decimal) else Decimal(str(valor or 0))
+
+def _id(movimiento, campo):
+    """Id de una relación del movimiento, dada como instancia (`campo`) o como `campo_id`."""
+    objeto = movimiento.get(campo)
+    return objeto.pk if objeto is not None else movimiento.get(f"{campo}_id")
+
+def _producto_id(movimiento):
+    return _id(movimiento, "producto")
+
+# ==========================================
+# BODEGAS Y EXISTENCIAS POR BODEGA
+# ==========================================
+
+def bodega_principal(empresa):
+    """Bodega principal de la empresa; si no tiene ninguna se crea "Principal"."""
+    bodega = Bodega.objects.filter(empresa=empresa, es_principal=True).first()
+    if bodega is None:
+        bodega, _ = Bodega.objects.get_or_create(
+            empresa=empresa, nombre="Principal", defaults={"es_principal": True}
+        )
+    return bodega
+
+def existencias_totales(producto_ids):
+    """{producto_id: cantidad} sumando todas las bodegas y franjas."""
+    totales = dict(
+        StockBodega.objects
+        .filter(producto_id__in=producto_ids)
+        .values("producto_id")
+        .annotate(total=Sum("cantidad"))
+        .values_list("producto_id", "total")
+    )
+    return {pid: totales.get(pid) or CERO for pid in producto_ids}
+
+def existencias_por_bodega(producto_ids, bodega=None):
+    """{producto_id: {bodega_id: cantidad}}; con `bodega`, solo esa bodega."""
+    filas = StockBodega.objects.filter(producto_id__in=producto_ids)
+    if bodega is not None:
+        filas = filas.filter(bodega=bodega)
+    resultado = {}
+    for pid, bodega_id, total in (
+        filas.values("producto_id", "bodega_id")
+        .annotate(total=Sum("cantidad"))
+        .values_list("producto_id", "bodega_id", "total")
+    ):
+        resultado.setdefault(pid, {})[bodega_id] = total
+    return resultado
+
+# Suma atómica en la fila; si la fila no existe se crea con la cantidad
+_SQL_STOCK = """
+    INSERT INTO {tabla} (producto_id, bodega_id, franja, cantidad)
+    VALUES {valores}
+    ON CONFLICT (producto_id, bodega_id, franja) DO UPDATE
+        SET cantidad = {tabla}.cantidad + EXCLUDED.cantidad
+"""
+
+def aplicar_stock(deltas):
+    """
+    Suma cada delta {(producto_id, bodega_id, franja): cantidad} a StockBodega
+    en una sola sentencia. Las filas se escriben ordenadas para que dos
+    transacciones concurrentes las bloqueen siempre en el mismo orden.
+    """
+    deltas = sorted((clave, cantidad) for clave, cantidad in deltas.items() if cantidad)
+    if not deltas:
+        return
+    tabla = StockBodega._meta.db_table
+    sql = _SQL_STOCK.format(tabla=tabla, valores=", ".join(["(%s, %s, %s, %s)"] * len(deltas)))
+    parametros = [v for (pid, bodega_id, franja), cantidad in deltas for v in (pid, bodega_id, franja, cantidad)]
+    with connection.cursor() as cursor:
+        cursor.execute(sql, parametros)
+
+# Producto.stock = suma de StockBodega (solo escribe las filas que cambian y
+# salta las que otra transacción tiene bloqueadas)
+_SQL_SINCRONIZAR = """
+    UPDATE {producto} p
+    SET stock = t.total
+    FROM (
+        SELECT base.id, COALESCE(SUM(s.cantidad), 0) AS total
+        FROM {producto} base
+        LEFT JOIN {stock} s ON s.producto_id = base.id
+        WHERE {filtro}
+        GROUP BY base.id
+    ) t
+    WHERE p.id = t.id AND p.stock IS DISTINCT FROM t.total
+      AND p.id IN (SELECT libre.id FROM {producto} libre WHERE libre.id = t.id FOR NO KEY UPDATE SKIP LOCKED)
+"""
+
+def sincronizar_stock(producto_ids=None):
+    """
+    Recalcula Producto.stock desde StockBodega y devuelve las filas
+    actualizadas. Con `producto_ids` (al confirmar un movimiento) solo esos
+    productos; sin ellos (tarea periódica) todos los que difieren.
+
+    Una fila bloqueada por otra transacción (una compra que cambia el costo)
+    se salta en lugar de esperarla: esa transacción la refresca al confirmar
+    y, si no, la próxima pasada de la tarea periódica.
+    """
+    if producto_ids is not None:
+        producto_ids = list(producto_ids)
+        if not producto_ids:
+            return 0
+        filtro, parametros = "base.id = ANY(%s)", [producto_ids]
+    else:
+        filtro, parametros = "TRUE", []
+    sql = _SQL_SINCRONIZAR.format(
+        producto=Producto._meta.db_table,
+        stock=StockBodega._meta.db_table,
+        filtro=filtro,
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, parametros)
+        return cursor.rowcount
+
+# ==========================================
+# REGISTRO DE MOVIMIENTOS
+# ==========================================
+
+@transaction.atomic
+def registrar_movimientos(empresa, movimientos, usuario=None, documento=None, bodega=None):
+    """
+    Aplica una lista de movimientos al kardex. Cada movimiento es un dict con:
+
+    - producto (instancia) o producto_id
+    - tipo: uno de MovimientoInventario.TIPO_CHOICES
+    - cantidad: siempre positiva; el tipo define el sentido
+    - costo_unitario: costo de la entrada. En una salida es opcional: si
+      viene, se retira el valor a ese costo (reversión de una compra); si no,
+      la salida se valoriza al costo promedio vigente.
+    - bodega o bodega_id (opcional): por defecto la del argumento `bodega`
+      y, si tampoco viene, la bodega principal de la empresa
+    - detalle_factura, detalle_compra (instancia o *_id), documento,
+      observacion (opcionales)
+
+    Solo los productos cuyo costo promedio cambia (entradas y reversiones a
+    costo) se bloquean con SELECT ... FOR NO KEY UPDATE. Una venta común no
+    toca la fila de Producto: se serializa en la fila de StockBodega que
+    descuenta (la bodega y, con franjas, una franja al azar). Devuelve los
+    MovimientoInventario creados.
+    """
+    if not movimientos:
+        return []
+
+    ids = {_producto_id(m) for m in movimientos}
+    # Entradas y reversiones recalculan el costo promedio: esas filas se bloquean
+    con_costo = {
+        _producto_id(m) for m in movimientos
+        if m["tipo"] in ENTRADAS or m.get("costo_unitario") is not None
+    }
+    campos = ("id", "costo", "franjas_stock")
+    productos = {
+        p.id: p
+        # Orden por id para que dos transacciones concurrentes bloqueen en el mismo orden.
+        # NO KEY: las claves foráneas que insertan las ventas (FOR KEY SHARE) no esperan
+        for p in Producto.objects.select_for_update(no_key=True)
+        .filter(empresa=empresa, pk__in=con_costo)
+        .only(*campos)
+        .order_by("id")
+    }
+    productos.update(
+        (p.id, p)
+        for p in Producto.objects.filter(empresa=empresa, pk__in=ids - con_costo).only(*campos)
+    )
+    faltantes = ids - productos.keys()
+    if faltantes:
+        raise ValueError(f"Productos inexistentes o de otra empresa: {sorted(faltantes)}")
+    for m in movimientos:
+        if m["tipo"] not in ENTRADAS and m["tipo"] not in SALIDAS:
+            raise ValueError(f"Tipo de movimiento desconocido: {m['tipo']}")
+
+    bodega_defecto = bodega
+    deltas, filas, netos = {}, [], dict.fromkeys(ids, CERO)
+    for m in movimientos:
+        producto = productos[_producto_id(m)]
+        bodega_id = _id(m, "bodega")
+        if bodega_id is None:
+            if bodega_defecto is None:
+                bodega_defecto = bodega_principal(empresa)
+            bodega_id = bodega_defecto.pk
+        # Con contadores repartidos cada movimiento cae en una franja al azar
+        franja = random.randrange(producto.franjas_stock) if producto.franjas_stock > 1 else 0
+        clave = (producto.id, bodega_id, franja)
+        cantidad = _decimal(m["cantidad"])
+        signo = cantidad if m["tipo"] in ENTRADAS else -cantidad
+        deltas[clave] = deltas.get(clave, CERO) + signo
+        netos[producto.id] += signo
+        filas.append((m, producto, bodega_id, cantidad))
+
+    # El UPSERT deja bloqueadas hasta el commit las filas de StockBodega que
+    # mueve este lote: otro movimiento de la misma fila espera aquí. La
+    # existencia de partida es la que queda menos lo que sumó este lote.
+    aplicar_stock(deltas)
+    existencias = {pid: total - netos[pid] for pid, total in existencias_totales(ids).items()}
+
+    nuevos = []
+    for m, producto, bodega_id, cantidad in filas:
+        tipo = m["tipo"]
+        stock = existencias[producto.id]
+        costo = producto.costo or CERO
+        costo_movimiento = m.get("costo_unitario")
+
+        if tipo in ENTRADAS:
+            costo_movimiento = costo if costo_movimiento is None else _decimal(costo_movimiento)
+            nuevo_stock = stock + cantidad
+            if stock <= 0 or nuevo_stock <= 0:
+                nuevo_costo = costo_movimiento
+            else:
+                nuevo_costo = (stock * costo + cantidad * costo_movimiento) / nuevo_stock
+        else:
+            nuevo_stock = stock - cantidad
+            if costo_movimiento is None:
+                costo_movimiento = costo
+                nuevo_costo = costo
+            else:
+                costo_movimiento = _decimal(costo_movimiento)
+                valor_restante = stock * costo - cantidad * costo_movimiento
+                nuevo_costo = valor_restante / nuevo_stock if nuevo_stock > 0 and valor_restante > 0 else costo
+
+        existencias[producto.id] = nuevo_stock
+        producto.costo = _redondear(nuevo_costo)
+
+        nuevos.append(MovimientoInventario(
+            empresa=empresa,
+            producto_id=producto.id,
+            bodega_id=bodega_id,
+            tipo=tipo,
+            cantidad=cantidad,
+            costo_unitario=_redondear(costo_movimiento),
+            costo_total=_redondear(cantidad * costo_movimiento),
+            saldo=nuevo_stock,
+            costo_promedio=producto.costo,
+            detalle_factura_id=_id(m, "detalle_factura"),
+            detalle_compra_id=_id(m, "detalle_compra"),
+            documento=m.get("documento", documento),
+            observacion=m.get("observacion"),
+            usuario=usuario,
+        ))
+
+    Producto.objects.bulk_update([productos[pid] for pid in sorted(con_costo)], ["costo"])
+
+    # El total de Producto.stock se refresca al confirmar; los productos con
+    # franjas quedan para la tarea periódica
+    normales = [pid for pid, p in productos.items() if p.franjas_stock <= 1]
+    transaction.on_commit(lambda: sincronizar_stock(normales))
+    cache_erp.invalidar_al_confirmar("inventario", empresa.id)
+    return MovimientoInventario.objects.bulk_create(nuevos)
+
+def transferir(empresa, origen, destino, lineas, usuario=None, documento=None):
+    """
+    Mueve existencias entre dos bodegas de la empresa. `lineas` es una lista
+    de dicts con producto/producto_id y cantidad. El costo promedio no cambia.
+    """
+    if origen.pk == destino.pk:
+        raise ValueError("La bodega de origen y la de destino son la misma.")
+    movimientos = []
+    for linea in lineas:
+        base = {k: linea[k] for k in ("producto", "producto_id") if k in linea}
+        observacion = f"Transferencia {origen} -> {destino}"
+        movimientos.append({**base, "tipo": "TR_S", "cantidad": linea["cantidad"], "bodega": origen, "observacion": observacion})
+        movimientos.append({**base, "tipo": "TR_E", "cantidad": linea["cantidad"], "bodega": destino, "observacion": observacion})
+    return registrar_movimientos(empresa, movimientos, usuario=usuario, documento=documento)
+
+def salidas_de_venta(detalle_factura_ids):
+    """{detalle_factura_id: (costo_unitario, bodega_id)} con que salió cada línea vendida."""
+    return {
+        detalle_id: (costo, bodega_id)
+        for detalle_id, costo, bodega_id in MovimientoInventario.objects
+        .filter(detalle_factura_id__in=detalle_factura_ids, tipo="S")
+        .values_list("detalle_factura_id", "costo_unitario", "bodega_id")
+    }
+
+# ==========================================
+# PERIODOS Y CIERRES
+# ==========================================
+
+def _ultimo_costo(movimientos):
+    """{producto_id: costo_promedio} del último movimiento de cada producto."""
+    filas = (
+        movimientos
+        .order_by("producto_id", "-fecha", "-id")
+        .distinct("producto_id")
+        .values_list("producto_id", "costo_promedio", "costo_unitario")
+    )
+    return {
+        pid: costo_promedio if costo_promedio is not None else (costo_unitario or CERO)
+        for pid, costo_promedio, costo_unitario in filas
+    }
+
+def _cantidades_al(empresa, hasta, producto_ids=None):
+    """
+    {producto_id: existencia en el instante `hasta`}: la actual (StockBodega)
+    menos el neto de los movimientos desde `hasta`. Es una sola consulta, así
+    existencia y movimientos salen de la misma foto de la base.
+    """
+    neto = Sum(Case(When(tipo__in=ENTRADAS, then=F("cantidad")), default=-F("cantidad")))
+    en_bodegas = StockBodega.objects.filter(producto=OuterRef("pk")).values("producto").annotate(t=Sum("cantidad")).values("t")
+    posteriores = (
+        MovimientoInventario.objects.filter(producto=OuterRef("pk"), fecha__gte=hasta)
+        .values("producto").annotate(t=neto).values("t")
+    )
+    productos = Producto.objects.filter(empresa=empresa)
+    if producto_ids is not None:
+        productos = productos.filter(pk__in=producto_ids)
+    return {
+        pid: actual - posterior
+        for pid, actual, posterior in productos.annotate(
+            actual=Coalesce(Subquery(en_bodegas), CERO, output_field=DecimalField()),
+            posterior=Coalesce(Subquery(posteriores), CERO, output_field=DecimalField()),
+        ).values_list("id", "actual", "posterior")
+    }
+
+def _cierre_base(empresa, antes_de):
+    """
+    Último periodo cerrado anterior a `antes_de` y su foto
+    {producto_id: (cantidad, costo_promedio)}. (None, {}) si no hay cierres.
+    """
+    periodo = (
+        CierreInventario.objects
+        .filter(empresa=empresa, periodo__lt=antes_de)
+        .aggregate(ultimo=Max("periodo"))["ultimo"]
+    )
+    if periodo is None:
+        return None, {}
+    foto = {
+        pid: (cantidad, costo)
+        for pid, cantidad, costo in CierreInventario.objects
+        .filter(empresa=empresa, periodo=periodo)
+        .values_list("producto_id", "cantidad", "costo_promedio")
+    }
+    return periodo, foto
+
+@transaction.atomic
+def cerrar_periodo(empresa, periodo):
+    """
+    Genera (o regenera) la foto del mes de `periodo` para todos los productos
+    de la empresa. Parte del cierre anterior y solo lee los movimientos del mes.
+    """
+    periodo = periodo.replace(day=1)
+    inicio, fin = rango_periodo(periodo)
+
+    base_periodo, base = _cierre_base(empresa, periodo)
+    desde = rango_periodo(base_periodo)[1] if base_periodo else None
+    costos = {pid: costo for pid, (_, costo) in base.items()}
+
+    # Movimientos entre el último cierre y el inicio de este mes (normalmente
+    # ninguno, salvo que haya meses sin cerrar o sea el primer cierre)
+    if desde is None or desde < inicio:
+        previos = MovimientoInventario.objects.filter(empresa=empresa, fecha__lt=inicio)
+        if desde is not None:
+            previos = previos.filter(fecha__gte=desde)
+        costos.update(_ultimo_costo(previos))
+
+    del_mes = MovimientoInventario.objects.filter(empresa=empresa, fecha__gte=inicio, fecha__lt=fin)
+    costos.update(_ultimo_costo(del_mes))
+    cantidades = _cantidades_al(empresa, fin)
+    acumulados = {
+        fila["producto_id"]: fila
+        for fila in del_mes.values("producto_id").annotate(
+            entradas_cantidad=Sum("cantidad", filter=Q(tipo__in=ENTRADAS)),
+            entradas_valor=Sum("costo_total", filter=Q(tipo__in=ENTRADAS)),
+            salidas_cantidad=Sum("cantidad", filter=Q(tipo__in=SALIDAS)),
+            salidas_valor=Sum("costo_total", filter=Q(tipo__in=SALIDAS)),
+            vendido=Sum("costo_total", filter=Q(tipo="S")),
+            devuelto=Sum("costo_total", filter=Q(tipo="AN_V")),
+        )
+    }
+
+    # Productos sin ningún movimiento hasta ahora: su existencia actual es la del cierre
+    sin_historial = set(
+        Producto.objects.filter(empresa=empresa, movimientos__isnull=True).values_list("id", flat=True)
+    )
+
+    cierres = []
+    for pid, costo in Producto.objects.filter(empresa=empresa).values_list("id", "costo"):
+        if pid in costos:
+            costo_promedio = costos[pid]
+        elif pid in sin_historial:
+            costo_promedio = costo or CERO
+        else:
+            # Su primer movimiento es posterior a este mes
+            continue
+        cantidad = cantidades.get(pid, CERO)
+
+        acum = acumulados.get(pid, {})
+        cierres.append(CierreInventario(
+            empresa=empresa,
+            producto_id=pid,
+            periodo=periodo,
+            cantidad=cantidad,
+            costo_promedio=costo_promedio,
+            valor=_redondear(cantidad * costo_promedio),
+            entradas_cantidad=acum.get("entradas_cantidad") or CERO,
+            entradas_valor=acum.get("entradas_valor") or CERO,
+            salidas_cantidad=acum.get("salidas_cantidad") or CERO,
+            salidas_valor=acum.get("salidas_valor") or CERO,
+            costo_ventas=(acum.get("vendido") or CERO) - (acum.get("devuelto") or CERO),
+        ))
+
+    CierreInventario.objects.bulk_create(
+        cierres,
+        update_conflicts=True,
+        unique_fields=["empresa", "producto", "periodo"],
+        update_fields=[
+            "cantidad", "costo_promedio", "valor",
+            "entradas_cantidad", "entradas_valor",
+            "salidas_cantidad", "salidas_valor",
+            "costo_ventas", "generado_en",
+        ],
+    )
+    return len(cierres)
+
+# ==========================================
+# REPORTES
+# ==========================================
+
+def existencias_a_fecha(empresa, fecha, producto_ids=None):
+    """
+    {producto_id: (cantidad, costo_promedio)} al cierre del día `fecha`.
+
+    Parte del último cierre mensual anterior al mes de `fecha`, le superpone
+    la última ExistenciaDiaria de cada producto dentro del mes y, si `fecha`
+    es posterior al último día consolidado, los movimientos aún no
+    consolidados (normalmente solo los de hoy).
+    """
+    periodo, estado = _cierre_base(empresa, fecha.replace(day=1))
+    if producto_ids is not None:
+        producto_ids = set(producto_ids)
+        estado = {pid: v for pid, v in estado.items() if pid in producto_ids}
+    desde = periodo + relativedelta(months=1) if periodo else None
+    ultimo = ultimo_dia_existencias()
+
+    def _filtrar(qs, campo="producto_id"):
+        return qs.filter(**{f"{campo}__in": producto_ids}) if producto_ids is not None else qs
+
+    if ultimo is not None:
+        diarias = ExistenciaDiaria.objects.filter(empresa=empresa, fecha__lte=min(fecha, ultimo))
+        if desde:
+            diarias = diarias.filter(fecha__gte=desde)
+        estado.update(
+            (pid, (cantidad, costo))
+            for pid, cantidad, costo in _filtrar(diarias)
+            .order_by("producto_id", "-fecha")
+            .distinct("producto_id")
+            .values_list("producto_id", "cantidad", "costo_promedio")
+        )
+
+    if ultimo is None or fecha > ultimo:
+        tramo = MovimientoInventario.objects.filter(
+            empresa=empresa, fecha__lt=fin_dia(fecha)
+        )
+        inicio = max(
+            (d for d in (desde, ultimo and ultimo + datetime.timedelta(days=1)) if d),
+            default=None,
+        )
+        if inicio:
+            tramo = tramo.filter(fecha__gte=inicio_dia(inicio))
+        costos = _ultimo_costo(_filtrar(tramo))
+        if costos:
+            cantidades = _cantidades_al(empresa, fin_dia(fecha), costos.keys())
+            estado.update((pid, (cantidades[pid], costo)) for pid, costo in costos.items())
+
+    # Productos que nunca tuvieron movimientos: su existencia es la actual
+    for pid, stock, costo in _filtrar(
+        Producto.objects.filter(empresa=empresa, movimientos__isnull=True), "id"
+    ).values_list("id", "stock", "costo"):
+        estado.setdefault(pid, (stock or CERO, costo or CERO))
+
+    return estado
+
+def inventario_valorizado(empresa, fecha, producto_ids=None):
+    """{producto_id: {'cantidad', 'costo_promedio', 'valor'}} al cierre del día `fecha`."""
+    return {
+        pid: {
+            "cantidad": cantidad,
+            "costo_promedio": costo,
+            "valor": _redondear(cantidad * costo),
+        }
+        for pid, (cantidad, costo) in existencias_a_fecha(empresa, fecha, producto_ids).items()
+    }
+
+def stock_a_fecha(producto, fecha):
+    """Existencia de un producto al cierre del día `fecha`."""
+    cantidad, _ = existencias_a_fecha(producto.empresa, fecha, [producto.id]).get(producto.id, (CERO, CERO))
+    return cantidad
+
+def costo_de_ventas(empresa, periodo):
+    """Costo de ventas del mes: desde el cierre si existe, si no desde los movimientos del mes."""
+    periodo = periodo.replace(day=1)
+    cierre = CierreInventario.objects.filter(empresa=empresa, periodo=periodo)
+    if cierre.exists():
+        return cierre.aggregate(total=Sum("costo_ventas"))["total"] or CERO
+
+    inicio, fin = rango_periodo(periodo)
+    totales = MovimientoInventario.objects.filter(
+        empresa=empresa, fecha__gte=inicio, fecha__lt=fin
+    ).aggregate(
+        vendido=Sum("costo_total", filter=Q(tipo="S")),
+        devuelto=Sum("costo_total", filter=Q(tipo="AN_V")),
+    )
+    return (totales["vendido"] or CERO) - (totales["devuelto"] or CERO)
+
+# ==========================================
+# EXISTENCIAS DIARIAS
+# ==========================================
+
+CLAVE_EXISTENCIAS = "kardex:existencias_diarias"
+
+# Una fila por (producto, día local) con movimientos: la existencia al final del
+# día es la actual menos el neto de todo lo posterior a su último movimiento
+# (ventana hacia atrás desde hoy), y el costo es el de ese último movimiento
+_SQL_EXISTENCIAS = """
+    INSERT INTO {existencia} (empresa_id, producto_id, fecha, cantidad, costo_promedio)
+    SELECT DISTINCT ON (t.producto_id, t.dia)
+           t.empresa_id,
+           t.producto_id,
+           t.dia,
+           COALESCE(a.total, 0) - t.posteriores,
+           t.costo
+    FROM (
+        SELECT m.empresa_id,
+               m.producto_id,
+               m.fecha,
+               m.id,
+               (m.fecha AT TIME ZONE %(zona)s)::date AS dia,
+               COALESCE(m.costo_promedio, m.costo_unitario, 0) AS costo,
+               COALESCE(SUM(CASE WHEN m.tipo = ANY(%(entradas)s) THEN m.cantidad ELSE -m.cantidad END) OVER (
+                   PARTITION BY m.producto_id ORDER BY m.fecha DESC, m.id DESC
+                   ROWS BETWEEN UNBOUNDED PRECEDING AND 1 PRECEDING
+               ), 0) AS posteriores
+        FROM {movimiento} m
+        WHERE m.fecha >= %(desde)s
+    ) t
+    LEFT JOIN (
+        SELECT producto_id, SUM(cantidad) AS total
+        FROM {stock}
+        WHERE producto_id IN (SELECT producto_id FROM {movimiento} WHERE fecha >= %(desde)s)
+        GROUP BY producto_id
+    ) a ON a.producto_id = t.producto_id
+    WHERE t.fecha < %(hasta)s
+    ORDER BY t.producto_id, t.dia, t.fecha DESC, t.id DESC
+    ON CONFLICT (producto_id, fecha) DO UPDATE
+        SET cantidad = EXCLUDED.cantidad,
+            costo_promedio = EXCLUDED.costo_promedio
+"""
+
+def ultimo_dia_existencias():
+    """Último día consolidado en ExistenciaDiaria (None si nunca se generó)."""
+    return PuntoControl.objects.filter(clave=CLAVE_EXISTENCIAS).values_list("fecha", flat=True).first()
+
+@transaction.atomic
+def generar_existencias_diarias(hasta=None, desde=None):
+    """
+    Consolida en ExistenciaDiaria los días desde el último procesado (o
+    `desde`, para reprocesar) hasta `hasta` (por defecto, ayer), para todas
+    las empresas, con una sola sentencia INSERT ... SELECT. Devuelve las filas
+    escritas.
+    """
+    hasta = hasta or timezone.localdate() - datetime.timedelta(days=1)
+    punto, _ = PuntoControl.objects.select_for_update().get_or_create(clave=CLAVE_EXISTENCIAS)
+
+    if desde is None:
+        if punto.fecha:
+            desde = punto.fecha + datetime.timedelta(days=1)
+        else:
+            primero = MovimientoInventario.objects.aggregate(primero=Min("fecha"))["primero"]
+            desde = timezone.localdate(primero) if primero else hasta
+
+    filas = 0
+    if desde <= hasta:
+        sql = _SQL_EXISTENCIAS.format(
+            existencia=ExistenciaDiaria._meta.db_table,
+            movimiento=MovimientoInventario._meta.db_table,
+            stock=StockBodega._meta.db_table,
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(sql, {
+                "zona": timezone.get_current_timezone_name(),
+                "entradas": list(ENTRADAS),
+                "desde": inicio_dia(desde),
+                "hasta": fin_dia(hasta),
+            })
+            filas = cursor.rowcount
+
+    if punto.fecha is None or hasta > punto.fecha:
+        punto.fecha = hasta
+        punto.save(update_fields=["fecha", "actualizado_en"])
+    return filas
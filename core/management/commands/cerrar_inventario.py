@@ -0,0 +1,45 @@
+import datetime
+
+from dateutil.relativedelta import relativedelta
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from core import kardex
+from core.models import Empresa
+
+
+class Command(BaseCommand):
+    help = "Genera la foto mensual del kardex (CierreInventario) para uno o varios meses"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--desde", help="Primer mes a cerrar (YYYY-MM). Por defecto, el mes anterior.")
+        parser.add_argument("--hasta", help="Último mes a cerrar (YYYY-MM). Por defecto, igual a --desde.")
+        parser.add_argument("--empresa", type=int, help="ID de la empresa. Por defecto, todas.")
+
+    def _mes(self, valor):
+        try:
+            return datetime.datetime.strptime(valor, "%Y-%m").date()
+        except ValueError:
+            raise CommandError(f"Mes inválido: {valor} (use YYYY-MM)")
+
+    def handle(self, *args, **options):
+        desde = self._mes(options["desde"]) if options["desde"] else (
+            timezone.localdate().replace(day=1) - relativedelta(months=1)
+        )
+        hasta = self._mes(options["hasta"]) if options["hasta"] else desde
+        if hasta < desde:
+            raise CommandError("--hasta no puede ser anterior a --desde")
+
+        empresas = Empresa.objects.all()
+        if options["empresa"]:
+            empresas = empresas.filter(pk=options["empresa"])
+
+        # Los meses se cierran en orden: cada cierre parte del anterior
+        periodo = desde
+        while periodo <= hasta:
+            for empresa in empresas:
+                total = kardex.cerrar_periodo(empresa, periodo)
+                self.stdout.write(f"{empresa} {periodo:%Y-%m}: {total} productos")
+            periodo += relativedelta(months=1)
+
+        self.stdout.write(self.style.SUCCESS("Cierre de inventario completado"))
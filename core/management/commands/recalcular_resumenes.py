@@ -0,0 +1,47 @@
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Max, Min
+from django.utils import timezone
+
+from core import resumenes
+from core.models import Compra, Factura
+
+
+class Command(BaseCommand):
+    help = "Reconstruye el resumen diario de ventas y compras (ResumenDiario) desde los documentos"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--desde", help="Primer día (YYYY-MM-DD). Por defecto, el documento más antiguo.")
+        parser.add_argument("--hasta", help="Último día (YYYY-MM-DD). Por defecto, el documento más reciente.")
+        parser.add_argument("--empresa", type=int, help="ID de la empresa. Por defecto, todas.")
+
+    def _dia(self, valor):
+        try:
+            return datetime.datetime.strptime(valor, "%Y-%m-%d").date()
+        except ValueError:
+            raise CommandError(f"Fecha inválida: {valor} (use YYYY-MM-DD)")
+
+    def handle(self, *args, **options):
+        empresa_ids = [options["empresa"]] if options["empresa"] else None
+
+        facturas = Factura.objects.all()
+        compras = Compra.objects.all()
+        if empresa_ids:
+            facturas = facturas.filter(empresa_id__in=empresa_ids)
+            compras = compras.filter(empresa_id__in=empresa_ids)
+        rango_f = facturas.aggregate(desde=Min("fecha_emision"), hasta=Max("fecha_emision"))
+        rango_c = compras.aggregate(desde=Min("fecha"), hasta=Max("fecha"))
+        hoy = timezone.localdate()
+
+        desde = self._dia(options["desde"]) if options["desde"] else min(
+            (d for d in (rango_f["desde"], rango_c["desde"]) if d), default=hoy
+        )
+        hasta = self._dia(options["hasta"]) if options["hasta"] else max(
+            (d for d in (rango_f["hasta"], rango_c["hasta"], hoy) if d)
+        )
+        if hasta < desde:
+            raise CommandError("--hasta no puede ser anterior a --desde")
+
+        filas = resumenes.recalcular(desde, hasta, empresa_ids)
+        self.stdout.write(self.style.SUCCESS(f"Resumen diario {desde} a {hasta}: {filas} días con movimiento"))
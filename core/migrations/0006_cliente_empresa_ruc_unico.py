@@ -0,0 +1,66 @@
+# Generated by Django 5.2.5 on 2026-10-19 18:34
+
+from django.db import migrations
+from django.db.models import Count, Min
+
+
+def fusionar_clientes_duplicados(apps, schema_editor):
+    """
+    Antes de exigir (empresa, ruc) único, fusiona los clientes repetidos en el
+    más antiguo: se reapuntan todas las relaciones y se eliminan los duplicados.
+    """
+    # Las FK son diferidas: se validan ya para que el ALTER posterior no
+    # encuentre eventos de trigger pendientes en la misma transacción.
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute('SET CONSTRAINTS ALL IMMEDIATE')
+
+    Cliente = apps.get_model('core', 'Cliente')
+    relaciones = [
+        rel for rel in Cliente._meta.related_objects
+        if rel.one_to_many or rel.one_to_one
+    ]
+
+    grupos = (
+        Cliente.objects
+        .values('empresa_id', 'ruc')
+        .annotate(total=Count('id'), conservar=Min('id'))
+        .filter(total__gt=1)
+    )
+
+    for grupo in grupos:
+        duplicados = list(
+            Cliente.objects
+            .filter(empresa_id=grupo['empresa_id'], ruc=grupo['ruc'])
+            .exclude(pk=grupo['conservar'])
+            .values_list('pk', 'user_id')
+        )
+        ids = [pk for pk, _ in duplicados]
+
+        for rel in relaciones:
+            rel.related_model._base_manager.filter(
+                **{f"{rel.field.name}__in": ids}
+            ).update(**{rel.field.name: grupo['conservar']})
+
+        # Conserva el acceso de Home Banking si solo lo tenía un duplicado
+        usuario_id = next((u for _, u in duplicados if u), None)
+        Cliente.objects.filter(pk__in=ids).delete()
+        if usuario_id:
+            Cliente.objects.filter(
+                pk=grupo['conservar'], user__isnull=True
+            ).update(user_id=usuario_id)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_empresamodulo_perfilmodulo'),
+        ('cobros', '0005_alter_prestamocobro_tipo_interes'),
+    ]
+
+    operations = [
+        migrations.RunPython(fusionar_clientes_duplicados, migrations.RunPython.noop),
+        migrations.AlterUniqueTogether(
+            name='cliente',
+            unique_together={('empresa', 'ruc')},
+        ),
+    ]
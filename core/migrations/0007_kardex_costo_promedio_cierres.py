@@ -0,0 +1,66 @@
+# Generated by Django 5.2.5 on 2026-10-19 18:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_cliente_empresa_ruc_unico'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CierreInventario',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('periodo', models.DateField(help_text='Primer día del mes cerrado')),
+                ('cantidad', models.DecimalField(decimal_places=4, default=0, max_digits=12)),
+                ('costo_promedio', models.DecimalField(decimal_places=4, default=0, max_digits=12)),
+                ('valor', models.DecimalField(decimal_places=4, default=0, max_digits=14)),
+                ('entradas_cantidad', models.DecimalField(decimal_places=4, default=0, max_digits=12)),
+                ('entradas_valor', models.DecimalField(decimal_places=4, default=0, max_digits=14)),
+                ('salidas_cantidad', models.DecimalField(decimal_places=4, default=0, max_digits=12)),
+                ('salidas_valor', models.DecimalField(decimal_places=4, default=0, max_digits=14)),
+                ('costo_ventas', models.DecimalField(decimal_places=4, default=0, max_digits=14)),
+                ('generado_en', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='movimientoinventario',
+            name='costo_promedio',
+            field=models.DecimalField(blank=True, decimal_places=4, max_digits=12, null=True),
+        ),
+        migrations.AlterField(
+            model_name='movimientoinventario',
+            name='tipo',
+            field=models.CharField(choices=[('E', 'Entrada / Compra'), ('S', 'Salida / Venta'), ('AJ_E', 'Ajuste Entrada'), ('AJ_S', 'Ajuste Salida'), ('TR_E', 'Transferencia Entrada'), ('TR_S', 'Transferencia Salida'), ('AN_V', 'Anulación de Venta'), ('AN_C', 'Anulación de Compra')], max_length=4),
+        ),
+        migrations.AddIndex(
+            model_name='movimientoinventario',
+            index=models.Index(fields=['producto', 'fecha'], name='core_movimi_product_e04447_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='movimientoinventario',
+            index=models.Index(fields=['empresa', 'fecha'], name='core_movimi_empresa_34b67a_idx'),
+        ),
+        migrations.AddField(
+            model_name='cierreinventario',
+            name='empresa',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.empresa'),
+        ),
+        migrations.AddField(
+            model_name='cierreinventario',
+            name='producto',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='cierres', to='core.producto'),
+        ),
+        migrations.AddIndex(
+            model_name='cierreinventario',
+            index=models.Index(fields=['empresa', 'periodo'], name='core_cierre_empresa_a7290d_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='cierreinventario',
+            unique_together={('empresa', 'producto', 'periodo')},
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.5 on 2026-10-19 18:43
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_kardex_costo_promedio_cierres'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImportacionInventario',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('archivo', models.FileField(upload_to='importaciones/inventario/%Y/%m/')),
+                ('vaciar_antes', models.BooleanField(default=False)),
+                ('estado', models.CharField(choices=[('P', 'Pendiente'), ('E', 'En proceso'), ('C', 'Completada'), ('F', 'Fallida')], default='P', max_length=1)),
+                ('total_filas', models.PositiveIntegerField(default=0)),
+                ('procesadas', models.PositiveIntegerField(default=0)),
+                ('creados', models.PositiveIntegerField(default=0)),
+                ('actualizados', models.PositiveIntegerField(default=0)),
+                ('omitidos', models.PositiveIntegerField(default=0)),
+                ('errores', models.PositiveIntegerField(default=0)),
+                ('detalle_errores', models.JSONField(blank=True, default=list)),
+                ('mensaje', models.TextField(blank=True)),
+                ('creado_en', models.DateTimeField(auto_now_add=True)),
+                ('finalizado_en', models.DateTimeField(blank=True, null=True)),
+                ('empresa', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.empresa')),
+                ('usuario', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-creado_en'],
+            },
+        ),
+    ]
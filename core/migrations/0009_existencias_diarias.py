@@ -0,0 +1,39 @@
+# Generated by Django 5.2.5 on 2026-10-19 18:44
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_importacion_inventario'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PuntoControl',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('clave', models.CharField(max_length=100, unique=True)),
+                ('fecha', models.DateField(blank=True, null=True)),
+                ('ultimo_id', models.BigIntegerField(blank=True, null=True)),
+                ('actualizado_en', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ExistenciaDiaria',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateField()),
+                ('cantidad', models.DecimalField(decimal_places=4, default=0, max_digits=12)),
+                ('costo_promedio', models.DecimalField(decimal_places=4, default=0, max_digits=12)),
+                ('empresa', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.empresa')),
+                ('producto', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='existencias_diarias', to='core.producto')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['empresa', 'fecha'], name='core_existe_empresa_472f27_idx')],
+                'unique_together': {('producto', 'fecha')},
+            },
+        ),
+    ]
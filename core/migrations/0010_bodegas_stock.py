@@ -0,0 +1,87 @@
+# Generated by Django 5.2.5 on 2026-10-19 18:48
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def crear_bodegas_principales(apps, schema_editor):
+    """Una bodega "Principal" por empresa con el stock actual de cada producto."""
+    Empresa = apps.get_model('core', 'Empresa')
+    Bodega = apps.get_model('core', 'Bodega')
+    Producto = apps.get_model('core', 'Producto')
+    PuntoVenta = apps.get_model('core', 'PuntoVenta')
+    StockBodega = apps.get_model('core', 'StockBodega')
+
+    for empresa in Empresa.objects.all():
+        bodega, _ = Bodega.objects.get_or_create(
+            empresa=empresa, nombre='Principal', defaults={'es_principal': True}
+        )
+        PuntoVenta.objects.filter(empresa=empresa, bodega__isnull=True).update(bodega=bodega)
+        StockBodega.objects.bulk_create(
+            [
+                StockBodega(producto_id=pid, bodega=bodega, franja=0, cantidad=stock)
+                for pid, stock in Producto.objects.filter(empresa=empresa)
+                .exclude(stock=0).values_list('id', 'stock').iterator()
+            ],
+            batch_size=1000,
+            ignore_conflicts=True,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_existencias_diarias'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='producto',
+            name='franjas_stock',
+            field=models.PositiveSmallIntegerField(default=1, help_text='Usar más de 1 solo en productos de altísima rotación para evitar bloqueos entre cajas.', verbose_name='Contadores de stock'),
+        ),
+        migrations.CreateModel(
+            name='Bodega',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nombre', models.CharField(max_length=100)),
+                ('direccion', models.CharField(blank=True, max_length=255, null=True)),
+                ('es_principal', models.BooleanField(default=False, help_text='Bodega por defecto para compras y ajustes.')),
+                ('activa', models.BooleanField(default=True)),
+                ('empresa', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='bodegas', to='core.empresa')),
+            ],
+            options={
+                'unique_together': {('empresa', 'nombre')},
+            },
+        ),
+        migrations.AddField(
+            model_name='compra',
+            name='bodega',
+            field=models.ForeignKey(blank=True, help_text='Vacío = bodega principal.', null=True, on_delete=django.db.models.deletion.PROTECT, to='core.bodega'),
+        ),
+        migrations.AddField(
+            model_name='movimientoinventario',
+            name='bodega',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, to='core.bodega'),
+        ),
+        migrations.AddField(
+            model_name='puntoventa',
+            name='bodega',
+            field=models.ForeignKey(blank=True, help_text='Bodega de la que descuentan stock las ventas de este punto. Vacío = bodega principal.', null=True, on_delete=django.db.models.deletion.PROTECT, to='core.bodega'),
+        ),
+        migrations.CreateModel(
+            name='StockBodega',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('franja', models.PositiveSmallIntegerField(default=0)),
+                ('cantidad', models.DecimalField(decimal_places=4, default=0, max_digits=12)),
+                ('bodega', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stocks', to='core.bodega')),
+                ('producto', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stock_bodegas', to='core.producto')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['bodega', 'producto'], name='core_stockb_bodega__75526c_idx')],
+                'unique_together': {('producto', 'bodega', 'franja')},
+            },
+        ),
+        migrations.RunPython(crear_bodegas_principales, migrations.RunPython.noop),
+    ]
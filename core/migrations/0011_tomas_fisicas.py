@@ -0,0 +1,50 @@
+# Generated by Django 5.2.5 on 2026-10-19 18:51
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_bodegas_stock'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TomaFisica',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('estado', models.CharField(choices=[('A', 'Abierta'), ('C', 'Aplicada'), ('N', 'Anulada')], default='A', max_length=1)),
+                ('observacion', models.CharField(blank=True, max_length=255)),
+                ('congelado_en', models.DateTimeField(auto_now_add=True)),
+                ('aplicada_en', models.DateTimeField(blank=True, null=True)),
+                ('total_productos', models.PositiveIntegerField(default=0)),
+                ('total_ajustes', models.PositiveIntegerField(default=0)),
+                ('valor_diferencia', models.DecimalField(decimal_places=4, default=0, max_digits=14)),
+                ('bodega', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='tomas_fisicas', to='core.bodega')),
+                ('empresa', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='tomas_fisicas', to='core.empresa')),
+                ('usuario', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-congelado_en'],
+            },
+        ),
+        migrations.CreateModel(
+            name='TomaFisicaDetalle',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('cantidad_sistema', models.DecimalField(decimal_places=4, default=0, max_digits=12)),
+                ('costo_unitario', models.DecimalField(decimal_places=4, default=0, max_digits=12)),
+                ('cantidad_contada', models.DecimalField(blank=True, decimal_places=4, max_digits=12, null=True)),
+                ('contado_en', models.DateTimeField(blank=True, null=True)),
+                ('diferencia', models.DecimalField(blank=True, decimal_places=4, max_digits=12, null=True)),
+                ('producto', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='core.producto')),
+                ('toma', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='detalles', to='core.tomafisica')),
+            ],
+            options={
+                'unique_together': {('toma', 'producto')},
+            },
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.5 on 2026-10-19 18:52
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_tomas_fisicas'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='compra',
+            name='corrige_a',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='correcciones', to='core.compra'),
+        ),
+    ]
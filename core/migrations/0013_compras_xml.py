@@ -0,0 +1,68 @@
+# Generated by Django 5.2.5 on 2026-10-19 18:56
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_compra_corrige_a'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='compra',
+            name='clave_acceso',
+            field=models.CharField(blank=True, max_length=49, null=True),
+        ),
+        migrations.AddField(
+            model_name='compra',
+            name='numero_comprobante',
+            field=models.CharField(blank=True, max_length=17),
+        ),
+        migrations.AlterUniqueTogether(
+            name='compra',
+            unique_together={('empresa', 'clave_acceso')},
+        ),
+        migrations.CreateModel(
+            name='ImportacionCompras',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('archivo', models.FileField(upload_to='importaciones/compras/%Y/%m/')),
+                ('crear_productos', models.BooleanField(default=True, help_text='Crear los productos que no se puedan asociar por código.')),
+                ('estado', models.CharField(choices=[('P', 'Pendiente'), ('E', 'En proceso'), ('C', 'Completada'), ('F', 'Fallida')], default='P', max_length=1)),
+                ('total_archivos', models.PositiveIntegerField(default=0)),
+                ('archivos_leidos', models.PositiveIntegerField(default=0)),
+                ('comprobantes', models.PositiveIntegerField(default=0)),
+                ('creadas', models.PositiveIntegerField(default=0)),
+                ('duplicadas', models.PositiveIntegerField(default=0)),
+                ('productos_creados', models.PositiveIntegerField(default=0)),
+                ('errores', models.PositiveIntegerField(default=0)),
+                ('detalle_errores', models.JSONField(blank=True, default=list)),
+                ('mensaje', models.TextField(blank=True)),
+                ('creado_en', models.DateTimeField(auto_now_add=True)),
+                ('finalizado_en', models.DateTimeField(blank=True, null=True)),
+                ('empresa', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.empresa')),
+                ('usuario', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-creado_en'],
+            },
+        ),
+        migrations.CreateModel(
+            name='ProductoProveedor',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('codigo_proveedor', models.CharField(max_length=50)),
+                ('actualizado_en', models.DateTimeField(auto_now=True)),
+                ('empresa', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.empresa')),
+                ('producto', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='codigos_proveedor', to='core.producto')),
+                ('proveedor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='codigos_producto', to='core.proveedor')),
+            ],
+            options={
+                'unique_together': {('proveedor', 'codigo_proveedor')},
+            },
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.5 on 2026-10-19 18:58
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_compras_xml'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResumenDiario',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateField()),
+                ('total_ventas', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('iva_ventas', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('num_facturas', models.IntegerField(default=0)),
+                ('total_compras', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('num_compras', models.IntegerField(default=0)),
+                ('empresa', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='resumenes_diarios', to='core.empresa')),
+            ],
+            options={
+                'ordering': ['fecha'],
+                'unique_together': {('empresa', 'fecha')},
+            },
+        ),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 5.2.5 on 2026-10-19 19:06
+
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import DecimalField, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def _neto(modelo, fk, entrada, salida):
+    """Subconsulta: entradas menos salidas de los movimientos de cada cuenta."""
+    return Coalesce(
+        Subquery(
+            modelo.objects.filter(**{fk: OuterRef('pk')})
+            .values(fk)
+            .annotate(neto=(
+                Coalesce(Sum('monto', filter=Q(tipo=entrada)), Value(Decimal('0')))
+                - Coalesce(Sum('monto', filter=Q(tipo=salida)), Value(Decimal('0')))
+            ))
+            .values('neto')
+        ),
+        Value(Decimal('0')),
+        output_field=DecimalField(max_digits=14, decimal_places=2),
+    )
+
+
+def calcular_saldos_iniciales(apps, schema_editor):
+    """El saldo inicial de las cuentas existentes es el que cuadra con su saldo actual."""
+    CajaChica = apps.get_model('core', 'CajaChica')
+    MovimientoCaja = apps.get_model('core', 'MovimientoCaja')
+    CuentaBancaria = apps.get_model('core', 'CuentaBancaria')
+    TransaccionBancaria = apps.get_model('core', 'TransaccionBancaria')
+
+    CajaChica.objects.update(saldo_inicial=models.F('saldo_actual') - _neto(MovimientoCaja, 'caja', 'ING', 'EGR'))
+    CuentaBancaria.objects.update(saldo_inicial=models.F('saldo') - _neto(TransaccionBancaria, 'cuenta', 'DEP', 'RET'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0014_resumen_diario'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cajachica',
+            name='saldo_inicial',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=12),
+        ),
+        migrations.AddField(
+            model_name='cuentabancaria',
+            name='saldo_inicial',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=14),
+        ),
+        migrations.RunPython(calcular_saldos_iniciales, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.5 on 2026-10-19 19:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0015_saldo_inicial_cuentas'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='movimientocaja',
+            name='saldo_anterior',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=12, null=True),
+        ),
+        migrations.AddField(
+            model_name='movimientocaja',
+            name='saldo_nuevo',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=12, null=True),
+        ),
+        migrations.AddField(
+            model_name='transaccionbancaria',
+            name='saldo_anterior',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=14, null=True),
+        ),
+        migrations.AddField(
+            model_name='transaccionbancaria',
+            name='saldo_nuevo',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=14, null=True),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.2.5 on 2026-10-19 19:10
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0016_saldos_movimientos_tesoreria'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CierreCuentaBancaria',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('periodo', models.DateField(help_text='Primer día del mes cerrado')),
+                ('saldo_inicial', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('ingresos', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('egresos', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('saldo_final', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('movimientos', models.PositiveIntegerField(default=0)),
+                ('generado_en', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'ordering': ['periodo'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='transaccionbancaria',
+            index=models.Index(fields=['cuenta', 'fecha', 'id'], name='core_transa_cuenta__c6a4cb_idx'),
+        ),
+        migrations.AddField(
+            model_name='cierrecuentabancaria',
+            name='cuenta',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='cierres', to='core.cuentabancaria'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='cierrecuentabancaria',
+            unique_together={('cuenta', 'periodo')},
+        ),
+    ]
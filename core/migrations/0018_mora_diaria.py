@@ -0,0 +1,23 @@
+# Generated by Django 5.2.5 on 2026-10-19 19:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0017_cierres_cuentas'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='empresa',
+            name='dias_gracia_mora',
+            field=models.PositiveIntegerField(default=0, help_text='Días después del vencimiento de una cuota antes de empezar a cobrar mora.', verbose_name='Días de gracia'),
+        ),
+        migrations.AddField(
+            model_name='empresa',
+            name='mora_porcentaje_diario',
+            field=models.DecimalField(decimal_places=4, default=0, help_text='Recargo diario sobre las cuotas vencidas de préstamos y compras financiadas. 0 desactiva la mora.', max_digits=6, verbose_name='Mora diaria (%)'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.5 on 2026-10-19 19:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0018_mora_diaria'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='cotizacion',
+            index=models.Index(fields=['empresa', 'estado', 'fecha_vencimiento'], name='core_cotiza_empresa_595bae_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='cuotaprestamo',
+            index=models.Index(fields=['estado', 'fecha_vencimiento'], name='core_cuotap_estado_c2aa09_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-19 19:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0019_indices_vencimientos'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='prestamo',
+            name='sistema_amortizacion',
+            field=models.CharField(choices=[('FRANCES', 'Francés (cuota fija)'), ('ALEMAN', 'Alemán (capital constante)')], default='FRANCES', max_length=10, verbose_name='Sistema de amortización'),
+        ),
+    ]
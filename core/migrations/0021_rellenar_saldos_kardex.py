@@ -0,0 +1,101 @@
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.conf import settings
+from django.db import migrations
+from django.db.models import Sum
+
+ENTRADAS = ('E', 'AJ_E', 'TR_E', 'AN_V')
+CUATRO_DECIMALES = Decimal('0.0001')
+CERO = Decimal('0')
+
+# Igual que core/kardex.py: una fila por (producto, día local) con el último saldo del día
+_SQL_EXISTENCIAS = """
+    INSERT INTO {existencia} (empresa_id, producto_id, fecha, cantidad, costo_promedio)
+    SELECT DISTINCT ON (m.producto_id, (m.fecha AT TIME ZONE %(zona)s)::date)
+           m.empresa_id,
+           m.producto_id,
+           (m.fecha AT TIME ZONE %(zona)s)::date,
+           COALESCE(m.saldo, 0),
+           COALESCE(m.costo_promedio, m.costo_unitario, 0)
+    FROM {movimiento} m
+    WHERE m.producto_id = ANY(%(productos)s) AND (m.fecha AT TIME ZONE %(zona)s)::date <= %(hasta)s
+    ORDER BY m.producto_id, (m.fecha AT TIME ZONE %(zona)s)::date, m.fecha DESC, m.id DESC
+    ON CONFLICT (producto_id, fecha) DO UPDATE
+        SET cantidad = EXCLUDED.cantidad,
+            costo_promedio = EXCLUDED.costo_promedio
+"""
+
+
+def rellenar_saldos(apps, schema_editor):
+    """
+    Saldo y costo promedio de los movimientos anteriores al kardex valorizado.
+
+    La existencia de apertura de cada producto es la actual menos el neto de
+    todos sus movimientos (el stock inicial se cargaba sin movimiento); desde
+    ahí se recorre su historial en orden. Las filas que ya tienen saldo se
+    respetan. Después se rehacen las ExistenciaDiaria ya consolidadas de esos
+    productos.
+    """
+    MovimientoInventario = apps.get_model('core', 'MovimientoInventario')
+    Producto = apps.get_model('core', 'Producto')
+    StockBodega = apps.get_model('core', 'StockBodega')
+    ExistenciaDiaria = apps.get_model('core', 'ExistenciaDiaria')
+    PuntoControl = apps.get_model('core', 'PuntoControl')
+
+    productos = list(
+        MovimientoInventario.objects.filter(saldo__isnull=True)
+        .values_list('producto_id', flat=True).distinct().order_by('producto_id')
+    )
+    if not productos:
+        return
+
+    en_bodegas = dict(
+        StockBodega.objects.filter(producto_id__in=productos)
+        .values('producto_id').annotate(total=Sum('cantidad')).values_list('producto_id', 'total')
+    )
+    for producto in Producto.objects.filter(pk__in=productos).only('id', 'stock', 'costo'):
+        movimientos = list(
+            MovimientoInventario.objects.filter(producto_id=producto.id)
+            .order_by('fecha', 'id')
+            .only('id', 'tipo', 'cantidad', 'costo_unitario', 'saldo', 'costo_promedio')
+        )
+        actual = en_bodegas.get(producto.id, producto.stock) or CERO
+        neto = sum((m.cantidad if m.tipo in ENTRADAS else -m.cantidad for m in movimientos), CERO)
+        saldo = actual - neto
+
+        # Antes del kardex valorizado el costo no se promediaba: las filas antiguas quedan al
+        # costo con que arrancó (el de la primera salida valorizada o, si no hay, el actual)
+        primera = next((m for m in movimientos if m.saldo is not None), None)
+        if primera is not None and primera.tipo not in ENTRADAS and primera.costo_unitario is not None:
+            costo = primera.costo_unitario
+        else:
+            costo = (producto.costo or CERO).quantize(CUATRO_DECIMALES, rounding=ROUND_HALF_UP)
+
+        cambiados = []
+        for m in movimientos:
+            saldo = m.saldo if m.saldo is not None else saldo + (m.cantidad if m.tipo in ENTRADAS else -m.cantidad)
+            if m.saldo is None:
+                m.saldo, m.costo_promedio = saldo, costo
+                cambiados.append(m)
+        MovimientoInventario.objects.bulk_update(cambiados, ['saldo', 'costo_promedio'], batch_size=1000)
+
+    hasta = PuntoControl.objects.filter(clave='kardex:existencias_diarias').values_list('fecha', flat=True).first()
+    if hasta is None:
+        return
+    sql = _SQL_EXISTENCIAS.format(
+        existencia=ExistenciaDiaria._meta.db_table,
+        movimiento=MovimientoInventario._meta.db_table,
+    )
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(sql, {'zona': settings.TIME_ZONE, 'productos': productos, 'hasta': hasta})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0020_prestamo_sistema_amortizacion'),
+    ]
+
+    operations = [
+        migrations.RunPython(rellenar_saldos, migrations.RunPython.noop),
+    ]
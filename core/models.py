@@ -1,11 +1,12 @@
 # Ubicación: core/models.py
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth.models import AbstractUser
 from django.db.models import Sum
 from django.conf import settings
 from decimal import Decimal
-from dateutil.relativedelta import relativedelta
 import json
+
+from . import amortizacion
 # =========================================
 # SISTEMAS DISPONIBLES
 # =========================================
@@ -75,6 +76,18 @@ class Empresa(models.Model):
         verbose_name="Porcentaje de IVA (%)",
         help_text="Valor actual del IVA. Ej: 12.00 para 12%, 5.00 para 5%."
     )
+    mora_porcentaje_diario = models.DecimalField(
+        max_digits=6,
+        decimal_places=4,
+        default=0,
+        verbose_name="Mora diaria (%)",
+        help_text="Recargo diario sobre las cuotas vencidas de préstamos y compras financiadas. 0 desactiva la mora."
+    )
+    dias_gracia_mora = models.PositiveIntegerField(
+        default=0,
+        verbose_name="Días de gracia",
+        help_text="Días después del vencimiento de una cuota antes de empezar a cobrar mora."
+    )
 
     def __str__(self):
         return self.nombre
@@ -103,6 +116,19 @@ class Perfil(models.Model):
     def __str__(self):
         return f"Perfil de {self.user.username} en {self.empresa.nombre}"
 
+class Bodega(models.Model):
+    empresa = models.ForeignKey(Empresa, on_delete=models.CASCADE, related_name='bodegas')
+    nombre = models.CharField(max_length=100)
+    direccion = models.CharField(max_length=255, blank=True, null=True)
+    es_principal = models.BooleanField(default=False, help_text="Bodega por defecto para compras y ajustes.")
+    activa = models.BooleanField(default=True)
+
+    def __str__(self):
+        return self.nombre
+
+    class Meta:
+        unique_together = ('empresa', 'nombre')
+
 class PuntoVenta(models.Model):
     empresa = models.ForeignKey(Empresa, on_delete=models.CASCADE, related_name='puntos_venta')
     nombre = models.CharField(max_length=100)
@@ -111,6 +137,10 @@ class PuntoVenta(models.Model):
     secuencial_factura = models.PositiveIntegerField(default=1)
     secuencial_nota_credito = models.PositiveIntegerField(default=1)
     secuencial_retencion = models.PositiveIntegerField(default=1)
+    bodega = models.ForeignKey(
+        Bodega, on_delete=models.PROTECT, null=True, blank=True,
+        help_text="Bodega de la que descuentan stock las ventas de este punto. Vacío = bodega principal."
+    )
     activo = models.BooleanField(default=True)
 
     def __str__(self):
@@ -164,6 +194,9 @@ class Cliente(models.Model):
     def __str__(self):
         return self.nombre
 
+    class Meta:
+        unique_together = ('empresa', 'ruc')
+
 class Proveedor(models.Model):
     empresa = models.ForeignKey(Empresa, on_delete=models.CASCADE)
     razon_social = models.CharField(
@@ -246,7 +279,14 @@ class Producto(models.Model):
     costo = models.DecimalField(max_digits=12, decimal_places=4, default=0, verbose_name="Costo Unitario")
     # PRECIO 1 (principal)
     precio = models.DecimalField(max_digits=12, decimal_places=4, verbose_name="Precio 1")
+    # Total de todas las bodegas; se deriva de StockBodega (ver core/kardex.py)
     stock = models.DecimalField(max_digits=12, decimal_places=4, default=0)
+    # > 1 reparte el stock de productos muy vendidos en varias filas de StockBodega
+    franjas_stock = models.PositiveSmallIntegerField(
+        default=1,
+        verbose_name="Contadores de stock",
+        help_text="Usar más de 1 solo en productos de altísima rotación para evitar bloqueos entre cajas."
+    )
     maneja_iva = models.BooleanField(default=True, verbose_name="Grava IVA")
     activo = models.BooleanField(default=True)
     
@@ -262,13 +302,15 @@ class Producto(models.Model):
     # ============================
     # Helpers para 3 precios
     # ============================
-    def _get_tipo_precio(self, nombre: str):
-        return TipoPrecio.objects.filter(empresa=self.empresa, nombre=nombre).first()
-
     def get_precio(self, n: int) -> Decimal:
         if n == 1:
             return self.precio or Decimal("0")
 
+        # Si la vista ya resolvió la matriz con core.precios.precargar_precios
+        resueltos = getattr(self, '_precios_resueltos', None)
+        if resueltos is not None and n in resueltos:
+            return resueltos[n]
+
         nombre_tipo = f"Precio {n}"
 
         # Si precios ya vino con prefetch_related('precios__tipo'),
@@ -279,33 +321,31 @@ class Producto(models.Model):
                     return pp.valor
             return Decimal("0")
 
-        # fallback si no vino prefetched
-        tipo = TipoPrecio.objects.filter(empresa=self.empresa, nombre=nombre_tipo).first()
-        if not tipo:
-            return Decimal("0")
-
-        pp = self.precios.filter(tipo=tipo).first()
-        return pp.valor if pp else Decimal("0")
+        # fallback: caché de precios por empresa (core/precios.py)
+        from .precios import resolver_precios
+        return resolver_precios([self], n).get(self.id, Decimal("0"))
 
     def set_precio(self, n: int, valor):
         """
         Guarda precio 1 en Producto.precio
         Guarda precio 2/3 en ProductoPrecio
         """
+        from .precios import tipo_precio_id
+
         valor = Decimal(str(valor or "0"))
 
+        # Lo precargado en la instancia ya no vale para este nivel
+        getattr(self, '_precios_resueltos', {}).pop(n, None)
+
         if n == 1:
             self.precio = valor
             return
 
-        tipo, _ = TipoPrecio.objects.get_or_create(
-            empresa=self.empresa,
-            nombre=f"Precio {n}",
-            defaults={"activo": True},
-        )
+        getattr(self, '_prefetched_objects_cache', {}).pop('precios', None)
+
         ProductoPrecio.objects.update_or_create(
             producto=self,
-            tipo=tipo,
+            tipo_id=tipo_precio_id(self.empresa_id, n, crear=True),
             defaults={"valor": valor},
         )
 
@@ -321,6 +361,43 @@ class Producto(models.Model):
     def precio_3(self):
         return self.get_precio(3)
 
+class StockBodega(models.Model):
+    """
+    Existencia de un producto en una bodega. Con Producto.franjas_stock > 1
+    la existencia se reparte en varias filas (franja 0..n-1) y cada venta
+    descuenta de una al azar; la existencia real es la suma de las franjas.
+    """
+    producto = models.ForeignKey(Producto, on_delete=models.CASCADE, related_name="stock_bodegas")
+    bodega = models.ForeignKey(Bodega, on_delete=models.CASCADE, related_name="stocks")
+    franja = models.PositiveSmallIntegerField(default=0)
+    cantidad = models.DecimalField(max_digits=12, decimal_places=4, default=0)
+
+    class Meta:
+        unique_together = ('producto', 'bodega', 'franja')
+        indexes = [
+            models.Index(fields=['bodega', 'producto']),
+        ]
+
+    def __str__(self):
+        return f"{self.producto} @ {self.bodega}: {self.cantidad}"
+
+class ProductoProveedor(models.Model):
+    """
+    Código con que un proveedor factura un producto. Se aprende al cargar
+    compras desde XML (ver core/compras_xml.py) y se usa en las siguientes.
+    """
+    empresa = models.ForeignKey(Empresa, on_delete=models.CASCADE)
+    proveedor = models.ForeignKey(Proveedor, on_delete=models.CASCADE, related_name='codigos_producto')
+    codigo_proveedor = models.CharField(max_length=50)
+    producto = models.ForeignKey(Producto, on_delete=models.CASCADE, related_name='codigos_proveedor')
+    actualizado_en = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ('proveedor', 'codigo_proveedor')
+
+    def __str__(self):
+        return f"{self.proveedor} {self.codigo_proveedor} -> {self.producto}"
+
 class ProductoPrecio(models.Model):
     producto = models.ForeignKey(Producto, related_name="precios", on_delete=models.CASCADE)
     tipo = models.ForeignKey(TipoPrecio, on_delete=models.PROTECT)
@@ -342,8 +419,17 @@ class Compra(models.Model):
     subtotal = models.DecimalField(max_digits=12, decimal_places=2, default=0)
     iva = models.DecimalField(max_digits=12, decimal_places=2, default=0)
     total = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    bodega = models.ForeignKey('Bodega', on_delete=models.PROTECT, null=True, blank=True, help_text="Vacío = bodega principal.")
     ESTADO_CHOICES = [('A', 'Activa'), ('N', 'Anulada')]
     estado = models.CharField(max_length=1, choices=ESTADO_CHOICES, default='A')
+    # Compra anulada que esta reemplaza (ver core/compras.py: corregir_compra)
+    corrige_a = models.ForeignKey('self', on_delete=models.SET_NULL, null=True, blank=True, related_name='correcciones')
+    # Datos del comprobante electrónico cuando la compra se cargó desde el XML del SRI
+    clave_acceso = models.CharField(max_length=49, null=True, blank=True)
+    numero_comprobante = models.CharField(max_length=17, blank=True)
+
+    class Meta:
+        unique_together = ('empresa', 'clave_acceso')
     
     def __str__(self):
         return f"Compra #{self.id} a {self.proveedor.nombre}"
@@ -446,8 +532,14 @@ class MovimientoInventario(models.Model):
         ('AJ_S', 'Ajuste Salida'),
         ('TR_E', 'Transferencia Entrada'),
         ('TR_S', 'Transferencia Salida'),
+        ('AN_V', 'Anulación de Venta'),
+        ('AN_C', 'Anulación de Compra'),
     ]
 
+    # Sentido de cada tipo en el kardex (ver core/kardex.py)
+    TIPOS_ENTRADA = ('E', 'AJ_E', 'TR_E', 'AN_V')
+    TIPOS_SALIDA = ('S', 'AJ_S', 'TR_S', 'AN_C')
+
     empresa = models.ForeignKey(Empresa, on_delete=models.CASCADE)
 
     producto = models.ForeignKey(
@@ -487,8 +579,23 @@ class MovimientoInventario(models.Model):
         blank=True
     )
 
+    # COSTO PROMEDIO PONDERADO DESPUÉS DEL MOVIMIENTO
+    costo_promedio = models.DecimalField(
+        max_digits=12,
+        decimal_places=4,
+        null=True,
+        blank=True
+    )
+
     fecha = models.DateTimeField(auto_now_add=True)
 
+    bodega = models.ForeignKey(
+        Bodega,
+        null=True,
+        blank=True,
+        on_delete=models.PROTECT
+    )
+
     # DOCUMENTOS RELACIONADOS
     detalle_factura = models.ForeignKey(
         FacturaDetalle,
@@ -527,10 +634,224 @@ class MovimientoInventario(models.Model):
 
     class Meta:
         ordering = ['-fecha']
+        indexes = [
+            models.Index(fields=['producto', 'fecha']),
+            models.Index(fields=['empresa', 'fecha']),
+        ]
 
     def __str__(self):
         return f"{self.producto.nombre} - {self.tipo} - {self.cantidad}"
 
+class CierreInventario(models.Model):
+    """
+    Foto mensual del kardex por producto: existencia y costo promedio al cierre
+    del periodo, más los acumulados del mes. Los reportes de inventario
+    valorizado y costo de ventas parten de aquí en vez de recorrer el histórico.
+    """
+    empresa = models.ForeignKey(Empresa, on_delete=models.CASCADE)
+    producto = models.ForeignKey(Producto, on_delete=models.CASCADE, related_name="cierres")
+    periodo = models.DateField(help_text="Primer día del mes cerrado")
+
+    cantidad = models.DecimalField(max_digits=12, decimal_places=4, default=0)
+    costo_promedio = models.DecimalField(max_digits=12, decimal_places=4, default=0)
+    valor = models.DecimalField(max_digits=14, decimal_places=4, default=0)
+
+    entradas_cantidad = models.DecimalField(max_digits=12, decimal_places=4, default=0)
+    entradas_valor = models.DecimalField(max_digits=14, decimal_places=4, default=0)
+    salidas_cantidad = models.DecimalField(max_digits=12, decimal_places=4, default=0)
+    salidas_valor = models.DecimalField(max_digits=14, decimal_places=4, default=0)
+    costo_ventas = models.DecimalField(max_digits=14, decimal_places=4, default=0)
+
+    generado_en = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ('empresa', 'producto', 'periodo')
+        indexes = [
+            models.Index(fields=['empresa', 'periodo']),
+        ]
+
+    def __str__(self):
+        return f"{self.producto} - {self.periodo:%Y-%m} - {self.cantidad}"
+
+class ExistenciaDiaria(models.Model):
+    """
+    Existencia y costo promedio de un producto al cierre de un día. Es dispersa:
+    solo hay fila para los días en que el producto tuvo movimientos (la genera
+    cada noche core.tasks.generar_existencias_diarias_task).
+    """
+    empresa = models.ForeignKey(Empresa, on_delete=models.CASCADE)
+    producto = models.ForeignKey(Producto, on_delete=models.CASCADE, related_name="existencias_diarias")
+    fecha = models.DateField()
+    cantidad = models.DecimalField(max_digits=12, decimal_places=4, default=0)
+    costo_promedio = models.DecimalField(max_digits=12, decimal_places=4, default=0)
+
+    class Meta:
+        unique_together = ('producto', 'fecha')
+        indexes = [
+            models.Index(fields=['empresa', 'fecha']),
+        ]
+
+    def __str__(self):
+        return f"{self.producto} - {self.fecha} - {self.cantidad}"
+
+class PuntoControl(models.Model):
+    """Marca de agua de los procesos periódicos (último día o último id procesado)."""
+    clave = models.CharField(max_length=100, unique=True)
+    fecha = models.DateField(null=True, blank=True)
+    ultimo_id = models.BigIntegerField(null=True, blank=True)
+    actualizado_en = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.clave}: {self.fecha or self.ultimo_id}"
+
+class ResumenDiario(models.Model):
+    """
+    Ventas y compras acumuladas por empresa y día. Se actualiza al emitir o
+    anular cada documento (core/resumenes.py) y se reconstruye con el comando
+    recalcular_resumenes. El dashboard y los reportes por período leen de aquí.
+    """
+    empresa = models.ForeignKey(Empresa, on_delete=models.CASCADE, related_name="resumenes_diarios")
+    fecha = models.DateField()
+    total_ventas = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    iva_ventas = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    num_facturas = models.IntegerField(default=0)
+    total_compras = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    num_compras = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ('empresa', 'fecha')
+        ordering = ['fecha']
+
+    def __str__(self):
+        return f"{self.empresa} - {self.fecha}"
+
+class ImportacionInventario(models.Model):
+    """Carga masiva de inventario desde Excel, procesada en segundo plano por Celery."""
+    ESTADO_CHOICES = [
+        ('P', 'Pendiente'),
+        ('E', 'En proceso'),
+        ('C', 'Completada'),
+        ('F', 'Fallida'),
+    ]
+
+    empresa = models.ForeignKey(Empresa, on_delete=models.CASCADE)
+    usuario = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True)
+    archivo = models.FileField(upload_to='importaciones/inventario/%Y/%m/')
+    vaciar_antes = models.BooleanField(default=False)
+    estado = models.CharField(max_length=1, choices=ESTADO_CHOICES, default='P')
+
+    total_filas = models.PositiveIntegerField(default=0)
+    procesadas = models.PositiveIntegerField(default=0)
+    creados = models.PositiveIntegerField(default=0)
+    actualizados = models.PositiveIntegerField(default=0)
+    omitidos = models.PositiveIntegerField(default=0)
+    errores = models.PositiveIntegerField(default=0)
+    # [{"fila": 12, "codigo": "A-1", "error": "..."}] (se guardan las primeras 500)
+    detalle_errores = models.JSONField(default=list, blank=True)
+    mensaje = models.TextField(blank=True)
+
+    creado_en = models.DateTimeField(auto_now_add=True)
+    finalizado_en = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-creado_en']
+
+    def __str__(self):
+        return f"Importación #{self.id} - {self.get_estado_display()}"
+
+    @property
+    def porcentaje(self):
+        if not self.total_filas:
+            return 100 if self.estado in ('C', 'F') else 0
+        return min(100, int(self.procesadas * 100 / self.total_filas))
+
+class ImportacionCompras(models.Model):
+    """Carga de facturas de proveedores desde XML autorizados del SRI (un XML o un ZIP)."""
+    ESTADO_CHOICES = ImportacionInventario.ESTADO_CHOICES
+
+    empresa = models.ForeignKey(Empresa, on_delete=models.CASCADE)
+    usuario = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True)
+    archivo = models.FileField(upload_to='importaciones/compras/%Y/%m/')
+    crear_productos = models.BooleanField(default=True, help_text="Crear los productos que no se puedan asociar por código.")
+    estado = models.CharField(max_length=1, choices=ESTADO_CHOICES, default='P')
+
+    total_archivos = models.PositiveIntegerField(default=0)
+    archivos_leidos = models.PositiveIntegerField(default=0)
+    comprobantes = models.PositiveIntegerField(default=0)
+    creadas = models.PositiveIntegerField(default=0)
+    duplicadas = models.PositiveIntegerField(default=0)
+    productos_creados = models.PositiveIntegerField(default=0)
+    errores = models.PositiveIntegerField(default=0)
+    # [{"archivo": "x.xml", "comprobante": "001-001-000000001", "error": "..."}]
+    detalle_errores = models.JSONField(default=list, blank=True)
+    mensaje = models.TextField(blank=True)
+
+    creado_en = models.DateTimeField(auto_now_add=True)
+    finalizado_en = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-creado_en']
+
+    def __str__(self):
+        return f"Importación de compras #{self.id} - {self.get_estado_display()}"
+
+    @property
+    def porcentaje(self):
+        if not self.total_archivos:
+            return 100 if self.estado in ('C', 'F') else 0
+        return min(100, int(self.archivos_leidos * 100 / self.total_archivos))
+
+class TomaFisica(models.Model):
+    """
+    Sesión de conteo físico de una bodega. Al abrirla se congela la
+    existencia esperada de cada producto; los conteos llegan por lotes
+    (escáner o CSV) y al aplicarla las diferencias se registran como un solo
+    conjunto de ajustes AJ_E / AJ_S. Las ventas siguen funcionando mientras
+    está abierta: la diferencia descuenta los movimientos posteriores al
+    congelamiento (ver core/tomas.py).
+    """
+    ESTADO_CHOICES = [
+        ('A', 'Abierta'),
+        ('C', 'Aplicada'),
+        ('N', 'Anulada'),
+    ]
+
+    empresa = models.ForeignKey(Empresa, on_delete=models.CASCADE, related_name='tomas_fisicas')
+    bodega = models.ForeignKey(Bodega, on_delete=models.PROTECT, related_name='tomas_fisicas')
+    usuario = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True)
+    estado = models.CharField(max_length=1, choices=ESTADO_CHOICES, default='A')
+    observacion = models.CharField(max_length=255, blank=True)
+
+    congelado_en = models.DateTimeField(auto_now_add=True)
+    aplicada_en = models.DateTimeField(null=True, blank=True)
+
+    total_productos = models.PositiveIntegerField(default=0)
+    total_ajustes = models.PositiveIntegerField(default=0)
+    valor_diferencia = models.DecimalField(max_digits=14, decimal_places=4, default=0)
+
+    class Meta:
+        ordering = ['-congelado_en']
+
+    def __str__(self):
+        return f"Toma física #{self.id} - {self.bodega} ({self.get_estado_display()})"
+
+class TomaFisicaDetalle(models.Model):
+    toma = models.ForeignKey(TomaFisica, on_delete=models.CASCADE, related_name='detalles')
+    producto = models.ForeignKey(Producto, on_delete=models.CASCADE, related_name='+')
+    # Existencia y costo al congelar la toma
+    cantidad_sistema = models.DecimalField(max_digits=12, decimal_places=4, default=0)
+    costo_unitario = models.DecimalField(max_digits=12, decimal_places=4, default=0)
+    cantidad_contada = models.DecimalField(max_digits=12, decimal_places=4, null=True, blank=True)
+    contado_en = models.DateTimeField(null=True, blank=True)
+    # Se calcula al aplicar la toma
+    diferencia = models.DecimalField(max_digits=12, decimal_places=4, null=True, blank=True)
+
+    class Meta:
+        unique_together = ('toma', 'producto')
+
+    def __str__(self):
+        return f"{self.producto} contado {self.cantidad_contada}"
+
 class Promocion(models.Model):
     empresa = models.ForeignKey(Empresa, on_delete=models.CASCADE)
     nombre = models.CharField(max_length=100)
@@ -598,6 +919,10 @@ class Cotizacion(models.Model):
         verbose_name = "Cotización"
         verbose_name_plural = "Cotizaciones"
         ordering = ['-fecha_emision']
+        indexes = [
+            # Barrido de cotizaciones vencidas (cobros/vencimientos.py)
+            models.Index(fields=['empresa', 'estado', 'fecha_vencimiento']),
+        ]
 
 class CotizacionDetalle(models.Model):
     """
@@ -626,6 +951,8 @@ class CajaChica(models.Model):
     responsable = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.PROTECT, verbose_name="Custodio")
     nombre = models.CharField(max_length=100, help_text="Ej: Caja Chica Administración")
     saldo_actual = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    # Saldo sin movimientos: saldo_actual = saldo_inicial + ingresos - egresos (ver cobros/conciliacion.py)
+    saldo_inicial = models.DecimalField(max_digits=12, decimal_places=2, default=0)
     fecha_apertura = models.DateField(auto_now_add=True)
     fecha_cierre = models.DateField(null=True, blank=True)
     activo = models.BooleanField(default=True)
@@ -633,6 +960,11 @@ class CajaChica(models.Model):
     def __str__(self):
         return f"{self.nombre} - Saldo: ${self.saldo_actual}"
 
+    def save(self, *args, **kwargs):
+        if self._state.adding and not self.saldo_inicial:
+            self.saldo_inicial = self.saldo_actual
+        super().save(*args, **kwargs)
+
 class MovimientoCaja(models.Model):
     """
     Registra entradas (reposición) y salidas (gastos) de la caja chica.
@@ -657,24 +989,31 @@ class MovimientoCaja(models.Model):
         verbose_name="Evidencia/Recibo"
     )
 
+    # Saldo de la caja antes y después del movimiento (vacíos en los registrados antes de guardarse)
+    saldo_anterior = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True)
+    saldo_nuevo = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True)
+
     def save(self, *args, **kwargs):
-        # Lógica de actualización de saldo de la caja
-        es_nuevo = self.pk is None
-        super().save(*args, **kwargs)
-        
-        if es_nuevo:
-            if self.tipo == 'ING':
-                self.caja.saldo_actual += self.monto
-            else:
-                self.caja.saldo_actual -= self.monto
-            self.caja.save()
-            
+        from . import tesoreria
+
+        if self.pk is not None:
+            return super().save(*args, **kwargs)
+
+        # Lógica de actualización de saldo de la caja (una caja chica no se sobregira)
+        with transaction.atomic():
+            delta = self.monto if self.tipo == 'ING' else -self.monto
+            self.saldo_anterior, self.saldo_nuevo = tesoreria.postear(
+                CajaChica, self.caja_id, 'saldo_actual', delta, nombre=self.caja.nombre
+            )
+            super().save(*args, **kwargs)
+
             # Auditoría Automática (Reutilizando tu modelo Bitacora)
-            Bitacora.objects.create(
-                usuario=self.usuario,
-                empresa=self.caja.empresa,
-                accion=f"Movimiento Caja {self.caja.nombre}: {self.tipo} de ${self.monto}. Ref: {self.concepto}"
+            tesoreria.auditar(
+                self.usuario,
+                self.caja.empresa,
+                f"Movimiento Caja {self.caja.nombre}: {self.tipo} de ${self.monto}. Ref: {self.concepto}",
             )
+        self.caja.saldo_actual = self.saldo_nuevo
 
     def __str__(self):
         return f"{self.tipo} - {self.monto} ({self.fecha.strftime('%Y-%m-%d')})"
@@ -698,6 +1037,9 @@ class Prestamo(models.Model):
     
     monto_capital = models.DecimalField(max_digits=12, decimal_places=2, verbose_name="Capital Prestado")
     tasa_interes_mensual = models.DecimalField(max_digits=5, decimal_places=2, verbose_name="Tasa Interés %")
+    sistema_amortizacion = models.CharField(
+        max_length=10, choices=amortizacion.SISTEMAS, default='FRANCES', verbose_name="Sistema de amortización"
+    )
     
     observaciones = models.TextField(blank=True, null=True)
     estado = models.CharField(max_length=1, choices=ESTADO_PRESTAMO, default='A')
@@ -715,51 +1057,23 @@ class Prestamo(models.Model):
             # Al crear, el saldo pendiente es igual al monto prestado
             self.saldo_capital_pendiente = self.monto_capital
         super().save(*args, **kwargs)
+    def tabla_amortizacion(self):
+        """Tabla calculada en memoria (sin guardar), para vista previa."""
+        return amortizacion.tabla(
+            self.monto_capital, self.tasa_interes_mensual, self.plazo_meses, self.fecha_inicio,
+            self.sistema_amortizacion,
+        )
+
     def generar_tabla_amortizacion(self):
         """
-        Calcula y guarda las cuotas usando el Sistema Francés.
-        Formula: R = P * ( i * (1+i)^n ) / ( (1+i)^n - 1 )
+        Reemplaza las cuotas por la tabla del sistema del préstamo (ver
+        core/amortizacion.py), calculada en Decimal y guardada con un solo INSERT.
         """
-        # Limpiamos tabla anterior si existe
-        self.cuotas.all().delete()
-        
-        capital = float(self.monto_capital)
-        tasa = float(self.tasa_interes_mensual) / 100
-        plazo = self.plazo_meses
-
-        # Evitar división por cero
-        if tasa > 0:
-            cuota_fija = capital * (tasa * pow(1 + tasa, plazo)) / (pow(1 + tasa, plazo) - 1)
-        else:
-            cuota_fija = capital / plazo
-
-        saldo = capital
-        fecha_pago = self.fecha_inicio
-
-        for i in range(1, plazo + 1):
-            # Calcular componentes
-            interes_cuota = saldo * tasa
-            capital_cuota = cuota_fija - interes_cuota
-            saldo -= capital_cuota
-            
-            # Avanzar un mes para la fecha de pago
-            fecha_pago += relativedelta(months=1)
-
-            # Ajuste final para evitar decimales residuales en la última cuota
-            if i == plazo and saldo != 0:
-                capital_cuota += saldo
-                saldo = 0
-
-            # Guardar en Base de Datos
-            CuotaPrestamo.objects.create(
-                prestamo=self,
-                numero_cuota=i,
-                fecha_vencimiento=fecha_pago,
-                valor_cuota=Decimal(cuota_fija),
-                interes=Decimal(interes_cuota),
-                capital=Decimal(capital_cuota),
-                saldo_pendiente=Decimal(saldo if saldo > 0 else 0)
-            )
+        cuotas = [CuotaPrestamo(prestamo=self, **fila) for fila in self.tabla_amortizacion()]
+        with transaction.atomic():
+            self.cuotas.all().delete()
+            CuotaPrestamo.objects.bulk_create(cuotas)
+        return cuotas
 
 class CuotaPrestamo(models.Model):
     """
@@ -784,6 +1098,11 @@ class CuotaPrestamo(models.Model):
     estado = models.CharField(max_length=3, choices=ESTADO_CUOTA, default='PEN')
     fecha_pago_real = models.DateField(null=True, blank=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['estado', 'fecha_vencimiento']),
+        ]
+
     def __str__(self):
         return f"Cuota {self.numero_cuota}/{self.prestamo.plazo_meses} - ${self.valor_cuota}"
 
@@ -851,26 +1170,103 @@ class CuentaBancaria(models.Model):
     color = models.CharField(max_length=7, default='#4e73df', verbose_name="Color de Tarjeta")
     tipo = models.CharField(max_length=3, choices=[('AH', 'Ahorros'), ('CTE', 'Corriente')])
     saldo = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    # Saldo sin transacciones: saldo = saldo_inicial + depósitos - retiros (ver cobros/conciliacion.py)
+    saldo_inicial = models.DecimalField(max_digits=14, decimal_places=2, default=0)
     activa = models.BooleanField(default=True)
 
+    # Libro de la cuenta para saldos a una fecha y estados de cuenta (ver core/tesoreria.py)
+    RELACION_MOVIMIENTOS = 'transacciones'
+    CAMPO_SALDO = 'saldo'
+
     def __str__(self):
         return f"{self.banco} - {self.numero_cuenta}"
 
+    def save(self, *args, **kwargs):
+        if self._state.adding and not self.saldo_inicial:
+            self.saldo_inicial = self.saldo
+        super().save(*args, **kwargs)
+
+    def ajustar_saldo(self, nuevo_saldo):
+        """
+        Cambio manual del saldo: la diferencia se registra como un depósito o
+        retiro de ajuste con su fecha, así los cierres mensuales y los estados
+        de cuenta (core/tesoreria.py) la ven como cualquier otra transacción.
+        Lanza tesoreria.SaldoInsuficiente si el saldo quedaría negativo.
+        """
+        nuevo_saldo = Decimal(str(nuevo_saldo))
+        with transaction.atomic():
+            actual = CuentaBancaria.objects.select_for_update().values_list('saldo', flat=True).get(pk=self.pk)
+            diferencia = nuevo_saldo - actual
+            if diferencia:
+                TransaccionBancaria.objects.create(
+                    cuenta=self,
+                    tipo='DEP' if diferencia > 0 else 'RET',
+                    monto=abs(diferencia),
+                    descripcion='Ajuste manual de saldo',
+                )
+        self.saldo = nuevo_saldo
+
 # Y necesitas registrar las transacciones de esas cuentas
 class TransaccionBancaria(models.Model):
+    TIPOS_INGRESO = ('DEP',)
+    TIPOS_EGRESO = ('RET',)
+
     cuenta = models.ForeignKey(CuentaBancaria, on_delete=models.CASCADE, related_name='transacciones')
     fecha = models.DateTimeField(auto_now_add=True)
     tipo = models.CharField(max_length=3, choices=[('DEP', 'Depósito'), ('RET', 'Retiro')])
     monto = models.DecimalField(max_digits=12, decimal_places=2)
     descripcion = models.CharField(max_length=200)
-    
+    # Saldo de la cuenta antes y después de la transacción (vacíos en las registradas antes de guardarse)
+    saldo_anterior = models.DecimalField(max_digits=14, decimal_places=2, null=True, blank=True)
+    saldo_nuevo = models.DecimalField(max_digits=14, decimal_places=2, null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['cuenta', 'fecha', 'id']),
+        ]
+
     def save(self, *args, **kwargs):
-        # Actualizar saldo automáticamente
-        if not self.pk:
-            if self.tipo == 'DEP':
-                self.cuenta.saldo += self.monto
-            elif self.tipo == 'RET':
-                self.cuenta.saldo -= self.monto
-            self.cuenta.save()
-        super().save(*args, **kwargs)
+        from . import tesoreria
+
+        if self.pk:
+            return super().save(*args, **kwargs)
+
+        # Actualizar saldo automáticamente (un retiro no puede dejar la cuenta en negativo)
+        with transaction.atomic():
+            delta = self.monto if self.tipo == 'DEP' else -self.monto
+            self.saldo_anterior, self.saldo_nuevo = tesoreria.postear(
+                CuentaBancaria, self.cuenta_id, 'saldo', delta, nombre=str(self.cuenta)
+            )
+            super().save(*args, **kwargs)
+            if self.cuenta.empresa_id:
+                tesoreria.auditar(
+                    None,
+                    self.cuenta.empresa,
+                    f"Transacción {self.get_tipo_display()} en {self.cuenta}: ${self.monto}. Ref: {self.descripcion}",
+                )
+        self.cuenta.saldo = self.saldo_nuevo
+
+class CierreCuentaBancaria(models.Model):
+    """
+    Saldo de la cuenta al cierre de cada mes y totales del mes (core/tesoreria.py).
+    El saldo a una fecha parte del último cierre y solo suma las transacciones
+    posteriores, sin recorrer toda la historia de la cuenta.
+    """
+    cuenta = models.ForeignKey(CuentaBancaria, on_delete=models.CASCADE, related_name='cierres')
+    periodo = models.DateField(help_text="Primer día del mes cerrado")
+
+    saldo_inicial = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    ingresos = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    egresos = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    saldo_final = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    movimientos = models.PositiveIntegerField(default=0)
+
+    generado_en = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ('cuenta', 'periodo')
+        ordering = ['periodo']
+
+    def __str__(self):
+        return f"{self.cuenta} - {self.periodo:%Y-%m}: {self.saldo_final}"
 
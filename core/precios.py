@@ -0,0 +1,126 @@
+# Ubicación: core/precios.py
+"""
+Resolución de precios por nivel (Precio 1/2/3) con caché por empresa.
+
+- El Precio 1 vive en Producto.precio; los demás en ProductoPrecio.
+- El mapa "Precio n" -> id de TipoPrecio se guarda en la caché compartida.
+- Los precios por producto se guardan como {tipo_id: valor}; una lista de
+  productos se resuelve con get_many y, para los que faltan, UNA sola consulta.
+
+Todas las claves llevan la versión de la empresa. Cualquier cambio en
+TipoPrecio o ProductoPrecio incrementa la versión (ver core/signals.py), con
+lo que una lectura concurrente nunca deja un precio viejo bajo la clave nueva.
+"""
+import re
+from decimal import Decimal
+
+from django.core.cache import cache
+
+from . import cache as cache_erp
+from .models import ProductoPrecio, TipoPrecio
+
+TTL_PRECIOS = 60 * 60 * 6
+_PATRON_TIPO = re.compile(r"^precio\s*(\d+)$", re.IGNORECASE)
+
+# ==========================================
+# VERSIÓN POR EMPRESA
+# ==========================================
+
+def version_precios(empresa_id):
+    return cache_erp.version("precios", empresa_id)
+
+def invalidar_precios(empresa_id):
+    cache_erp.invalidar("precios", empresa_id)
+
+# ==========================================
+# TIPOS DE PRECIO
+# ==========================================
+
+def tipos_precio(empresa_id):
+    """Mapa {n: tipo_precio_id} de los tipos "Precio n" de la empresa."""
+    clave = f"precios:tipos:{empresa_id}:{version_precios(empresa_id)}"
+    mapa = cache.get(clave)
+    if mapa is None:
+        mapa = {}
+        for tipo_id, nombre in TipoPrecio.objects.filter(empresa_id=empresa_id).values_list("id", "nombre"):
+            encontrado = _PATRON_TIPO.match(nombre.strip())
+            if encontrado:
+                mapa[int(encontrado.group(1))] = tipo_id
+        cache.set(clave, mapa, TTL_PRECIOS)
+    return mapa
+
+def tipo_precio_id(empresa_id, n, crear=False):
+    """Id del TipoPrecio "Precio n"; con crear=True lo crea si no existe."""
+    tipo_id = tipos_precio(empresa_id).get(n)
+    if tipo_id is None and crear:
+        tipo, _ = TipoPrecio.objects.get_or_create(
+            empresa_id=empresa_id,
+            nombre=f"Precio {n}",
+            defaults={"activo": True},
+        )
+        tipo_id = tipo.id
+    return tipo_id
+
+# ==========================================
+# MATRIZ DE PRECIOS
+# ==========================================
+
+def _precios_por_tipo(empresa_id, producto_ids):
+    """{producto_id: {tipo_id: valor}} desde la caché, completando con una consulta."""
+    version = version_precios(empresa_id)
+    claves = {f"precios:p:{empresa_id}:{version}:{pid}": pid for pid in producto_ids}
+    resultado = {claves[k]: v for k, v in cache.get_many(list(claves)).items()}
+
+    faltantes = [pid for pid in producto_ids if pid not in resultado]
+    if faltantes:
+        nuevos = {pid: {} for pid in faltantes}
+        filas = ProductoPrecio.objects.filter(producto_id__in=faltantes).values_list("producto_id", "tipo_id", "valor")
+        for pid, tipo_id, valor in filas:
+            nuevos[pid][tipo_id] = valor
+        cache.set_many(
+            {f"precios:p:{empresa_id}:{version}:{pid}": v for pid, v in nuevos.items()},
+            TTL_PRECIOS,
+        )
+        resultado.update(nuevos)
+    return resultado
+
+def matriz_precios(productos, niveles=(1, 2, 3)):
+    """
+    Devuelve {producto_id: {n: Decimal}} para los niveles pedidos.
+    Recibe instancias de Producto (se usa empresa_id y precio de cada una).
+    """
+    productos = [p for p in productos if p.pk]
+    matriz = {}
+    por_empresa = {}
+    for p in productos:
+        por_empresa.setdefault(p.empresa_id, []).append(p)
+
+    for empresa_id, grupo in por_empresa.items():
+        tipos = tipos_precio(empresa_id)
+        otros = [n for n in niveles if n != 1]
+        precios = _precios_por_tipo(empresa_id, [p.id for p in grupo]) if otros else {}
+
+        for p in grupo:
+            fila = {}
+            for n in niveles:
+                if n == 1:
+                    fila[n] = p.precio or Decimal("0")
+                else:
+                    fila[n] = precios.get(p.id, {}).get(tipos.get(n), Decimal("0"))
+            matriz[p.id] = fila
+    return matriz
+
+def resolver_precios(productos, tier):
+    """{producto_id: Decimal} con el precio del nivel `tier` para una lista de productos."""
+    return {pid: fila[tier] for pid, fila in matriz_precios(productos, niveles=(tier,)).items()}
+
+def precargar_precios(productos, niveles=(1, 2, 3)):
+    """
+    Resuelve los precios de todos los productos de una vez y los deja en cada
+    instancia, para que precio_2/precio_3 en plantillas no consulten por fila.
+    """
+    productos = list(productos)
+    matriz = matriz_precios(productos, niveles)
+    for p in productos:
+        p._precios_resueltos = matriz.get(p.id, {})
+    return productos
@@ -0,0 +1,67 @@
+# Ubicación: core/procesos.py
+"""
+Piezas comunes de las importaciones que corren en segundo plano con Celery
+(ImportacionInventario en core/importaciones.py, ImportacionCompras en
+core/compras_xml.py). Los dos modelos comparten estado (P/E/C/F), errores,
+detalle_errores, mensaje, creado_en y la propiedad porcentaje.
+
+- Progreso: contadores en memoria que se escriben con un solo UPDATE cada
+  tanto; el detalle de errores se corta en MAX_ERRORES_GUARDADOS.
+- en_curso: una importación a la vez por empresa.
+- estado: respuesta del polling de la plantilla.
+"""
+import datetime
+
+from django.utils import timezone
+
+MAX_ERRORES_GUARDADOS = 500
+# Una importación pendiente o en proceso más vieja que esto se da por colgada
+HORAS_EN_CURSO = 2
+ERRORES_EN_ESTADO = 50
+
+class Progreso:
+    """Avance de una importación. Cada subclase lista en CONTADORES los campos que acumula."""
+    CONTADORES = ()
+
+    def __init__(self, importacion):
+        self.importacion = importacion
+        for campo in self.CONTADORES:
+            setattr(self, campo, 0)
+        self.errores = 0
+        self.detalle_errores = []
+
+    def error(self, mensaje, **donde):
+        """Cuenta el error y guarda su detalle ({**donde, "error": mensaje}) mientras haya lugar."""
+        self.errores += 1
+        if len(self.detalle_errores) < MAX_ERRORES_GUARDADOS:
+            self.detalle_errores.append({**donde, "error": str(mensaje)})
+
+    def guardar(self, **extra):
+        type(self.importacion).objects.filter(pk=self.importacion.pk).update(
+            **{campo: getattr(self, campo) for campo in self.CONTADORES},
+            errores=self.errores,
+            detalle_errores=self.detalle_errores,
+            **extra,
+        )
+
+def en_curso(modelo, empresa):
+    """Importación pendiente o en proceso de la empresa, o None (ignora las colgadas)."""
+    return modelo.objects.filter(
+        empresa=empresa,
+        estado__in=['P', 'E'],
+        creado_en__gte=timezone.now() - datetime.timedelta(hours=HORAS_EN_CURSO),
+    ).first()
+
+def estado(importacion, *campos):
+    """Avance de la importación para el polling de la plantilla, con sus contadores `campos`."""
+    return {
+        'status': 'ok',
+        'id': importacion.id,
+        'estado': importacion.estado,
+        'estado_display': importacion.get_estado_display(),
+        'porcentaje': importacion.porcentaje,
+        **{campo: getattr(importacion, campo) for campo in campos},
+        'errores': importacion.errores,
+        'detalle_errores': importacion.detalle_errores[:ERRORES_EN_ESTADO],
+        'mensaje': importacion.mensaje,
+    }
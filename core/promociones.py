@@ -0,0 +1,140 @@
+# Ubicación: core/promociones.py
+"""
+Motor de promociones aplicado al momento de vender o cotizar.
+
+Cada proceso mantiene, por empresa, un índice en memoria con los intervalos
+(fecha_inicio, fecha_fin, porcentaje) de las promociones activas de cada
+producto. El índice se reconstruye cuando cambia la versión de la empresa en
+la caché compartida (señales de Promocion y la tarea de medianoche), de modo
+que resolver el descuento de un carrito completo no hace ninguna consulta de
+rangos de fechas por línea.
+"""
+import threading
+from bisect import bisect_right
+from decimal import Decimal, ROUND_HALF_UP
+
+from django.utils import timezone
+
+from . import cache as cache_erp
+from .models import Promocion
+
+CENTAVO = Decimal("0.01")
+
+# ==========================================
+# ÍNDICE DE INTERVALOS
+# ==========================================
+
+class IndicePromociones:
+    """
+    Intervalos de promociones agrupados por producto y ordenados por fecha de
+    inicio. Para una fecha se buscan con bisect los intervalos que ya
+    empezaron y se toma el mayor porcentaje de los que no han terminado.
+    """
+
+    def __init__(self, promociones):
+        self._por_producto = {}
+        for promo in promociones:
+            self._por_producto.setdefault(promo["producto_id"], []).append(
+                (promo["fecha_inicio"], promo["fecha_fin"], promo["porcentaje_descuento"], promo["id"])
+            )
+        self._inicios = {}
+        for producto_id, intervalos in self._por_producto.items():
+            intervalos.sort()
+            self._inicios[producto_id] = [i[0] for i in intervalos]
+
+    def mejor(self, producto_id, fecha):
+        """(porcentaje, promocion_id) del mejor descuento vigente, o None."""
+        intervalos = self._por_producto.get(producto_id)
+        if not intervalos:
+            return None
+        mejor = None
+        for _, fin, porcentaje, promo_id in intervalos[:bisect_right(self._inicios[producto_id], fecha)]:
+            if fin >= fecha and (mejor is None or porcentaje > mejor[0]):
+                mejor = (porcentaje, promo_id)
+        return mejor
+
+# ==========================================
+# VERSIÓN POR EMPRESA
+# ==========================================
+
+_indices = {}
+_lock = threading.Lock()
+
+def version_promociones(empresa_id):
+    return cache_erp.version("promociones", empresa_id)
+
+def invalidar_promociones(empresa_id):
+    cache_erp.invalidar("promociones", empresa_id)
+
+def obtener_indice(empresa_id):
+    """
+    Índice vigente de la empresa. Solo se cargan promociones activas que no
+    hayan terminado antes de hoy; la tarea de medianoche descarta las vencidas.
+    """
+    version = version_promociones(empresa_id)
+    actual = _indices.get(empresa_id)
+    if actual and actual[0] == version:
+        return actual[1]
+
+    with _lock:
+        actual = _indices.get(empresa_id)
+        if actual and actual[0] == version:
+            return actual[1]
+
+        promociones = Promocion.objects.filter(
+            empresa_id=empresa_id,
+            activa=True,
+            fecha_fin__gte=timezone.localdate(),
+        ).values("id", "producto_id", "fecha_inicio", "fecha_fin", "porcentaje_descuento")
+        indice = IndicePromociones(promociones)
+        _indices[empresa_id] = (version, indice)
+        return indice
+
+# ==========================================
+# APLICACIÓN SOBRE EL CARRITO
+# ==========================================
+
+def _leer(linea, campo):
+    return linea.get(campo) if isinstance(linea, dict) else getattr(linea, campo, None)
+
+def _producto_id(linea):
+    if isinstance(linea, dict):
+        producto = linea.get("producto")
+        return producto.pk if producto is not None else linea.get("producto_id")
+    return linea.producto_id
+
+def aplicar_promociones(empresa_id, lineas, fecha=None):
+    """
+    Resuelve en una sola pasada el mejor descuento de cada línea y lo escribe
+    en `descuento` (monto, no porcentaje). Acepta instancias de FacturaDetalle
+    / CotizacionDetalle o los diccionarios cleaned_data de los formsets.
+    Devuelve el descuento total del carrito.
+    """
+    fecha = fecha or timezone.localdate()
+    indice = obtener_indice(empresa_id)
+    total = Decimal("0")
+
+    for linea in lineas:
+        descuento = Decimal("0")
+        mejor = indice.mejor(_producto_id(linea), fecha)
+        if mejor:
+            bruto = Decimal(str(_leer(linea, "cantidad") or 0)) * Decimal(str(_leer(linea, "precio_unitario") or 0))
+            descuento = (bruto * mejor[0] / 100).quantize(CENTAVO, rounding=ROUND_HALF_UP)
+
+        if isinstance(linea, dict):
+            linea["descuento"] = descuento
+        else:
+            linea.descuento = descuento
+        total += descuento
+    return total
+
+def porcentajes_vigentes(empresa_id, producto_ids, fecha=None):
+    """{producto_id: porcentaje} de los productos con promoción vigente."""
+    fecha = fecha or timezone.localdate()
+    indice = obtener_indice(empresa_id)
+    resultado = {}
+    for producto_id in producto_ids:
+        mejor = indice.mejor(producto_id, fecha)
+        if mejor:
+            resultado[producto_id] = mejor[0]
+    return resultado
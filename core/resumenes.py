@@ -0,0 +1,162 @@
+# Ubicación: core/resumenes.py
+"""
+Resumen diario de ventas y compras por empresa (ResumenDiario).
+
+Cada documento suma (o resta, al anularse) su total en la fila de su empresa
+y su día, así el dashboard y los reportes por período leen una fila por día
+en lugar de recorrer todas las facturas y compras.
+
+- registrar_facturas / registrar_compras acumulan los deltas y los escriben
+  al confirmar la transacción del documento, con un solo UPSERT. Así la fila
+  del día (compartida por todas las cajas de la empresa) se bloquea solo
+  durante esa sentencia y no mientras dura la venta.
+- recalcular reconstruye un rango de días desde los documentos (comando
+  recalcular_resumenes); sirve para la carga inicial y para corregir
+  cualquier desfase.
+
+Cuentan las facturas no anuladas (estado_pago distinto de 'N') y las compras
+activas.
+"""
+from decimal import Decimal
+
+from django.db import connection, transaction
+from django.db.models import Sum
+from django.db.models.functions import TruncMonth
+
+from . import cache as cache_erp
+from .models import Compra, Factura, ResumenDiario
+
+CERO = Decimal("0")
+
+# ==========================================
+# ACTUALIZACIÓN INCREMENTAL
+# ==========================================
+
+_SQL_ACUMULAR = """
+    INSERT INTO {tabla} (empresa_id, fecha, total_ventas, iva_ventas, num_facturas, total_compras, num_compras)
+    VALUES {valores}
+    ON CONFLICT (empresa_id, fecha) DO UPDATE SET
+        total_ventas = {tabla}.total_ventas + EXCLUDED.total_ventas,
+        iva_ventas = {tabla}.iva_ventas + EXCLUDED.iva_ventas,
+        num_facturas = {tabla}.num_facturas + EXCLUDED.num_facturas,
+        total_compras = {tabla}.total_compras + EXCLUDED.total_compras,
+        num_compras = {tabla}.num_compras + EXCLUDED.num_compras
+"""
+
+def _acumular(deltas):
+    """Suma {(empresa_id, fecha): [ventas, iva, facturas, compras, n_compras]} en una sentencia."""
+    filas = sorted((clave, valores) for clave, valores in deltas.items() if any(valores))
+    if not filas:
+        return
+    tabla = ResumenDiario._meta.db_table
+    sql = _SQL_ACUMULAR.format(tabla=tabla, valores=", ".join(["(%s, %s, %s, %s, %s, %s, %s)"] * len(filas)))
+    parametros = [v for (empresa_id, fecha), valores in filas for v in (empresa_id, fecha, *valores)]
+    with connection.cursor() as cursor:
+        cursor.execute(sql, parametros)
+    # Lo cacheado a partir del resumen se invalida recién con el resumen ya escrito
+    for empresa_id, espacio in {(e, "ventas" if v[2] else "compras") for (e, _), v in filas}:
+        cache_erp.invalidar(espacio, empresa_id)
+
+def _al_confirmar(deltas):
+    if deltas:
+        transaction.on_commit(lambda: _acumular(deltas))
+
+def registrar_facturas(facturas, signo=1):
+    """Suma (signo=1) o resta (signo=-1, anulación) facturas ya guardadas."""
+    deltas = {}
+    for f in facturas:
+        fila = deltas.setdefault((f.empresa_id, f.fecha_emision), [CERO, CERO, 0, CERO, 0])
+        fila[0] += signo * f.importe_total
+        fila[1] += signo * (f.importe_total - f.total_sin_impuestos)
+        fila[2] += signo
+    _al_confirmar(deltas)
+
+def registrar_compras(compras, signo=1):
+    """Suma (signo=1) o resta (signo=-1, anulación) compras ya guardadas."""
+    deltas = {}
+    for c in compras:
+        fila = deltas.setdefault((c.empresa_id, c.fecha), [CERO, CERO, 0, CERO, 0])
+        fila[3] += signo * c.total
+        fila[4] += signo
+    _al_confirmar(deltas)
+
+# ==========================================
+# RECONSTRUCCIÓN
+# ==========================================
+
+_SQL_RECALCULAR = """
+    INSERT INTO {resumen} (empresa_id, fecha, total_ventas, iva_ventas, num_facturas, total_compras, num_compras)
+    SELECT empresa_id, fecha, SUM(ventas), SUM(iva), SUM(facturas), SUM(compras), SUM(n_compras)
+    FROM (
+        SELECT empresa_id, fecha_emision AS fecha, importe_total AS ventas,
+               importe_total - total_sin_impuestos AS iva, 1 AS facturas, 0 AS compras, 0 AS n_compras
+        FROM {factura}
+        WHERE estado_pago <> 'N' AND fecha_emision BETWEEN %(desde)s AND %(hasta)s {filtro}
+        UNION ALL
+        SELECT empresa_id, fecha, 0, 0, 0, total, 1
+        FROM {compra}
+        WHERE estado = 'A' AND fecha BETWEEN %(desde)s AND %(hasta)s {filtro}
+    ) documentos
+    GROUP BY empresa_id, fecha
+"""
+
+@transaction.atomic
+def recalcular(desde, hasta, empresa_ids=None):
+    """Reconstruye los días [desde, hasta] desde las facturas y compras. Devuelve las filas escritas."""
+    resumenes = ResumenDiario.objects.filter(fecha__range=(desde, hasta))
+    filtro = ""
+    parametros = {"desde": desde, "hasta": hasta}
+    if empresa_ids is not None:
+        resumenes = resumenes.filter(empresa_id__in=empresa_ids)
+        filtro = "AND empresa_id = ANY(%(empresas)s)"
+        parametros["empresas"] = list(empresa_ids)
+    afectadas = set(resumenes.values_list("empresa_id", flat=True).distinct())
+    resumenes.delete()
+
+    sql = _SQL_RECALCULAR.format(
+        resumen=ResumenDiario._meta.db_table,
+        factura=Factura._meta.db_table,
+        compra=Compra._meta.db_table,
+        filtro=filtro,
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, parametros)
+        filas = cursor.rowcount
+
+    afectadas.update(
+        ResumenDiario.objects.filter(fecha__range=(desde, hasta)).values_list("empresa_id", flat=True).distinct()
+    )
+    for empresa_id in afectadas:
+        cache_erp.invalidar_al_confirmar("ventas", empresa_id)
+        cache_erp.invalidar_al_confirmar("compras", empresa_id)
+    return filas
+
+# ==========================================
+# CONSULTAS
+# ==========================================
+
+def _resumenes(empresa, desde, hasta):
+    qs = ResumenDiario.objects.filter(fecha__range=(desde, hasta))
+    return qs.filter(empresa=empresa) if empresa is not None else qs
+
+def totales(empresa, desde, hasta):
+    """Totales del período. empresa=None suma todas las empresas."""
+    t = _resumenes(empresa, desde, hasta).aggregate(
+        total_ventas=Sum("total_ventas"),
+        iva_ventas=Sum("iva_ventas"),
+        num_facturas=Sum("num_facturas"),
+        total_compras=Sum("total_compras"),
+        num_compras=Sum("num_compras"),
+    )
+    return {campo: valor or 0 for campo, valor in t.items()}
+
+def por_mes(empresa, desde, hasta):
+    """{primer día del mes: (ventas, compras)} del período."""
+    return {
+        fila["mes"]: (fila["ventas"], fila["compras"])
+        for fila in _resumenes(empresa, desde, hasta)
+        .annotate(mes=TruncMonth("fecha"))
+        .values("mes")
+        .annotate(ventas=Sum("total_ventas"), compras=Sum("total_compras"))
+        .order_by("mes")
+    }
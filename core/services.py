@@ -2,7 +2,7 @@
 
 from django.db import transaction
 from decimal import Decimal
-from . import sri_services
+from . import kardex, resumenes, sri_services, promociones
 from .models import Factura, FacturaDetalle
 
 @transaction.atomic
@@ -24,10 +24,13 @@ def crear_nueva_venta(factura_data, detalles_data, empresa, usuario):
     iva_rate = Decimal('0.15')         # Tasa de IVA ajustada al 14%
     codigo_porcentaje_iva = "4" 
    
+    # Promociones vigentes: una sola pasada sobre el carrito
+    total_descuento = promociones.aplicar_promociones(empresa.id, detalles_data, factura.fecha_emision)
+
     detalles_a_crear = []
     for data in detalles_data:
         detalle = FacturaDetalle(**data)
-        subtotal_linea = (detalle.cantidad * detalle.precio_unitario).quantize(Decimal('0.01'))
+        subtotal_linea = (detalle.cantidad * detalle.precio_unitario - detalle.descuento).quantize(Decimal('0.01'))
         detalle.precio_total_sin_impuesto = subtotal_linea
         total_sin_impuestos += subtotal_linea
 
@@ -42,6 +45,7 @@ def crear_nueva_venta(factura_data, detalles_data, empresa, usuario):
 
     # 3. Asignar totales a la factura
     factura.total_sin_impuestos = total_sin_impuestos
+    factura.total_descuento = total_descuento
     factura.importe_total = total_sin_impuestos + total_iva
     
     if total_iva > 0:
@@ -79,15 +83,17 @@ def crear_nueva_venta(factura_data, detalles_data, empresa, usuario):
 
     for detalle in detalles_a_crear:
         detalle.factura = factura
-        detalle.save()
-        
-        # Actualizar stock del producto
-        producto = detalle.producto
-        producto.stock -= detalle.cantidad
-        producto.save(update_fields=['stock'])
+    FacturaDetalle.objects.bulk_create(detalles_a_crear)
+
+    # Actualizar stock y kardex (salida al costo promedio vigente)
+    kardex.registrar_movimientos(empresa, [
+        {'producto_id': d.producto_id, 'tipo': 'S', 'cantidad': d.cantidad, 'detalle_factura': d}
+        for d in detalles_a_crear
+    ], usuario=usuario, documento=f"FAC-{secuencial_str}", bodega=punto_venta.bodega)
 
     # 7. Actualizar el secuencial para la próxima factura
     punto_venta.secuencial_factura += 1
     punto_venta.save(update_fields=['secuencial_factura'])
 
+    resumenes.registrar_facturas([factura])
     return factura
\ No newline at end of file
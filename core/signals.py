@@ -0,0 +1,86 @@
+# Ubicación: core/signals.py
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from . import busqueda, cache as cache_erp, precios, promociones
+from .models import (
+    Bodega, Cliente, Compra, Factura, Producto, ProductoPrecio, Promocion,
+    Proveedor, TipoPrecio,
+)
+
+# ==========================================
+# ÍNDICES DE AUTOCOMPLETADO
+# ==========================================
+# La versión se incrementa al confirmar la transacción: si se hiciera antes,
+# otro proceso podría reconstruir el índice sin ver todavía el cambio.
+
+@receiver(post_save, sender=Cliente)
+@receiver(post_delete, sender=Cliente)
+def invalidar_indice_clientes(sender, instance, **kwargs):
+    empresa_id = instance.empresa_id
+    transaction.on_commit(lambda: busqueda.invalidar_indice("cliente", empresa_id))
+
+@receiver(post_save, sender=Proveedor)
+@receiver(post_delete, sender=Proveedor)
+def invalidar_indice_proveedores(sender, instance, **kwargs):
+    empresa_id = instance.empresa_id
+    transaction.on_commit(lambda: busqueda.invalidar_indice("proveedor", empresa_id))
+
+# ==========================================
+# CACHÉ DE PRECIOS
+# ==========================================
+
+@receiver(post_save, sender=TipoPrecio)
+@receiver(post_delete, sender=TipoPrecio)
+def invalidar_tipos_precio(sender, instance, **kwargs):
+    empresa_id = instance.empresa_id
+    transaction.on_commit(lambda: precios.invalidar_precios(empresa_id))
+
+@receiver(post_save, sender=ProductoPrecio)
+@receiver(post_delete, sender=ProductoPrecio)
+def invalidar_producto_precio(sender, instance, **kwargs):
+    if ProductoPrecio.producto.field.is_cached(instance):
+        empresa_id = instance.producto.empresa_id
+    else:
+        empresa_id = (
+            Producto.objects.filter(pk=instance.producto_id)
+            .values_list("empresa_id", flat=True)
+            .first()
+        )
+    if empresa_id is None:
+        return
+    transaction.on_commit(lambda: precios.invalidar_precios(empresa_id))
+
+# ==========================================
+# ÍNDICE DE PROMOCIONES
+# ==========================================
+
+@receiver(post_save, sender=Promocion)
+@receiver(post_delete, sender=Promocion)
+def invalidar_indice_promociones(sender, instance, **kwargs):
+    empresa_id = instance.empresa_id
+    transaction.on_commit(lambda: promociones.invalidar_promociones(empresa_id))
+
+# ==========================================
+# CACHÉ POR EMPRESA (core/cache.py)
+# ==========================================
+# Las escrituras en bloque (bulk_create, UPSERT del kardex) no disparan
+# señales: esos servicios invalidan su espacio directamente.
+
+def conectar_invalidacion(espacio, *modelos):
+    """Incrementa la versión de `espacio` de la empresa al guardar o borrar cualquiera de los modelos."""
+    def invalidar(sender, instance, **kwargs):
+        empresa_id = getattr(instance, "empresa_id", None)
+        if empresa_id is not None:
+            cache_erp.invalidar_al_confirmar(espacio, empresa_id)
+
+    for modelo in modelos:
+        uid = f"cache:{espacio}:{modelo._meta.label}"
+        post_save.connect(invalidar, sender=modelo, weak=False, dispatch_uid=uid)
+        post_delete.connect(invalidar, sender=modelo, weak=False, dispatch_uid=uid)
+
+conectar_invalidacion("ventas", Factura)
+conectar_invalidacion("compras", Compra)
+conectar_invalidacion("inventario", Producto, Bodega)
+conectar_invalidacion("clientes", Cliente)
@@ -1,9 +1,12 @@
 # tasks.py
 
 from celery import shared_task, Task
-from .models import Factura
-from . import sri_services
+from .models import CuentaBancaria, Empresa, Factura, Promocion
+from . import compras_xml, importaciones, kardex, sri_services, promociones, tesoreria
+import datetime
 import logging
+from dateutil.relativedelta import relativedelta
+from django.utils import timezone
 from django.core.mail import EmailMessage
 from django.template.loader import render_to_string
 from weasyprint import HTML
@@ -152,4 +155,152 @@ def enviar_factura_email_task(self, factura_id):
         return f"No se envió email: Factura {factura_id} no encontrada o no autorizada."
     except Exception as e:
         logger.error(f"Error al enviar correo para factura {factura_id}: {e}")
-        raise self.retry(exc=e)
\ No newline at end of file
+        raise self.retry(exc=e)
+# --- TAREA 4: Refrescar promociones a medianoche ---
+@shared_task
+def refrescar_promociones_task():
+    """
+    Invalida el índice de promociones de cada empresa que tenga promociones
+    activas, para que los procesos descarten las que vencieron ayer.
+    """
+    empresas = list(
+        Promocion.objects.filter(activa=True).values_list('empresa_id', flat=True).distinct()
+    )
+    for empresa_id in empresas:
+        promociones.invalidar_promociones(empresa_id)
+    return f"Índice de promociones refrescado para {len(empresas)} empresas."
+
+# --- TAREA 5: Cierre mensual del kardex ---
+@shared_task
+def cerrar_inventario_mensual_task(periodo=None):
+    """
+    Genera la foto de inventario (CierreInventario) del mes indicado
+    ('YYYY-MM-DD') o, por defecto, del mes anterior, para todas las empresas.
+    """
+    if periodo:
+        periodo = datetime.date.fromisoformat(periodo)
+    else:
+        periodo = timezone.localdate().replace(day=1) - relativedelta(months=1)
+
+    total = 0
+    for empresa in Empresa.objects.all():
+        total += kardex.cerrar_periodo(empresa, periodo)
+    return f"Cierre de inventario {periodo:%Y-%m}: {total} productos."
+
+# --- TAREA 6: Importación masiva de inventario ---
+@shared_task
+def importar_inventario_task(importacion_id):
+    importacion = importaciones.procesar_importacion_inventario(importacion_id)
+    return (
+        f"Importación #{importacion.id} ({importacion.get_estado_display()}): "
+        f"{importacion.creados} creados, {importacion.actualizados} actualizados, "
+        f"{importacion.errores} errores."
+    )
+
+# --- TAREA 7: Existencias diarias ---
+@shared_task
+def generar_existencias_diarias_task():
+    """Consolida en ExistenciaDiaria los días pendientes hasta ayer."""
+    filas = kardex.generar_existencias_diarias()
+    return f"Existencias diarias consolidadas: {filas} filas."
+
+# --- TAREA 8: Stock total derivado de StockBodega ---
+@shared_task
+def sincronizar_stock_task():
+    """Refresca Producto.stock donde difiere de StockBodega (franjas_stock > 1 o filas saltadas al vender)."""
+    filas = kardex.sincronizar_stock()
+    return f"Stock sincronizado en {filas} productos."
+
+# --- TAREA 9: Compras desde XML autorizados del SRI ---
+@shared_task
+def importar_compras_xml_task(importacion_id):
+    importacion = compras_xml.procesar_importacion_compras(importacion_id)
+    return (
+        f"Importación de compras #{importacion.id} ({importacion.get_estado_display()}): "
+        f"{importacion.creadas} compras, {importacion.duplicadas} duplicadas, "
+        f"{importacion.errores} errores."
+    )
+
+# --- TAREA 10: Conciliación nocturna de saldos ---
+@shared_task
+def conciliar_saldos_task(reparar=False, completo=False):
+    """
+    Compara los saldos de cobranza y tesorería con sus movimientos desde la
+    última corrida (ver cobros/conciliacion.py) y, si se pide, los corrige.
+    """
+    from cobros import conciliacion
+
+    descuadres = conciliacion.conciliar(reparar=reparar, completo=completo)
+    accion = "reparados" if reparar else "informados"
+    return f"Conciliación de saldos: {len(descuadres)} descuadres {accion}."
+
+# --- TAREA 11: Cierre mensual de saldos de cuentas ---
+@shared_task
+def cerrar_cuentas_mensual_task(periodo=None):
+    """
+    Guarda el saldo de cierre del mes indicado ('YYYY-MM-DD') o, por defecto,
+    del mes anterior, de las cuentas bancarias y financieras de cobranza.
+    """
+    from cobros.models import CuentaFinancieraCobro
+
+    if periodo:
+        periodo = datetime.date.fromisoformat(periodo)
+    else:
+        periodo = timezone.localdate().replace(day=1) - relativedelta(months=1)
+
+    total = 0
+    for empresa in Empresa.objects.all():
+        total += tesoreria.cerrar_periodo(CuentaBancaria, empresa, periodo)
+        total += tesoreria.cerrar_periodo(CuentaFinancieraCobro, empresa, periodo)
+    return f"Cierre de cuentas {periodo:%Y-%m}: {total} cuentas."
+
+# --- TAREA 12: Foto diaria de la antigüedad de cartera ---
+@shared_task
+def materializar_antiguedad_task():
+    """
+    Guarda la antigüedad de la cartera del día de todas las empresas
+    (ver cobros/antiguedad.py); alimenta el gráfico de tendencia.
+    """
+    from cobros import antiguedad
+
+    total = antiguedad.materializar()
+    return f"Antigüedad de cartera: {total} empresas."
+
+# --- TAREA 13: Devengo diario de mora ---
+@shared_task
+def devengar_mora_task(dia=None):
+    """
+    Carga la mora del día indicado ('YYYY-MM-DD') o, por defecto, de ayer en
+    los préstamos y compras financiadas con cuotas vencidas (ver cobros/mora.py).
+    """
+    from cobros import mora
+
+    dia = datetime.date.fromisoformat(dia) if dia else None
+    cargos = mora.devengar(dia)
+    return f"Mora devengada: {cargos['prestamos']} préstamos, {cargos['compras_financiadas']} compras financiadas."
+
+# --- TAREA 14: Barrido de estados por vencimiento ---
+@shared_task
+def barrer_vencimientos_task():
+    """
+    Marca como vencidos los préstamos, compras financiadas, estados de cuenta,
+    cuotas y cotizaciones cuya fecha pasó, y cierra las promesas de pago
+    (ver cobros/vencimientos.py).
+    """
+    from cobros import vencimientos
+
+    resultado = vencimientos.barrer()
+    cambios = sum(sum(c.values()) for c in resultado.values())
+    return f"Barrido de vencimientos: {cambios} cambios en {len(resultado)} empresas."
+
+# --- TAREA 15: Hoja de ruta diaria de cobradores ---
+@shared_task
+def generar_ruta_cobro_task():
+    """
+    Arma la hoja de ruta del día: clientes con cuotas o estados de cuenta
+    vencidos o por vencer hoy y promesas del día (ver cobros/ruta.py).
+    """
+    from cobros import ruta
+
+    resultado = ruta.generar_todas()
+    return f"Hoja de ruta: {sum(resultado.values())} clientes en {len(resultado)} empresas."
@@ -0,0 +1,240 @@
+# Ubicación: core/tesoreria.py
+"""
+Registro de movimientos de tesorería sobre saldos compartidos (cuentas
+financieras de cobranza, cuentas bancarias y cajas chicas).
+
+- postear: suma el movimiento al saldo con un único UPDATE ... RETURNING.
+  La base de datos bloquea la fila solo durante esa sentencia y hasta el fin
+  de la transacción, así dos cobros simultáneos sobre la misma cuenta se
+  encolan en lugar de pisarse. La condición de sobregiro va en el WHERE: si
+  el saldo no alcanza no se actualiza ninguna fila y se lanza
+  SaldoInsuficiente, sin ventana entre la validación y la escritura.
+- auditar: acumula los registros de Bitacora de la transacción y los inserta
+  juntos (bulk_create) al confirmarla (core/transacciones.py), fuera del
+  tiempo en que la cuenta queda bloqueada.
+
+Saldos a una fecha (cuentas con RELACION_MOVIMIENTOS, CAMPO_SALDO y una
+relación `cierres`: CuentaBancaria y CuentaFinancieraCobro):
+- cerrar_periodo guarda por cuenta el saldo al cierre del mes y sus totales,
+  partiendo del cierre anterior y leyendo solo los movimientos del mes.
+- saldo_al / saldo_antes parten del último cierre y suman solo los
+  movimientos posteriores (a lo sumo un mes si los cierres están al día).
+- estado_de_cuenta pagina hacia atrás por (fecha, id) desde cualquier fecha o
+  movimiento, con el saldo corrido de cada fila.
+Los movimientos anulados no cuentan.
+"""
+from decimal import Decimal
+
+from django.core.exceptions import ValidationError
+from django.db import connection, transaction
+from django.db.models import Count, Q, Sum
+from django.utils import timezone
+
+from . import transacciones
+from .fechas import fin_dia, rango_periodo
+from .models import Bitacora
+
+CERO = Decimal("0.00")
+
+class SaldoInsuficiente(ValidationError):
+    pass
+
+# ==========================================
+# SALDOS
+# ==========================================
+
+_SQL_POSTEAR = "UPDATE {tabla} SET {campo} = {campo} + %s WHERE {pk} = %s{condicion} RETURNING {campo}"
+
+def postear(modelo, pk, campo, delta, sobregiro=False, nombre=None):
+    """
+    Suma `delta` al `campo` de saldo de la fila `pk` de `modelo` y devuelve
+    (saldo_anterior, saldo_nuevo). Un delta negativo que dejaría el saldo bajo
+    cero se rechaza (salvo sobregiro=True). `nombre` se usa en el mensaje.
+    """
+    delta = Decimal(delta)
+    columna = modelo._meta.get_field(campo).column
+    condicion = f" AND {columna} + %s >= 0" if delta < 0 and not sobregiro else ""
+    sql = _SQL_POSTEAR.format(
+        tabla=modelo._meta.db_table, campo=columna, pk=modelo._meta.pk.column, condicion=condicion,
+    )
+    parametros = [delta, pk] + ([delta] if condicion else [])
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, parametros)
+        fila = cursor.fetchone()
+
+    if fila is None:
+        disponible = modelo.objects.filter(pk=pk).values_list(campo, flat=True).first()
+        if disponible is None:
+            raise modelo.DoesNotExist(f"{modelo._meta.verbose_name} {pk} no existe.")
+        raise SaldoInsuficiente(
+            f"No hay saldo suficiente en la cuenta '{nombre or pk}'. "
+            f"Disponible: {disponible}, requerido: {-delta}"
+        )
+    saldo_nuevo = fila[0]
+    return saldo_nuevo - delta, saldo_nuevo
+
+# ==========================================
+# AUDITORÍA
+# ==========================================
+
+def auditar(usuario, empresa, accion):
+    """Registra en Bitacora al confirmar la transacción (un solo INSERT por transacción)."""
+    registro = Bitacora(usuario=usuario, empresa=empresa, accion=accion)
+    lote = transacciones.lote_al_confirmar("bitacora", Bitacora.objects.bulk_create)
+    if lote is None:
+        registro.save()
+        return
+    lote.append(registro)
+
+# ==========================================
+# CIERRES MENSUALES Y SALDOS A UNA FECHA
+# ==========================================
+
+def _libro(modelo_cuenta):
+    """(modelo de movimientos, nombre del FK a la cuenta, modelo de cierres) de un tipo de cuenta."""
+    relacion = modelo_cuenta._meta.get_field(modelo_cuenta.RELACION_MOVIMIENTOS)
+    return relacion.related_model, relacion.field.name, modelo_cuenta._meta.get_field("cierres").related_model
+
+def _vigentes(movimiento, **filtros):
+    movimientos = movimiento.objects.filter(**filtros)
+    if any(campo.name == "anulado" for campo in movimiento._meta.fields):
+        movimientos = movimientos.filter(anulado=False)
+    return movimientos
+
+def _totales(movimientos, movimiento, agrupar=None):
+    """Ingresos, egresos y cantidad de movimientos (por cuenta si se indica `agrupar`)."""
+    ingreso = Q(tipo__in=movimiento.TIPOS_INGRESO)
+    expresiones = {
+        "ingresos": Sum("monto", filter=ingreso),
+        "egresos": Sum("monto", filter=~ingreso),
+        "movimientos": Count("id"),
+    }
+    if agrupar is None:
+        return {k: v or 0 for k, v in movimientos.aggregate(**expresiones).items()}
+    return {
+        fila[agrupar]: {k: fila[k] or 0 for k in expresiones}
+        for fila in movimientos.order_by().values(agrupar).annotate(**expresiones)
+    }
+
+@transaction.atomic
+def cerrar_periodo(modelo_cuenta, empresa, periodo):
+    """
+    Genera (o regenera) el cierre del mes de `periodo` de todas las cuentas de
+    la empresa. Parte del cierre anterior y solo lee los movimientos del mes;
+    las cuentas sin cierre previo parten de su saldo_inicial.
+    """
+    movimiento, fk, cierre_modelo = _libro(modelo_cuenta)
+    periodo = periodo.replace(day=1)
+    inicio, fin = rango_periodo(periodo)
+    cuentas = list(modelo_cuenta.objects.filter(empresa=empresa).values_list("id", "saldo_inicial"))
+    if not cuentas:
+        return 0
+    ids = [cid for cid, _ in cuentas]
+
+    anteriores = cierre_modelo.objects.filter(cuenta_id__in=ids, periodo__lt=periodo)
+    base_periodo = max(anteriores.values_list("periodo", flat=True).distinct(), default=None)
+    base = dict(
+        anteriores.filter(periodo=base_periodo).values_list("cuenta_id", "saldo_final")
+    ) if base_periodo else {}
+
+    # Apertura: cierre anterior más los meses sin cerrar, o saldo_inicial más todo lo previo
+    apertura = {cid: base.get(cid, saldo_inicial) for cid, saldo_inicial in cuentas}
+    previos = _vigentes(movimiento, **{f"{fk}_id__in": ids, "fecha__lt": inicio})
+    desde = rango_periodo(base_periodo)[1] if base_periodo else None
+    if desde is not None:
+        previos = previos.filter(Q(fecha__gte=desde) | ~Q(**{f"{fk}_id__in": list(base)}))
+    for cid, t in _totales(previos, movimiento, agrupar=f"{fk}_id").items():
+        apertura[cid] += t["ingresos"] - t["egresos"]
+
+    del_mes = _totales(
+        _vigentes(movimiento, **{f"{fk}_id__in": ids, "fecha__gte": inicio, "fecha__lt": fin}),
+        movimiento, agrupar=f"{fk}_id",
+    )
+    cierres = []
+    for cid in ids:
+        t = del_mes.get(cid, {"ingresos": CERO, "egresos": CERO, "movimientos": 0})
+        cierres.append(cierre_modelo(
+            cuenta_id=cid,
+            periodo=periodo,
+            saldo_inicial=apertura[cid],
+            ingresos=t["ingresos"],
+            egresos=t["egresos"],
+            saldo_final=apertura[cid] + t["ingresos"] - t["egresos"],
+            movimientos=t["movimientos"],
+        ))
+    cierre_modelo.objects.bulk_create(
+        cierres,
+        update_conflicts=True,
+        unique_fields=["cuenta", "periodo"],
+        update_fields=["saldo_inicial", "ingresos", "egresos", "saldo_final", "movimientos", "generado_en"],
+    )
+    return len(cierres)
+
+def saldo_antes(cuenta, limite=None, antes_id=None):
+    """
+    Saldo de la cuenta con los movimientos anteriores a `limite` (datetime) o,
+    si se da `antes_id`, anteriores al movimiento (limite, antes_id) en orden
+    (fecha, id). Sin límite, el saldo con todos los movimientos.
+    """
+    movimiento, fk, cierre_modelo = _libro(type(cuenta))
+    movimientos = _vigentes(movimiento, **{fk: cuenta})
+
+    cierres = cierre_modelo.objects.filter(cuenta=cuenta)
+    if limite is not None:
+        # Un cierre sirve si su mes terminó antes del límite
+        cierres = cierres.filter(periodo__lt=timezone.localtime(limite).date().replace(day=1))
+        punto = Q(fecha__lt=limite)
+        if antes_id is not None:
+            punto |= Q(fecha=limite, id__lt=antes_id)
+        movimientos = movimientos.filter(punto)
+
+    cierre = cierres.order_by("-periodo").values_list("periodo", "saldo_final").first()
+    if cierre:
+        saldo = cierre[1]
+        movimientos = movimientos.filter(fecha__gte=rango_periodo(cierre[0])[1])
+    else:
+        saldo = cuenta.saldo_inicial
+
+    t = _totales(movimientos, movimiento)
+    return saldo + t["ingresos"] - t["egresos"]
+
+def saldo_al(cuenta, fecha):
+    """Saldo de la cuenta al final del día `fecha`."""
+    return saldo_antes(cuenta, fin_dia(fecha))
+
+def estado_de_cuenta(cuenta, hasta=None, antes=None, limite=50):
+    """
+    Página de movimientos de la cuenta, del más nuevo al más viejo, con el
+    saldo después de cada uno. Empieza en el último movimiento del día `hasta`
+    (o el más reciente) o, con `antes`, en el anterior al movimiento de ese id.
+
+    Devuelve {"movimientos", "saldo" (después del primero de la página),
+    "saldo_anterior" (antes del último de la página), "siguiente" (id para
+    pedir la página anterior, o None)}.
+    """
+    movimiento, fk, _ = _libro(type(cuenta))
+    movimientos = _vigentes(movimiento, **{fk: cuenta})
+
+    fecha_ref = None
+    if antes is not None:
+        fecha_ref = movimiento.objects.filter(**{fk: cuenta}, pk=antes).values_list("fecha", flat=True).first()
+    if fecha_ref is not None:
+        movimientos = movimientos.filter(Q(fecha__lt=fecha_ref) | Q(fecha=fecha_ref, id__lt=antes))
+        saldo = saldo_antes(cuenta, fecha_ref, antes)
+    elif hasta is not None:
+        tope = fin_dia(hasta)
+        movimientos = movimientos.filter(fecha__lt=tope)
+        saldo = saldo_antes(cuenta, tope)
+    else:
+        saldo = saldo_antes(cuenta)
+
+    pagina = list(movimientos.order_by("-fecha", "-id")[:limite + 1])
+    siguiente = pagina[limite - 1].pk if len(pagina) > limite else None
+    pagina = pagina[:limite]
+
+    corrido = saldo
+    for m in pagina:
+        m.saldo_corrido = corrido
+        corrido -= m.monto if m.tipo in movimiento.TIPOS_INGRESO else -m.monto
+    return {"movimientos": pagina, "saldo": saldo, "saldo_anterior": corrido, "siguiente": siguiente}
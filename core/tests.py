@@ -1,3 +1,862 @@
-from django.test import TestCase
+import datetime
+import io
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.http import http_date
+from lxml import etree
+
+from . import amortizacion, busqueda, cache as cache_erp, compras, compras_xml, importaciones, kardex, precios, promociones, resumenes, tesoreria, tomas
+from .models import (
+    Bitacora, Bodega, CajaChica, CierreCuentaBancaria, CierreInventario, Cliente, Compra, CompraDetalle, CuentaBancaria, Empresa,
+    ExistenciaDiaria,
+    Factura, FacturaDetalle, ImportacionInventario, MovimientoCaja, MovimientoInventario, Perfil,
+    Prestamo, Producto, Promocion, Proveedor, PuntoVenta, ResumenDiario, TomaFisicaDetalle, TransaccionBancaria,
+)
+
+def crear_empresa(ruc="0990000000001"):
+    return Empresa.objects.create(nombre="Empresa de prueba", ruc=ruc, direccion="Guayaquil")
+
+def crear_usuario(username="cajero"):
+    return get_user_model().objects.create_user(username=username, password="x")
+
+# ==========================================
+# KARDEX
+# ==========================================
+
+class KardexTests(TestCase):
+    def setUp(self):
+        self.empresa = crear_empresa()
+        self.principal = kardex.bodega_principal(self.empresa)
+        self.sucursal = Bodega.objects.create(empresa=self.empresa, nombre="Sucursal")
+        self.producto = Producto.objects.create(empresa=self.empresa, codigo="P1", nombre="Producto", precio=5)
+
+    def mover(self, tipo, cantidad, costo=None, bodega=None):
+        movimiento = {"producto": self.producto, "tipo": tipo, "cantidad": cantidad}
+        if costo is not None:
+            movimiento["costo_unitario"] = costo
+        with self.captureOnCommitCallbacks(execute=True):
+            return kardex.registrar_movimientos(self.empresa, [movimiento], bodega=bodega)
+
+    def test_saldo_y_costo_promedio_por_movimiento(self):
+        self.mover("E", 10, costo=2)
+        self.mover("E", 10, costo=4, bodega=self.sucursal)
+        self.mover("S", 5)
+
+        filas = list(
+            MovimientoInventario.objects.filter(producto=self.producto)
+            .order_by("id").values_list("saldo", "costo_promedio", "costo_unitario")
+        )
+        self.assertEqual(filas, [
+            (Decimal("10"), Decimal("2"), Decimal("2")),
+            (Decimal("20"), Decimal("3"), Decimal("4")),
+            (Decimal("15"), Decimal("3"), Decimal("3")),
+        ])
+        self.producto.refresh_from_db()
+        self.assertEqual(self.producto.stock, Decimal("15"))
+        self.assertEqual(self.producto.costo, Decimal("3"))
+
+    def test_saldo_varios_movimientos_del_mismo_producto_en_un_lote(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            kardex.registrar_movimientos(self.empresa, [
+                {"producto": self.producto, "tipo": "E", "cantidad": 4, "costo_unitario": 1},
+                {"producto_id": self.producto.id, "tipo": "S", "cantidad": 1},
+                {"producto": self.producto, "tipo": "E", "cantidad": 2, "costo_unitario": 4},
+            ])
+        saldos = list(MovimientoInventario.objects.filter(producto=self.producto).order_by("id").values_list("saldo", flat=True))
+        self.assertEqual(saldos, [Decimal("4"), Decimal("3"), Decimal("5")])
+
+    def test_existencias_por_bodega_y_transferencia(self):
+        self.mover("E", 10, costo=2)
+        self.mover("E", 6, costo=2, bodega=self.sucursal)
+        with self.captureOnCommitCallbacks(execute=True):
+            kardex.transferir(self.empresa, self.sucursal, self.principal, [{"producto": self.producto, "cantidad": 4}])
+
+        self.assertEqual(
+            kardex.existencias_por_bodega([self.producto.id]),
+            {self.producto.id: {self.principal.id: Decimal("14"), self.sucursal.id: Decimal("2")}},
+        )
+        self.assertEqual(kardex.existencias_totales([self.producto.id]), {self.producto.id: Decimal("16")})
+        self.producto.refresh_from_db()
+        self.assertEqual(self.producto.stock, Decimal("16"))
+
+    def test_reportes_no_dependen_del_saldo_de_cada_fila(self):
+        # Dos ventas concurrentes en distintas bodegas pueden dejar un saldo que no ve a la otra
+        self.mover("E", 10, costo=2)
+        self.mover("S", 3, bodega=self.sucursal)
+        self.mover("S", 2)
+        MovimientoInventario.objects.filter(producto=self.producto, tipo="S").update(saldo=Decimal("7"))
+        hoy = timezone.localdate()
+
+        self.assertEqual(kardex.existencias_a_fecha(self.empresa, hoy)[self.producto.id], (Decimal("5"), Decimal("2")))
+        kardex.cerrar_periodo(self.empresa, hoy)
+        self.assertEqual(CierreInventario.objects.get(producto=self.producto).cantidad, Decimal("5"))
+        kardex.generar_existencias_diarias(hasta=hoy, desde=hoy)
+        self.assertEqual(ExistenciaDiaria.objects.get(producto=self.producto, fecha=hoy).cantidad, Decimal("5"))
+
+    def test_existencias_a_fecha_iguales_con_o_sin_consolidar(self):
+        d = datetime.date
+        for fecha, tipo, cantidad, costo in [
+            (d(2026, 1, 5), "E", 10, 2), (d(2026, 1, 20), "S", 4, None), (d(2026, 2, 10), "E", 6, 4),
+        ]:
+            movimiento, = self.mover(tipo, cantidad, costo=costo)
+            MovimientoInventario.objects.filter(pk=movimiento.pk).update(
+                fecha=timezone.make_aware(datetime.datetime.combine(fecha, datetime.time(10)))
+            )
+        esperadas = {
+            d(2026, 1, 4): None,
+            d(2026, 1, 19): (Decimal("10"), Decimal("2")),
+            d(2026, 1, 31): (Decimal("6"), Decimal("2")),
+            d(2026, 2, 9): (Decimal("6"), Decimal("2")),
+            d(2026, 2, 28): (Decimal("12"), Decimal("3")),
+        }
+
+        def comprobar(fuente):
+            for fecha, esperada in esperadas.items():
+                self.assertEqual(kardex.existencias_a_fecha(self.empresa, fecha).get(self.producto.id), esperada, (fuente, fecha))
+
+        comprobar("movimientos")
+        kardex.generar_existencias_diarias(hasta=d(2026, 2, 28), desde=d(2026, 1, 1))
+        self.assertEqual(ExistenciaDiaria.objects.filter(producto=self.producto).count(), 3)
+        comprobar("existencias diarias")
+        kardex.cerrar_periodo(self.empresa, d(2026, 1, 1))
+        comprobar("cierre mensual")
+        self.assertEqual(kardex.stock_a_fecha(self.producto, d(2026, 1, 31)), Decimal("6"))
+
+    def test_sincronizar_stock(self):
+        self.mover("E", 4, costo=1)
+        Producto.objects.filter(pk=self.producto.pk).update(stock=0)
+        self.assertEqual(kardex.sincronizar_stock(), 1)
+        self.assertEqual(kardex.sincronizar_stock(), 0)
+        self.producto.refresh_from_db()
+        self.assertEqual(self.producto.stock, Decimal("4"))
+
+    def test_producto_de_otra_empresa(self):
+        otra = crear_empresa(ruc="0990000000002")
+        with self.assertRaises(ValueError):
+            kardex.registrar_movimientos(otra, [{"producto": self.producto, "tipo": "E", "cantidad": 1}])
+
+# ==========================================
+# CACHÉ POR EMPRESA
+# ==========================================
+
+class CacheEmpresaTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_version_estable_hasta_invalidar_y_por_empresa(self):
+        v1 = cache_erp.version("ventas", 1)
+        self.assertEqual(cache_erp.version("ventas", 1), v1)
+        cache_erp.invalidar("ventas", 1)
+        self.assertEqual(cache_erp.version("ventas", 1), v1 + 1)
+        self.assertEqual(cache_erp.versiones(("ventas", "compras"), 1)[0], v1 + 1)
+
+        otra = cache_erp.version("ventas", 2)
+        cache_erp.invalidar("compras", 1)
+        self.assertEqual(cache_erp.version("ventas", 2), otra)
+
+    def test_version_perdida_no_repite_una_anterior(self):
+        v1 = cache_erp.version("ventas", 1)
+        cache.clear()
+        cache_erp.invalidar("ventas", 1)
+        self.assertGreater(cache_erp.version("ventas", 1), v1)
+
+    def test_obtener_recalcula_solo_tras_invalidar_sus_espacios(self):
+        llamadas = []
+
+        def obtener():
+            def calcular():
+                llamadas.append(1)
+                return len(llamadas)
+            return cache_erp.obtener(1, ("ventas", "compras"), "prueba", calcular, partes=("202603",))
+
+        self.assertEqual((obtener(), obtener()), (1, 1))
+        cache_erp.invalidar("inventario", 1)
+        self.assertEqual(obtener(), 1)
+        cache_erp.invalidar("compras", 1)
+        self.assertEqual(obtener(), 2)
+        self.assertEqual(cache_erp.estadisticas()["prueba"], {"aciertos": 2, "fallos": 2, "tasa_aciertos": 0.5})
+
+    def test_invalidar_al_confirmar_espera_el_commit(self):
+        v1 = cache_erp.version("clientes", 1)
+        with self.captureOnCommitCallbacks(execute=False) as pendientes:
+            cache_erp.invalidar_al_confirmar("clientes", 1)
+        self.assertEqual(cache_erp.version("clientes", 1), v1)
+        pendientes[0]()
+        self.assertEqual(cache_erp.version("clientes", 1), v1 + 1)
+        self.assertIsNotNone(cache_erp.ultimo_cambio(("clientes",), 1))
+
+# ==========================================
+# AUTOCOMPLETADO
+# ==========================================
+
+class IndicePrefijosTests(SimpleTestCase):
+    def setUp(self):
+        self.indice = busqueda.IndicePrefijos([
+            {"id": 1, "nombre": "José Pérez Andrade", "ruc": "0912345678"},
+            {"id": 2, "nombre": "Ferretería  El Perno", "ruc": "0990011223001"},
+            {"id": 3, "nombre": "Pedro Peña", "ruc": "1712345678"},
+            {"id": 4, "nombre": "Comercial 0912", "ruc": None},
+        ], ("nombre",), "ruc")
+
+    def buscar(self, consulta, limite=20):
+        return [r["id"] for r in self.indice.buscar(consulta, limite=limite)]
+
+    def test_prefijo_sin_tildes_ni_mayusculas(self):
+        self.assertEqual(self.buscar("PEREZ"), [1])
+        self.assertEqual(self.buscar("ferret"), [2])
+        self.assertEqual(self.buscar("pe"), [1, 2, 3])
+
+    def test_todas_las_palabras_deben_coincidir_en_cualquier_orden(self):
+        self.assertEqual(self.buscar("and jos"), [1])
+        self.assertEqual(self.buscar("pedro perez"), [])
+
+    def test_documento_primero_y_sin_duplicados(self):
+        self.assertEqual(self.buscar("0912"), [1, 4])
+        self.assertEqual(self.buscar("0990 011"), [2])
+
+    def test_limite_y_consulta_vacia(self):
+        self.assertEqual(self.buscar("pe", limite=2), [1, 2])
+        self.assertEqual(self.buscar("   "), [])
+
+class BuscarClientesTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.empresa = crear_empresa()
+
+    def crear_cliente(self, nombre, ruc):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Cliente.objects.create(
+                empresa=self.empresa, nombre=nombre, ruc=ruc, email="c@x.com", direccion="Guayaquil",
+            )
+
+    def test_indice_se_reconstruye_al_cambiar_un_cliente(self):
+        self.crear_cliente("Ana Torres", "0900000001")
+        self.assertEqual([c["nombre"] for c in busqueda.buscar_clientes(self.empresa.id, "tor")], ["Ana Torres"])
+        with self.assertNumQueries(0):
+            busqueda.buscar_clientes(self.empresa.id, "ana")
+
+        self.crear_cliente("Luis Torres", "0900000002")
+        self.assertEqual(
+            [c["nombre"] for c in busqueda.buscar_clientes(self.empresa.id, "tor")], ["Ana Torres", "Luis Torres"],
+        )
+        otra = crear_empresa(ruc="0990000000002")
+        self.assertEqual(busqueda.buscar_clientes(otra.id, "tor"), [])
+
+# ==========================================
+# PRECIOS
+# ==========================================
+
+class PreciosTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.empresa = crear_empresa()
+        self.a = Producto.objects.create(empresa=self.empresa, codigo="A", nombre="A", precio=10)
+        self.b = Producto.objects.create(empresa=self.empresa, codigo="B", nombre="B", precio=20)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.a.set_precio(2, "9")
+            self.a.set_precio(3, "8")
+            self.b.set_precio(2, "18")
+
+    def test_matriz_y_resolver_precios(self):
+        self.assertEqual(precios.matriz_precios([self.a, self.b]), {
+            self.a.id: {1: Decimal("10"), 2: Decimal("9"), 3: Decimal("8")},
+            self.b.id: {1: Decimal("20"), 2: Decimal("18"), 3: Decimal("0")},
+        })
+        self.assertEqual(precios.resolver_precios([self.a, self.b], 2), {self.a.id: Decimal("9"), self.b.id: Decimal("18")})
+
+    def test_tipos_y_precios_se_consultan_una_vez(self):
+        with self.assertNumQueries(2):
+            precios.matriz_precios([self.a, self.b])
+        with self.assertNumQueries(0):
+            precios.matriz_precios([self.a, self.b])
+
+    def test_cambio_de_precio_invalida_la_cache(self):
+        precios.matriz_precios([self.a])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.a.set_precio(2, "7")
+        self.assertEqual(precios.resolver_precios([self.a], 2), {self.a.id: Decimal("7")})
+
+    def test_set_precio_descarta_lo_precargado(self):
+        precios.precargar_precios([self.a])
+        self.assertEqual(self.a.get_precio(2), Decimal("9"))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.a.set_precio(2, "7")
+        self.assertEqual(self.a.get_precio(2), Decimal("7"))
+
+        producto = Producto.objects.prefetch_related("precios__tipo").get(pk=self.b.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            producto.set_precio(2, "15")
+        self.assertEqual(producto.get_precio(2), Decimal("15"))
+
+# ==========================================
+# PROMOCIONES
+# ==========================================
+
+class IndicePromocionesTests(SimpleTestCase):
+    def setUp(self):
+        d = lambda dia: datetime.date(2026, 3, dia)
+        self.indice = promociones.IndicePromociones([
+            {"id": 1, "producto_id": 7, "fecha_inicio": d(1), "fecha_fin": d(31), "porcentaje_descuento": Decimal("5")},
+            {"id": 2, "producto_id": 7, "fecha_inicio": d(10), "fecha_fin": d(15), "porcentaje_descuento": Decimal("20")},
+            {"id": 3, "producto_id": 7, "fecha_inicio": d(12), "fecha_fin": d(20), "porcentaje_descuento": Decimal("10")},
+        ])
+        self.d = d
+
+    def test_mayor_porcentaje_vigente_con_limites_inclusivos(self):
+        self.assertEqual(self.indice.mejor(7, self.d(9)), (Decimal("5"), 1))
+        self.assertEqual(self.indice.mejor(7, self.d(10)), (Decimal("20"), 2))
+        self.assertEqual(self.indice.mejor(7, self.d(15)), (Decimal("20"), 2))
+        self.assertEqual(self.indice.mejor(7, self.d(16)), (Decimal("10"), 3))
+        self.assertEqual(self.indice.mejor(7, self.d(31)), (Decimal("5"), 1))
+
+    def test_fuera_de_fecha_o_sin_promocion(self):
+        self.assertIsNone(self.indice.mejor(7, datetime.date(2026, 2, 28)))
+        self.assertIsNone(self.indice.mejor(7, datetime.date(2026, 4, 1)))
+        self.assertIsNone(self.indice.mejor(8, self.d(10)))
+
+class AplicarPromocionesTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.empresa = crear_empresa()
+        self.hoy = timezone.localdate()
+        self.a = Producto.objects.create(empresa=self.empresa, codigo="A", nombre="A", precio=10)
+        self.b = Producto.objects.create(empresa=self.empresa, codigo="B", nombre="B", precio=10)
+
+    def promocion(self, producto, porcentaje, **extra):
+        datos = {"fecha_inicio": self.hoy, "fecha_fin": self.hoy, **extra}
+        with self.captureOnCommitCallbacks(execute=True):
+            return Promocion.objects.create(
+                empresa=self.empresa, nombre="Promo", producto=producto, porcentaje_descuento=porcentaje, **datos,
+            )
+
+    def test_descuento_por_linea_en_dicts_e_instancias(self):
+        self.promocion(self.a, "12.5")
+        self.promocion(self.b, "50", activa=False)
+        lineas = [
+            {"producto": self.a, "cantidad": Decimal("3"), "precio_unitario": Decimal("1.99")},
+            FacturaDetalle(producto=self.b, cantidad=1, precio_unitario=10),
+        ]
+        self.assertEqual(promociones.aplicar_promociones(self.empresa.id, lineas), Decimal("0.75"))
+        self.assertEqual((lineas[0]["descuento"], lineas[1].descuento), (Decimal("0.75"), Decimal("0")))
+
+    def test_una_promocion_nueva_invalida_el_indice(self):
+        self.assertEqual(promociones.porcentajes_vigentes(self.empresa.id, [self.a.id]), {})
+        with self.assertNumQueries(0):
+            promociones.porcentajes_vigentes(self.empresa.id, [self.a.id])
+        self.promocion(self.a, "10")
+        self.assertEqual(promociones.porcentajes_vigentes(self.empresa.id, [self.a.id]), {self.a.id: Decimal("10.00")})
+
+# ==========================================
+# IMPORTACIÓN DE INVENTARIO
+# ==========================================
+
+class ImportacionTests(TestCase):
+    def setUp(self):
+        self.empresa = crear_empresa()
+        self.importacion = ImportacionInventario.objects.create(empresa=self.empresa, archivo="inventario.xlsx")
+        self.catalogos = importaciones.Catalogos(self.empresa)
+        self.tipos_precio = {n: precios.tipo_precio_id(self.empresa.id, n, crear=True) for n in (2, 3)}
+
+    def fila(self, codigo, stock, costo):
+        return {
+            "codigo": codigo, "nombre": f"Producto {codigo}", "categoria": "NA", "marca": "NA",
+            "stock": Decimal(stock), "costo": Decimal(costo), "precio1": Decimal("5"),
+            "precio2": Decimal("4"), "precio3": Decimal("3"), "maneja_iva": True, "activo": True,
+        }
+
+    def guardar(self, *filas):
+        lote = list(enumerate(filas, start=2))
+        self.catalogos.resolver(filas)
+        with self.captureOnCommitCallbacks(execute=True):
+            return importaciones.guardar_lote(self.importacion, lote, self.catalogos, self.tipos_precio)
+
+    def test_stock_se_ajusta_por_el_kardex(self):
+        self.assertEqual(self.guardar(self.fila("A1", "10", "2")), (1, 0))
+        producto = Producto.objects.get(empresa=self.empresa, codigo="A1")
+        kardex.registrar_movimientos(self.empresa, [{"producto": producto, "tipo": "S", "cantidad": 3}])
+
+        self.assertEqual(self.guardar(self.fila("A1", "4", "2")), (0, 1))
+        self.assertEqual(self.guardar(self.fila("A1", "6", "5")), (0, 1))
+
+        filas = list(
+            MovimientoInventario.objects.filter(producto=producto)
+            .order_by("id").values_list("tipo", "cantidad", "saldo", "costo_promedio")
+        )
+        self.assertEqual(filas, [
+            ("AJ_E", Decimal("10"), Decimal("10"), Decimal("2")),
+            ("S", Decimal("3"), Decimal("7"), Decimal("2")),
+            ("AJ_S", Decimal("3"), Decimal("4"), Decimal("2")),
+            ("AJ_E", Decimal("2"), Decimal("6"), Decimal("5")),
+        ])
+        producto.refresh_from_db()
+        self.assertEqual(producto.stock, Decimal("6"))
+        self.assertEqual(kardex.existencias_totales([producto.id]), {producto.id: Decimal("6")})
+
+    def test_sin_diferencia_no_hay_movimiento(self):
+        self.guardar(self.fila("A1", "0", "2"))
+        self.assertFalse(MovimientoInventario.objects.filter(empresa=self.empresa).exists())
+
+# ==========================================
+# COMPRAS
+# ==========================================
+
+class ComprasTests(TestCase):
+    def setUp(self):
+        self.empresa = crear_empresa()
+        self.proveedor = Proveedor.objects.create(empresa=self.empresa, ruc="0990000000001", nombre="Proveedor")
+        self.producto = Producto.objects.create(empresa=self.empresa, codigo="P1", nombre="Producto", precio=5)
+
+    def nueva(self, cantidad, costo):
+        compra = Compra(empresa=self.empresa, proveedor=self.proveedor, fecha=timezone.localdate())
+        return compra, [CompraDetalle(producto=self.producto, cantidad=Decimal(cantidad), costo_unitario=Decimal(costo))]
+
+    def comprar(self, cantidad, costo):
+        with self.captureOnCommitCallbacks(execute=True):
+            return compras.registrar_compra(*self.nueva(cantidad, costo))
+
+    def corregir(self, original, cantidad, costo):
+        with self.captureOnCommitCallbacks(execute=True):
+            return compras.corregir_compra(original, *self.nueva(cantidad, costo))
+
+    def ejecutar(self, operacion, compra):
+        with self.captureOnCommitCallbacks(execute=True):
+            return operacion(compra)
+
+    def estado(self):
+        self.producto.refresh_from_db()
+        resumen = ResumenDiario.objects.get(empresa=self.empresa)
+        return self.producto.stock, self.producto.costo, resumen.num_compras, resumen.total_compras
+
+    def test_anular_revierte_al_costo_de_ingreso_una_sola_vez(self):
+        primera = self.comprar("10", "2")
+        self.comprar("10", "4")
+        self.assertEqual(self.estado(), (Decimal("20"), Decimal("3"), 2, Decimal("60")))
+
+        self.assertTrue(self.ejecutar(compras.anular_compra, primera))
+        self.assertFalse(self.ejecutar(compras.anular_compra, primera))
+        self.assertEqual(self.estado(), (Decimal("10"), Decimal("4"), 1, Decimal("40")))
+        self.assertEqual(MovimientoInventario.objects.filter(tipo="AN_C").count(), 1)
+
+        self.assertTrue(self.ejecutar(compras.restaurar_compra, primera))
+        self.assertFalse(self.ejecutar(compras.restaurar_compra, primera))
+        self.assertEqual(self.estado(), (Decimal("20"), Decimal("3"), 2, Decimal("60")))
+
+    def test_corregir_reversa_y_registra_la_nueva(self):
+        self.comprar("10", "2")
+        original = self.comprar("10", "4")
+        nueva = self.corregir(original, "5", "4")
+
+        original.refresh_from_db()
+        self.assertEqual((original.estado, nueva.corrige_a_id, nueva.total), ("N", original.pk, Decimal("20")))
+        self.assertEqual(self.estado(), (Decimal("15"), Decimal("2.6667"), 2, Decimal("40")))
+        with self.assertRaises(ValueError):
+            self.corregir(original, "1", "1")
+
+# ==========================================
+# COMPRAS DESDE XML DEL SRI
+# ==========================================
+
+FACTURA_XML = """<factura id="comprobante" version="1.1.0">
+  <infoTributaria>
+    <ruc>0990000000001</ruc><razonSocial>Distribuidora S.A.</razonSocial><nombreComercial>Distri</nombreComercial>
+    <claveAcceso>{clave}</claveAcceso><estab>001</estab><ptoEmi>002</ptoEmi><secuencial>000000123</secuencial>
+    <dirMatriz>Guayaquil</dirMatriz>
+  </infoTributaria>
+  <infoFactura>
+    <fechaEmision>15/03/2026</fechaEmision><identificacionComprador>0990000000002</identificacionComprador>
+    <totalSinImpuestos>25.00</totalSinImpuestos>
+    <totalConImpuestos>
+      <totalImpuesto><codigo>2</codigo><valor>3.00</valor></totalImpuesto>
+      <totalImpuesto><codigo>2</codigo><valor>0.00</valor></totalImpuesto>
+    </totalConImpuestos>
+    <importeTotal>28.00</importeTotal>
+  </infoFactura>
+  <detalles>
+    <detalle>
+      <codigoPrincipal>A-1</codigoPrincipal><descripcion>Tornillo</descripcion><cantidad>3</cantidad>
+      <precioTotalSinImpuesto>20.00</precioTotalSinImpuesto>
+      <impuestos><impuesto><codigo>2</codigo><valor>3.00</valor></impuesto></impuestos>
+    </detalle>
+    <detalle>
+      <codigoAuxiliar>B-2</codigoAuxiliar><cantidad>2</cantidad>
+      <precioTotalSinImpuesto>5.00</precioTotalSinImpuesto>
+      <impuestos><impuesto><codigo>2</codigo><valor>0.00</valor></impuesto></impuestos>
+    </detalle>
+  </detalles>
+</factura>"""
+
+class LeerFacturaXmlTests(SimpleTestCase):
+    def factura(self, clave="1" * 49):
+        return etree.fromstring(FACTURA_XML.format(clave=clave).encode())
+
+    def test_lee_cabecera_totales_y_lineas(self):
+        datos = compras_xml.leer_factura(self.factura())
+        self.assertEqual(
+            (datos["numero"], datos["fecha"], datos["ruc"], datos["subtotal"], datos["iva"], datos["total"]),
+            ("001-002-000000123", datetime.date(2026, 3, 15), "0990000000001", Decimal("25.00"), Decimal("3.00"), Decimal("28.00")),
+        )
+        self.assertEqual(datos["lineas"], [
+            {"codigo": "A-1", "descripcion": "Tornillo", "cantidad": Decimal("3"),
+             "costo_unitario": Decimal("6.6667"), "grava_iva": True},
+            {"codigo": "B-2", "descripcion": "B-2", "cantidad": Decimal("2"),
+             "costo_unitario": Decimal("2.5000"), "grava_iva": False},
+        ])
+
+    def test_errores_de_contenido(self):
+        for buscar, reemplazo in [
+            ("15/03/2026", "2026-03-15"),
+            ("<cantidad>3</cantidad>", "<cantidad>0</cantidad>"),
+            ("<importeTotal>28.00</importeTotal>", "<importeTotal>abc</importeTotal>"),
+            ("<codigoAuxiliar>B-2</codigoAuxiliar>", ""),
+        ]:
+            with self.subTest(buscar=buscar), self.assertRaises(ValueError):
+                compras_xml.leer_factura(etree.fromstring(FACTURA_XML.replace(buscar, reemplazo).encode()))
+
+    def test_comprobantes_sueltos_y_dentro_de_autorizaciones(self):
+        cdata = FACTURA_XML.format(clave="2" * 49)
+        xml = (
+            "<lote>"
+            f"<autorizacion><estado>AUTORIZADO</estado><comprobante><![CDATA[{cdata}]]></comprobante></autorizacion>"
+            f"<autorizacion><estado>NO AUTORIZADO</estado><comprobante><![CDATA[{cdata}]]></comprobante></autorizacion>"
+            f"{FACTURA_XML.format(clave='3' * 49)}"
+            "</lote>"
+        )
+        resultados = [
+            (compras_xml.leer_factura(factura)["clave_acceso"][0] if factura is not None else None, error)
+            for factura, error in compras_xml.comprobantes(io.BytesIO(xml.encode()))
+        ]
+        self.assertEqual(resultados, [
+            ("2", None), (None, "Comprobante no autorizado (estado NO AUTORIZADO)."), ("3", None),
+        ])
+
+# ==========================================
+# TOMAS FÍSICAS
+# ==========================================
+
+class LeerConteosTests(SimpleTestCase):
+    def test_separadores_encabezado_y_lineas_sin_cantidad(self):
+        self.assertEqual(tomas.leer_conteos("codigo;cantidad\nP1;3\n\nP2;2,5\n"), [("P1", "3"), ("P2", "2,5")])
+        self.assertEqual(tomas.leer_conteos("P1\t4\nP2\t1"), [("P1", "4"), ("P2", "1")])
+        self.assertEqual(tomas.leer_conteos("P1\nP1\nP2"), [("P1", "1"), ("P1", "1"), ("P2", "1")])
+        self.assertEqual(tomas.leer_conteos("  \n"), [])
+
+class TomaFisicaTests(TestCase):
+    def setUp(self):
+        self.empresa = crear_empresa()
+        self.bodega = kardex.bodega_principal(self.empresa)
+        self.p1 = Producto.objects.create(empresa=self.empresa, codigo="P1", nombre="Uno", precio=5)
+        self.p2 = Producto.objects.create(empresa=self.empresa, codigo="P2", nombre="Dos", precio=5)
+        with self.captureOnCommitCallbacks(execute=True):
+            kardex.registrar_movimientos(self.empresa, [
+                {"producto": self.p1, "tipo": "E", "cantidad": 10, "costo_unitario": 2},
+                {"producto": self.p2, "tipo": "E", "cantidad": 4, "costo_unitario": 3},
+            ])
+        self.toma = tomas.abrir_toma(self.empresa, self.bodega)
+
+    def contados(self):
+        return dict(
+            TomaFisicaDetalle.objects.filter(toma=self.toma).values_list("producto__codigo", "cantidad_contada")
+        )
+
+    def test_abrir_congela_y_no_permite_otra_toma_en_la_bodega(self):
+        self.assertEqual(self.toma.total_productos, 2)
+        self.assertEqual(
+            dict(TomaFisicaDetalle.objects.filter(toma=self.toma).values_list("producto__codigo", "cantidad_sistema")),
+            {"P1": Decimal("10"), "P2": Decimal("4")},
+        )
+        with self.assertRaises(ValueError):
+            tomas.abrir_toma(self.empresa, self.bodega)
+
+    def test_registrar_conteos_reemplaza_o_acumula(self):
+        self.assertEqual(tomas.registrar_conteos(self.toma, [("P1", "3"), ("P1", "5")]), (1, []))
+        self.assertEqual(self.contados()["P1"], Decimal("5"))
+
+        tomas.registrar_conteos(self.toma, [("P1", "1"), ("P1", "1"), ("P2", "2")], acumular=True)
+        self.assertEqual(self.contados(), {"P1": Decimal("7"), "P2": Decimal("2")})
+
+    def test_registrar_conteos_reporta_errores_sin_frenar_el_lote(self):
+        actualizados, errores = tomas.registrar_conteos(self.toma, [("P1", "x"), ("P2", "-1"), ("P9", "1"), ("P1", "2,5")])
+        self.assertEqual(actualizados, 1)
+        self.assertEqual(len(errores), 3)
+        self.assertEqual(self.contados(), {"P1": Decimal("2.5"), "P2": None})
+
+    def test_aplicar_descuenta_lo_vendido_despues_del_congelamiento(self):
+        # Se venden 2 después de congelar y antes de contar: de 10 quedan 8 y se cuentan 7
+        with self.captureOnCommitCallbacks(execute=True):
+            kardex.registrar_movimientos(self.empresa, [{"producto": self.p1, "tipo": "S", "cantidad": 2}])
+        tomas.registrar_conteos(self.toma, [("P1", "7")])
+        with self.captureOnCommitCallbacks(execute=True):
+            tomas.aplicar_toma(self.toma, no_contados_en_cero=True)
+
+        self.toma.refresh_from_db()
+        self.assertEqual((self.toma.estado, self.toma.total_ajustes), ("C", 2))
+        self.assertEqual(self.toma.valor_diferencia, Decimal("-14"))
+        self.assertEqual(
+            kardex.existencias_totales([self.p1.id, self.p2.id]), {self.p1.id: Decimal("7"), self.p2.id: Decimal("0")},
+        )
+        with self.assertRaises(ValueError):
+            tomas.registrar_conteos(self.toma, [("P1", "1")])
+
+# ==========================================
+# ANULACIÓN DE VENTAS
+# ==========================================
+
+class AnularVentaTests(TestCase):
+    def setUp(self):
+        self.empresa = crear_empresa()
+        self.usuario = crear_usuario()
+        Perfil.objects.create(user=self.usuario, empresa=self.empresa)
+        self.client.force_login(self.usuario)
+
+        self.producto = Producto.objects.create(empresa=self.empresa, codigo="P1", nombre="Producto", precio=5)
+        cliente = Cliente.objects.create(
+            empresa=self.empresa, ruc="0900000001", nombre="Cliente", email="c@x.com", direccion="Guayaquil",
+        )
+        punto = PuntoVenta.objects.create(
+            empresa=self.empresa, nombre="Matriz", codigo_establecimiento="001", codigo_punto_emision="001",
+        )
+        self.venta = Factura.objects.create(
+            empresa=self.empresa, cliente=cliente, punto_venta=punto, usuario=self.usuario, ambiente="1",
+            secuencial="000000001", clave_acceso="0" * 49, fecha_emision=timezone.localdate(),
+            total_sin_impuestos=Decimal("10"), importe_total=Decimal("11.50"),
+        )
+        detalle = FacturaDetalle.objects.create(
+            factura=self.venta, producto=self.producto, cantidad=2, precio_unitario=5,
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            kardex.registrar_movimientos(self.empresa, [
+                {"producto": self.producto, "tipo": "E", "cantidad": 10, "costo_unitario": 1},
+                {"producto": self.producto, "tipo": "S", "cantidad": 2, "detalle_factura": detalle},
+            ])
+            resumenes.registrar_facturas([self.venta])
+
+    def test_anular_dos_veces_revierte_una_sola_vez(self):
+        url = reverse("core:anular_venta", args=[self.venta.pk])
+        for _ in range(2):
+            with self.captureOnCommitCallbacks(execute=True):
+                self.client.post(url)
+
+        self.venta.refresh_from_db()
+        self.assertEqual(self.venta.estado_pago, "N")
+        self.assertEqual(MovimientoInventario.objects.filter(tipo="AN_V").count(), 1)
+        self.assertEqual(kardex.existencias_totales([self.producto.id]), {self.producto.id: Decimal("10")})
+        resumen = ResumenDiario.objects.get(empresa=self.empresa)
+        self.assertEqual((resumen.num_facturas, resumen.total_ventas), (0, Decimal("0")))
+
+# ==========================================
+# GRÁFICO DEL DASHBOARD
+# ==========================================
+
+class DashboardGraficoTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.empresa = crear_empresa()
+        usuario = crear_usuario()
+        Perfil.objects.create(user=usuario, empresa=self.empresa)
+        self.client.force_login(usuario)
+        self.url = reverse("core:dashboard_grafico")
+
+    def test_revalidacion_con_etag_y_last_modified(self):
+        cache_erp.invalidar("ventas", self.empresa.id)
+        respuesta = self.client.get(self.url)
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(
+            self.client.get(self.url, HTTP_IF_NONE_MATCH=respuesta["ETag"]).status_code, 304,
+        )
+        self.assertEqual(
+            self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=respuesta["Last-Modified"]).status_code, 304,
+        )
+
+    def test_last_modified_no_queda_antes_del_mes_en_curso(self):
+        inicio_mes = timezone.localtime().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+        mes_pasado = inicio_mes - datetime.timedelta(days=3)
+        with mock.patch.object(cache_erp, "ultimo_cambio", return_value=mes_pasado):
+            respuesta = self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=http_date(mes_pasado.timestamp()))
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(respuesta["Last-Modified"], http_date(inicio_mes.timestamp()))
+
+# ==========================================
+# TESORERÍA
+# ==========================================
+
+class PostearTests(TestCase):
+    def setUp(self):
+        self.empresa = crear_empresa()
+        self.usuario = crear_usuario()
+        self.caja = CajaChica.objects.create(
+            empresa=self.empresa, responsable=self.usuario, nombre="Caja", saldo_actual=Decimal("10.00"),
+        )
+
+    def test_devuelve_saldo_anterior_y_nuevo(self):
+        self.assertEqual(
+            tesoreria.postear(CajaChica, self.caja.pk, "saldo_actual", Decimal("-4.00")),
+            (Decimal("10.00"), Decimal("6.00")),
+        )
+        self.caja.refresh_from_db()
+        self.assertEqual(self.caja.saldo_actual, Decimal("6.00"))
+
+    def test_rechaza_dejar_el_saldo_negativo(self):
+        with self.assertRaises(tesoreria.SaldoInsuficiente):
+            tesoreria.postear(CajaChica, self.caja.pk, "saldo_actual", Decimal("-10.01"), nombre="Caja")
+        self.caja.refresh_from_db()
+        self.assertEqual(self.caja.saldo_actual, Decimal("10.00"))
+
+    def test_sobregiro_permitido(self):
+        tesoreria.postear(CajaChica, self.caja.pk, "saldo_actual", Decimal("-15.00"), sobregiro=True)
+        self.caja.refresh_from_db()
+        self.assertEqual(self.caja.saldo_actual, Decimal("-5.00"))
+
+    def test_cuenta_inexistente(self):
+        with self.assertRaises(CajaChica.DoesNotExist):
+            tesoreria.postear(CajaChica, self.caja.pk + 1000, "saldo_actual", Decimal("-1.00"))
+
+    def test_movimiento_de_caja_guarda_saldos_y_bitacora(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            movimiento = MovimientoCaja.objects.create(
+                caja=self.caja, usuario=self.usuario, tipo="EGR", monto=Decimal("4.00"), concepto="Gasto",
+            )
+        self.assertEqual((movimiento.saldo_anterior, movimiento.saldo_nuevo), (Decimal("10.00"), Decimal("6.00")))
+        self.assertEqual(Bitacora.objects.filter(empresa=self.empresa).count(), 1)
+
+        with self.assertRaises(tesoreria.SaldoInsuficiente):
+            MovimientoCaja.objects.create(
+                caja=self.caja, usuario=self.usuario, tipo="EGR", monto=Decimal("7.00"), concepto="Gasto",
+            )
+        self.assertEqual(MovimientoCaja.objects.filter(caja=self.caja).count(), 1)
+
+    def test_retiro_bancario_sin_fondos(self):
+        cuenta = CuentaBancaria.objects.create(empresa=self.empresa, numero_cuenta="001", tipo="AH", saldo=Decimal("5.00"))
+        with self.assertRaises(tesoreria.SaldoInsuficiente):
+            TransaccionBancaria.objects.create(cuenta=cuenta, tipo="RET", monto=Decimal("6.00"), descripcion="Retiro")
+        cuenta.refresh_from_db()
+        self.assertEqual(cuenta.saldo, Decimal("5.00"))
+
+class SaldosAFechaTests(TestCase):
+    def setUp(self):
+        self.empresa = crear_empresa()
+        self.cuenta = CuentaBancaria.objects.create(
+            empresa=self.empresa, numero_cuenta="001", tipo="AH", saldo=Decimal("100.00"),
+        )
+        # (fecha local, tipo, monto); el retiro de las 23:59 del 31 es de enero
+        self.movimientos = [
+            self.transaccion(datetime.datetime(2026, 1, 10, 9), "DEP", "50.00"),
+            self.transaccion(datetime.datetime(2026, 1, 31, 23, 59), "RET", "20.00"),
+            self.transaccion(datetime.datetime(2026, 2, 5, 12), "DEP", "30.00"),
+            self.transaccion(datetime.datetime(2026, 3, 1, 0, 0), "RET", "10.00"),
+        ]
+
+    def transaccion(self, fecha, tipo, monto):
+        with self.captureOnCommitCallbacks(execute=True):
+            t = TransaccionBancaria.objects.create(cuenta=self.cuenta, tipo=tipo, monto=Decimal(monto), descripcion=tipo)
+        TransaccionBancaria.objects.filter(pk=t.pk).update(fecha=timezone.make_aware(fecha))
+        return t
+
+    def test_cierres_encadenados(self):
+        tesoreria.cerrar_periodo(CuentaBancaria, self.empresa, datetime.date(2026, 1, 1))
+        tesoreria.cerrar_periodo(CuentaBancaria, self.empresa, datetime.date(2026, 2, 1))
+        self.assertEqual(
+            list(CierreCuentaBancaria.objects.filter(cuenta=self.cuenta).order_by("periodo")
+                 .values_list("saldo_inicial", "ingresos", "egresos", "saldo_final", "movimientos")),
+            [
+                (Decimal("100.00"), Decimal("50.00"), Decimal("20.00"), Decimal("130.00"), 2),
+                (Decimal("130.00"), Decimal("30.00"), Decimal("0.00"), Decimal("160.00"), 1),
+            ],
+        )
+
+    def test_saldo_al_final_de_cada_dia(self):
+        d = datetime.date
+        esperados = {d(2026, 1, 9): "100.00", d(2026, 1, 31): "130.00", d(2026, 2, 28): "160.00", d(2026, 3, 1): "150.00"}
+        for fecha, saldo in esperados.items():
+            self.assertEqual(tesoreria.saldo_al(self.cuenta, fecha), Decimal(saldo), fecha)
+
+        # El cierre de enero es el saldo al 31; los días anteriores no lo usan
+        tesoreria.cerrar_periodo(CuentaBancaria, self.empresa, d(2026, 1, 1))
+        CierreCuentaBancaria.objects.filter(cuenta=self.cuenta).update(saldo_final=Decimal("1000.00"))
+        self.assertEqual(tesoreria.saldo_al(self.cuenta, d(2026, 1, 30)), Decimal("150.00"))
+        self.assertEqual(tesoreria.saldo_al(self.cuenta, d(2026, 1, 31)), Decimal("1000.00"))
+        self.assertEqual(tesoreria.saldo_al(self.cuenta, d(2026, 2, 28)), Decimal("1030.00"))
+
+    def test_estado_de_cuenta_paginado_hacia_atras(self):
+        pagina = tesoreria.estado_de_cuenta(self.cuenta, limite=3)
+        self.assertEqual(
+            [(m.pk, m.saldo_corrido) for m in pagina["movimientos"]],
+            [(self.movimientos[3].pk, Decimal("150.00")), (self.movimientos[2].pk, Decimal("160.00")),
+             (self.movimientos[1].pk, Decimal("130.00"))],
+        )
+        self.assertEqual((pagina["saldo_anterior"], pagina["siguiente"]), (Decimal("150.00"), self.movimientos[1].pk))
+
+        anterior = tesoreria.estado_de_cuenta(self.cuenta, antes=pagina["siguiente"], limite=3)
+        self.assertEqual([m.pk for m in anterior["movimientos"]], [self.movimientos[0].pk])
+        self.assertEqual((anterior["saldo"], anterior["saldo_anterior"], anterior["siguiente"]), (Decimal("150.00"), Decimal("100.00"), None))
+
+        hasta = tesoreria.estado_de_cuenta(self.cuenta, hasta=datetime.date(2026, 1, 31))
+        self.assertEqual((hasta["saldo"], len(hasta["movimientos"])), (Decimal("130.00"), 2))
+
+# ==========================================
+# AMORTIZACIÓN
+# ==========================================
+
+class AmortizacionTests(TestCase):
+    def test_frances_cuota_fija_y_capital_exacto(self):
+        filas = amortizacion.tabla(Decimal("1000"), Decimal("2"), 3, datetime.date(2026, 1, 15))
+        self.assertEqual([f["valor_cuota"] for f in filas], [Decimal("346.75"), Decimal("346.75"), Decimal("346.77")])
+        self.assertEqual([f["interes"] for f in filas], [Decimal("20.00"), Decimal("13.47"), Decimal("6.80")])
+        self.assertEqual(filas[-1]["saldo_pendiente"], Decimal("0.00"))
+        self.assertEqual(amortizacion.resumen(filas)["total_capital"], Decimal("1000.00"))
+
+    def test_aleman_capital_constante(self):
+        filas = amortizacion.tabla(Decimal("100"), Decimal("1"), 3, datetime.date(2026, 1, 15), "ALEMAN")
+        self.assertEqual([f["capital"] for f in filas], [Decimal("33.33"), Decimal("33.33"), Decimal("33.34")])
+        self.assertEqual([f["interes"] for f in filas], [Decimal("1.00"), Decimal("0.67"), Decimal("0.33")])
+
+    def test_plazo_largo_cierra_al_centavo(self):
+        for sistema, _ in amortizacion.SISTEMAS:
+            filas = amortizacion.tabla(Decimal("150000"), Decimal("0.75"), 360, datetime.date(2026, 1, 31), sistema)
+            self.assertEqual(len(filas), 360)
+            self.assertEqual(filas[-1]["saldo_pendiente"], Decimal("0.00"))
+            self.assertEqual(amortizacion.resumen(filas)["total_capital"], Decimal("150000.00"))
+            self.assertTrue(all(f["valor_cuota"] == f["capital"] + f["interes"] for f in filas))
+
+    def test_sin_interes_y_fechas_fin_de_mes(self):
+        filas = amortizacion.tabla(1000, 0, 3, datetime.date(2026, 1, 31))
+        self.assertEqual([f["valor_cuota"] for f in filas], [Decimal("333.33"), Decimal("333.33"), Decimal("333.34")])
+        self.assertEqual(
+            [f["fecha_vencimiento"] for f in filas],
+            [datetime.date(2026, 2, 28), datetime.date(2026, 3, 31), datetime.date(2026, 4, 30)],
+        )
+
+    def test_generar_tabla_del_prestamo(self):
+        prestamo = Prestamo.objects.create(
+            empresa=crear_empresa(), beneficiario_nombre="Beneficiario", ruc_cedula="0900000001", plazo_meses=12,
+            fecha_inicio=datetime.date(2026, 1, 1), fecha_vencimiento=datetime.date(2027, 1, 1),
+            monto_capital=Decimal("5000"), tasa_interes_mensual=Decimal("1.5"),
+        )
+        prestamo.generar_tabla_amortizacion()
+        prestamo.generar_tabla_amortizacion()
+        self.assertEqual(prestamo.cuotas.count(), 12)
+        self.assertEqual(sum(prestamo.cuotas.values_list("capital", flat=True)), Decimal("5000.00"))
+
+    def test_simulacion_rechaza_parametros_invalidos(self):
+        self.client.force_login(crear_usuario())
+        url = reverse("core:prestamo_simular")
+        respuesta = self.client.get(url, {"capital": "1000", "tasa": "2", "plazo": "3", "fecha_inicio": "2026-01-15"})
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(respuesta.json()["total_capital"], "1000.00")
+        for parametros in (
+            {"capital": "x", "plazo": "3"},
+            {"capital": "NaN", "plazo": "3"},
+            {"capital": "Infinity", "plazo": "3"},
+            {"capital": "1E20", "plazo": "3"},
+            {"capital": "1000", "tasa": "-1", "plazo": "3"},
+            {"capital": "1000", "plazo": "0"},
+            {"capital": "1000", "plazo": "3", "sistema": "OTRO"},
+            {"capital": "1000", "plazo": "3", "fecha_inicio": "2026-02-30"},
+        ):
+            with self.subTest(parametros=parametros):
+                self.assertEqual(self.client.get(url, parametros).status_code, 400)
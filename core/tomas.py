@@ -0,0 +1,241 @@
+# Ubicación: core/tomas.py
+"""
+Tomas físicas de inventario por bodega.
+
+1. abrir_toma congela con un solo INSERT ... SELECT la existencia de cada
+   producto activo en la bodega (suma de sus franjas) y su costo promedio.
+2. registrar_conteos recibe lotes de (código, cantidad) desde el escáner o un
+   CSV y los escribe con un UPDATE ... FROM (VALUES ...) por lote.
+3. aplicar_toma calcula todas las diferencias con un solo UPDATE (contado
+   menos lo congelado y menos los movimientos de la bodega entre el
+   congelamiento y el momento del conteo) y registra los ajustes con una
+   sola llamada a kardex.registrar_movimientos.
+
+Mientras la toma está abierta no se bloquea ningún producto: se puede seguir
+vendiendo y comprando con normalidad.
+"""
+import csv
+import io
+from decimal import Decimal, InvalidOperation
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from . import kardex
+from .models import MovimientoInventario, Producto, StockBodega, TomaFisica, TomaFisicaDetalle
+
+CERO = Decimal("0")
+TAMANO_LOTE = 1000
+
+# ==========================================
+# APERTURA (CONGELAMIENTO)
+# ==========================================
+
+_SQL_CONGELAR = """
+    INSERT INTO {detalle} (toma_id, producto_id, cantidad_sistema, costo_unitario)
+    SELECT %(toma)s, p.id, COALESCE(SUM(s.cantidad), 0), COALESCE(p.costo, 0)
+    FROM {producto} p
+    LEFT JOIN {stock} s ON s.producto_id = p.id AND s.bodega_id = %(bodega)s
+    WHERE p.empresa_id = %(empresa)s AND p.activo
+    GROUP BY p.id, p.costo
+"""
+
+@transaction.atomic
+def abrir_toma(empresa, bodega, usuario=None, observacion=""):
+    """Crea la toma y congela la existencia esperada de la bodega."""
+    if TomaFisica.objects.filter(bodega=bodega, estado="A").exists():
+        raise ValueError(f'Ya hay una toma física abierta para la bodega "{bodega}".')
+
+    toma = TomaFisica.objects.create(
+        empresa=empresa, bodega=bodega, usuario=usuario, observacion=observacion
+    )
+    sql = _SQL_CONGELAR.format(
+        detalle=TomaFisicaDetalle._meta.db_table,
+        producto=Producto._meta.db_table,
+        stock=StockBodega._meta.db_table,
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, {"toma": toma.id, "empresa": empresa.id, "bodega": bodega.id})
+        toma.total_productos = cursor.rowcount
+    toma.save(update_fields=["total_productos"])
+    return toma
+
+# ==========================================
+# CONTEOS POR LOTES
+# ==========================================
+
+def leer_conteos(texto):
+    """
+    Convierte el texto de un CSV o de un escáner en una lista de
+    (código, cantidad). Acepta coma, punto y coma o tabulador como separador;
+    una línea con solo el código cuenta como 1 unidad. Un encabezado en la
+    primera línea se ignora.
+    """
+    lineas = [l for l in texto.splitlines() if l.strip()]
+    if not lineas:
+        return []
+    try:
+        dialecto = csv.Sniffer().sniff(lineas[0], delimiters=",;\t")
+    except csv.Error:
+        dialecto = csv.excel
+
+    conteos = []
+    for i, fila in enumerate(csv.reader(io.StringIO("\n".join(lineas)), dialecto)):
+        fila = [c.strip() for c in fila]
+        if not fila or not fila[0]:
+            continue
+        cantidad = fila[1] if len(fila) > 1 and fila[1] else "1"
+        if i == 0:
+            try:
+                Decimal(cantidad.replace(",", "."))
+            except InvalidOperation:
+                continue  # encabezado
+        conteos.append((fila[0], cantidad))
+    return conteos
+
+_SQL_CONTEOS = """
+    UPDATE {detalle} d
+    SET cantidad_contada = {base} + v.cantidad,
+        contado_en = %s
+    FROM (VALUES {valores}) AS v(producto_id, cantidad)
+    WHERE d.toma_id = %s AND d.producto_id = v.producto_id
+"""
+
+def registrar_conteos(toma, conteos, acumular=False):
+    """
+    Guarda un lote de conteos [(código, cantidad), ...]. Con acumular=True
+    cada cantidad se suma a lo ya contado (lecturas de escáner); si no,
+    reemplaza el conteo anterior (carga de CSV). Devuelve
+    (productos actualizados, [errores]).
+    """
+    if toma.estado != "A":
+        raise ValueError("La toma física ya no está abierta.")
+
+    errores = []
+    cantidades = {}
+    for codigo, cantidad in conteos:
+        codigo = str(codigo or "").strip()
+        if not codigo:
+            continue
+        try:
+            cantidad = Decimal(str(cantidad).strip().replace(",", "."))
+        except InvalidOperation:
+            errores.append(f"{codigo}: cantidad inválida ({cantidad}).")
+            continue
+        if cantidad < 0:
+            errores.append(f"{codigo}: la cantidad no puede ser negativa.")
+            continue
+        cantidades[codigo] = cantidades.get(codigo, CERO) + cantidad if acumular else cantidad
+
+    if not cantidades:
+        return 0, errores
+
+    ids = dict(
+        TomaFisicaDetalle.objects
+        .filter(toma=toma, producto__codigo__in=list(cantidades))
+        .values_list("producto__codigo", "producto_id")
+    )
+    for codigo in cantidades.keys() - ids.keys():
+        errores.append(f"{codigo}: el producto no existe o no forma parte de esta toma.")
+
+    valores = [(ids[codigo], cantidad) for codigo, cantidad in cantidades.items() if codigo in ids]
+    ahora = timezone.now()
+    actualizados = 0
+    with connection.cursor() as cursor:
+        for i in range(0, len(valores), TAMANO_LOTE):
+            lote = valores[i:i + TAMANO_LOTE]
+            sql = _SQL_CONTEOS.format(
+                detalle=TomaFisicaDetalle._meta.db_table,
+                base="COALESCE(d.cantidad_contada, 0)" if acumular else "0",
+                valores=", ".join(["(%s::bigint, %s::numeric)"] * len(lote)),
+            )
+            cursor.execute(sql, [ahora] + [v for fila in lote for v in fila] + [toma.id])
+            actualizados += cursor.rowcount
+    return actualizados, errores
+
+def resumen(toma):
+    """Contadores de avance de la toma para la pantalla de conteo."""
+    contados = TomaFisicaDetalle.objects.filter(toma=toma, cantidad_contada__isnull=False).count()
+    return {
+        "total": toma.total_productos,
+        "contados": contados,
+        "pendientes": toma.total_productos - contados,
+    }
+
+# ==========================================
+# APLICACIÓN DE DIFERENCIAS
+# ==========================================
+
+# Diferencia = contado - (congelado + neto de movimientos de la bodega
+# entre el congelamiento y el momento en que se contó el producto)
+_SQL_DIFERENCIAS = """
+    UPDATE {detalle} d
+    SET diferencia = d.cantidad_contada - d.cantidad_sistema - COALESCE((
+        SELECT SUM(CASE WHEN m.tipo = ANY(%(entradas)s) THEN m.cantidad ELSE -m.cantidad END)
+        FROM {movimiento} m
+        WHERE m.producto_id = d.producto_id
+          AND m.bodega_id = %(bodega)s
+          AND m.fecha > %(desde)s
+          AND m.fecha <= d.contado_en
+    ), 0)
+    WHERE d.toma_id = %(toma)s AND d.cantidad_contada IS NOT NULL
+"""
+
+@transaction.atomic
+def aplicar_toma(toma, usuario=None, no_contados_en_cero=False):
+    """
+    Calcula las diferencias y registra los ajustes en el kardex. Los
+    productos sin conteo se ignoran, salvo con no_contados_en_cero=True
+    (se asume que no se encontró ninguna unidad).
+    """
+    toma = TomaFisica.objects.select_for_update(of=("self",)).select_related("empresa", "bodega").get(pk=toma.pk)
+    if toma.estado != "A":
+        raise ValueError("La toma física ya no está abierta.")
+
+    ahora = timezone.now()
+    if no_contados_en_cero:
+        TomaFisicaDetalle.objects.filter(toma=toma, cantidad_contada__isnull=True).update(
+            cantidad_contada=0, contado_en=ahora
+        )
+
+    sql = _SQL_DIFERENCIAS.format(
+        detalle=TomaFisicaDetalle._meta.db_table,
+        movimiento=MovimientoInventario._meta.db_table,
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, {
+            "entradas": list(MovimientoInventario.TIPOS_ENTRADA),
+            "bodega": toma.bodega_id,
+            "desde": toma.congelado_en,
+            "toma": toma.id,
+        })
+
+    ajustes = list(
+        TomaFisicaDetalle.objects
+        .filter(toma=toma, diferencia__isnull=False)
+        .exclude(diferencia=0)
+        .values_list("producto_id", "diferencia", "costo_unitario")
+    )
+    # Los faltantes salen y los sobrantes entran al costo promedio vigente
+    kardex.registrar_movimientos(toma.empresa, [
+        {
+            "producto_id": producto_id,
+            "tipo": "AJ_E" if diferencia > 0 else "AJ_S",
+            "cantidad": abs(diferencia),
+            "observacion": f"Toma física #{toma.id}",
+        }
+        for producto_id, diferencia, _ in ajustes
+    ], usuario=usuario, documento=f"TOMA-{toma.id}", bodega=toma.bodega)
+
+    toma.estado = "C"
+    toma.aplicada_en = ahora
+    toma.total_ajustes = len(ajustes)
+    toma.valor_diferencia = sum((diferencia * costo for _, diferencia, costo in ajustes), CERO)
+    toma.save(update_fields=["estado", "aplicada_en", "total_ajustes", "valor_diferencia"])
+    return toma
+
+def anular_toma(toma):
+    """Descarta una toma abierta sin tocar el inventario."""
+    actualizadas = TomaFisica.objects.filter(pk=toma.pk, estado="A").update(estado="N")
+    if not actualizadas:
+        raise ValueError("Solo se pueden anular tomas abiertas.")
@@ -0,0 +1,49 @@
+# Ubicación: core/transacciones.py
+"""
+Trabajo diferido hasta que se confirma la transacción, juntado en un lote.
+
+lote_al_confirmar devuelve un contenedor por transacción y clave; quien lo
+llama le agrega elementos y, al confirmarse la transacción, el contenedor
+completo se entrega una sola vez a `ejecutar` (un INSERT, un recálculo). Lo
+usan la Bitacora de core/tesoreria.py y el refresco de la hoja de ruta de
+cobros/ruta.py.
+
+Si la transacción (o el punto de guardado donde se creó el lote) se revierte,
+Django descarta el callback: el lote deja de valer y la próxima llamada abre
+otro. Django no expone si un callback sigue pendiente, así que eso se lee de
+connection.run_on_commit; es el único lugar del proyecto que lo hace.
+"""
+from django.db import transaction
+
+def _pendiente(conexion, confirmar):
+    """True si `confirmar` sigue registrado para ejecutarse al confirmar la transacción."""
+    return any(entrada[1] is confirmar for entrada in conexion.run_on_commit)
+
+def lote_al_confirmar(clave, ejecutar, nuevo=list):
+    """
+    Contenedor (creado con nuevo()) de la transacción en curso para `clave`;
+    ejecutar(contenedor) se registra con transaction.on_commit la primera vez.
+    Fuera de una transacción devuelve None: quien llama ejecuta en el momento.
+    """
+    conexion = transaction.get_connection()
+    if not conexion.in_atomic_block:
+        return None
+
+    lotes = getattr(conexion, "lotes_al_confirmar", None)
+    if lotes is None:
+        lotes = conexion.lotes_al_confirmar = {}
+    actual = lotes.get(clave)
+    if actual is not None and _pendiente(conexion, actual[1]):
+        return actual[0]
+
+    lote = nuevo()
+
+    def confirmar():
+        if lotes.get(clave) is registro:
+            del lotes[clave]
+        ejecutar(lote)
+
+    registro = (lote, confirmar)
+    lotes[clave] = registro
+    transaction.on_commit(confirmar)
+    return lote
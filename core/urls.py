@@ -10,6 +10,7 @@ urlpatterns = [
     
     # Ruta principal
     path('', views.dashboard_view, name='dashboard'),
+    path('dashboard/grafico/', views.dashboard_grafico_view, name='dashboard_grafico'),
     
     # --- Rutas del Módulo de Proveedores ---
     path('proveedores/', views.proveedores_view, name='proveedores'),
@@ -32,6 +33,8 @@ urlpatterns = [
     path('compras/<int:pk>/anular/', views.anular_compra_view, name='anular_compra'),
     path('compras/<int:pk>/restaurar/', views.restaurar_compra_view, name='restaurar_compra'),
     path('compras/<int:pk>/corregir/', views.corregir_compra_view, name='corregir_compra'),
+    path('compras/importar-xml/', views.importar_compras_xml_view, name='importar_compras_xml'),
+    path('compras/importar-xml/<int:pk>/estado/', views.importacion_compras_estado_view, name='importacion_compras_estado'),
     path('ventas/<int:pk>/pdf/', views.venta_pdf_view, name='venta_pdf'),
     path('ventas/<int:pk>/anular/', views.anular_venta_view, name='anular_venta'),
     path('configuracion-empresa/', views.config_empresa_view, name='config_empresa'),
@@ -73,10 +76,13 @@ urlpatterns = [
     # 2. Crear un nuevo préstamo
     path('finanzas/prestamos/nuevo/', views.prestamo_create, name='prestamo_create'),
     
+    # Vista previa de la tabla para el formulario (JSON, no guarda)
+    path('finanzas/prestamos/simular/', views.prestamo_simular_ajax, name='prestamo_simular'),
+
     # 3. Ver detalle del préstamo (Aquí se muestra la Tabla de Amortización)
     path('finanzas/prestamos/<int:pk>/', views.prestamo_detail, name='prestamo_detail'),
     
-    # 4. Acción para (Re)calcular la Tabla de Amortización (Sistema Francés)
+    # 4. Acción para (Re)calcular la Tabla de Amortización (francés o alemán, según el préstamo)
     path('finanzas/prestamos/<int:pk>/calcular/', views.generar_tabla_view, name='prestamo_generar_tabla'),
     
     # 5. Registrar un pago/abono de cuota
@@ -119,9 +125,17 @@ urlpatterns = [
         name='password_reset_complete'
     ),
     path('backup-db/', views.ejecutar_backup, name='backup_db'),
+    path('sistema/cache/', views.cache_estadisticas_view, name='cache_estadisticas'),
 
     path('inventario/importar/', views.importar_inventario_excel_view, name='inventario_importar'),
+    path('inventario/importar/<int:pk>/estado/', views.importacion_inventario_estado_view, name='inventario_importacion_estado'),
     path("inventario/", views.inventario_view, name="inventario"),
+    path("inventario/valorizado/", views.inventario_valorizado_view, name="inventario_valorizado"),
+    path("inventario/tomas/", views.tomas_fisicas_view, name="tomas_fisicas"),
+    path("inventario/tomas/<int:pk>/", views.toma_fisica_view, name="toma_fisica"),
+    path("inventario/tomas/<int:pk>/escanear/", views.toma_fisica_escanear_ajax, name="toma_fisica_escanear"),
+    path("inventario/tomas/<int:pk>/aplicar/", views.toma_fisica_aplicar_view, name="toma_fisica_aplicar"),
+    path("inventario/tomas/<int:pk>/anular/", views.toma_fisica_anular_view, name="toma_fisica_anular"),
     path("inventario/<int:pk>/editar/", views.editar_producto_view, name="editar_producto"),
     path("inventario/<int:pk>/eliminar/", views.eliminar_producto_view, name="eliminar_producto"),
 
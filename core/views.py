@@ -12,8 +12,7 @@ from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.utils import timezone
-from django.db.models import Sum
-from django.db.models.functions import TruncMonth
+from django.utils.dateparse import parse_date
 from django.db import IntegrityError
 from core.models import *  # Ajusta el import según tu estructura
 from .forms import *
@@ -28,10 +27,15 @@ from weasyprint import HTML
 # Importa tus modelos
 from .models import *
 from .forms import *
+from .fechas import inicio_dia
+from . import amortizacion, busqueda, cache as cache_erp, compras, kardex, precios, procesos, promociones, resumenes, tesoreria, tomas
 import time
 import openpyxl
 from django.conf import settings
 from functools import wraps
+from django.urls import reverse
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.views.decorators.http import condition
 # ------------------------------
 # LOGIN Y LOGOUT
 # ------------------------------
@@ -203,16 +207,12 @@ def dashboard_view(request):
     # SUPERUSUARIO: entra al dashboard general
     # ==========================================
     if request.user.is_superuser:
-        total_vendido_mes = Factura.objects.filter(
-            fecha_emision__year=today.year,
-            fecha_emision__month=today.month
-        ).aggregate(total=Sum('importe_total'))['total'] or 0
-
-        total_comprado_mes = Compra.objects.filter(
-            fecha__year=today.year,
-            fecha__month=today.month,
-            estado='A'
-        ).aggregate(total=Sum('total'))['total'] or 0
+        # Totales del mes desde el resumen diario (core/resumenes.py)
+        inicio_mes = today.date().replace(day=1)
+        fin_mes = inicio_mes + relativedelta(months=1, days=-1)
+        mes = resumenes.totales(None, inicio_mes, fin_mes)
+        total_vendido_mes = mes['total_ventas']
+        total_comprado_mes = mes['total_compras']
 
         stock_bajo = Producto.objects.filter(
             stock__lt=5
@@ -229,47 +229,6 @@ def dashboard_view(request):
             'facturas_pendientes': facturas_pendientes_sri,
         }
 
-        fecha_inicio = today - relativedelta(months=5)
-        fecha_inicio = fecha_inicio.replace(day=1)
-
-        ventas_por_mes = Factura.objects.filter(
-            fecha_emision__gte=fecha_inicio
-        ).annotate(
-            mes=TruncMonth('fecha_emision')
-        ).values('mes').annotate(
-            total_ventas=Sum('importe_total')
-        ).order_by('mes')
-
-        compras_por_mes = Compra.objects.filter(
-            fecha__gte=fecha_inicio
-        ).annotate(
-            mes=TruncMonth('fecha')
-        ).values('mes').annotate(
-            total_compras=Sum('total')
-        ).order_by('mes')
-
-        ventas_dict = {
-            v['mes'].strftime('%b %Y'): float(v['total_ventas'])
-            for v in ventas_por_mes if v['mes']
-        }
-        compras_dict = {
-            c['mes'].strftime('%b %Y'): float(c['total_compras'])
-            for c in compras_por_mes if c['mes']
-        }
-
-        labels_grafico = [
-            (fecha_inicio + relativedelta(months=i)).strftime('%b %Y')
-            for i in range(6)
-        ]
-        data_ventas = [ventas_dict.get(label, 0) for label in labels_grafico]
-        data_compras = [compras_dict.get(label, 0) for label in labels_grafico]
-
-        grafico_data = {
-            "labels": labels_grafico,
-            "ventas": data_ventas,
-            "compras": data_compras,
-        }
-
         clientes_nuevos_mes = Cliente.objects.filter(
             fecha_creacion__year=today.year,
             fecha_creacion__month=today.month
@@ -280,7 +239,6 @@ def dashboard_view(request):
             'es_superadmin': True,
             'indicadores': indicadores,
             'clientes_nuevos': clientes_nuevos_mes,
-            'grafico_json': json.dumps(grafico_data),
         }
 
         return render(request, 'core/dashboard.html', context)
@@ -305,18 +263,15 @@ def dashboard_view(request):
 
     empresa_actual = request.user.perfil.empresa
 
-    total_vendido_mes = Factura.objects.filter(
-        empresa=empresa_actual,
-        fecha_emision__year=today.year,
-        fecha_emision__month=today.month
-    ).aggregate(total=Sum('importe_total'))['total'] or 0
-
-    total_comprado_mes = Compra.objects.filter(
-        empresa=empresa_actual,
-        fecha__year=today.year,
-        fecha__month=today.month,
-        estado='A'
-    ).aggregate(total=Sum('total'))['total'] or 0
+    # Totales del mes desde el resumen diario (core/resumenes.py)
+    inicio_mes = today.date().replace(day=1)
+    fin_mes = inicio_mes + relativedelta(months=1, days=-1)
+    mes = cache_erp.obtener(
+        empresa_actual.id, ("ventas", "compras"), "dashboard_totales",
+        lambda: resumenes.totales(empresa_actual, inicio_mes, fin_mes), partes=(inicio_mes,),
+    )
+    total_vendido_mes = mes['total_ventas']
+    total_comprado_mes = mes['total_compras']
 
     stock_bajo = Producto.objects.filter(
         empresa=empresa_actual,
@@ -335,49 +290,6 @@ def dashboard_view(request):
         'facturas_pendientes': facturas_pendientes_sri,
     }
 
-    fecha_inicio = today - relativedelta(months=5)
-    fecha_inicio = fecha_inicio.replace(day=1)
-
-    ventas_por_mes = Factura.objects.filter(
-        empresa=empresa_actual,
-        fecha_emision__gte=fecha_inicio
-    ).annotate(
-        mes=TruncMonth('fecha_emision')
-    ).values('mes').annotate(
-        total_ventas=Sum('importe_total')
-    ).order_by('mes')
-
-    compras_por_mes = Compra.objects.filter(
-        empresa=empresa_actual,
-        fecha__gte=fecha_inicio
-    ).annotate(
-        mes=TruncMonth('fecha')
-    ).values('mes').annotate(
-        total_compras=Sum('total')
-    ).order_by('mes')
-
-    ventas_dict = {
-        v['mes'].strftime('%b %Y'): float(v['total_ventas'])
-        for v in ventas_por_mes if v['mes']
-    }
-    compras_dict = {
-        c['mes'].strftime('%b %Y'): float(c['total_compras'])
-        for c in compras_por_mes if c['mes']
-    }
-
-    labels_grafico = [
-        (fecha_inicio + relativedelta(months=i)).strftime('%b %Y')
-        for i in range(6)
-    ]
-    data_ventas = [ventas_dict.get(label, 0) for label in labels_grafico]
-    data_compras = [compras_dict.get(label, 0) for label in labels_grafico]
-
-    grafico_data = {
-        "labels": labels_grafico,
-        "ventas": data_ventas,
-        "compras": data_compras,
-    }
-
     clientes_nuevos_mes = Cliente.objects.filter(
         empresa=empresa_actual,
         fecha_creacion__year=today.year,
@@ -389,11 +301,80 @@ def dashboard_view(request):
         'es_superadmin': False,
         'indicadores': indicadores,
         'clientes_nuevos': clientes_nuevos_mes,
-        'grafico_json': json.dumps(grafico_data),
     }
 
     return render(request, 'core/dashboard.html', context)
 
+# ==========================================
+# GRÁFICO DEL DASHBOARD (JSON CONDICIONAL)
+# ==========================================
+# El navegador lo pide aparte y revalida con If-None-Match / If-Modified-Since:
+# mientras no cambien ventas ni compras de la empresa se responde 304 sin
+# consultar la base.
+
+ESPACIOS_GRAFICO = ("ventas", "compras")
+
+def _serie_ventas_compras(empresa, today):
+    """Ventas y compras de los últimos 6 meses desde el resumen diario (empresa=None: todas)."""
+    fecha_inicio = (today - relativedelta(months=5)).replace(day=1)
+    fin_mes = today.replace(day=1) + relativedelta(months=1, days=-1)
+    meses = resumenes.por_mes(empresa, fecha_inicio, fin_mes)
+
+    labels_grafico = [
+        (fecha_inicio + relativedelta(months=i)).strftime('%b %Y')
+        for i in range(6)
+    ]
+    valores = {m.strftime('%b %Y'): (float(v), float(c)) for m, (v, c) in meses.items()}
+    return {
+        "labels": labels_grafico,
+        "ventas": [valores.get(label, (0, 0))[0] for label in labels_grafico],
+        "compras": [valores.get(label, (0, 0))[1] for label in labels_grafico],
+    }
+
+def _empresa_grafico(request):
+    """Empresa del gráfico; None para el superusuario (todas las empresas, sin caché)."""
+    if request.user.is_superuser:
+        return None
+    perfil = getattr(request.user, 'perfil', None)
+    return perfil.empresa if perfil else None
+
+def _etag_grafico(request):
+    empresa = _empresa_grafico(request)
+    if empresa is None:
+        return None
+    # El mes entra en la ETag: la ventana de 6 meses se corre aunque no haya cambios
+    return cache_erp.etag(empresa.id, ESPACIOS_GRAFICO, "grafico", timezone.localdate().strftime('%Y%m'))
+
+def _modificado_grafico(request):
+    empresa = _empresa_grafico(request)
+    if empresa is None:
+        return None
+    cambio = cache_erp.ultimo_cambio(ESPACIOS_GRAFICO, empresa.id)
+    if cambio is None:
+        return None
+    # Como en la ETag: al empezar el mes la ventana se corre aunque no haya cambios
+    return max(cambio, inicio_dia(timezone.localdate().replace(day=1)))
+
+@login_required
+@condition(etag_func=_etag_grafico, last_modified_func=_modificado_grafico)
+def dashboard_grafico_view(request):
+    empresa = _empresa_grafico(request)
+    if empresa is None and not request.user.is_superuser:
+        return JsonResponse({'status': 'error', 'message': 'Usuario sin empresa asignada.'}, status=403)
+
+    hoy = timezone.localdate()
+    if empresa is None:
+        respuesta = JsonResponse(_serie_ventas_compras(None, hoy))
+    else:
+        respuesta = cache_erp.respuesta_json(
+            empresa.id, ESPACIOS_GRAFICO, "dashboard_grafico",
+            lambda: _serie_ventas_compras(empresa, hoy), partes=(hoy.strftime('%Y%m'),),
+        )
+    # Privado (depende del usuario) pero revalidable: el navegador guarda la copia y pide 304
+    patch_cache_control(respuesta, private=True, no_cache=True)
+    patch_vary_headers(respuesta, ('Cookie',))
+    return respuesta
+
 # ------------------------------
 # VISTAS DE MÓDULOS (PLACEHOLDERS)
 # ------------------------------
@@ -595,34 +576,10 @@ def compras_view(request):
         # Verificamos que ambos sean válidos
         if compra_form.is_valid() and detalle_formset.is_valid():
             try:
-                # Usamos una transacción para asegurar que todo se guarde o nada se guarde
-                with transaction.atomic():
-                    # Guardamos la cabecera de la compra
-                    compra = compra_form.save(commit=False)
-                    compra.empresa = empresa_actual
-                    compra.save() # Se genera el ID de la compra
-
-                    # Iteramos sobre los detalles del formset
-                    total_compra = 0
-                    for detalle_form in detalle_formset:
-                        detalle = detalle_form.save(commit=False)
-                        detalle.compra = compra # Asignamos la compra recién creada
-                        
-                        # Calculamos el subtotal de la línea
-                        subtotal = detalle.cantidad * detalle.costo_unitario
-                        total_compra += subtotal
-                        
-                        detalle.save()
-                        
-                        # Actualizar el stock del producto
-                        producto = detalle.producto
-                        producto.stock += detalle.cantidad
-                        producto.save()
-                    
-                    # Actualizamos el total en la cabecera de la compra
-                    compra.total = total_compra
-                    compra.subtotal = total_compra # Asumiendo que no hay IVA por ahora
-                    compra.save()
+                compra = compra_form.save(commit=False)
+                compra.empresa = empresa_actual
+                # Cabecera, detalles y kardex en una sola transacción (core/compras.py)
+                compras.registrar_compra(compra, _detalles_compra(detalle_formset), usuario=request.user)
 
                 messages.success(request, '¡Compra registrada exitosamente!')
                 return redirect('compras')
@@ -638,38 +595,80 @@ def compras_view(request):
         detalle_formset = CompraDetalleFormSet(form_kwargs={'empresa': empresa_actual})
     
     # Obtenemos las compras existentes para mostrarlas en la tabla
-    compras = Compra.objects.filter(empresa=empresa_actual).order_by('-fecha')
+    compras_lista = Compra.objects.filter(empresa=empresa_actual).order_by('-fecha')
     
     context = {
-        'compras': compras,
+        'compras': compras_lista,
         'compra_form': compra_form,
         'detalle_formset': detalle_formset,
+        'ultima_importacion': ImportacionCompras.objects.filter(empresa=empresa_actual).first(),
     }
     return render(request, 'compras.html', context)
 
+def _detalles_compra(detalle_formset):
+    """Detalles sin guardar del formset, omitiendo las filas extra vacías."""
+    return [
+        form.save(commit=False)
+        for form in detalle_formset
+        if form.has_changed() and not form.cleaned_data.get('DELETE')
+    ]
+
+@login_required
+def importar_compras_xml_view(request):
+    """
+    Carga facturas de proveedores desde XML autorizados del SRI (un .xml o un
+    .zip con varios). Se procesa en segundo plano (core/compras_xml.py).
+    """
+    if request.method != 'POST':
+        return redirect('core:compras')
+
+    archivo = request.FILES.get('archivo_xml')
+    if not archivo or not archivo.name.lower().endswith(('.xml', '.zip')):
+        messages.error(request, 'Debes seleccionar un archivo .xml o .zip con los comprobantes.')
+        return redirect('core:compras')
+
+    empresa = request.user.perfil.empresa
+
+    # Una importación a la vez por empresa
+    en_curso = procesos.en_curso(ImportacionCompras, empresa)
+    if en_curso:
+        messages.warning(request, f'Ya hay una carga de comprobantes en proceso (#{en_curso.id}). Espera a que termine.')
+        return redirect('core:compras')
+
+    importacion = ImportacionCompras.objects.create(
+        empresa=empresa,
+        usuario=request.user,
+        archivo=archivo,
+        crear_productos=request.POST.get('crear_productos') == '1',
+    )
+    transaction.on_commit(
+        lambda: app.send_task('core.tasks.importar_compras_xml_task', args=[importacion.id])
+    )
+
+    messages.info(request, f'Carga de comprobantes #{importacion.id} en proceso. Puedes seguir trabajando mientras se procesa.')
+    return redirect('core:compras')
+
+@login_required
+def importacion_compras_estado_view(request, pk):
+    """ Avance de una carga de comprobantes XML (JSON para el polling de la plantilla) """
+    importacion = get_object_or_404(ImportacionCompras, pk=pk, empresa=request.user.perfil.empresa)
+    return JsonResponse(procesos.estado(
+        importacion, 'total_archivos', 'archivos_leidos', 'comprobantes', 'creadas', 'duplicadas', 'productos_creados',
+    ))
+
 @login_required
 def anular_compra_view(request, pk):
     empresa_actual = request.user.perfil.empresa
     compra = get_object_or_404(Compra, pk=pk, empresa=empresa_actual)
 
-    if compra.estado == 'A':
-        try:
-            with transaction.atomic():
-                compra.estado = 'N' # Cambia el estado a Anulada
-                compra.save()
-
-                # Revertir el stock de cada producto en el detalle
-                for detalle in compra.detalles.all():
-                    producto = detalle.producto
-                    producto.stock -= detalle.cantidad
-                    # Aquí podrías recalcular el costo promedio si lo necesitas
-                    producto.save()
-            
+    try:
+        # Revierte el stock al costo con que entró cada línea
+        if compras.anular_compra(compra, usuario=request.user):
             messages.success(request, f'Compra #{compra.id} anulada y stock revertido.')
-        except Exception as e:
-            messages.error(request, f'Error al anular la compra: {e}')
-    else:
-        messages.warning(request, 'Esta compra ya está anulada.')
+        else:
+            messages.warning(request, 'Esta compra ya está anulada.')
+    except Exception as e:
+        messages.error(request, f'Error al anular la compra: {e}')
 
     return redirect('compras')
 
@@ -695,96 +694,67 @@ def restaurar_compra_view(request, pk):
     empresa_actual = request.user.perfil.empresa
     compra = get_object_or_404(Compra, pk=pk, empresa=empresa_actual)
 
-    if compra.estado == 'N':
-        try:
-            with transaction.atomic():
-                compra.estado = 'A' # Cambia el estado a Activa
-                compra.save()
-
-                # Re-aplicar el stock y recalcular costo promedio
-                for detalle in compra.detalles.all():
-                    producto = detalle.producto
-                    stock_antiguo = producto.stock
-                    costo_antiguo = producto.costo
-                    cantidad_nueva = detalle.cantidad
-                    costo_nuevo_compra = detalle.costo_unitario
-                    
-                    nuevo_stock = stock_antiguo + cantidad_nueva
-                    if nuevo_stock > 0:
-                        producto.costo = ((stock_antiguo * costo_antiguo) + (cantidad_nueva * costo_nuevo_compra)) / nuevo_stock
-                    else:
-                        producto.costo = costo_nuevo_compra
-                    
-                    producto.stock = nuevo_stock
-                    producto.save()
-            
+    try:
+        # Re-aplica el stock y recalcula el costo promedio
+        if compras.restaurar_compra(compra, usuario=request.user):
             messages.success(request, f'Compra #{compra.id} restaurada y stock actualizado.')
-        except Exception as e:
-            messages.error(request, f'Error al restaurar la compra: {e}')
-    else:
-        messages.warning(request, 'Esta compra no está anulada.')
+        else:
+            messages.warning(request, 'Esta compra no está anulada.')
+    except Exception as e:
+        messages.error(request, f'Error al restaurar la compra: {e}')
 
     return redirect('compras')
 
 @login_required
 def corregir_compra_view(request, pk):
+    """
+    GET muestra la compra en el formulario; POST anula la original y registra
+    la versión corregida en una sola transacción (core/compras.py).
+    """
     empresa_actual = request.user.perfil.empresa
     compra_original = get_object_or_404(Compra, pk=pk, empresa=empresa_actual)
 
-    if compra_original.estado == 'A':
-        # ... (la lógica de anulación no cambia) ...
-        try:
-            with transaction.atomic():
-                compra_original.estado = 'N'
-                compra_original.save()
-                for detalle in compra_original.detalles.all():
-                    producto = detalle.producto
-                    producto.stock -= detalle.cantidad
-                    producto.save()
-            messages.info(request, f'Compra #{compra_original.id} anulada. Por favor, guarde la nueva versión corregida.')
-        except Exception as e:
-            messages.error(request, f'Error al anular la compra original para corrección: {e}')
-            return redirect('compras')
-    else:
+    if compra_original.estado != 'A':
         messages.warning(request, 'Solo se pueden corregir compras activas.')
         return redirect('compras')
 
-    # Preparar datos para el nuevo formulario
-    compra_initial_data = {
-        'proveedor': compra_original.proveedor,
-        'fecha': compra_original.fecha.strftime('%Y-%m-%d'),
-    }
-    
-    detalle_initial_data = []
-    # Preparamos una lista separada para el JavaScript
-    detalle_json_data = [] 
-    for detalle in compra_original.detalles.all():
-        detalle_initial_data.append({
-            'producto': detalle.producto,
-            'cantidad': detalle.cantidad,
-            'costo_unitario': detalle.costo_unitario,
-        })
-        # Añadimos el precio de venta a nuestra lista para JS
-        detalle_json_data.append({
-            'precio_venta': detalle.producto.precio
-        })
-    
-    compra_form = CompraForm(initial=compra_initial_data, empresa=empresa_actual)
     CompraDetalleFormSetEdit = formset_factory(CompraDetalleForm, extra=0)
-    detalle_formset = CompraDetalleFormSetEdit(initial=detalle_initial_data, form_kwargs={'empresa': empresa_actual})
 
-    compras = Compra.objects.filter(empresa=empresa_actual).order_by('-fecha')
-    
+    if request.method == 'POST':
+        compra_form = CompraForm(request.POST, empresa=empresa_actual)
+        detalle_formset = CompraDetalleFormSetEdit(request.POST, form_kwargs={'empresa': empresa_actual})
+        if compra_form.is_valid() and detalle_formset.is_valid():
+            try:
+                nueva = compra_form.save(commit=False)
+                nueva.empresa = empresa_actual
+                compras.corregir_compra(compra_original, nueva, _detalles_compra(detalle_formset), usuario=request.user)
+                messages.success(request, f'Compra #{compra_original.id} corregida: se registró la compra #{nueva.id}.')
+                return redirect('compras')
+            except Exception as e:
+                messages.error(request, f'Error al corregir la compra: {e}')
+        else:
+            messages.error(request, 'Por favor, corrige los errores en el formulario.')
+    else:
+        compra_form = CompraForm(initial={
+            'proveedor': compra_original.proveedor,
+            'fecha': compra_original.fecha.strftime('%Y-%m-%d'),
+            'bodega': compra_original.bodega,
+        }, empresa=empresa_actual)
+        detalle_formset = CompraDetalleFormSetEdit(initial=[
+            {'producto': d.producto_id, 'cantidad': d.cantidad, 'costo_unitario': d.costo_unitario}
+            for d in compra_original.detalles.all()
+        ], form_kwargs={'empresa': empresa_actual})
+
     context = {
-        'compras': compras,
+        'compras': Compra.objects.filter(empresa=empresa_actual).order_by('-fecha'),
         'compra_form': compra_form,
         'detalle_formset': detalle_formset,
-        'open_modal_on_load': True,
-        # Pasamos los datos extra como JSON a la plantilla
-        'detalle_json_data': json.dumps(detalle_json_data, cls=DjangoJSONEncoder),
+        'compra_corregida': compra_original,
+        'ultima_importacion': ImportacionCompras.objects.filter(empresa=empresa_actual).first(),
     }
     return render(request, 'compras.html', context)
 
+
 def crear_nueva_venta(factura_data, detalles_data, empresa, usuario):
     """
     Función de servicio para crear una factura (venta) con su detalle.
@@ -832,6 +802,11 @@ def crear_nueva_venta(factura_data, detalles_data, empresa, usuario):
         iva_rate = iva_porcentaje / 100
         codigo_porcentaje_iva = IVA_MAP.get(str(int(iva_porcentaje)), '2')
 
+        # Promociones vigentes: una sola pasada sobre el carrito (core/promociones.py)
+        total_descuento = promociones.aplicar_promociones(
+            empresa.id, detalles_data, factura_data['fecha_emision']
+        )
+
         for detalle_data in detalles_data:
             cantidad = detalle_data.get('cantidad', 0)
             precio = detalle_data.get('precio_unitario', 0)
@@ -847,6 +822,7 @@ def crear_nueva_venta(factura_data, detalles_data, empresa, usuario):
         
         # 5. Asignar totales a la factura y guardar
         factura.total_sin_impuestos = total_sin_impuestos
+        factura.total_descuento = total_descuento
         factura.importe_total = total_sin_impuestos + iva_total
         factura.total_con_impuestos = {
             'totalImpuesto': [{'codigo': '2', 'codigoPorcentaje': codigo_porcentaje_iva, 'baseImponible': f"{base_imponible_iva:.2f}", 'valor': f"{iva_total:.2f}"}]
@@ -872,6 +848,13 @@ def crear_nueva_venta(factura_data, detalles_data, empresa, usuario):
         
         FacturaDetalle.objects.bulk_create(detalles_a_crear)
 
+        # Kardex: salida de stock al costo promedio vigente
+        kardex.registrar_movimientos(empresa, [
+            {'producto_id': d.producto_id, 'tipo': 'S', 'cantidad': d.cantidad, 'detalle_factura': d}
+            for d in detalles_a_crear
+        ], usuario=usuario, documento=f"FAC-{secuencial_str}", bodega=punto_venta.bodega)
+        resumenes.registrar_facturas([factura])
+
         # 7. Lanzar la tarea de Celery
         app.send_task('core.tasks.enviar_factura_sri_task', args=[factura.id])
 
@@ -909,26 +892,22 @@ def ventas_view(request):
                     # 2. Guardar Detalles y Actualizar Stock
                     detalles = detalle_formset.save(commit=False)
                     total_sin_impuestos = Decimal(0)
+                    total_descuento = promociones.aplicar_promociones(
+                        empresa.id, detalles, factura.fecha_emision
+                    )
                     
                     for detalle in detalles:
                         detalle.factura = factura
-                        detalle.precio_total_sin_impuesto = detalle.cantidad * detalle.precio_unitario
+                        detalle.precio_total_sin_impuesto = detalle.cantidad * detalle.precio_unitario - detalle.descuento
                         detalle.save()
                         
                         total_sin_impuestos += detalle.precio_total_sin_impuesto
-                        
-                        # -- MOVIMIENTO DE INVENTARIO (DESCONTAR STOCK) --
-                        producto = detalle.producto
-                        producto.stock -= detalle.cantidad
-                        producto.save()
-                        
-                        MovimientoInventario.objects.create(
-                            empresa=empresa,
-                            producto=producto,
-                            tipo='S', # Salida
-                            cantidad=detalle.cantidad,
-                            detalle_factura=detalle
-                        )
+
+                    # -- MOVIMIENTO DE INVENTARIO (DESCONTAR STOCK al costo promedio) --
+                    kardex.registrar_movimientos(empresa, [
+                        {'producto_id': d.producto_id, 'tipo': 'S', 'cantidad': d.cantidad, 'detalle_factura': d}
+                        for d in detalles
+                    ], usuario=request.user, documento=f"FAC-{factura.secuencial}", bodega=punto_venta.bodega)
                     
                     # Para manejar los eliminados en el formset
                     for obj in detalle_formset.deleted_objects:
@@ -938,6 +917,7 @@ def ventas_view(request):
                     # (Lógica simplificada de impuestos, ajustar según necesidad)
                     iva_total = total_sin_impuestos * (empresa.iva_porcentaje / 100)
                     factura.total_sin_impuestos = total_sin_impuestos
+                    factura.total_descuento = total_descuento
                     factura.total_con_impuestos = {"iva": str(iva_total)} # JSON
                     factura.importe_total = total_sin_impuestos + iva_total
                     
@@ -946,6 +926,7 @@ def ventas_view(request):
                     punto_venta.save()
                     
                     factura.save()
+                    resumenes.registrar_facturas([factura])
                     
                     return redirect('ventas') # Redirigir a la misma página (limpia)
                     
@@ -974,18 +955,25 @@ def buscar_productos_ajax(request):
     query = request.GET.get('q', '')
     empresa = request.user.perfil.empresa
     
-    productos = Producto.objects.filter(
+    productos = list(Producto.objects.filter(
         Q(nombre__icontains=query) | Q(codigo__icontains=query),
         empresa=empresa,
         activo=True
-    )[:20] # Limitar resultados
-    
+    )[:20]) # Limitar resultados
+
+    # Precios 2/3 de todos los resultados en una sola resolución (caché por empresa)
+    matriz = precios.matriz_precios(productos)
+    promos = promociones.porcentajes_vigentes(empresa.id, [p.id for p in productos])
+
     results = []
     for p in productos:
         results.append({
             'id': p.id,
             'text': f"{p.codigo} - {p.nombre}", # Lo que ve el usuario
             'precio': str(p.precio),            # Datos extra para JS
+            'precio_2': str(matriz[p.id][2]),
+            'precio_3': str(matriz[p.id][3]),
+            'descuento_pct': str(promos.get(p.id, 0)),
             'stock': str(p.stock)
         })
     
@@ -993,27 +981,26 @@ def buscar_productos_ajax(request):
 
 @login_required
 def buscar_clientes_ajax(request):
-    """ Busca clientes para el Select2 """
+    """ Busca clientes para el Select2 (índice de prefijos en memoria, ver core/busqueda.py) """
     query = request.GET.get('q', '')
     empresa = request.user.perfil.empresa
-    
-    clientes = Cliente.objects.filter(
-        Q(nombre__icontains=query) | Q(ruc__icontains=query),
-        empresa=empresa
-    )[:20]
-    
-    results = [{'id': c.id, 'text': c.nombre} for c in clientes]
+
+    clientes = busqueda.buscar_clientes(empresa.id, query, limite=20)
+
+    results = [{'id': c['id'], 'text': c['nombre']} for c in clientes]
     return JsonResponse({'results': results})
 
 @login_required
 def agregar_cliente_ajax(request):
     if request.method == 'POST':
-        form = ClienteAjaxForm(request.POST)
+        empresa = request.user.perfil.empresa
+        form = ClienteAjaxForm(request.POST, empresa=empresa)
         if form.is_valid():
             cliente = form.save(commit=False)
-            cliente.empresa = request.user.perfil.empresa
+            cliente.empresa = empresa
             cliente.save()
             return JsonResponse({'status': 'success', 'id': cliente.id, 'text': cliente.nombre})
+        return JsonResponse({'status': 'error', 'errors': form.errors})
     return JsonResponse({'status': 'error'})
 
 @login_required
@@ -1032,22 +1019,38 @@ def anular_venta_view(request, pk):
     empresa_actual = request.user.perfil.empresa
     venta = get_object_or_404(Factura, pk=pk, empresa=empresa_actual)
 
-    if venta.estado_pago != 'N':
-        try:
-            with transaction.atomic():
-                venta.estado_pago = 'N'
-                venta.save()
-                for detalle in venta.detalles.all():
-                    producto = detalle.producto
-                    producto.stock += detalle.cantidad
-                    producto.save()
-            messages.success(request, f'Venta #{venta.secuencial} anulada y stock restaurado.')
-        except Exception as e:
-            messages.error(request, f'Error al anular la venta: {e}')
-    else:
-        messages.warning(request, 'Esta venta ya se encuentra anulada.')
-    
-    return redirect('ventas')
+    try:
+        with transaction.atomic():
+            # Update condicional: de dos anulaciones simultáneas solo una cambia la fila
+            # y solo esa revierte el stock y resta la venta de los resúmenes
+            if not Factura.objects.filter(pk=venta.pk).exclude(estado_pago='N').update(estado_pago='N'):
+                messages.warning(request, 'Esta venta ya se encuentra anulada.')
+                return redirect('core:ventas')
+            venta.estado_pago = 'N'
+            # El update no dispara post_save
+            cache_erp.invalidar_al_confirmar('ventas', empresa_actual.id)
+
+            # Reingresa el stock al mismo costo y en la misma bodega de donde salió; las
+            # líneas sin salida registrada vuelven a la bodega actual del punto de venta
+            detalles = list(venta.detalles.all())
+            salidas = kardex.salidas_de_venta([d.id for d in detalles])
+            kardex.registrar_movimientos(empresa_actual, [
+                {
+                    'producto_id': d.producto_id,
+                    'tipo': 'AN_V',
+                    'cantidad': d.cantidad,
+                    'costo_unitario': salidas.get(d.id, (None, None))[0],
+                    'bodega_id': salidas.get(d.id, (None, None))[1],
+                    'detalle_factura': d,
+                }
+                for d in detalles
+            ], usuario=request.user, documento=f"ANULA-FAC-{venta.secuencial}", bodega=venta.punto_venta.bodega)
+            resumenes.registrar_facturas([venta], signo=-1)
+        messages.success(request, f'Venta #{venta.secuencial} anulada y stock restaurado.')
+    except Exception as e:
+        messages.error(request, f'Error al anular la venta: {e}')
+
+    return redirect('core:ventas')
 
 @login_required
 def venta_pdf_view(request, pk):
@@ -1066,8 +1069,24 @@ def venta_pdf_view(request, pk):
 def config_empresa_view(request):
     empresa_actual = request.user.perfil.empresa
 
-    if request.method == 'POST':
-        form = PuntoVentaForm(request.POST)
+    form = PuntoVentaForm(empresa=empresa_actual)
+    bodega_form = BodegaForm(empresa=empresa_actual)
+
+    if request.method == 'POST' and 'guardar_bodega' in request.POST:
+        bodega_form = BodegaForm(request.POST, empresa=empresa_actual)
+        if bodega_form.is_valid():
+            with transaction.atomic():
+                bodega = bodega_form.save(commit=False)
+                bodega.empresa = empresa_actual
+                if bodega.es_principal:
+                    # Solo una bodega principal por empresa
+                    Bodega.objects.filter(empresa=empresa_actual, es_principal=True).update(es_principal=False)
+                bodega.save()
+            messages.success(request, f'Bodega "{bodega.nombre}" creada.')
+            return redirect('config_empresa')
+        messages.error(request, 'Hubo un error al crear la bodega. Por favor, revisa los datos.')
+    elif request.method == 'POST':
+        form = PuntoVentaForm(request.POST, empresa=empresa_actual)
         if form.is_valid():
             punto_venta = form.save(commit=False)
             punto_venta.empresa = empresa_actual
@@ -1076,13 +1095,14 @@ def config_empresa_view(request):
             return redirect('config_empresa')
         else:
             messages.error(request, 'Hubo un error en el formulario. Por favor, revisa los datos.')
-    else:
-        form = PuntoVentaForm()
 
-    puntos_venta = PuntoVenta.objects.filter(empresa=empresa_actual)
+    puntos_venta = PuntoVenta.objects.filter(empresa=empresa_actual).select_related('bodega')
+    bodegas = Bodega.objects.filter(empresa=empresa_actual).order_by('-es_principal', 'nombre')
     context = {
         'form': form,
+        'bodega_form': bodega_form,
         'puntos_venta': puntos_venta,
+        'bodegas': bodegas,
         'empresa': empresa_actual, # Pasamos los datos de la empresa para mostrarlos
     }
     return render(request, 'config_empresa.html', context)
@@ -1093,13 +1113,13 @@ def editar_puntoventa_view(request, pk):
     punto_venta = get_object_or_404(PuntoVenta, pk=pk, empresa=empresa_actual)
 
     if request.method == 'POST':
-        form = PuntoVentaForm(request.POST, instance=punto_venta)
+        form = PuntoVentaForm(request.POST, instance=punto_venta, empresa=empresa_actual)
         if form.is_valid():
             form.save()
             messages.success(request, f'Punto de Venta "{punto_venta.nombre}" actualizado.')
             return redirect('config_empresa')
     else:
-        form = PuntoVentaForm(instance=punto_venta)
+        form = PuntoVentaForm(instance=punto_venta, empresa=empresa_actual)
 
     context = {
         'form': form,
@@ -1174,7 +1194,7 @@ def clientes_view(request):
     
     # --- LÓGICA PARA CREAR UN NUEVO CLIENTE (POST) ---
     if request.method == 'POST':
-        form = ClienteForm(request.POST)
+        form = ClienteForm(request.POST, empresa=empresa_actual)
         if form.is_valid():
             cliente = form.save(commit=False)
             cliente.empresa = empresa_actual # Asigna la empresa del usuario actual
@@ -1218,6 +1238,7 @@ def importar_clientes_excel_view(request):
             if not nombre or not ruc:
                 continue
 
+            # (empresa, ruc) es único en BD: una fila repetida actualiza, no duplica
             cliente, creado = Cliente.objects.update_or_create(
                 empresa=empresa,
                 ruc=ruc,
@@ -1320,14 +1341,13 @@ def buscar_proveedores_ajax(request):
     search_term = request.GET.get('q', '').strip()
     
     if search_term:
-        # Busca proveedores cuya razón social O RUC contenga el término de búsqueda
-        proveedores = Proveedor.objects.filter(
-            Q(nombre__icontains=search_term) | Q(ruc__icontains=search_term),
-            empresa=request.user.perfil.empresa
-        ).order_by('nombre')[:10] # Limita a 10 resultados por eficiencia
+        # Busca por prefijo de nombre/razón social o RUC en el índice en memoria
+        proveedores = busqueda.buscar_proveedores(
+            request.user.perfil.empresa.id, search_term, limite=10
+        )
 
         results = [
-            {'id': p.id, 'text': f"{p.razon_social} - {p.ruc}"} 
+            {'id': p['id'], 'text': f"{p['razon_social']} - {p['ruc']}"} 
             for p in proveedores
         ]
     else:
@@ -1441,6 +1461,13 @@ def convertir_cotizacion_a_factura_ajax(request):
                 )
             FacturaDetalle.objects.bulk_create(detalles_a_crear)
 
+            # Kardex: salida de stock al costo promedio vigente
+            kardex.registrar_movimientos(empresa, [
+                {'producto_id': d.producto_id, 'tipo': 'S', 'cantidad': d.cantidad, 'detalle_factura': d}
+                for d in detalles_a_crear
+            ], usuario=request.user, documento=f"FAC-{secuencial_str}", bodega=punto_venta.bodega)
+            resumenes.registrar_facturas([nueva_factura])
+
             # 5. Actualizar y enlazar la cotización
             cotizacion.factura_generada = nueva_factura
             cotizacion.estado = 'F'
@@ -1505,18 +1532,6 @@ def cotizaciones(request):
         'cotizaciones': cotizaciones_list
     })
 
-def buscar_clientes_ajax(request):
-    """AJAX: Busca clientes para el Select2"""
-    query = request.GET.get('q', '')
-    data = []
-    if query:
-        qs = Cliente.objects.filter(
-            Q(nombre__icontains=query) | Q(dni__icontains=query)
-        ).values('id', 'nombre', 'dni')[:20]
-        for c in qs:
-            data.append({'id': c['id'], 'text': f"{c['nombre']} ({c['dni']})"})
-    return JsonResponse({'results': data})
-
 @login_required
 def detalle_cotizacion(request, cotizacion_id):
     """
@@ -1586,27 +1601,26 @@ def crear_cotizacion(request):
                     
                     codigo_porcentaje_iva = IVA_MAP.get(str(int(iva_porcentaje)), '2')
 
-                    # Filtramos las filas que no están marcadas para borrarse
-                    detalles_validos = [f for f in formset.cleaned_data if f and not f.get('DELETE', False)]
+                    # Líneas sin guardar (el formset ya descarta las marcadas para borrarse)
+                    detalles = formset.save(commit=False)
 
-                    if not detalles_validos:
+                    if not detalles:
                         raise Exception("Se debe añadir al menos un producto a la cotización.")
 
-                    for detalle_data in detalles_validos:
-                        cantidad = detalle_data.get('cantidad', 0)
-                        precio = detalle_data.get('precio_unitario', 0)
-                        descuento = detalle_data.get('descuento', 0)
-                        producto = detalle_data.get('producto')
-                        
-                        subtotal_linea = (cantidad * precio) - descuento
+                    # Promociones vigentes: una sola pasada sobre todas las líneas
+                    total_descuento = promociones.aplicar_promociones(empresa.id, detalles)
+
+                    for detalle in detalles:
+                        subtotal_linea = (detalle.cantidad * detalle.precio_unitario) - detalle.descuento
                         total_sin_impuestos += subtotal_linea
                         
-                        if producto and producto.maneja_iva:
+                        if detalle.producto.maneja_iva:
                             base_imponible_iva += subtotal_linea
                             iva_total += subtotal_linea * iva_rate
                     
                     # 3. Asignar los totales calculados al objeto de cotización
                     cotizacion.total_sin_impuestos = total_sin_impuestos
+                    cotizacion.total_descuento = total_descuento
                     cotizacion.importe_total = total_sin_impuestos + iva_total
                     cotizacion.total_con_impuestos = {
                         'totalImpuesto': [{
@@ -1621,7 +1635,6 @@ def crear_cotizacion(request):
                     cotizacion.save()
 
                     # 5. Guardar las líneas de detalle asociándolas a la cotización
-                    detalles = formset.save(commit=False)
                     for detalle in detalles:
                         detalle.cotizacion = cotizacion
                         detalle.precio_total_sin_impuesto = (detalle.cantidad * detalle.precio_unitario) - detalle.descuento
@@ -1658,13 +1671,28 @@ def crear_cotizacion(request):
         formset = CotizacionDetalleFormSet(queryset=CotizacionDetalle.objects.none(), prefix='detalles')
 
     # Preparar el contexto para la plantilla
-    productos = Producto.objects.filter(empresa=empresa, activo=True).values('id', 'nombre', 'precio', 'maneja_iva')
+    productos = list(
+        Producto.objects.filter(empresa=empresa, activo=True)
+        .only('id', 'empresa', 'nombre', 'precio', 'maneja_iva')
+    )
+    matriz = precios.matriz_precios(productos)
+    productos_json = [
+        {
+            'id': p.id,
+            'nombre': p.nombre,
+            'precio': p.precio,
+            'precio_2': matriz[p.id][2],
+            'precio_3': matriz[p.id][3],
+            'maneja_iva': p.maneja_iva,
+        }
+        for p in productos
+    ]
     iva_rate_decimal = empresa.iva_porcentaje / 100
 
     context = {
         'form': form,
         'formset': formset,
-        'productos_json': list(productos),
+        'productos_json': productos_json,
         'iva_rate': iva_rate_decimal,
         'iva_porcentaje': empresa.iva_porcentaje,
     }
@@ -1760,6 +1788,40 @@ def registrar_abono_prestamo(request, pk):
     # Aquí iría la lógica para subir el comprobante y registrar pago
     return HttpResponse(f"Formulario para abonar al préstamo {pk}")
 
+# Mismos límites que Prestamo: monto_capital (12, 2) y tasa_interes_mensual (5, 2)
+SIMULACION_CAPITAL_MAXIMO = Decimal('1E10')
+SIMULACION_TASA_MAXIMA = Decimal('1000')
+
+@login_required
+def prestamo_simular_ajax(request):
+    """
+    Vista previa de la tabla de amortización para el formulario de préstamo:
+    ?capital=&tasa=&plazo=&fecha_inicio=YYYY-MM-DD&sistema=FRANCES|ALEMAN.
+    Se calcula en memoria, no guarda nada.
+    """
+    try:
+        capital = Decimal(request.GET.get('capital', ''))
+        tasa = Decimal(request.GET.get('tasa', '0'))
+        plazo = int(request.GET.get('plazo', ''))
+        # parse_date lanza ValueError con fechas bien formadas pero inexistentes (2024-02-30)
+        fecha_inicio = parse_date(request.GET.get('fecha_inicio', '')) or timezone.localdate()
+    except (InvalidOperation, ValueError):
+        return JsonResponse({'status': 'error', 'message': 'Capital, tasa, plazo y fecha deben ser válidos.'}, status=400)
+
+    sistema = request.GET.get('sistema', 'FRANCES')
+    if (
+        sistema not in dict(amortizacion.SISTEMAS) or not 0 < plazo <= 600
+        or not capital.is_finite() or not 0 < capital < SIMULACION_CAPITAL_MAXIMO
+        or not tasa.is_finite() or not 0 <= tasa < SIMULACION_TASA_MAXIMA
+    ):
+        return JsonResponse({'status': 'error', 'message': 'Parámetros fuera de rango.'}, status=400)
+
+    filas = amortizacion.tabla(capital, tasa, plazo, fecha_inicio, sistema)
+    return JsonResponse(
+        {'status': 'success', 'cuotas': filas, **amortizacion.resumen(filas)},
+        encoder=DjangoJSONEncoder,
+    )
+
 def generar_tabla_view(request, pk):
     prestamo = get_object_or_404(Prestamo, pk=pk)
     # Ejecutamos la lógica matemática
@@ -1784,16 +1846,19 @@ def buscar_productos_venta_ajax(request):
 
     if query:
         # Busca por nombre o código
-        productos = Producto.objects.filter(
+        productos = list(Producto.objects.filter(
             Q(nombre__icontains=query) | Q(codigo__icontains=query)
-        ).values('id', 'codigo', 'nombre', 'precio', 'stock')[:20]
+        ).only('id', 'empresa', 'codigo', 'nombre', 'precio', 'stock')[:20])
+        matriz = precios.matriz_precios(productos)
 
         for p in productos:
             data.append({
-                'id': p['id'],
-                'text': f"{p['codigo']} - {p['nombre']} (Stock: {p['stock']})",
-                'precio': float(p['precio']), # Importante: Precio de Venta
-                'stock': p['stock']
+                'id': p.id,
+                'text': f"{p.codigo} - {p.nombre} (Stock: {p.stock})",
+                'precio': float(p.precio), # Importante: Precio de Venta
+                'precio_2': float(matriz[p.id][2]),
+                'precio_3': float(matriz[p.id][3]),
+                'stock': p.stock
             })
     
     return JsonResponse({'results': data})
@@ -1840,16 +1905,21 @@ def editar_cuenta_view(request, pk):
         
         cuenta.tipo = request.POST.get('tipo')
         
-        # AGREGAR ESTO: Para que se guarde el cambio de saldo
-        saldo_value = request.POST.get('saldo')
-        if saldo_value:
-            cuenta.saldo = saldo_value
-
         # AGREGAR ESTO: Para que se guarde el cambio de color
         cuenta.color = request.POST.get('color')
 
-        # 3. Guardamos en la BD
-        cuenta.save()
+        try:
+            with transaction.atomic():
+                # AGREGAR ESTO: Para que se guarde el cambio de saldo (queda como transacción de ajuste)
+                saldo_value = request.POST.get('saldo')
+                if saldo_value:
+                    cuenta.ajustar_saldo(saldo_value)
+
+                # 3. Guardamos en la BD
+                cuenta.save()
+        except tesoreria.SaldoInsuficiente as e:
+            messages.error(request, e.message)
+            return redirect('caja_list')
         
         messages.success(request, 'Datos de la cuenta actualizados correctamente.')
     
@@ -1859,6 +1929,7 @@ def editar_cuenta_view(request, pk):
 def editar_cuenta(request, id):
     # Buscamos la cuenta por ID, si no existe da error 404
     cuenta = get_object_or_404(CuentaBancaria, id=id)
+    saldo_anterior = cuenta.saldo
 
     if request.method == 'POST':
         # Cargamos el formulario con los datos que llegan (request.POST) 
@@ -1866,7 +1937,15 @@ def editar_cuenta(request, id):
         form = CuentaBancariaForm(request.POST, instance=cuenta)
         
         if form.is_valid():
-            form.save()
+            cuenta = form.save(commit=False)
+            nuevo_saldo, cuenta.saldo = cuenta.saldo, saldo_anterior
+            try:
+                with transaction.atomic():
+                    cuenta.ajustar_saldo(nuevo_saldo)
+                    cuenta.save()
+            except tesoreria.SaldoInsuficiente as e:
+                messages.error(request, e.message)
+                return redirect('caja_list')
             messages.success(request, '¡Cuenta actualizada correctamente!')
             return redirect('caja_list') # O el nombre de tu URL de lista
         else:
@@ -1933,27 +2012,47 @@ def cuenta_movimientos_view(request, pk):
         tipo = request.POST.get('tipo') 
         
         # Creamos la transacción pasándole el monto ya convertido
-        TransaccionBancaria.objects.create(
-            cuenta=cuenta,
-            descripcion=descripcion,
-            monto=monto, # Ahora sí es un número
-            tipo=tipo
-        )
+        try:
+            TransaccionBancaria.objects.create(
+                cuenta=cuenta,
+                descripcion=descripcion,
+                monto=monto, # Ahora sí es un número
+                tipo=tipo
+            )
+        except tesoreria.SaldoInsuficiente as e:
+            messages.error(request, e.message)
+            return redirect('core:cuenta_movimientos', pk=cuenta.pk)
         
         # El método .save() de tu modelo se encargará del saldo automáticamente
         
         messages.success(request, 'Transacción registrada correctamente.')
-        return redirect('cuenta_movimientos', pk=cuenta.pk)
+        return redirect('core:cuenta_movimientos', pk=cuenta.pk)
 
-    # 3. Listar transacciones
-    movimientos = cuenta.transacciones.all().order_by('-fecha', '-id')
+    # 3. Listar transacciones: una página hacia atrás desde ?hasta=YYYY-MM-DD o ?antes=<id>
+    try:
+        hasta = parse_date(request.GET.get('hasta') or '')
+    except ValueError:
+        hasta = None
+    antes = request.GET.get('antes')
+    estado = tesoreria.estado_de_cuenta(
+        cuenta, hasta=hasta, antes=int(antes) if antes and antes.isdigit() else None
+    )
 
     context = {
         'cuenta': cuenta,
-        'movimientos': movimientos
+        'movimientos': estado['movimientos'],
+        'estado': estado,
+        'hasta': hasta,
     }
     return render(request, 'finanzas/movimientos.html', context)
 
+@staff_member_required
+def cache_estadisticas_view(request):
+    """ Aciertos y fallos de la caché por helper (core/cache.py), sumando todas las empresas. Un POST pone los contadores en cero. """
+    if request.method == 'POST':
+        cache_erp.reiniciar_estadisticas()
+    return JsonResponse({'status': 'ok', 'estadisticas': cache_erp.estadisticas()})
+
 #backup_db.py
 @staff_member_required
 def ejecutar_backup(request):
@@ -1991,6 +2090,9 @@ def importar_inventario_excel_view(request):
     categoría/categoria
     proveedor/marca
     precio 1/precio1/precio
+
+    El archivo se guarda y se procesa en segundo plano (core/importaciones.py);
+    el avance se consulta en importacion_inventario_estado_view.
     """
     if request.method != "POST":
         return redirect("core:inventario")
@@ -2002,256 +2104,38 @@ def importar_inventario_excel_view(request):
         messages.error(request, "Debes seleccionar un archivo Excel (.xlsx).")
         return redirect("core:inventario")
 
-    empresa = request.user.perfil.empresa
-
-    from core.models import (
-        Producto, Categoria, Marca, Modelo,
-        MovimientoInventario, TipoPrecio, ProductoPrecio
-    )
-
-    def norm(s):
-        if s is None:
-            return ""
-        return str(s).strip().upper()
-
-    def to_decimal(v, default="0"):
-        if v in (None, ""):
-            return Decimal(default)
-        s = str(v).strip().replace(" ", "")
-        # Soporta 1.234,56 / 1234,56 / 1234.56
-        if s.count(",") == 1 and s.count(".") >= 1:
-            s = s.replace(".", "").replace(",", ".")
-        else:
-            s = s.replace(",", ".")
-        try:
-            return Decimal(s)
-        except Exception:
-            return Decimal(default)
-
-    def to_bool(v, default=True):
-        if v in (None, ""):
-            return default
-        s = str(v).strip().lower()
-        return s in ("1", "true", "si", "sí", "yes", "x", "ok", "activo")
-
-    try:
-        wb = openpyxl.load_workbook(archivo, data_only=True)
-        ws = wb.active
-
-        # 1) detectar fila de encabezados real
-        # busca una fila que tenga al menos código + producto/nombre
-        header_row = None
-        for r in range(1, min(ws.max_row, 50) + 1):
-            row_vals = [norm(ws.cell(r, c).value) for c in range(1, ws.max_column + 1)]
-            if (
-                ("CÓDIGO" in row_vals or "CODIGO" in row_vals or "COD" in row_vals)
-                and ("PRODUCTO" in row_vals or "NOMBRE" in row_vals or "DESCRIPCION" in row_vals or "DESCRIPCIÓN" in row_vals)
-            ):
-                header_row = r
-                break
-
-        if not header_row:
-            messages.error(
-                request,
-                "No se encontró la fila de encabezados del Excel. "
-                "El archivo debe contener columnas como: CÓDIGO, PRODUCTO, STOCK, COSTO, PRECIO 1, PRECIO 2, PRECIO 3."
-            )
-            return redirect("core:inventario")
-
-        headers = [norm(ws.cell(header_row, c).value) for c in range(1, ws.max_column + 1)]
-
-        aliases = {
-            "codigo": ["CÓDIGO", "CODIGO", "COD", "SKU"],
-            "nombre": ["PRODUCTO", "NOMBRE", "DESCRIPCION", "DESCRIPCIÓN"],
-            "categoria": ["CATEGORÍA", "CATEGORIA"],
-            "marca": ["PROVEEDOR", "MARCA"],
-            "stock": ["STOCK", "EXISTENCIA"],
-            "costo": ["COSTO", "COSTE", "COSTO UNITARIO"],
-            "precio1": ["PRECIO 1", "PRECIO1", "PRECIO"],
-            "precio2": ["PRECIO 2", "PRECIO2", "P2"],
-            "precio3": ["PRECIO 3", "PRECIO3", "P3"],
-            "maneja_iva": ["IVA", "MANEJA IVA", "GRAVA IVA"],
-            "activo": ["ACTIVO", "ESTADO"],
-        }
-
-        def find_col(names):
-            for name in names:
-                if name in headers:
-                    return headers.index(name) + 1
-            return None
-
-        c_codigo = find_col(aliases["codigo"])
-        c_nombre = find_col(aliases["nombre"])
-        c_categoria = find_col(aliases["categoria"])
-        c_marca = find_col(aliases["marca"])
-        c_stock = find_col(aliases["stock"])
-        c_costo = find_col(aliases["costo"])
-        c_precio1 = find_col(aliases["precio1"])
-        c_precio2 = find_col(aliases["precio2"])
-        c_precio3 = find_col(aliases["precio3"])
-        c_maneja_iva = find_col(aliases["maneja_iva"])
-        c_activo = find_col(aliases["activo"])
-
-        if not c_codigo or not c_nombre or not c_precio1:
-            messages.error(
-                request,
-                "El archivo debe incluir al menos estas columnas válidas: "
-                "CÓDIGO, PRODUCTO y PRECIO 1."
-            )
-            return redirect("core:inventario")
-
-        # maestros base
-        categoria_na, _ = Categoria.objects.get_or_create(empresa=empresa, nombre="NA")
-        marca_na, _ = Marca.objects.get_or_create(empresa=empresa, nombre="NA")
-        modelo_na, _ = Modelo.objects.get_or_create(
-            empresa=empresa,
-            marca=marca_na,
-            nombre="NA"
-        )
-
-        tipo_precio_2, _ = TipoPrecio.objects.get_or_create(
-            empresa=empresa,
-            nombre="Precio 2",
-            defaults={"activo": True}
-        )
-        tipo_precio_3, _ = TipoPrecio.objects.get_or_create(
-            empresa=empresa,
-            nombre="Precio 3",
-            defaults={"activo": True}
-        )
-
-        creados = 0
-        actualizados = 0
-        omitidos = 0
-        errores = 0
-
-        with transaction.atomic():
-
-            if vaciar_antes:
-                ProductoPrecio.objects.filter(producto__empresa=empresa).delete()
-                MovimientoInventario.objects.filter(empresa=empresa).delete()
-                Producto.objects.filter(empresa=empresa).delete()
-
-            for r in range(header_row + 1, ws.max_row + 1):
-                try:
-                    raw_codigo = ws.cell(r, c_codigo).value if c_codigo else None
-                    raw_nombre = ws.cell(r, c_nombre).value if c_nombre else None
-
-                    codigo = str(raw_codigo).strip() if raw_codigo is not None else ""
-                    nombre = str(raw_nombre).strip() if raw_nombre is not None else ""
-
-                    if not codigo or not nombre:
-                        omitidos += 1
-                        continue
-
-                    # categoría
-                    categoria = categoria_na
-                    if c_categoria:
-                        val = ws.cell(r, c_categoria).value
-                        txt = str(val).strip() if val is not None else ""
-                        if txt:
-                            categoria, _ = Categoria.objects.get_or_create(
-                                empresa=empresa,
-                                nombre=txt
-                            )
-
-                    # marca (tu excel usa PROVEEDOR)
-                    marca = marca_na
-                    if c_marca:
-                        val = ws.cell(r, c_marca).value
-                        txt = str(val).strip() if val is not None else ""
-                        if txt:
-                            marca, _ = Marca.objects.get_or_create(
-                                empresa=empresa,
-                                nombre=txt
-                            )
-
-                    # modelo: como tu excel no trae, usar NA
-                    modelo, _ = Modelo.objects.get_or_create(
-                        empresa=empresa,
-                        marca=marca,
-                        nombre="NA"
-                    )
+    if not archivo.name.lower().endswith(".xlsx"):
+        messages.error(request, "El archivo debe estar en formato Excel (.xlsx).")
+        return redirect("core:inventario")
 
-                    stock_excel = to_decimal(ws.cell(r, c_stock).value, "0") if c_stock else Decimal("0")
-                    costo = to_decimal(ws.cell(r, c_costo).value, "0") if c_costo else Decimal("0")
-                    precio_1 = to_decimal(ws.cell(r, c_precio1).value, "0")
-                    precio_2 = to_decimal(ws.cell(r, c_precio2).value, "0") if c_precio2 else Decimal("0")
-                    precio_3 = to_decimal(ws.cell(r, c_precio3).value, "0") if c_precio3 else Decimal("0")
-                    maneja_iva = to_bool(ws.cell(r, c_maneja_iva).value, True) if c_maneja_iva else True
-                    activo = to_bool(ws.cell(r, c_activo).value, True) if c_activo else True
-
-                    existente = Producto.objects.filter(empresa=empresa, codigo=codigo).first()
-                    stock_anterior = existente.stock if existente else Decimal("0")
-
-                    producto, created = Producto.objects.update_or_create(
-                        empresa=empresa,
-                        codigo=codigo,
-                        defaults={
-                            "nombre": nombre,
-                            "categoria": categoria,
-                            "marca": marca,
-                            "modelo": modelo,
-                            "stock": stock_excel,
-                            "costo": costo,
-                            "precio": precio_1,
-                            "maneja_iva": maneja_iva,
-                            "activo": activo,
-                        }
-                    )
+    empresa = request.user.perfil.empresa
 
-                    ProductoPrecio.objects.update_or_create(
-                        producto=producto,
-                        tipo=tipo_precio_2,
-                        defaults={"valor": precio_2}
-                    )
-                    ProductoPrecio.objects.update_or_create(
-                        producto=producto,
-                        tipo=tipo_precio_3,
-                        defaults={"valor": precio_3}
-                    )
+    # Una importación a la vez por empresa
+    en_curso = procesos.en_curso(ImportacionInventario, empresa)
+    if en_curso:
+        messages.warning(request, f"Ya hay una importación en proceso (#{en_curso.id}). Espera a que termine.")
+        return redirect("core:inventario")
 
-                    diff = stock_excel - stock_anterior
-                    if diff != 0:
-                        MovimientoInventario.objects.create(
-                            empresa=empresa,
-                            producto=producto,
-                            tipo="AJ_E" if diff > 0 else "AJ_S",
-                            cantidad=abs(diff),
-                            costo_unitario=costo,
-                            costo_total=abs(diff) * costo,
-                            saldo=stock_excel,
-                            usuario=request.user,
-                            documento="IMPORTACION_EXCEL",
-                            observacion=f"Importación de inventario fila {r}"
-                        )
-
-                    if created:
-                        creados += 1
-                    else:
-                        actualizados += 1
-
-                except Exception:
-                    errores += 1
-
-        if errores:
-            messages.warning(
-                request,
-                f"Importación terminada con novedades. "
-                f"Creados: {creados}, actualizados: {actualizados}, omitidos: {omitidos}, errores: {errores}."
-            )
-        else:
-            messages.success(
-                request,
-                f"Importación completada. "
-                f"Creados: {creados}, actualizados: {actualizados}, omitidos: {omitidos}."
-            )
+    importacion = ImportacionInventario.objects.create(
+        empresa=empresa,
+        usuario=request.user,
+        archivo=archivo,
+        vaciar_antes=vaciar_antes,
+    )
+    transaction.on_commit(
+        lambda: app.send_task('core.tasks.importar_inventario_task', args=[importacion.id])
+    )
 
-        return redirect("core:inventario")
+    messages.info(request, f"Importación #{importacion.id} en proceso. Puedes seguir trabajando mientras se carga.")
+    return redirect("core:inventario")
 
-    except Exception as e:
-        messages.error(request, f"No se pudo importar el archivo: {e}")
-        return redirect("core:inventario")
+@login_required
+def importacion_inventario_estado_view(request, pk):
+    """ Avance de una importación de inventario (JSON para el polling de la plantilla) """
+    importacion = get_object_or_404(ImportacionInventario, pk=pk, empresa=request.user.perfil.empresa)
+    return JsonResponse(procesos.estado(
+        importacion, 'total_filas', 'procesadas', 'creados', 'actualizados', 'omitidos',
+    ))
     
 @login_required
 def eliminar_producto_view(request, pk):
@@ -2277,8 +2161,20 @@ def inventario_view(request):
         if form.is_valid():
             producto = form.save(commit=False)
             producto.empresa = empresa_actual
+            stock_inicial = producto.stock or Decimal("0")
+            producto.stock = 0
             producto.save()
 
+            # El stock inicial entra por el kardex como ajuste
+            if stock_inicial > 0:
+                kardex.registrar_movimientos(empresa_actual, [{
+                    'producto_id': producto.id,
+                    'tipo': 'AJ_E',
+                    'cantidad': stock_inicial,
+                    'costo_unitario': producto.costo,
+                    'observacion': 'Stock inicial',
+                }], usuario=request.user, documento="STOCK-INICIAL")
+
             # guardar precios 2 y 3 si vienen
             producto.set_precio(2, request.POST.get("precio_2"))
             producto.set_precio(3, request.POST.get("precio_3"))
@@ -2294,9 +2190,8 @@ def inventario_view(request):
         Producto.objects
         .filter(empresa=empresa_actual)
         .select_related('categoria', 'marca', 'modelo')
-        .prefetch_related('precios__tipo')
         .only(
-            'id', 'codigo', 'nombre', 'stock', 'costo', 'precio',
+            'id', 'empresa', 'codigo', 'nombre', 'stock', 'costo', 'precio',
             'maneja_iva',
             'categoria__id', 'categoria__nombre',
             'marca__id', 'marca__nombre',
@@ -2304,6 +2199,8 @@ def inventario_view(request):
         )
         .order_by('nombre')
     )
+    # Precios 2/3 resueltos de una vez desde la caché (core/precios.py)
+    productos = precios.precargar_precios(productos)
 
     categorias = Categoria.objects.filter(empresa=empresa_actual).only('id', 'nombre').order_by('nombre')
     marcas = Marca.objects.filter(empresa=empresa_actual).only('id', 'nombre').order_by('nombre')
@@ -2315,9 +2212,149 @@ def inventario_view(request):
         'categorias': categorias,
         'marcas': marcas,
         'modelos': modelos,
+        'ultima_importacion': ImportacionInventario.objects.filter(empresa=empresa_actual).first(),
     }
     return render(request, 'inventario.html', context)
 
+@login_required
+def inventario_valorizado_view(request):
+    """ Existencias y valor del inventario al cierre de una fecha (core/kardex.py) """
+    empresa = request.user.perfil.empresa
+
+    fecha = timezone.localdate()
+    if request.GET.get('fecha'):
+        try:
+            fecha = date.fromisoformat(request.GET['fecha'])
+        except ValueError:
+            messages.error(request, 'Fecha inválida.')
+
+    valorizado = kardex.inventario_valorizado(empresa, fecha)
+    productos = Producto.objects.filter(empresa=empresa, id__in=valorizado.keys()).only('id', 'codigo', 'nombre').order_by('nombre')
+
+    filas = []
+    total_valor = Decimal('0')
+    for producto in productos:
+        datos = valorizado[producto.id]
+        if not datos['cantidad']:
+            continue
+        filas.append({'producto': producto, **datos})
+        total_valor += datos['valor']
+
+    context = {
+        'fecha': fecha,
+        'filas': filas,
+        'total_valor': total_valor,
+        'costo_ventas_mes': kardex.costo_de_ventas(empresa, fecha),
+    }
+    return render(request, 'inventario_valorizado.html', context)
+
+# ==========================================
+# TOMAS FÍSICAS DE INVENTARIO
+# ==========================================
+
+@login_required
+def tomas_fisicas_view(request):
+    empresa = request.user.perfil.empresa
+
+    if request.method == 'POST':
+        bodega = Bodega.objects.filter(empresa=empresa, pk=request.POST.get('bodega')).first() or kardex.bodega_principal(empresa)
+        try:
+            toma = tomas.abrir_toma(empresa, bodega, usuario=request.user, observacion=request.POST.get('observacion', '').strip())
+        except ValueError as e:
+            messages.error(request, str(e))
+            return redirect('core:tomas_fisicas')
+        messages.success(request, f'Toma física #{toma.id} abierta con {toma.total_productos} productos. Ya puede registrar los conteos.')
+        return redirect('core:toma_fisica', pk=toma.id)
+
+    context = {
+        'tomas': TomaFisica.objects.filter(empresa=empresa).select_related('bodega', 'usuario')[:50],
+        'bodegas': Bodega.objects.filter(empresa=empresa, activa=True).order_by('-es_principal', 'nombre'),
+    }
+    return render(request, 'tomas_fisicas.html', context)
+
+@login_required
+def toma_fisica_view(request, pk):
+    """ Conteo por lotes: texto pegado desde el escáner o archivo CSV (codigo,cantidad) """
+    empresa = request.user.perfil.empresa
+    toma = get_object_or_404(TomaFisica.objects.select_related('bodega'), pk=pk, empresa=empresa)
+
+    if request.method == 'POST':
+        texto = request.POST.get('conteos', '')
+        archivo = request.FILES.get('archivo')
+        if archivo:
+            texto = archivo.read().decode('utf-8-sig', errors='replace')
+        try:
+            actualizados, errores = tomas.registrar_conteos(
+                toma, tomas.leer_conteos(texto), acumular=bool(request.POST.get('acumular'))
+            )
+        except ValueError as e:
+            messages.error(request, str(e))
+            return redirect('core:toma_fisica', pk=toma.id)
+
+        messages.success(request, f'{actualizados} productos contados.')
+        for error in errores[:20]:
+            messages.warning(request, error)
+        if len(errores) > 20:
+            messages.warning(request, f'... y {len(errores) - 20} errores más.')
+        return redirect('core:toma_fisica', pk=toma.id)
+
+    ver = request.GET.get('ver', 'contados')
+    detalles = toma.detalles.select_related('producto').order_by('producto__nombre')
+    if ver == 'pendientes':
+        detalles = detalles.filter(cantidad_contada__isnull=True)
+    elif ver == 'diferencias':
+        detalles = detalles.filter(diferencia__isnull=False).exclude(diferencia=0)
+    else:
+        detalles = detalles.filter(cantidad_contada__isnull=False)
+
+    context = {
+        'toma': toma,
+        'detalles': detalles[:500],
+        'ver': ver,
+        'resumen': tomas.resumen(toma),
+    }
+    return render(request, 'toma_fisica.html', context)
+
+@login_required
+def toma_fisica_escanear_ajax(request, pk):
+    """ Lote de lecturas del escáner: {"lecturas": [{"codigo": "...", "cantidad": 1}, ...]} """
+    if request.method != 'POST':
+        return JsonResponse({'status': 'error', 'message': 'Método no permitido'}, status=405)
+
+    toma = get_object_or_404(TomaFisica, pk=pk, empresa=request.user.perfil.empresa)
+    try:
+        lecturas = json.loads(request.body or b'{}').get('lecturas', [])
+        actualizados, errores = tomas.registrar_conteos(
+            toma, [(l.get('codigo'), l.get('cantidad', 1)) for l in lecturas], acumular=True
+        )
+    except (ValueError, AttributeError) as e:
+        return JsonResponse({'status': 'error', 'message': str(e)}, status=400)
+    return JsonResponse({'status': 'success', 'actualizados': actualizados, 'errores': errores})
+
+@login_required
+def toma_fisica_aplicar_view(request, pk):
+    empresa = request.user.perfil.empresa
+    toma = get_object_or_404(TomaFisica, pk=pk, empresa=empresa)
+
+    if request.method == 'POST':
+        try:
+            toma = tomas.aplicar_toma(toma, usuario=request.user, no_contados_en_cero=bool(request.POST.get('no_contados_en_cero')))
+            messages.success(request, f'Toma física #{toma.id} aplicada: {toma.total_ajustes} ajustes por ${toma.valor_diferencia:.2f}.')
+        except ValueError as e:
+            messages.error(request, str(e))
+    return redirect(f"{reverse('core:toma_fisica', args=[toma.id])}?ver=diferencias")
+
+@login_required
+def toma_fisica_anular_view(request, pk):
+    toma = get_object_or_404(TomaFisica, pk=pk, empresa=request.user.perfil.empresa)
+    if request.method == 'POST':
+        try:
+            tomas.anular_toma(toma)
+            messages.success(request, f'Toma física #{toma.id} anulada.')
+        except ValueError as e:
+            messages.error(request, str(e))
+    return redirect('core:tomas_fisicas')
+
 @login_required
 def editar_producto_view(request, pk):
     empresa = request.user.perfil.empresa
@@ -2329,7 +2366,7 @@ def editar_producto_view(request, pk):
         producto.categoria_id = request.POST.get("categoria") or None
         producto.marca_id = request.POST.get("marca") or None
         producto.modelo_id = request.POST.get("modelo") or None
-        producto.stock = Decimal(request.POST.get("stock") or "0")
+        stock_nuevo = Decimal(request.POST.get("stock") or "0")
         producto.costo = Decimal(request.POST.get("costo") or "0")
 
         # PRECIO 1/2/3
@@ -2341,6 +2378,17 @@ def editar_producto_view(request, pk):
         producto.maneja_iva = True if request.POST.get("maneja_iva") else False
         producto.save()
 
+        # La diferencia de stock se registra como ajuste en el kardex
+        diferencia = stock_nuevo - producto.stock
+        if diferencia:
+            kardex.registrar_movimientos(empresa, [{
+                'producto_id': producto.id,
+                'tipo': 'AJ_E' if diferencia > 0 else 'AJ_S',
+                'cantidad': abs(diferencia),
+                'costo_unitario': producto.costo if diferencia > 0 else None,
+                'observacion': 'Ajuste desde edición de producto',
+            }], usuario=request.user, documento="AJUSTE-MANUAL")
+
         messages.success(request, "Producto actualizado")
         return redirect("core:inventario")
 
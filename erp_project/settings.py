@@ -121,6 +121,70 @@ CELERY_RESULT_BACKEND = env('REDIS_URL')
 if not CELERY_BROKER_URL:
     print("ADVERTENCIA: Celery no está configurado. Las tareas asíncronas fallarán.")
 
+CELERY_TIMEZONE = TIME_ZONE
+
+# Tareas periódicas (servicio celery_beat de docker-compose)
+from celery.schedules import crontab
+
+CELERY_BEAT_SCHEDULE = {
+    'refrescar-promociones': {
+        'task': 'core.tasks.refrescar_promociones_task',
+        'schedule': crontab(hour=0, minute=0),
+    },
+    'generar-existencias-diarias': {
+        'task': 'core.tasks.generar_existencias_diarias_task',
+        # Media hora de margen para que terminen las ventas de la medianoche
+        'schedule': crontab(hour=0, minute=30),
+    },
+    'barrer-vencimientos': {
+        'task': 'core.tasks.barrer_vencimientos_task',
+        # Pasada la medianoche: vence lo que venció el día anterior
+        'schedule': crontab(hour=0, minute=15),
+    },
+    'devengar-mora': {
+        'task': 'core.tasks.devengar_mora_task',
+        # Carga la mora del día anterior, ya completo
+        'schedule': crontab(hour=0, minute=45),
+    },
+    'cerrar-inventario-mensual': {
+        'task': 'core.tasks.cerrar_inventario_mensual_task',
+        'schedule': crontab(day_of_month=1, hour=1, minute=0),
+    },
+    'cerrar-cuentas-mensual': {
+        'task': 'core.tasks.cerrar_cuentas_mensual_task',
+        'schedule': crontab(day_of_month=1, hour=1, minute=30),
+    },
+    'sincronizar-stock': {
+        'task': 'core.tasks.sincronizar_stock_task',
+        # Productos con contadores repartidos y los que se saltaron al vender por estar bloqueados
+        'schedule': crontab(minute='*'),
+    },
+    'conciliar-saldos': {
+        'task': 'core.tasks.conciliar_saldos_task',
+        'schedule': crontab(hour=2, minute=0),
+    },
+    'materializar-antiguedad': {
+        'task': 'core.tasks.materializar_antiguedad_task',
+        # Al cierre del día: los saldos guardados son los vigentes, no hay foto retroactiva
+        'schedule': crontab(hour=23, minute=50),
+    },
+    'generar-ruta-cobro': {
+        'task': 'core.tasks.generar_ruta_cobro_task',
+        # Después del barrido de vencimientos y de la mora, antes de que salgan los cobradores
+        'schedule': crontab(hour=5, minute=0),
+    },
+}
+
+# Caché compartida en el mismo Redis: coordina entre workers las versiones de
+# los índices en memoria (autocompletado de clientes/proveedores).
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': CELERY_BROKER_URL,
+        'KEY_PREFIX': 'erp',
+    }
+}
+
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 